@@ -0,0 +1,109 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import math
+from enum import Enum
+
+
+class ThroughputConvergence:
+    """
+    Decides, from the throughput a benchmark reports at regular intervals,
+    when the benchmark can be stopped early:
+    * converged: the throughput is in steady state, i.e. since the last level
+    shift detected by a two-sided CUSUM test, the confidence interval of the
+    mean throughput is narrower than 'rel_ci_width' of the mean;
+    * losing: the upper bound of the confidence interval is lower than the
+    'baseline' throughput by more than 'loss_margin', so the configuration
+    cannot beat the baseline.
+    The first 'warmup_intervals' samples are always ignored.
+    """
+
+    class Status(Enum):
+        running = 1
+        converged = 2
+        losing = 3
+
+    def __init__(
+        self,
+        warmup_intervals=2,
+        min_intervals=5,
+        rel_ci_width=0.05,
+        z_score=1.96,
+        cusum_threshold=5.0,
+        cusum_drift=0.5,
+        loss_margin=0.1,
+        min_loss_intervals=3,
+    ):
+        self.warmup_intervals = warmup_intervals
+        self.min_intervals = min_intervals
+        self.rel_ci_width = rel_ci_width
+        self.z_score = z_score
+        self.cusum_threshold = cusum_threshold
+        self.cusum_drift = cusum_drift
+        self.loss_margin = loss_margin
+        self.min_loss_intervals = min_loss_intervals
+        self.samples = []
+        # the index of the first sample of the current steady-state window
+        self.window_start = warmup_intervals
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+
+    def get_window(self):
+        return self.samples[self.window_start :]
+
+    def get_mean(self):
+        window = self.get_window() or self.samples
+        if not window:
+            return None
+        return sum(window) / len(window)
+
+    def get_ci_half_width(self):
+        window = self.get_window()
+        if len(window) < 2:
+            return float("inf")
+        mean = sum(window) / len(window)
+        variance = sum((x - mean) ** 2 for x in window) / (len(window) - 1)
+        return self.z_score * math.sqrt(variance / len(window))
+
+    def update_cusum(self, sample):
+        # A level shift (eg. the end of the initial cache warm-up or the start
+        # of write stalls) restarts the steady-state window at the sample.
+        window = self.get_window()[:-1]
+        if len(window) < 2:
+            return
+        mean = sum(window) / len(window)
+        std = math.sqrt(sum((x - mean) ** 2 for x in window) / (len(window) - 1))
+        # the relative CI target also bounds the noise that is tolerated
+        std = max(std, abs(mean) * self.rel_ci_width / self.z_score, 1e-9)
+        z = (sample - mean) / std
+        self.cusum_high = max(0.0, self.cusum_high + z - self.cusum_drift)
+        self.cusum_low = max(0.0, self.cusum_low - z - self.cusum_drift)
+        if self.cusum_high > self.cusum_threshold or (
+            self.cusum_low > self.cusum_threshold
+        ):
+            self.window_start = len(self.samples) - 1
+            self.cusum_high = 0.0
+            self.cusum_low = 0.0
+
+    def add(self, throughput, baseline=None):
+        # adds the throughput of the next interval and returns the Status
+        self.samples.append(throughput)
+        if len(self.samples) <= self.warmup_intervals:
+            return self.Status.running
+        self.update_cusum(throughput)
+        window = self.get_window()
+        mean = sum(window) / len(window)
+        half_width = self.get_ci_half_width()
+        if (
+            baseline
+            and len(window) >= self.min_loss_intervals
+            and mean + half_width < baseline * (1 - self.loss_margin)
+        ):
+            return self.Status.losing
+        if len(window) >= self.min_intervals and (
+            half_width <= self.rel_ci_width * abs(mean)
+        ):
+            return self.Status.converged
+        return self.Status.running
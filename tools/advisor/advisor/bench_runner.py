@@ -15,7 +15,16 @@ class BenchmarkRunner(ABC):
 
     @abstractmethod
     def run_experiment(self):
-        # should return a list of DataSource objects
+        # should return a list of DataSource objects and the metric; when
+        # called with metric_vector=True, the metric should be a dictionary of
+        # the metrics defined in db_objectives.py instead
+        pass
+
+    def disable_early_stopping(self):
+        # called by the optimizers that need metrics an experiment stopped
+        # early does not measure (refer LATENCY_METRICS in db_objectives.py);
+        # runners that stop experiments early should run them to completion
+        # from then on
         pass
 
     @staticmethod
@@ -4,10 +4,14 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import argparse
+import random
 
 from advisor.db_config_optimizer import ConfigOptimizer
 from advisor.db_log_parser import NO_COL_FAMILY
+from advisor.db_objectives import Constraint
 from advisor.db_options_parser import DatabaseOptions
+from advisor.db_surrogate_optimizer import SurrogateConfigOptimizer
+from advisor.db_trajectory import TrajectoryComparison, TrajectoryLog
 from advisor.rule_parser import RulesSpec
 
 
@@ -16,7 +20,7 @@ CONFIG_OPT_NUM_ITER = 10
 
 def main(args):
     # initialise the RulesSpec parser
-    rule_spec_parser = RulesSpec(args.rules_spec)
+    rule_spec_parser = RulesSpec(args.rules_spec, rules_packs=args.rules_packs)
     # initialise the benchmark runner
     bench_runner_module = __import__(
         args.benchrunner_module, fromlist=[args.benchrunner_class]
@@ -29,18 +33,66 @@ def main(args):
         if args.ods_key_prefix:
             ods_args["key_prefix"] = args.ods_key_prefix
     db_bench_runner = bench_runner_class(args.benchrunner_pos_args, ods_args)
+    if args.early_stopping_interval_sec:
+        db_bench_runner.set_early_stopping(args.early_stopping_interval_sec)
     # initialise the database configuration
     db_options = DatabaseOptions(args.rocksdb_options, args.misc_options)
+    if args.warm_start:
+        # start from the best configuration found by the earlier sessions
+        warm_start_options = TrajectoryComparison.from_files(
+            args.warm_start
+        ).get_warm_start_options()
+        if warm_start_options:
+            db_options.update_options(warm_start_options)
     # set the frequency at which stats are dumped in the LOG file and the
     # location of the LOG file.
     db_log_dump_settings = {
         "DBOptions.stats_dump_period_sec": {NO_COL_FAMILY: args.stats_dump_period_sec}
     }
     db_options.update_options(db_log_dump_settings)
+    if args.seed is not None:
+        random.seed(args.seed)
+    trajectory_log = None
+    if args.trajectory_log:
+        trajectory_log = TrajectoryLog(
+            args.trajectory_log,
+            {
+                "search_mode": args.search_mode,
+                "seed": args.seed,
+                "objectives": args.objectives,
+                "constraints": args.constraints,
+                "maximize": db_bench_runner.is_metric_better(1, 0),
+                "warm_start": args.warm_start,
+            },
+        )
     # initialise the configuration optimizer
-    config_optimizer = ConfigOptimizer(
-        db_bench_runner, db_options, rule_spec_parser, args.base_db_path
-    )
+    objectives = None
+    if args.objectives:
+        objectives = args.objectives.split(",")
+    constraints = Constraint.parse_all(args.constraints)
+    if args.search_mode == "surrogate":
+        config_optimizer = SurrogateConfigOptimizer(
+            db_bench_runner,
+            db_options,
+            rule_spec_parser,
+            args.base_db_path,
+            num_iterations=args.num_iterations,
+            cache_path=args.experiments_cache,
+            seed=args.seed,
+            trajectory_log=trajectory_log,
+            objectives=objectives,
+            constraints=constraints,
+        )
+    else:
+        config_optimizer = ConfigOptimizer(
+            db_bench_runner,
+            db_options,
+            rule_spec_parser,
+            args.base_db_path,
+            objectives,
+            constraints,
+            trajectory_log,
+        )
     # run the optimiser to improve the database configuration for given
     # benchmarks, with the help of expert-specified rules
     final_db_options = config_optimizer.run()
@@ -91,6 +143,13 @@ if __name__ == "__main__":
         type=str,
         help="path of the file containing the expert-specified Rules",
     )
+    parser.add_argument(
+        "--rules_packs",
+        nargs="*",
+        help="whitespace-separated paths of rules packs (eg. generated by "
+        + "advisor.rules_pack_example) that are loaded after the rules spec "
+        + "and replace its sections of the same name",
+    )
     parser.add_argument(
         "--stats_dump_period_sec",
         required=True,
@@ -136,5 +195,78 @@ if __name__ == "__main__":
         + 'benchrunner_class argument, example: "use_existing_db=true '
         + 'duration=900"',
     )
+    parser.add_argument(
+        "--early_stopping_interval_sec",
+        type=int,
+        help="if given, the benchmark reports its throughput at this interval "
+        + "and every experiment is stopped as soon as the throughput has "
+        + "converged or is clearly worse than the best so far (supported by "
+        + "DBBenchRunner); ignored when the objectives or constraints are "
+        + "on the latency percentiles",
+    )
+    # search mode arguments
+    parser.add_argument(
+        "--search_mode",
+        choices=["rules", "surrogate"],
+        default="rules",
+        help="'rules' applies the suggestions of one triggered rule per "
+        + "benchmark run; 'surrogate' fits a model on all the benchmark runs "
+        + "and uses the triggered rules only to pick the options to vary",
+    )
+    parser.add_argument(
+        "--num_iterations",
+        type=int,
+        default=CONFIG_OPT_NUM_ITER,
+        help="the maximum number of benchmark runs in the surrogate mode",
+    )
+    parser.add_argument(
+        "--experiments_cache",
+        type=str,
+        help="path of a JSON file in which the results of the benchmark runs "
+        + "are kept, across runs of the surrogate mode",
+    )
+    # multi-objective arguments
+    parser.add_argument(
+        "--objectives",
+        type=str,
+        help="comma-separated metrics to optimize for, in the order of "
+        + "priority, out of: throughput, p99, p99.9, peak_rss, write_amp, "
+        + "memtable_memory; the optimizer then keeps the Pareto front of "
+        + "the configurations instead of optimizing the throughput alone (in "
+        + "the surrogate mode, the model is fitted on the first objective "
+        + "penalized by the violation of the constraints)",
+    )
+    parser.add_argument(
+        "--constraints",
+        type=str,
+        help="the constraints that the recommended configuration must "
+        + "satisfy in the multi-objective mode (requires --objectives), "
+        + "example: "
+        + '"p99 < 300us and memtable_memory < 1GB"',
+    )
+    # session history arguments
+    parser.add_argument(
+        "--trajectory_log",
+        type=str,
+        help="path of a JSON lines file to which every benchmarked "
+        + "configuration is logged: the rule applied, the options changed, "
+        + "the metric, whether it was accepted and the benchmark duration; "
+        + "compare sessions with advisor.trajectory_compare_example",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed of the random choices of the optimizer, to reproduce or "
+        + "vary a session",
+    )
+    parser.add_argument(
+        "--warm_start",
+        nargs="*",
+        help="whitespace-separated paths of the trajectory logs of earlier "
+        + "sessions; the optimizer starts from the best configuration found "
+        + "by them, applied on top of the given OPTIONS file",
+    )
     args = parser.parse_args()
+    if args.constraints and not args.objectives:
+        parser.error("--constraints requires --objectives")
     main(args)
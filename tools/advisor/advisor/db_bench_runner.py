@@ -3,12 +3,24 @@
 #  COPYING file in the root directory) and Apache 2.0 License
 #  (found in the LICENSE.Apache file in the root directory).
 
+import os
 import shutil
+import signal
 import subprocess
+import sys
 import time
 
+from advisor.bench_convergence import ThroughputConvergence
 from advisor.bench_runner import BenchmarkRunner
 from advisor.db_log_parser import DatabaseLogs, DataSource, NO_COL_FAMILY
+from advisor.db_objectives import (
+    MEMTABLE_MEMORY,
+    P99,
+    P999,
+    PEAK_RSS,
+    THROUGHPUT,
+    WRITE_AMP,
+)
 from advisor.db_stats_fetcher import (
     DatabasePerfContext,
     LogStatsParser,
@@ -24,9 +36,12 @@ NOTE: This is not thread-safe, because the output file is simply overwritten.
 class DBBenchRunner(BenchmarkRunner):
     OUTPUT_FILE = "temp/dbbench_out.tmp"
     ERROR_FILE = "temp/dbbench_err.tmp"
+    REPORT_FILE = "temp/dbbench_report.tmp"
     DB_PATH = "DB path"
     THROUGHPUT = "ops/sec"
     PERF_CON = " PERF_CONTEXT:"
+    PERCENTILES = "Percentiles:"
+    STATS_COUNT = " COUNT : "
 
     @staticmethod
     def is_metric_better(new_metric, old_metric):
@@ -43,6 +58,60 @@ class DBBenchRunner(BenchmarkRunner):
                 optional_args_str += " --" + option_name + "=" + str(option_value)
         return optional_args_str
 
+    @staticmethod
+    def get_memtable_memory(db_options):
+        # the memory that the memtables can take as per the options: the sum
+        # of write_buffer_size * max_write_buffer_number over the column
+        # families, capped by db_write_buffer_size if it is set
+        options = db_options.get_typed_options(
+            [
+                "CFOptions.write_buffer_size",
+                "CFOptions.max_write_buffer_number",
+                "DBOptions.db_write_buffer_size",
+            ]
+        )
+        write_buffer_size = options.get("CFOptions.write_buffer_size", {})
+        max_write_buffer_number = options.get("CFOptions.max_write_buffer_number", {})
+        memtable_memory = 0
+        for col_fam in db_options.get_column_families() or []:
+            # the defaults of Rocksdb
+            memtable_memory += write_buffer_size.get(
+                col_fam, 64 << 20
+            ) * max_write_buffer_number.get(col_fam, 2)
+        db_write_buffer_size = options.get("DBOptions.db_write_buffer_size", {}).get(
+            NO_COL_FAMILY
+        )
+        if db_write_buffer_size:
+            memtable_memory = min(memtable_memory, db_write_buffer_size)
+        return memtable_memory
+
+    def get_metric_vector(self, parsed_output, peak_rss, db_options):
+        # builds the metric vector of an experiment (refer db_objectives.py);
+        # the tail latencies are the worst over all the operation types and
+        # are left out if no histogram has them, while the memtable memory is
+        # not measured but derived from the options
+        metrics = {THROUGHPUT: parsed_output[self.THROUGHPUT]}
+        percentiles = parsed_output[self.PERCENTILES]
+        for metric, percentile in ((P99, "P99"), (P999, "P99.9")):
+            value = max(
+                (p[percentile] for p in percentiles if percentile in p), default=None
+            )
+            if value is not None:
+                metrics[metric] = value
+        if peak_rss:
+            metrics[PEAK_RSS] = peak_rss
+        stats = parsed_output[self.STATS_COUNT]
+        if stats.get("rocksdb.bytes.written"):
+            metrics[WRITE_AMP] = (
+                stats.get("rocksdb.flush.write.bytes", 0)
+                + stats.get("rocksdb.compact.write.bytes", 0)
+            ) / stats["rocksdb.bytes.written"]
+        try:
+            metrics[MEMTABLE_MEMORY] = DBBenchRunner.get_memtable_memory(db_options)
+        except ValueError as e:
+            print("WARNING(DBBenchRunner) get_metric_vector: " + str(e))
+        return metrics
+
     def __init__(self, positional_args, ods_args=None):
         # parse positional_args list appropriately
         self.db_bench_binary = positional_args[0]
@@ -53,6 +122,28 @@ class DBBenchRunner(BenchmarkRunner):
             self.db_bench_args = positional_args[2:]
         # save ods_args, if provided
         self.ods_args = ods_args
+        # early stopping is disabled unless set_early_stopping() is called
+        self.report_interval_sec = None
+        self.convergence_args = None
+        # the best throughput of all the experiments so far, candidates that
+        # are clearly worse than it are aborted in the early stopping mode
+        self.best_throughput = None
+
+    def set_early_stopping(self, report_interval_sec, **convergence_args):
+        # In this mode db_bench reports its throughput every
+        # 'report_interval_sec' seconds and the experiment is stopped as soon
+        # as the throughput converges or is clearly worse than the best one
+        # so far; 'convergence_args' are passed on to ThroughputConvergence
+        self.report_interval_sec = report_interval_sec
+        self.convergence_args = convergence_args
+
+    def disable_early_stopping(self):
+        if self.report_interval_sec:
+            print(
+                "WARNING(DBBenchRunner) early stopping disabled: the latency "
+                + "percentiles are printed only by the complete runs"
+            )
+        self.report_interval_sec = None
 
     def _parse_output(self, get_perf_context=False):
         """
@@ -63,7 +154,13 @@ class DBBenchRunner(BenchmarkRunner):
         PERF_CONTEXT:\n
         user_key_comparison_count = 500466712, block_cache_hit_count = ...\n
         """
-        output = {self.THROUGHPUT: None, self.DB_PATH: None, self.PERF_CON: None}
+        output = {
+            self.THROUGHPUT: None,
+            self.DB_PATH: None,
+            self.PERF_CON: None,
+            self.PERCENTILES: [],
+            self.STATS_COUNT: {},
+        }
         perf_context_begins = False
         with open(self.OUTPUT_FILE) as fp:
             for line in fp:
@@ -107,6 +204,24 @@ class DBBenchRunner(BenchmarkRunner):
                     # line from sample output:
                     # DB path: [/tmp/rocksdbtest-155919/dbbench]\n
                     output[self.DB_PATH] = line.split("[")[1].split("]")[0]
+                elif line.startswith(self.PERCENTILES):
+                    # printed with --histogram, one line per operation type:
+                    # Percentiles: P50: 1.50 P75: 2.10 P99: 5.20 P99.9: 12.10\
+                    # P99.99: 50.00\n
+                    token_list = line[len(self.PERCENTILES) :].split()
+                    output[self.PERCENTILES].append(
+                        {
+                            token_list[ix].rstrip(":"): float(token_list[ix + 1])
+                            for ix in range(0, len(token_list) - 1, 2)
+                        }
+                    )
+                elif line.startswith("rocksdb.") and self.STATS_COUNT in line:
+                    # the tickers printed with --statistics:
+                    # rocksdb.bytes.written COUNT : 1183930\n
+                    # (histograms are printed as 'P50 : .. COUNT : .. SUM : ..')
+                    stat, count = line.split(self.STATS_COUNT, 1)
+                    if count.strip().isdigit():
+                        output[self.STATS_COUNT][stat.strip()] = int(count)
         return output
 
     def get_log_options(self, db_options, db_path):
@@ -167,12 +282,15 @@ class DBBenchRunner(BenchmarkRunner):
         command += args_str
         self._run_command(command)
 
-    def _build_experiment_command(self, curr_options, db_path):
+    def _build_experiment_command(self, curr_options, db_path, histogram=False):
         command = "{} --benchmarks={} --statistics --perf_level=3 --db={}".format(
             self.db_bench_binary,
             self.benchmark,
             db_path,
         )
+        if histogram:
+            # the latency percentiles are printed only with --histogram
+            command += " --histogram"
         # fetch the command-line arguments string for providing Rocksdb options
         args_str = self._get_options_command_line_args_str(curr_options)
         # handle the command-line args passed in the constructor, these
@@ -186,21 +304,126 @@ class DBBenchRunner(BenchmarkRunner):
         out_file = open(self.OUTPUT_FILE, "w+")
         err_file = open(self.ERROR_FILE, "w+")
         print("executing... - " + command)
-        subprocess.call(command, shell=True, stdout=out_file, stderr=err_file)
+        process = subprocess.Popen(
+            command, shell=True, stdout=out_file, stderr=err_file
+        )
+        # wait4() reports the peak RSS of the command and its children
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        out_file.close()
+        err_file.close()
+        # ru_maxrss is in kilobytes on Linux, but in bytes on macOS
+        if sys.platform == "darwin":
+            return rusage.ru_maxrss
+        return rusage.ru_maxrss * 1024
+
+    def _read_report(self, offset):
+        # returns the throughputs reported since 'offset' in the report file
+        # and the new offset; sample report file:
+        # secs_elapsed,interval_qps\n
+        # 5,301530\n
+        # 10,298311\n
+        # where 'interval_qps' is the number of operations in the interval
+        throughputs = []
+        if not os.path.isfile(self.REPORT_FILE):
+            return throughputs, offset
+        with open(self.REPORT_FILE) as fp:
+            fp.seek(offset)
+            while True:
+                line = fp.readline()
+                # a line without a newline has not been completely written yet
+                if not line.endswith("\n"):
+                    break
+                offset = fp.tell()
+                token_list = line.strip().split(",")
+                if len(token_list) == 2 and token_list[1].isdigit():
+                    throughputs.append(int(token_list[1]) / self.report_interval_sec)
+        return throughputs, offset
+
+    def _run_command_with_early_stopping(self, command):
+        # Runs the experiment command, following its throughput reports, and
+        # stops it as soon as ThroughputConvergence says so. Returns the peak
+        # RSS and the converged throughput, which is None if the experiment
+        # ran to completion (its output then has the throughput).
+        if os.path.isfile(self.REPORT_FILE):
+            os.remove(self.REPORT_FILE)
+        command += " --report_interval_seconds={} --report_file={}".format(
+            self.report_interval_sec, self.REPORT_FILE
+        )
+        convergence = ThroughputConvergence(**self.convergence_args)
+        out_file = open(self.OUTPUT_FILE, "w+")
+        err_file = open(self.ERROR_FILE, "w+")
+        print("executing with early stopping... - " + command)
+        # a new session, so that db_bench and the shell can be killed together
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=out_file,
+            stderr=err_file,
+            start_new_session=True,
+        )
+        offset = 0
+        throughput = None
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            time.sleep(min(1, self.report_interval_sec))
+            throughputs, offset = self._read_report(offset)
+            verdict = ThroughputConvergence.Status.running
+            for interval_throughput in throughputs:
+                verdict = convergence.add(interval_throughput, self.best_throughput)
+                if verdict is not ThroughputConvergence.Status.running:
+                    break
+            if verdict is not ThroughputConvergence.Status.running:
+                throughput = convergence.get_mean()
+                print(
+                    "stopping the experiment early, throughput "
+                    + verdict.name
+                    + ": "
+                    + str(throughput)
+                    + " ops/sec after "
+                    + str(len(convergence.samples))
+                    + " reports"
+                )
+                os.killpg(process.pid, signal.SIGTERM)
+                _, status, rusage = os.wait4(process.pid, 0)
+                break
+        process.returncode = os.waitstatus_to_exitcode(status)
         out_file.close()
         err_file.close()
+        peak_rss = rusage.ru_maxrss
+        if sys.platform != "darwin":
+            peak_rss *= 1024
+        return peak_rss, throughput
 
-    def run_experiment(self, db_options, db_path):
+    def run_experiment(self, db_options, db_path, metric_vector=False):
         # setup the Rocksdb database before running experiment
         self._setup_db_before_experiment(db_options, db_path)
         # get the command to run the experiment
-        command = self._build_experiment_command(db_options, db_path)
+        command = self._build_experiment_command(db_options, db_path, metric_vector)
         experiment_start_time = int(time.time())
         # run experiment
-        self._run_command(command)
+        early_throughput = None
+        if self.report_interval_sec:
+            peak_rss, early_throughput = self._run_command_with_early_stopping(command)
+        else:
+            peak_rss = self._run_command(command)
         experiment_end_time = int(time.time())
         # parse the db_bench experiment output
         parsed_output = self._parse_output(get_perf_context=True)
+        if early_throughput is not None:
+            # db_bench was stopped before it printed its results
+            parsed_output[self.THROUGHPUT] = early_throughput
+            if not parsed_output[self.DB_PATH]:
+                parsed_output[self.DB_PATH] = db_path
+            if not parsed_output[self.PERF_CON]:
+                parsed_output[self.PERF_CON] = {}
+        if parsed_output[self.THROUGHPUT] is not None and (
+            self.best_throughput is None
+            or parsed_output[self.THROUGHPUT] > self.best_throughput
+        ):
+            self.best_throughput = parsed_output[self.THROUGHPUT]
 
         # get the log files path prefix and frequency at which Rocksdb stats
         # are dumped in the logs
@@ -233,5 +456,10 @@ class DBBenchRunner(BenchmarkRunner):
                     key_prefix,
                 )
             )
+        if metric_vector:
+            # return the experiment's data-sources and all its metrics
+            return data_sources, self.get_metric_vector(
+                parsed_output, peak_rss, db_options
+            )
         # return the experiment's data-sources and throughput
         return data_sources, parsed_output[self.THROUGHPUT]
@@ -0,0 +1,174 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import math
+from collections import deque
+from enum import Enum
+
+
+class BurstInterval:
+    """
+    A run of consecutive samples whose windowed rate was found bursty: the
+    timestamps of its first and last samples and of the sample with the
+    largest score, together with that score.
+    """
+
+    def __init__(self, start, peak_timestamp, peak_score):
+        self.start = start
+        self.end = start
+        self.peak_timestamp = peak_timestamp
+        self.peak_score = peak_score
+
+    def extend(self, timestamp, score):
+        self.end = timestamp
+        if score > self.peak_score:
+            self.peak_timestamp = timestamp
+            self.peak_score = score
+
+    def __eq__(self, other):
+        return isinstance(other, BurstInterval) and (
+            (self.start, self.end, self.peak_timestamp, self.peak_score)
+            == (other.start, other.end, other.peak_timestamp, other.peak_score)
+        )
+
+    def __repr__(self):
+        return (
+            "BurstInterval: ["
+            + str(self.start)
+            + ", "
+            + str(self.end)
+            + "] peak: "
+            + str(self.peak_score)
+            + " at "
+            + str(self.peak_timestamp)
+        )
+
+
+class BurstDetector:
+    """
+    Detects the bursts in a time series that is fed to it one sample at a
+    time, in O(1) time per sample and O(window_samples) memory, so arbitrarily
+    long series can be processed incrementally. For every sample, the rate of
+    change over the sliding window of the last 'window_samples' samples is
+    computed like TimeSeriesStore.rate_change() does, and scored by 'method':
+    * percent: the rate of change in percent of the value at the start of the
+    window (the score used by the 'bursty' behavior so far);
+    * ewma: the ratio of the rate to its exponentially weighted moving
+    average, i.e. how many times the usual rate it is;
+    * zscore: the number of exponentially weighted standard deviations by
+    which the rate exceeds its exponentially weighted moving average.
+    A sample is bursty if its score is at least 'threshold', and consecutive
+    bursty samples are merged into one BurstInterval. The moving averages are
+    not updated by bursty samples, so that a long burst does not become the
+    baseline it is compared with, and no sample is scored by them before
+    'warmup_samples' rates have been seen.
+    """
+
+    class Method(Enum):
+        percent = 1
+        ewma = 2
+        zscore = 3
+
+    def __init__(
+        self,
+        method,
+        threshold,
+        window_samples,
+        duration_sec,
+        ewma_alpha=0.1,
+        warmup_samples=10,
+    ):
+        self.method = method
+        self.threshold = threshold
+        self.window_samples = max(window_samples, 1)
+        self.duration_sec = duration_sec
+        self.ewma_alpha = ewma_alpha
+        self.warmup_samples = warmup_samples
+        # the (timestamp, value) pairs of the current window
+        self.window = deque(maxlen=self.window_samples + 1)
+        self.last_timestamp = None
+        self.ewma_mean = None
+        self.ewma_var = 0.0
+        self.num_rates = 0
+        self.intervals = []
+        # the interval of the ongoing burst, if any
+        self.open_interval = None
+
+    def get_rate(self):
+        prev_ts, prev_val = self.window[0]
+        curr_ts, curr_val = self.window[-1]
+        diff = curr_val - prev_val
+        if self.method is self.Method.percent:
+            if prev_val == 0:
+                return None
+            diff = diff * 100 / prev_val
+        if curr_ts == prev_ts:
+            return None
+        return (diff * self.duration_sec) / (curr_ts - prev_ts)
+
+    def get_score(self, rate):
+        if self.method is self.Method.percent:
+            return rate
+        if self.num_rates < self.warmup_samples:
+            return None
+        if self.method is self.Method.ewma:
+            if self.ewma_mean <= 0:
+                return None
+            return rate / self.ewma_mean
+        std = math.sqrt(self.ewma_var)
+        if std == 0:
+            return None
+        return (rate - self.ewma_mean) / std
+
+    def update_ewma(self, rate):
+        self.num_rates += 1
+        if self.ewma_mean is None:
+            self.ewma_mean = rate
+            return
+        # the exponentially weighted variance, updated incrementally
+        delta = rate - self.ewma_mean
+        self.ewma_mean += self.ewma_alpha * delta
+        self.ewma_var = (1 - self.ewma_alpha) * (
+            self.ewma_var + self.ewma_alpha * delta * delta
+        )
+
+    def add(self, timestamp, value):
+        # Adds the next sample, whose timestamp must be larger than those of
+        # the samples added so far (older samples are ignored), and returns
+        # the BurstInterval that it closed, if any.
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return None
+        self.last_timestamp = timestamp
+        self.window.append((timestamp, value))
+        if len(self.window) <= self.window_samples:
+            return None
+        rate = self.get_rate()
+        if rate is None or not math.isfinite(rate):
+            return None
+        score = self.get_score(rate)
+        if score is not None and score >= self.threshold:
+            if self.open_interval:
+                self.open_interval.extend(timestamp, score)
+            else:
+                self.open_interval = BurstInterval(timestamp, timestamp, score)
+            return None
+        if self.method is not self.Method.percent:
+            self.update_ewma(rate)
+        closed_interval = self.open_interval
+        if closed_interval:
+            self.intervals.append(closed_interval)
+            self.open_interval = None
+        return closed_interval
+
+    def add_series(self, timestamps, values):
+        for timestamp, value in zip(timestamps, values):
+            self.add(timestamp, value)
+
+    def get_intervals(self):
+        # the intervals of all the bursts seen so far, including the ongoing
+        # one
+        if self.open_interval:
+            return self.intervals + [self.open_interval]
+        return list(self.intervals)
@@ -5,8 +5,10 @@
 
 import copy
 import random
+import time
 
 from advisor.db_log_parser import NO_COL_FAMILY
+from advisor.db_objectives import LATENCY_METRICS, ParetoFront
 from advisor.db_options_parser import DatabaseOptions
 from advisor.rule_parser import Suggestion
 
@@ -127,6 +129,8 @@ class ConfigOptimizer:
                             + "suggested_values for "
                             + sugg.option
                         )
+        # keep the suggested values within the valid ranges of the options
+        updated_config = DatabaseOptions.sanitize_options(updated_config)
         return current_config, updated_config
 
     @staticmethod
@@ -201,11 +205,71 @@ class ConfigOptimizer:
         print(bt_config)
         return bt_config
 
-    def __init__(self, bench_runner, db_options, rule_parser, base_db):
+    def __init__(
+        self,
+        bench_runner,
+        db_options,
+        rule_parser,
+        base_db,
+        objectives=None,
+        constraints=None,
+        trajectory_log=None,
+    ):
         self.bench_runner = bench_runner
         self.db_options = db_options
         self.rule_parser = rule_parser
         self.base_db_path = base_db
+        # In the multi-objective mode, the bench runner returns a vector of
+        # metrics (refer db_objectives.py) and the optimizer keeps the Pareto
+        # front of the configurations that satisfy the constraints
+        self.pareto_front = None
+        if objectives:
+            self.pareto_front = ParetoFront(objectives, constraints)
+            if self.pareto_front.get_metrics() & LATENCY_METRICS:
+                # the experiments stopped early would miss the latencies and
+                # be scored as infeasible
+                self.bench_runner.disable_early_stopping()
+        # if given, every benchmarked configuration is logged to this
+        # TrajectoryLog (refer db_trajectory.py)
+        self.trajectory_log = trajectory_log
+
+    def run_experiment(self, options):
+        if not self.pareto_front:
+            return self.bench_runner.run_experiment(options, self.base_db_path)
+        data_sources, metrics = self.bench_runner.run_experiment(
+            options, self.base_db_path, metric_vector=True
+        )
+        if self.pareto_front.add(metrics, copy.deepcopy(options)):
+            print("\nadded to the Pareto front: " + str(metrics))
+        return data_sources, metrics
+
+    def log_step(self, options, metric, rule, accepted, duration_sec):
+        if self.trajectory_log:
+            self.trajectory_log.add_step(options, metric, rule, accepted, duration_sec)
+
+    def is_metric_better(self, new_metric, old_metric):
+        if not self.pareto_front:
+            return self.bench_runner.is_metric_better(new_metric, old_metric)
+        return self.pareto_front.is_better(new_metric, old_metric)
+
+    def get_final_options(self, options):
+        # in the multi-objective mode, the recommended configuration of the
+        # Pareto front is returned instead of the last accepted one
+        if not self.pareto_front:
+            return options
+        print("\nPareto front:")
+        for metrics, _ in self.pareto_front.get_front():
+            print(metrics)
+        recommended = self.pareto_front.get_recommended()
+        if not recommended:
+            print(
+                "WARNING(ConfigOptimizer): no configuration satisfies the "
+                + "constraints: "
+                + str(self.pareto_front.constraints)
+            )
+            return options
+        print("Recommended: " + str(recommended[0]))
+        return recommended[1]
 
     def run(self):
         # In every iteration of this method's optimization loop we pick ONE
@@ -214,12 +278,11 @@ class ConfigOptimizer:
         # bootstrapping the optimizer
         print("Bootstrapping optimizer:")
         options = copy.deepcopy(self.db_options)
-        old_data_sources, old_metric = self.bench_runner.run_experiment(
-            options, self.base_db_path
-        )
+        start_time = time.time()
+        old_data_sources, old_metric = self.run_experiment(options)
         print("Initial metric: " + str(old_metric))
-        self.rule_parser.load_rules_from_spec()
-        self.rule_parser.perform_section_checks()
+        self.log_step(options, old_metric, None, True, time.time() - start_time)
+        self.rule_parser.load()
         triggered_rules = self.rule_parser.get_triggered_rules(
             old_data_sources, options.get_column_families()
         )
@@ -250,11 +313,14 @@ class ConfigOptimizer:
             print(updated_conf)
             options.update_options(updated_conf)
             # run bench_runner with updated config
-            new_data_sources, new_metric = self.bench_runner.run_experiment(
-                options, self.base_db_path
-            )
+            start_time = time.time()
+            new_data_sources, new_metric = self.run_experiment(options)
+            duration_sec = time.time() - start_time
             print("\nnew metric: " + str(new_metric))
-            backtrack = not self.bench_runner.is_metric_better(new_metric, old_metric)
+            backtrack = not self.is_metric_better(new_metric, old_metric)
+            self.log_step(
+                options, new_metric, curr_rule.name, not backtrack, duration_sec
+            )
             # update triggered_rules, metric, data_sources, if required
             if backtrack:
                 # revert changes to options config
@@ -265,8 +331,7 @@ class ConfigOptimizer:
                 options.update_options(backtrack_conf)
             else:
                 # run advisor on new data sources
-                self.rule_parser.load_rules_from_spec()  # reboot the advisor
-                self.rule_parser.perform_section_checks()
+                self.rule_parser.load()  # reboot the advisor
                 triggered_rules = self.rule_parser.get_triggered_rules(
                     new_data_sources, options.get_column_families()
                 )
@@ -290,4 +355,4 @@ class ConfigOptimizer:
                 self.rule_parser.get_suggestions_dict(),
             )
         # return the final database options configuration
-        return options
+        return self.get_final_options(options)
@@ -4,6 +4,7 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import glob
+import os
 import re
 import time
 from abc import ABC, abstractmethod
@@ -22,6 +23,12 @@ class DataSource(ABC):
 
     def __init__(self, type):
         self.type = type
+        # an EvaluationProfile (refer advisor/rule_report.py) that records the
+        # cost of evaluating every condition, if profiling is enabled
+        self.profile = None
+
+    def set_profile(self, profile):
+        self.profile = profile
 
     @abstractmethod
     def check_and_trigger_conditions(self, conditions):
@@ -52,6 +59,13 @@ class Log:
                 break
         if not self.column_family:
             self.column_family = NO_COL_FAMILY
+        # the LOG file and the line number the log starts at, if known
+        self.file_name = None
+        self.line_number = None
+
+    def set_source(self, file_name, line_number):
+        self.file_name = file_name
+        self.line_number = line_number
 
     def get_human_readable_time(self):
         # example from a log line: '2018/07/25-11:25:45.782710'
@@ -90,18 +104,124 @@ class Log:
         )
 
 
-class DatabaseLogs(DataSource):
+class LogFollower:
+    """
+    Incrementally reads Log objects from a live Rocksdb LOG and its rotated
+    'LOG.old.<micros>' files. The read offset of every file is remembered
+    between calls to read_new_logs(), so each call only parses the bytes that
+    were appended since the previous call. Files are tracked by inode, so a
+    LOG that is renamed to LOG.old.* on rotation keeps its offset.
+    """
+
     def __init__(self, logs_path_prefix, column_families):
+        self.logs_path_prefix = logs_path_prefix
+        self.column_families = column_families
+        # Dict[(st_dev, st_ino), offset of the first unread byte]
+        self.file_offsets = {}
+        # Dict[(st_dev, st_ino), Log]: the last log read from a file; it is
+        # held back because its continuation lines may not be written yet
+        self.pending_logs = {}
+        # Dict[(st_dev, st_ino), number of lines read]
+        self.line_counts = {}
+
+    @staticmethod
+    def is_rotated_log(file_name):
+        return re.search("old", file_name, re.IGNORECASE) is not None
+
+    def get_log_files(self):
+        # Returns the (file_name, stat) pairs of all the LOG files, oldest
+        # first, so that the logs are emitted in the order they were written.
+        log_files = []
+        for file_name in glob.glob(self.logs_path_prefix + "*"):
+            try:
+                log_files.append((file_name, os.stat(file_name)))
+            except FileNotFoundError:
+                # the file was rotated away or deleted after the glob
+                continue
+        log_files.sort(key=lambda pair: (pair[1].st_mtime, pair[0]))
+        return log_files
+
+    def read_new_logs(self, flush=False):
+        # Returns List[Log] of the logs that were completely written since the
+        # last call. If 'flush' is True, the last log of every file is also
+        # returned, even if more continuation lines might follow.
+        new_logs = []
+        seen_files = set()
+        for file_name, file_stat in self.get_log_files():
+            file_id = (file_stat.st_dev, file_stat.st_ino)
+            seen_files.add(file_id)
+            offset = self.file_offsets.get(file_id, 0)
+            if file_stat.st_size < offset:
+                # the file was truncated, start reading it from the beginning
+                offset = 0
+                self.pending_logs.pop(file_id, None)
+                self.line_counts.pop(file_id, None)
+            new_log = self.pending_logs.pop(file_id, None)
+            line_count = self.line_counts.get(file_id, 0)
+            with open(file_name) as db_logs:
+                db_logs.seek(offset)
+                while True:
+                    line = db_logs.readline()
+                    if not line.endswith("\n"):
+                        # a partially written line is read again next time
+                        break
+                    offset = db_logs.tell()
+                    line_count += 1
+                    if Log.is_new_log(line):
+                        if new_log:
+                            new_logs.append(new_log)
+                        new_log = Log(line, self.column_families)
+                        new_log.set_source(file_name, line_count)
+                    elif new_log:
+                        # To account for logs split into multiple lines
+                        new_log.append_message(line)
+            self.file_offsets[file_id] = offset
+            self.line_counts[file_id] = line_count
+            if new_log:
+                # A rotated file is never appended to again, so its last log
+                # is complete.
+                if flush or self.is_rotated_log(file_name):
+                    new_logs.append(new_log)
+                else:
+                    self.pending_logs[file_id] = new_log
+        # forget the files that have been deleted
+        for file_id in list(self.file_offsets.keys()):
+            if file_id not in seen_files:
+                self.file_offsets.pop(file_id)
+                self.pending_logs.pop(file_id, None)
+                self.line_counts.pop(file_id, None)
+        return new_logs
+
+
+class DatabaseLogs(DataSource):
+    def __init__(self, logs_path_prefix, column_families, follow=False):
         super().__init__(DataSource.Type.LOG)
         self.logs_path_prefix = logs_path_prefix
         self.column_families = column_families
+        # In follow mode, every call to check_and_trigger_conditions() only
+        # parses the logs appended since the previous call, and the triggers
+        # of the conditions accumulate across calls.
+        self.log_follower = None
+        if follow:
+            self.log_follower = LogFollower(logs_path_prefix, column_families)
 
     def trigger_conditions_for_log(self, conditions, log):
         # For a LogCondition object, trigger is:
         # Dict[column_family_name, List[Log]]. This explains why the condition
         # was triggered and for which column families.
         for cond in conditions:
-            if re.search(cond.regex, log.get_message(), re.IGNORECASE):
+            if self.profile:
+                start = self.profile.now()
+                matched = re.search(cond.regex, log.get_message(), re.IGNORECASE)
+                self.profile.record(
+                    cond.name,
+                    self.profile.now() - start,
+                    records=1,
+                    num_bytes=len(log.get_message()),
+                )
+            else:
+                matched = re.search(cond.regex, log.get_message(), re.IGNORECASE)
+            if matched:
                 trigger = cond.get_trigger()
                 if not trigger:
                     trigger = {}
@@ -111,6 +231,10 @@ class DatabaseLogs(DataSource):
                 cond.set_trigger(trigger)
 
     def check_and_trigger_conditions(self, conditions):
+        if self.log_follower:
+            for log in self.log_follower.read_new_logs():
+                self.trigger_conditions_for_log(conditions, log)
+            return
         for file_name in glob.glob(self.logs_path_prefix + "*"):
             # TODO(poojam23): find a way to distinguish between log files
             # - generated in the current experiment but are labeled 'old'
@@ -121,11 +245,12 @@ class DatabaseLogs(DataSource):
                 continue
             with open(file_name) as db_logs:
                 new_log = None
-                for line in db_logs:
+                for line_number, line in enumerate(db_logs, 1):
                     if Log.is_new_log(line):
                         if new_log:
                             self.trigger_conditions_for_log(conditions, new_log)
                         new_log = Log(line, self.column_families)
+                        new_log.set_source(file_name, line_number)
                     else:
                         # To account for logs split into multiple lines
                         new_log.append_message(line)
@@ -0,0 +1,202 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import re
+
+
+# The metrics in the metric vector returned by
+# BenchmarkRunner.run_experiment(..., metric_vector=True); a runner may leave
+# out the metrics it cannot measure.
+THROUGHPUT = "throughput"  # ops/sec
+P99 = "p99"  # micros
+P999 = "p99.9"  # micros
+PEAK_RSS = "peak_rss"  # bytes
+WRITE_AMP = "write_amp"
+MEMTABLE_MEMORY = "memtable_memory"  # bytes, derived from the options
+
+# the metrics that are better when larger, all the others are better when
+# smaller
+MAXIMIZED_METRICS = {THROUGHPUT}
+
+# the metrics that db_bench prints only at the end of a benchmark, so they are
+# missing from the metric vectors of the experiments stopped early
+LATENCY_METRICS = {P99, P999}
+
+
+class Constraint:
+    """
+    A bound on a metric of the metric vector, given as a string such as
+    'p99 < 300us' or 'memtable_memory <= 1GB'. Latency thresholds can have the
+    units us, ms or s (converted to micros) and memory thresholds can have the
+    units K, M, G or T (with an optional B, converted to bytes).
+    """
+
+    CONSTRAINT_REGEX = re.compile(
+        r"^\s*([a-zA-Z_][a-zA-Z0-9_.]*)\s*(<=|>=|<|>)\s*([0-9.eE+-]+)\s*([a-zA-Z]*)\s*$"
+    )
+    UNITS = {
+        "": 1,
+        "us": 1,
+        "ms": 1e3,
+        "s": 1e6,
+        "k": 1 << 10,
+        "kb": 1 << 10,
+        "m": 1 << 20,
+        "mb": 1 << 20,
+        "g": 1 << 30,
+        "gb": 1 << 30,
+        "t": 1 << 40,
+        "tb": 1 << 40,
+        "b": 1,
+    }
+
+    @classmethod
+    def parse_all(cls, constraints_str):
+        # example: 'p99 < 300us and memtable_memory < 1GB'
+        if not constraints_str:
+            return []
+        return [
+            cls.parse(constraint_str)
+            for constraint_str in re.split(r"\band\b|,", constraints_str)
+            if constraint_str.strip()
+        ]
+
+    @classmethod
+    def parse(cls, constraint_str):
+        match = cls.CONSTRAINT_REGEX.match(constraint_str)
+        if not match or match.group(4).lower() not in cls.UNITS:
+            raise ValueError("Constraint: invalid constraint: " + constraint_str)
+        metric, operator, threshold, unit = match.groups()
+        return cls(metric, operator, float(threshold) * cls.UNITS[unit.lower()])
+
+    def __init__(self, metric, operator, threshold):
+        self.metric = metric
+        self.operator = operator
+        self.threshold = threshold
+
+    def get_violation(self, metrics):
+        # returns how far the metric is from satisfying the constraint,
+        # relative to the threshold; 0 if it is satisfied. A metric that was
+        # not measured violates the constraint.
+        value = metrics.get(self.metric)
+        if value is None:
+            return float("inf")
+        if self.operator == "<" and value < self.threshold:
+            return 0.0
+        if self.operator == "<=" and value <= self.threshold:
+            return 0.0
+        if self.operator == ">" and value > self.threshold:
+            return 0.0
+        if self.operator == ">=" and value >= self.threshold:
+            return 0.0
+        return abs(value - self.threshold) / (abs(self.threshold) or 1.0)
+
+    def __repr__(self):
+        return self.metric + " " + self.operator + " " + str(self.threshold)
+
+
+class ParetoFront:
+    """
+    The set of configurations whose metric vectors are not dominated by any
+    other benchmarked configuration over the 'objectives' (a list of metric
+    names; larger is better for THROUGHPUT, smaller for the rest). Only the
+    configurations that satisfy all the 'constraints' are kept in the front.
+    The recommended configuration is the one in the front that is best in
+    the first objective.
+    """
+
+    # the violation of the constraints beyond which the penalty of
+    # get_penalized_value() stops growing, so that the metric vectors that
+    # miss a constrained metric (an infinite violation) get a finite value
+    MAX_PENALTY = 1.0
+
+    def __init__(self, objectives, constraints=None):
+        self.objectives = objectives
+        self.constraints = constraints or []
+        # List[Tuple(metrics, config)]
+        self.front = []
+
+    def get_violation(self, metrics):
+        return sum(constraint.get_violation(metrics) for constraint in self.constraints)
+
+    def get_metrics(self):
+        # the names of all the metrics the objectives and constraints are on
+        metrics = set(self.objectives)
+        metrics.update(constraint.metric for constraint in self.constraints)
+        return metrics
+
+    def is_feasible(self, metrics):
+        return self.get_violation(metrics) == 0
+
+    def get_value(self, metrics, objective):
+        # the value of the objective to be maximized
+        value = metrics.get(objective)
+        if value is None:
+            return float("-inf")
+        return value if objective in MAXIMIZED_METRICS else -value
+
+    def get_penalized_value(self, metrics):
+        # a scalarization of the metric vector for the optimizers that search
+        # on a single value: the value of the first objective (to be
+        # maximized), decreased by its magnitude times the violation of the
+        # constraints, so that an infeasible configuration scores lower than
+        # a feasible one with the same first objective
+        value = self.get_value(metrics, self.objectives[0])
+        penalty = min(self.get_violation(metrics), self.MAX_PENALTY)
+        return value - abs(value) * penalty
+
+    def dominates(self, metrics1, metrics2):
+        # True if metrics1 is at least as good as metrics2 in all the
+        # objectives and strictly better in at least one of them
+        strictly_better = False
+        for objective in self.objectives:
+            value1 = self.get_value(metrics1, objective)
+            value2 = self.get_value(metrics2, objective)
+            if value1 < value2:
+                return False
+            if value1 > value2:
+                strictly_better = True
+        return strictly_better
+
+    def is_better(self, new_metrics, old_metrics):
+        # Used by the optimizer to decide whether to keep a new
+        # configuration: a feasible configuration beats an infeasible one,
+        # of two infeasible ones the one closer to the constraints wins and of
+        # two feasible ones the new one is kept unless the old one dominates it
+        new_violation = self.get_violation(new_metrics)
+        old_violation = self.get_violation(old_metrics)
+        if new_violation or old_violation:
+            return new_violation < old_violation
+        return not self.dominates(old_metrics, new_metrics)
+
+    def add(self, metrics, config):
+        # returns True if the configuration was added to the front
+        if not self.is_feasible(metrics):
+            return False
+        for front_metrics, _ in self.front:
+            if self.dominates(front_metrics, metrics):
+                return False
+        self.front = [
+            (front_metrics, front_config)
+            for front_metrics, front_config in self.front
+            if not self.dominates(metrics, front_metrics)
+        ]
+        self.front.append((metrics, config))
+        return True
+
+    def get_front(self):
+        return self.front
+
+    def get_recommended(self):
+        # returns (metrics, config) of the recommended configuration, or None
+        # if no benchmarked configuration satisfies the constraints
+        if not self.front:
+            return None
+        return max(
+            self.front,
+            key=lambda entry: tuple(
+                self.get_value(entry[0], objective) for objective in self.objectives
+            ),
+        )
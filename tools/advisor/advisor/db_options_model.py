@@ -0,0 +1,205 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import re
+from enum import Enum
+
+
+class OptionSpec:
+    """
+    The type, unit and valid range of a Rocksdb option. It parses the string
+    values read from OPTIONS files (and the values suggested by the rules)
+    into typed values, checks them and gives them a canonical string form,
+    so that equal configurations compare and hash equal regardless of how
+    their values were written, eg. '64M', '67108864' and 67108864.
+    """
+
+    class Type(Enum):
+        int = 1
+        size = 2  # an int number of bytes, may be given with a K/M/G/T suffix
+        double = 3
+        bool = 4
+        enum = 5
+        string = 6
+
+    SIZE_REGEX = re.compile(r"^(-?\d+)\s*([kmgt]?)b?$", re.IGNORECASE)
+    SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+    def __init__(
+        self, opt_type, min_value=None, max_value=None, choices=None, unit=None
+    ):
+        self.type = opt_type
+        self.min_value = min_value
+        self.max_value = max_value
+        # the allowed values of an enum option
+        self.choices = choices
+        self.unit = unit
+
+    def parse(self, value):
+        # raises ValueError if 'value' cannot be converted to the option type
+        if self.type is OptionSpec.Type.string:
+            return value
+        if isinstance(value, str):
+            value = value.strip()
+        if self.type is OptionSpec.Type.bool:
+            if isinstance(value, bool):
+                return value
+            if str(value).lower() in ("true", "1"):
+                return True
+            if str(value).lower() in ("false", "0"):
+                return False
+            raise ValueError("not a bool: " + str(value))
+        if self.type is OptionSpec.Type.enum:
+            return str(value)
+        if self.type is OptionSpec.Type.double:
+            return float(value)
+        if self.type is OptionSpec.Type.size and isinstance(value, str):
+            match = self.SIZE_REGEX.match(value)
+            if match:
+                return int(match.group(1)) * self.SIZE_UNITS[match.group(2).lower()]
+        # an int; values computed by the optimizer may be floats. A double
+        # cannot hold all the 64-bit values, so only the strings that are not
+        # ints, eg. '1e6', are parsed as floats
+        if isinstance(value, float):
+            return int(value)
+        try:
+            return int(value)
+        except ValueError:
+            return int(float(value))
+
+    def check(self, value):
+        # returns None if the typed 'value' is valid, else the reason why not
+        if self.choices is not None and value not in self.choices:
+            return "not one of " + str(self.choices)
+        if self.min_value is not None and value < self.min_value:
+            return "less than " + str(self.min_value)
+        if self.max_value is not None and value > self.max_value:
+            return "greater than " + str(self.max_value)
+        return None
+
+    def clamp(self, value):
+        # returns the valid value closest to the typed 'value'
+        if self.min_value is not None and value < self.min_value:
+            return self.min_value
+        if self.max_value is not None and value > self.max_value:
+            return self.max_value
+        return value
+
+    def to_string(self, value):
+        # the canonical string form of a typed value, as written in OPTIONS
+        if self.type is OptionSpec.Type.bool:
+            return "true" if value else "false"
+        if self.type is OptionSpec.Type.double:
+            return "%f" % value
+        return str(value)
+
+
+INT32_MAX = (1 << 31) - 1
+UINT64_MAX = (1 << 64) - 1
+
+# The specs of the options tuned by the rules; the other options are
+# considered strings. Keys are the names used in the rules spec and in
+# DatabaseOptions.get_options(): '<section_type>.<option_name>', or just
+# '<option_name>' for the misc options.
+OPTION_SPECS = {
+    "DBOptions.max_background_jobs": OptionSpec(OptionSpec.Type.int, 1, 256),
+    "DBOptions.max_background_compactions": OptionSpec(OptionSpec.Type.int, -1, 256),
+    "DBOptions.max_background_flushes": OptionSpec(OptionSpec.Type.int, -1, 256),
+    "DBOptions.max_subcompactions": OptionSpec(OptionSpec.Type.int, 1, 256),
+    "DBOptions.bytes_per_sync": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"
+    ),
+    "DBOptions.wal_bytes_per_sync": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"
+    ),
+    "DBOptions.db_write_buffer_size": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"
+    ),
+    "DBOptions.stats_dump_period_sec": OptionSpec(
+        OptionSpec.Type.int, 0, INT32_MAX, unit="seconds"
+    ),
+    "DBOptions.manual_wal_flush": OptionSpec(OptionSpec.Type.bool),
+    "DBOptions.allow_ingest_behind": OptionSpec(OptionSpec.Type.bool),
+    "DBOptions.use_fsync": OptionSpec(OptionSpec.Type.bool),
+    "CFOptions.write_buffer_size": OptionSpec(
+        OptionSpec.Type.size, 64 << 10, UINT64_MAX, unit="bytes"
+    ),
+    "CFOptions.max_write_buffer_number": OptionSpec(OptionSpec.Type.int, 2, INT32_MAX),
+    "CFOptions.min_write_buffer_number_to_merge": OptionSpec(
+        OptionSpec.Type.int, 1, INT32_MAX
+    ),
+    "CFOptions.level0_file_num_compaction_trigger": OptionSpec(
+        OptionSpec.Type.int, 1, INT32_MAX
+    ),
+    "CFOptions.level0_slowdown_writes_trigger": OptionSpec(
+        OptionSpec.Type.int, 0, INT32_MAX
+    ),
+    "CFOptions.level0_stop_writes_trigger": OptionSpec(
+        OptionSpec.Type.int, 0, INT32_MAX
+    ),
+    "CFOptions.max_bytes_for_level_base": OptionSpec(
+        OptionSpec.Type.size, 1, UINT64_MAX, unit="bytes"
+    ),
+    "CFOptions.max_bytes_for_level_multiplier": OptionSpec(OptionSpec.Type.double, 1.0),
+    "CFOptions.soft_pending_compaction_bytes_limit": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"
+    ),
+    "CFOptions.hard_pending_compaction_bytes_limit": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"
+    ),
+    "CFOptions.num_levels": OptionSpec(OptionSpec.Type.int, 1, 100),
+    "CFOptions.ttl": OptionSpec(OptionSpec.Type.int, 0, UINT64_MAX, unit="seconds"),
+    "CFOptions.compaction_style": OptionSpec(
+        OptionSpec.Type.enum,
+        choices=[
+            "kCompactionStyleLevel",
+            "kCompactionStyleUniversal",
+            "kCompactionStyleFIFO",
+            "kCompactionStyleNone",
+        ],
+    ),
+    "CFOptions.compression": OptionSpec(
+        OptionSpec.Type.enum,
+        choices=[
+            "kNoCompression",
+            "kSnappyCompression",
+            "kZlibCompression",
+            "kBZip2Compression",
+            "kLZ4Compression",
+            "kLZ4HCCompression",
+            "kXpressCompression",
+            "kZSTD",
+            "kDisableCompressionOption",
+        ],
+    ),
+    "TableOptions.BlockBasedTable.block_size": OptionSpec(
+        OptionSpec.Type.size, 1, INT32_MAX, unit="bytes"
+    ),
+    "TableOptions.BlockBasedTable.block_restart_interval": OptionSpec(
+        OptionSpec.Type.int, 1, INT32_MAX
+    ),
+    "TableOptions.BlockBasedTable.block_align": OptionSpec(OptionSpec.Type.bool),
+    "TableOptions.BlockBasedTable.index_type": OptionSpec(
+        OptionSpec.Type.enum,
+        choices=[
+            "kBinarySearch",
+            "kHashSearch",
+            "kTwoLevelIndexSearch",
+            "kBinarySearchWithFirstKey",
+        ],
+    ),
+    "bloom_bits": OptionSpec(OptionSpec.Type.int, 0, 64),
+    "cache_size": OptionSpec(OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes"),
+    "rate_limiter_bytes_per_sec": OptionSpec(
+        OptionSpec.Type.size, 0, UINT64_MAX, unit="bytes/sec"
+    ),
+}
+
+STRING_SPEC = OptionSpec(OptionSpec.Type.string)
+
+
+def get_option_spec(option):
+    # returns the spec of the option named '<section_type>.<option_name>'
+    return OPTION_SPECS.get(option, STRING_SPEC)
@@ -4,9 +4,11 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import copy
+import hashlib
 import os
 
 from advisor.db_log_parser import DataSource, NO_COL_FAMILY
+from advisor.db_options_model import get_option_spec
 from advisor.ini_parser import IniParser
 
 
@@ -85,46 +87,101 @@ class DatabaseOptions(DataSource):
         # Dict[option, Dict[col_fam, Tuple(old_value, new_value)]]
         # note: diff should contain a tuple of values only if they are
         # different from each other
-        options_union = set(opt_old.keys()).union(set(opt_new.keys()))
         diff = {}
-        for opt in options_union:
-            diff[opt] = {}
-            # if option in options_union, then it must be in one of the configs
-            if opt not in opt_old:
-                for col_fam in opt_new[opt]:
-                    diff[opt][col_fam] = (None, opt_new[opt][col_fam])
-            elif opt not in opt_new:
-                for col_fam in opt_old[opt]:
-                    diff[opt][col_fam] = (opt_old[opt][col_fam], None)
-            else:
-                for col_fam in opt_old[opt]:
-                    if col_fam in opt_new[opt]:
-                        if opt_old[opt][col_fam] != opt_new[opt][col_fam]:
-                            diff[opt][col_fam] = (
-                                opt_old[opt][col_fam],
-                                opt_new[opt][col_fam],
-                            )
-                    else:
-                        diff[opt][col_fam] = (opt_old[opt][col_fam], None)
-                for col_fam in opt_new[opt]:
-                    if col_fam in opt_old[opt]:
-                        if opt_old[opt][col_fam] != opt_new[opt][col_fam]:
-                            diff[opt][col_fam] = (
-                                opt_old[opt][col_fam],
-                                opt_new[opt][col_fam],
-                            )
-                    else:
-                        diff[opt][col_fam] = (None, opt_new[opt][col_fam])
-            if not diff[opt]:
-                diff.pop(opt)
+        for opt in opt_old.keys() | opt_new.keys():
+            old_values = opt_old.get(opt, {})
+            new_values = opt_new.get(opt, {})
+            if old_values == new_values:
+                continue
+            opt_diff = {
+                col_fam: (old_values.get(col_fam), new_values.get(col_fam))
+                for col_fam in old_values.keys() | new_values.keys()
+                if old_values.get(col_fam) != new_values.get(col_fam)
+                or (col_fam in old_values) != (col_fam in new_values)
+            }
+            if opt_diff:
+                diff[opt] = opt_diff
         return diff
 
+    @staticmethod
+    def get_typed_value(option, value):
+        # converts the value of 'option' to its type as per its OptionSpec;
+        # raises ValueError if the value is not valid for the option
+        spec = get_option_spec(option)
+        typed_value = spec.parse(value)
+        reason = spec.check(typed_value)
+        if reason:
+            raise ValueError(option + ": " + str(value) + " is " + reason)
+        return typed_value
+
+    @staticmethod
+    def get_canonical_value(option, value):
+        # the canonical string form of the value of 'option'; values that
+        # cannot be parsed are left as they are
+        spec = get_option_spec(option)
+        try:
+            return spec.to_string(spec.parse(value))
+        except (TypeError, ValueError):
+            return str(value)
+
+    @staticmethod
+    def sanitize_options(options):
+        # type: Dict[option, Dict[col_fam, value]] ->
+        # Dict[option, Dict[col_fam, value]]
+        # returns a copy of 'options' in which the numeric values that are
+        # out of range are clamped to the range of the option and the values
+        # that cannot be parsed are dropped, so that suggestions never
+        # produce an invalid configuration
+        sanitized = {}
+        for option in options:
+            spec = get_option_spec(option)
+            for col_fam, value in options[option].items():
+                try:
+                    typed_value = spec.parse(value)
+                    if spec.choices is None:
+                        typed_value = spec.clamp(typed_value)
+                    reason = spec.check(typed_value)
+                except (TypeError, ValueError) as e:
+                    reason = str(e)
+                if reason:
+                    print(
+                        "WARNING(DatabaseOptions.sanitize_options): dropping "
+                        + "value "
+                        + str(value)
+                        + " of option "
+                        + option
+                        + ": "
+                        + reason
+                    )
+                    continue
+                if option not in sanitized:
+                    sanitized[option] = {}
+                if spec.type in (spec.Type.int, spec.Type.size):
+                    # eg. the floats computed by the optimizers are written
+                    # as ints
+                    keep_value = str(value) == str(typed_value)
+                else:
+                    keep_value = (
+                        spec.type is spec.Type.string
+                        or typed_value == spec.parse(value)
+                    )
+                if keep_value:
+                    sanitized[option][col_fam] = value
+                else:
+                    sanitized[option][col_fam] = typed_value
+        return sanitized
+
     def __init__(self, rocksdb_options, misc_options=None):
         super().__init__(DataSource.Type.DB_OPTIONS)
         # The options are stored in the following data structure:
         # Dict[section_type, Dict[section_name, Dict[option_name, value]]]
         self.options_dict = None
+        # An index of the same options by their fully qualified name:
+        # Dict[<section_type>.<option_name>, Dict[section_name, value]]
+        self.options_index = None
         self.column_families = None
+        # cached by get_canonical_hash(), reset whenever the options change
+        self.canonical_hash = None
         # Load the options from the given file to a dictionary.
         self.load_from_source(rocksdb_options)
         # Setup the miscellaneous options expected to be List[str], where each
@@ -143,6 +200,8 @@ class DatabaseOptions(DataSource):
 
     def load_from_source(self, options_path):
         self.options_dict = {}
+        self.options_index = {}
+        self.canonical_hash = None
         with open(options_path) as db_options:
             for line in db_options:
                 line = OptionsSpecParser.remove_trailing_comment(line)
@@ -168,6 +227,7 @@ class DatabaseOptions(DataSource):
                 elif OptionsSpecParser.is_new_option(line):
                     key, value = OptionsSpecParser.get_key_value_pair(line)
                     self.options_dict[curr_sec_type][curr_sec_name][key] = value
+                    self.index_option(curr_sec_type, curr_sec_name, key, value)
                 else:
                     error = "Not able to parse line in Options file."
                     OptionsSpecParser.exit_with_parse_error(line, error)
@@ -180,17 +240,16 @@ class DatabaseOptions(DataSource):
     def get_column_families(self):
         return self.column_families
 
+    def index_option(self, sec_type, col_fam, opt_name, value):
+        option = sec_type + "." + opt_name
+        if option not in self.options_index:
+            self.options_index[option] = {}
+        self.options_index[option][col_fam] = value
+
     def get_all_options(self):
         # This method returns all the options that are stored in this object as
         # a: Dict[<sec_type>.<option_name>: Dict[col_fam, option_value]]
-        all_options = []
-        # Example: in the section header '[CFOptions "default"]' read from the
-        # OPTIONS file, sec_type='CFOptions'
-        for sec_type in self.options_dict:
-            for col_fam in self.options_dict[sec_type]:
-                for opt_name in self.options_dict[sec_type][col_fam]:
-                    option = sec_type + "." + opt_name
-                    all_options.append(option)
+        all_options = list(self.options_index.keys())
         all_options.extend(list(self.misc_options.keys()))
         return self.get_options(all_options)
 
@@ -205,31 +264,45 @@ class DatabaseOptions(DataSource):
                 # be fetched from the misc_options dictionary
                 if option not in self.misc_options:
                     continue
-                if option not in reqd_options_dict:
-                    reqd_options_dict[option] = {}
-                reqd_options_dict[option][NO_COL_FAMILY] = self.misc_options[option]
-            else:
+                reqd_options_dict[option] = {NO_COL_FAMILY: self.misc_options[option]}
+            elif option in self.options_index:
                 # Example: option = 'TableOptions.BlockBasedTable.block_align'
-                # then, sec_type = 'TableOptions.BlockBasedTable'
-                sec_type = ".".join(option.split(".")[:-1])
-                # opt_name = 'block_align'
-                opt_name = option.split(".")[-1]
-                if sec_type not in self.options_dict:
-                    continue
-                for col_fam in self.options_dict[sec_type]:
-                    if opt_name in self.options_dict[sec_type][col_fam]:
-                        if option not in reqd_options_dict:
-                            reqd_options_dict[option] = {}
-                        reqd_options_dict[option][col_fam] = self.options_dict[
-                            sec_type
-                        ][col_fam][opt_name]
+                reqd_options_dict[option] = dict(self.options_index[option])
+        return reqd_options_dict
+
+    def get_typed_options(self, reqd_options):
+        # same as get_options() but the values are converted to the types of
+        # the options (refer db_options_model.py); raises ValueError if a
+        # value is not valid
+        reqd_options_dict = self.get_options(reqd_options)
+        for option, values in reqd_options_dict.items():
+            for col_fam in values:
+                values[col_fam] = DatabaseOptions.get_typed_value(
+                    option, values[col_fam]
+                )
         return reqd_options_dict
 
+    def get_canonical_hash(self):
+        # A hash of all the options in their canonical form: two
+        # configurations have the same hash iff they set the same options to
+        # the same values, irrespective of the order of the sections and
+        # options and of how the values are written.
+        if self.canonical_hash is None:
+            items = []
+            for option, values in self.get_all_options().items():
+                for col_fam, value in values.items():
+                    canonical_value = DatabaseOptions.get_canonical_value(option, value)
+                    items.append(option + "|" + col_fam + "|" + canonical_value)
+            items.sort()
+            self.canonical_hash = hashlib.sha1("\n".join(items).encode()).hexdigest()
+        return self.canonical_hash
+
     def update_options(self, options):
         # An example 'options' object looks like:
         # {'DBOptions.max_background_jobs': {NO_COL_FAMILY: 2},
         # 'CFOptions.write_buffer_size': {'default': 1048576, 'cf_A': 128000},
         # 'bloom_bits': {NO_COL_FAMILY: 4}}
+        self.canonical_hash = None
         for option in options:
             if DatabaseOptions.is_misc_option(option):
                 # this is a misc_option i.e. an option that is not yet
@@ -259,9 +332,9 @@ class DatabaseOptions(DataSource):
                     # value
                     if col_fam not in self.options_dict[sec_name]:
                         self.options_dict[sec_name][col_fam] = {}
-                    self.options_dict[sec_name][col_fam][opt_name] = copy.deepcopy(
-                        options[option][col_fam]
-                    )
+                    value = copy.deepcopy(options[option][col_fam])
+                    self.options_dict[sec_name][col_fam][opt_name] = value
+                    self.index_option(sec_name, col_fam, opt_name, value)
 
     def generate_options_config(self, nonce):
         # this method generates a Rocksdb OPTIONS file in the INI format from
@@ -283,66 +356,76 @@ class DatabaseOptions(DataSource):
 
     def check_and_trigger_conditions(self, conditions):
         for cond in conditions:
-            reqd_options_dict = self.get_options(cond.options)
-            # This contains the indices of options that are specific to some
-            # column family and are not database-wide options.
-            incomplete_option_ix = []
-            options = []
-            missing_reqd_option = False
-            for ix, option in enumerate(cond.options):
-                if option not in reqd_options_dict:
-                    print(
-                        "WARNING(DatabaseOptions.check_and_trigger): "
-                        + "skipping condition "
-                        + cond.name
-                        + " because it "
-                        "requires option "
-                        + option
-                        + " but this option is"
-                        + " not available"
-                    )
-                    missing_reqd_option = True
-                    break  # required option is absent
-                if NO_COL_FAMILY in reqd_options_dict[option]:
-                    options.append(reqd_options_dict[option][NO_COL_FAMILY])
-                else:
-                    options.append(None)
-                    incomplete_option_ix.append(ix)
-
-            if missing_reqd_option:
+            if not self.profile:
+                self.trigger_condition(cond)
                 continue
+            start = self.profile.now()
+            self.trigger_condition(cond)
+            self.profile.record(
+                cond.name, self.profile.now() - start, records=len(cond.options)
+            )
+
+    def trigger_condition(self, cond):
+        reqd_options_dict = self.get_options(cond.options)
+        # This contains the indices of options that are specific to some
+        # column family and are not database-wide options.
+        incomplete_option_ix = []
+        options = []
+        missing_reqd_option = False
+        for ix, option in enumerate(cond.options):
+            if option not in reqd_options_dict:
+                print(
+                    "WARNING(DatabaseOptions.check_and_trigger): "
+                    + "skipping condition "
+                    + cond.name
+                    + " because it "
+                    "requires option "
+                    + option
+                    + " but this option is"
+                    + " not available"
+                )
+                missing_reqd_option = True
+                break  # required option is absent
+            if NO_COL_FAMILY in reqd_options_dict[option]:
+                options.append(reqd_options_dict[option][NO_COL_FAMILY])
+            else:
+                options.append(None)
+                incomplete_option_ix.append(ix)
 
-            # if all the options are database-wide options
-            if not incomplete_option_ix:
+        if missing_reqd_option:
+            return
+
+        # if all the options are database-wide options
+        if not incomplete_option_ix:
+            try:
+                if eval(cond.eval_expr):
+                    cond.set_trigger({NO_COL_FAMILY: options})
+            except Exception as e:
+                print("WARNING(DatabaseOptions) check_and_trigger:" + str(e))
+            return
+
+        # for all the options that are not database-wide, we look for their
+        # values specific to column families
+        col_fam_options_dict = {}
+        for col_fam in self.column_families:
+            present = True
+            for ix in incomplete_option_ix:
+                option = cond.options[ix]
+                if col_fam not in reqd_options_dict[option]:
+                    present = False
+                    break
+                options[ix] = reqd_options_dict[option][col_fam]
+            if present:
                 try:
                     if eval(cond.eval_expr):
-                        cond.set_trigger({NO_COL_FAMILY: options})
+                        col_fam_options_dict[col_fam] = copy.deepcopy(options)
                 except Exception as e:
-                    print("WARNING(DatabaseOptions) check_and_trigger:" + str(e))
-                continue
-
-            # for all the options that are not database-wide, we look for their
-            # values specific to column families
-            col_fam_options_dict = {}
-            for col_fam in self.column_families:
-                present = True
-                for ix in incomplete_option_ix:
-                    option = cond.options[ix]
-                    if col_fam not in reqd_options_dict[option]:
-                        present = False
-                        break
-                    options[ix] = reqd_options_dict[option][col_fam]
-                if present:
-                    try:
-                        if eval(cond.eval_expr):
-                            col_fam_options_dict[col_fam] = copy.deepcopy(options)
-                    except Exception as e:
-                        print("WARNING(DatabaseOptions) check_and_trigger: " + str(e))
-            # Trigger for an OptionCondition object is of the form:
-            # Dict[col_fam_name: List[option_value]]
-            # where col_fam_name is the name of a column family for which
-            # 'eval_expr' evaluated to True and List[option_value] is the list
-            # of values of the options specified in the condition's 'options'
-            # field
-            if col_fam_options_dict:
-                cond.set_trigger(col_fam_options_dict)
+                    print("WARNING(DatabaseOptions) check_and_trigger: " + str(e))
+        # Trigger for an OptionCondition object is of the form:
+        # Dict[col_fam_name: List[option_value]]
+        # where col_fam_name is the name of a column family for which
+        # 'eval_expr' evaluated to True and List[option_value] is the list
+        # of values of the options specified in the condition's 'options'
+        # field
+        if col_fam_options_dict:
+            cond.set_trigger(col_fam_options_dict)
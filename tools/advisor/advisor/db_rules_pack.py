@@ -0,0 +1,310 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import math
+import os
+import re
+
+from advisor.rule_parser import Suggestion
+
+
+# The workload features the experiments are keyed by
+VALUE_SIZE = "value_size"  # bytes
+NUM_CORES = "num_cores"
+WRITE_RATE = "write_rate"  # bytes/sec, 0 if the writes were not throttled
+WORKLOAD_FEATURES = (VALUE_SIZE, NUM_CORES, WRITE_RATE)
+
+
+class Experiment:
+    """
+    One db_bench run of the write buffer experiments: the options it was run
+    with, as a Dict[option, int], the features of its workload and its write
+    throughput in ops/sec.
+    """
+
+    def __init__(self, name, options, workload, throughput):
+        self.name = name
+        self.options = options
+        self.workload = workload
+        self.throughput = throughput
+
+    def get_workload_key(self):
+        return tuple(self.workload.get(feature) for feature in WORKLOAD_FEATURES)
+
+    def __repr__(self):
+        return (
+            "Experiment: "
+            + self.name
+            + " options: "
+            + str(self.options)
+            + " workload: "
+            + str(self.workload)
+            + " throughput: "
+            + str(self.throughput)
+        )
+
+
+class ExperimentResults:
+    """
+    Reads the results store written by write_buffer_experiment/
+    run_experiments.sh: the options of every experiment are logged to
+    experiment.log (after a line ending with the experiment's name) and the
+    db_bench output of the experiment is in <name>_result.txt, from which the
+    workload features and the fillrandom throughput are parsed. The options
+    are all column family options.
+    """
+
+    LOG_FILE = "experiment.log"
+    RESULT_SUFFIX = "_result.txt"
+    OPTION_SECTION = "CFOptions."
+    OPTION_REGEX = re.compile(r"-\s+(\w+):\s+(\d+)(MB)?\s*$")
+    THROUGHPUT_REGEX = re.compile(r"^fillrandom\s*:.*?([0-9.]+) ops/sec")
+    WORKLOAD_REGEXES = {
+        VALUE_SIZE: re.compile(r"^Values:\s+(\d+) bytes each"),
+        NUM_CORES: re.compile(r"^CPU:\s+(\d+) \*"),
+        WRITE_RATE: re.compile(r"^Write rate:\s+(\d+) bytes/second"),
+    }
+
+    @staticmethod
+    def parse_result_file(file_path):
+        # returns the workload features and the write throughput of a db_bench
+        # output file; the features of the first (write) benchmark are kept
+        workload = {}
+        throughput = None
+        with open(file_path) as result_file:
+            for line in result_file:
+                for feature, regex in ExperimentResults.WORKLOAD_REGEXES.items():
+                    match = regex.match(line)
+                    if match and feature not in workload:
+                        workload[feature] = int(match.group(1))
+                match = ExperimentResults.THROUGHPUT_REGEX.match(line)
+                if match and throughput is None:
+                    throughput = float(match.group(1))
+        return workload, throughput
+
+    @staticmethod
+    def parse_experiment_log(file_path, names):
+        # returns Dict[experiment name, Dict[option, value]] for the given
+        # experiment names
+        options = {}
+        curr_options = None
+        with open(file_path) as log_file:
+            for line in log_file:
+                line = line.rstrip()
+                tokens = line.split()
+                if tokens and tokens[-1] in names:
+                    # the experiment's options are logged once, after the
+                    # first line about it
+                    curr_options = None
+                    if tokens[-1] not in options:
+                        curr_options = options[tokens[-1]] = {}
+                    continue
+                match = ExperimentResults.OPTION_REGEX.search(line)
+                if match and curr_options is not None:
+                    value = int(match.group(2))
+                    if match.group(3):
+                        value <<= 20
+                    option = ExperimentResults.OPTION_SECTION + match.group(1)
+                    curr_options[option] = value
+        return options
+
+    @staticmethod
+    def load(results_dir):
+        # returns the List[Experiment] of the results store, leaving out the
+        # experiments that did not complete
+        names = {
+            file_name[: -len(ExperimentResults.RESULT_SUFFIX)]
+            for file_name in os.listdir(results_dir)
+            if file_name.endswith(ExperimentResults.RESULT_SUFFIX)
+        }
+        options = ExperimentResults.parse_experiment_log(
+            os.path.join(results_dir, ExperimentResults.LOG_FILE), names
+        )
+        experiments = []
+        for name in sorted(names):
+            workload, throughput = ExperimentResults.parse_result_file(
+                os.path.join(results_dir, name + ExperimentResults.RESULT_SUFFIX)
+            )
+            if throughput is None or not options.get(name):
+                print(
+                    "WARNING(ExperimentResults) skipping incomplete experiment: " + name
+                )
+                continue
+            experiments.append(Experiment(name, options[name], workload, throughput))
+        return experiments
+
+
+class RulesPack:
+    """
+    Derives a rules pack, i.e. a rules spec that is loaded on top of the
+    generic rules spec (refer RulesSpec), from the results of experiments
+    that sweep options one at a time. For every swept option of the workload
+    closest to the one being tuned, the empirically best value is suggested
+    by a Suggestion with the 'set' action, and a Rule is triggered when the
+    option's value is outside the 'fast range': the range of the swept values
+    whose throughput is within 'tolerance' of the best. Since the throughput
+    is not monotonic in these options (eg. larger write buffers can be slower),
+    the Suggestions of the generic rules spec that blindly increase or
+    decrease a swept option are overridden to set it to its best value. The
+    options whose swept values are all in the fast range are left out.
+    """
+
+    def __init__(self, experiments, name="write-buffer-pack", tolerance=0.1):
+        self.experiments = experiments
+        self.name = name
+        self.tolerance = tolerance
+
+    def get_workloads(self):
+        # Dict[workload key, List[Experiment]]
+        workloads = {}
+        for experiment in self.experiments:
+            workloads.setdefault(experiment.get_workload_key(), []).append(experiment)
+        return workloads
+
+    @staticmethod
+    def get_workload_distance(workload_key, workload):
+        # the distance, in doublings summed over the features known for both,
+        # between a workload key and the features of a workload
+        distance = 0.0
+        for feature, value in zip(WORKLOAD_FEATURES, workload_key):
+            if value is None or workload.get(feature) is None:
+                continue
+            distance += abs(math.log2((value + 1) / (workload[feature] + 1)))
+        return distance
+
+    def get_nearest_workload(self, workload=None):
+        # returns the key of the experimented workload that is nearest to the
+        # given workload features, or None if there are no experiments
+        workloads = self.get_workloads()
+        if not workloads:
+            return None
+        return min(
+            workloads,
+            key=lambda key: (
+                self.get_workload_distance(key, workload or {}),
+                -len(workloads[key]),
+            ),
+        )
+
+    @staticmethod
+    def get_sweeps(experiments):
+        # returns Dict[option, List[Tuple(value, mean throughput)]], sorted by
+        # value: for every option, the experiments that vary only that option
+        # and that try the largest number of its values
+        all_options = sorted({opt for exp in experiments for opt in exp.options})
+        sweeps = {}
+        for option in all_options:
+            groups = {}
+            for exp in experiments:
+                if option not in exp.options:
+                    continue
+                others = tuple(
+                    exp.options.get(opt) for opt in all_options if opt != option
+                )
+                values = groups.setdefault(others, {})
+                values.setdefault(exp.options[option], []).append(exp.throughput)
+            if not groups:
+                continue
+            values = max(groups.values(), key=len)
+            if len(values) < 2:
+                continue
+            sweeps[option] = sorted(
+                (value, sum(results) / len(results))
+                for value, results in values.items()
+            )
+        return sweeps
+
+    def get_fast_range(self, sweep):
+        # returns (best value, lowest fast value, highest fast value)
+        best_value, best_throughput = max(sweep, key=lambda result: result[1])
+        fast_values = [
+            value
+            for value, throughput in sweep
+            if throughput >= (1 - self.tolerance) * best_throughput
+        ]
+        return best_value, min(fast_values), max(fast_values)
+
+    def get_section_name(self, option, suffix=""):
+        option_name = option.split(".")[-1].replace("_", "-")
+        return self.name + "-" + option_name + suffix
+
+    def generate(self, workload=None, base_rules=None):
+        # returns the rules pack for the workload as the text of a rules spec;
+        # 'base_rules' is the loaded RulesSpec whose Suggestions are overridden
+        workload_key = self.get_nearest_workload(workload)
+        if workload_key is None:
+            raise ValueError("RulesPack: no experiments to derive rules from")
+        experiments = self.get_workloads()[workload_key]
+        lines = [
+            "# Rules pack derived from "
+            + str(len(experiments))
+            + " experiments, for the workload: "
+            + " ".join(
+                feature + "=" + str(value)
+                for feature, value in zip(WORKLOAD_FEATURES, workload_key)
+            ),
+        ]
+        for option, sweep in self.get_sweeps(experiments).items():
+            best_value, low, high = self.get_fast_range(sweep)
+            lines.append("")
+            lines.append(
+                "# "
+                + option
+                + " (value: ops/sec): "
+                + ", ".join(
+                    str(value) + ": " + str(round(throughput))
+                    for value, throughput in sweep
+                )
+            )
+            # the bounds of the fast range that are not the bounds of the sweep
+            bounds = []
+            if low > sweep[0][0]:
+                bounds.append("int(options[0])<" + str(low))
+            if high < sweep[-1][0]:
+                bounds.append("int(options[0])>" + str(high))
+            if not bounds:
+                # all the swept values are fast, so the sweep tells nothing
+                # about where to move the option and the generic suggestions
+                # are kept
+                lines.append("# all the values are fast, no rules")
+                continue
+            suggestion_lines = [
+                "option=" + option,
+                "action=set",
+                "suggested_values=" + str(best_value),
+            ]
+            lines.extend(
+                [
+                    '[Rule "' + self.get_section_name(option) + '"]',
+                    "conditions=" + self.get_section_name(option, "-not-fast"),
+                    "suggestions=" + self.get_section_name(option, "-set"),
+                    "",
+                    '[Condition "' + self.get_section_name(option, "-not-fast") + '"]',
+                    "source=OPTIONS",
+                    "options=" + option,
+                    "evaluate=" + " or ".join(bounds),
+                    "",
+                    '[Suggestion "' + self.get_section_name(option, "-set") + '"]',
+                ]
+                + suggestion_lines
+            )
+            if not base_rules:
+                continue
+            for sugg_name, sugg in base_rules.get_suggestions_dict().items():
+                if sugg.option == option and sugg.action in (
+                    Suggestion.Action.increase,
+                    Suggestion.Action.decrease,
+                ):
+                    lines.extend(
+                        ["", "# overrides the generic suggestion"]
+                        + ['[Suggestion "' + sugg_name + '"]']
+                        + suggestion_lines
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path, workload=None, base_rules=None):
+        with open(file_path, "w") as pack_file:
+            pack_file.write(self.generate(workload, base_rules))
+        return file_path
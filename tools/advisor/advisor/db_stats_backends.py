@@ -0,0 +1,278 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import glob
+import http.client
+import json
+import os
+import re
+import time
+import urllib.parse
+from abc import ABC, abstractmethod
+
+from advisor.db_timeseries_parser import NO_ENTITY
+
+
+class TimeSeriesBackend(ABC):
+    """
+    A source of time series that BackendStatsFetcher fetches statistics from.
+    A backend fetches the time series of many keys for many entities in one
+    call and returns them in the format of TimeSeriesData.keys_ts:
+    Dict[entity, Dict[key, Dict[timestamp, value]]]
+    """
+
+    @abstractmethod
+    def fetch(self, entities, keys, start_time, end_time):
+        # 'entities' is a list of entity names or None for all the entities;
+        # 'start_time' and 'end_time' are Unix timestamps or None
+        pass
+
+
+class PrometheusBackend(TimeSeriesBackend):
+    """
+    Base class for the backends that read Prometheus data. Rocksdb statistic
+    names are not valid Prometheus metric names, so a key such as
+    'rocksdb.db.get.micros.p50' is looked up as 'rocksdb_db_get_micros_p50',
+    but it is returned under the original key name. The entity of a series is
+    the value of its 'entity_label' label.
+    """
+
+    @staticmethod
+    def get_metric_name(key):
+        return re.sub(r"[^a-zA-Z0-9_:]", "_", key)
+
+    def __init__(self, entity_label="instance"):
+        self.entity_label = entity_label
+
+    def add_sample(self, keys_ts, entity, key, timestamp, value):
+        if entity not in keys_ts:
+            keys_ts[entity] = {}
+        if key not in keys_ts[entity]:
+            keys_ts[entity][key] = {}
+        keys_ts[entity][key][int(timestamp)] = float(value)
+
+    def parse_query_response(self, response, metric_keys, entities, keys_ts):
+        # Parses a Prometheus query or query_range API response, example:
+        # {"status": "success", "data": {"resultType": "matrix", "result": [
+        # {"metric": {"__name__": "rocksdb_db_get_micros_p50",
+        # "instance": "host1"}, "values": [[1532544591, "97.36"], ...]}]}}
+        # 'metric_keys' maps the metric names to the requested keys.
+        if response.get("status", "success") != "success":
+            raise ValueError(
+                "PrometheusBackend: query failed: " + str(response.get("error"))
+            )
+        for series in response["data"]["result"]:
+            metric = series["metric"]
+            key = metric_keys.get(metric.get("__name__"))
+            if key is None:
+                continue
+            entity = metric.get(self.entity_label, NO_ENTITY)
+            if entities and entity not in entities:
+                continue
+            samples = series.get("values")
+            if samples is None:  # resultType 'vector'
+                samples = [series["value"]]
+            for timestamp, value in samples:
+                self.add_sample(keys_ts, entity, key, timestamp, value)
+
+
+class PrometheusFileBackend(PrometheusBackend):
+    """
+    Reads time series from local files: either saved Prometheus query_range
+    JSON responses (*.json) or OpenMetrics/Prometheus text dumps. 'path' can
+    be a file, a directory or a glob pattern; all the matching files are read
+    and their samples merged. A text sample without a timestamp gets the
+    modification time of its file, so a directory of periodic metric dumps
+    is read as one time series.
+    """
+
+    SAMPLE_REGEX = re.compile(
+        r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)(?:\s+(\S+))?\s*$"
+    )
+    LABEL_REGEX = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+    def __init__(self, path, entity_label="instance"):
+        super().__init__(entity_label)
+        self.path = path
+
+    def get_files(self):
+        if os.path.isdir(self.path):
+            return sorted(glob.glob(os.path.join(self.path, "*")))
+        return sorted(glob.glob(self.path))
+
+    def parse_text_file(self, file_name, metric_keys, entities, keys_ts):
+        # Example OpenMetrics sample lines:
+        # rocksdb_db_get_micros_p50{instance="host1"} 97.36 1532544591
+        # rocksdb_block_cache_hit_count 37
+        default_timestamp = os.path.getmtime(file_name)
+        with open(file_name) as fp:
+            for line in fp:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                match = self.SAMPLE_REGEX.match(line)
+                if not match:
+                    continue
+                metric_name, labels, value, timestamp = match.groups()
+                key = metric_keys.get(metric_name)
+                if key is None:
+                    continue
+                labels = dict(self.LABEL_REGEX.findall(labels or ""))
+                entity = labels.get(self.entity_label, NO_ENTITY)
+                if entities and entity not in entities:
+                    continue
+                if timestamp is None:
+                    timestamp = default_timestamp
+                self.add_sample(keys_ts, entity, key, float(timestamp), value)
+
+    def fetch(self, entities, keys, start_time, end_time):
+        metric_keys = {self.get_metric_name(key): key for key in keys}
+        keys_ts = {}
+        for file_name in self.get_files():
+            if file_name.endswith(".json"):
+                with open(file_name) as fp:
+                    self.parse_query_response(
+                        json.load(fp), metric_keys, entities, keys_ts
+                    )
+            else:
+                self.parse_text_file(file_name, metric_keys, entities, keys_ts)
+        if start_time is not None or end_time is not None:
+            for entity in keys_ts:
+                for key in keys_ts[entity]:
+                    keys_ts[entity][key] = {
+                        ts: value
+                        for ts, value in keys_ts[entity][key].items()
+                        if (start_time is None or ts >= int(start_time))
+                        and (end_time is None or ts <= int(end_time))
+                    }
+        return keys_ts
+
+
+class PrometheusHttpBackend(PrometheusBackend):
+    """
+    Fetches time series from the query_range API of a Prometheus-compatible
+    server. The keys are fetched in batches of 'keys_per_request' with one
+    regex-matching query per batch, and a single HTTP/1.1 connection is kept
+    open and reused for all the requests. The query_range API requires a time
+    range: if the end time is not given, it is the current time, and if the
+    start time is not given, it is DEFAULT_WINDOW_SEC before the end time.
+    A request that gets no response within 'timeout_sec' fails.
+    """
+
+    QUERY_RANGE_PATH = "/api/v1/query_range"
+    DEFAULT_WINDOW_SEC = 60 * 60
+
+    def __init__(
+        self,
+        url,
+        step_sec=60,
+        entity_label="instance",
+        keys_per_request=50,
+        timeout_sec=60,
+    ):
+        super().__init__(entity_label)
+        parsed_url = urllib.parse.urlparse(url)
+        self.scheme = parsed_url.scheme
+        self.netloc = parsed_url.netloc
+        self.path_prefix = parsed_url.path.rstrip("/")
+        self.step_sec = step_sec
+        self.keys_per_request = keys_per_request
+        self.timeout_sec = timeout_sec
+        self.connection = None
+
+    def get_connection(self):
+        if self.connection is None:
+            if self.scheme == "https":
+                self.connection = http.client.HTTPSConnection(
+                    self.netloc, timeout=self.timeout_sec
+                )
+            else:
+                self.connection = http.client.HTTPConnection(
+                    self.netloc, timeout=self.timeout_sec
+                )
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def quote(string):
+        # a PromQL double-quoted string literal, in which a backslash starts
+        # an escape sequence like in Go
+        return '"' + string.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    def build_query(self, metric_names, entities):
+        selector = "__name__=~" + self.quote("|".join(metric_names))
+        if entities:
+            # the entities are matched literally, so the regex special
+            # characters in them (eg. the dots of a host name) are escaped
+            # first and then their backslashes are escaped in the literal
+            selector += (
+                ","
+                + self.entity_label
+                + "=~"
+                + self.quote("|".join(re.escape(entity) for entity in entities))
+            )
+        return "{" + selector + "}"
+
+    def request(self, params):
+        url = (
+            self.path_prefix
+            + self.QUERY_RANGE_PATH
+            + "?"
+            + urllib.parse.urlencode(params)
+        )
+        # retry once on a new connection if the server closed the kept-alive
+        # connection in the meantime
+        for attempt in range(2):
+            connection = self.get_connection()
+            try:
+                connection.request("GET", url)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.status != 200:
+                raise ValueError(
+                    "PrometheusHttpBackend: HTTP "
+                    + str(response.status)
+                    + ": "
+                    + body.decode(errors="replace")
+                )
+            return json.loads(body)
+
+    def fetch(self, entities, keys, start_time, end_time):
+        if end_time is None:
+            end_time = int(time.time())
+        if start_time is None:
+            start_time = int(end_time) - self.DEFAULT_WINDOW_SEC
+        metric_keys = {self.get_metric_name(key): key for key in keys}
+        metric_names = list(metric_keys.keys())
+        keys_ts = {}
+        for ix in range(0, len(metric_names), self.keys_per_request):
+            params = {
+                "query": self.build_query(
+                    metric_names[ix : ix + self.keys_per_request], entities
+                ),
+                "start": start_time,
+                "end": end_time,
+                "step": self.step_sec,
+            }
+            response = self.request(params)
+            self.parse_query_response(response, metric_keys, entities, keys_ts)
+        return keys_ts
+
+
+def create_backend(source, step_sec=60, entity_label="instance"):
+    # 'source' is either the URL of a Prometheus server or the path of local
+    # Prometheus JSON/OpenMetrics files
+    if re.match(r"^https?://", source):
+        return PrometheusHttpBackend(source, step_sec, entity_label)
+    return PrometheusFileBackend(source, entity_label)
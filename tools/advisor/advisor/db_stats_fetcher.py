@@ -10,12 +10,51 @@ import subprocess
 import time
 from typing import List
 
-from advisor.db_log_parser import Log
+from advisor.db_log_parser import Log, LogFollower
 from advisor.db_timeseries_parser import NO_ENTITY, TimeSeriesData
 
 
 class LogStatsParser(TimeSeriesData):
     STATS = "STATISTICS:"
+    # The periodic stats dump (every stats_dump_period_sec) has a DB-wide
+    # section and a section per column family, whose statistics are added to
+    # 'keys_ts' with the column family name as the entity:
+    # compaction.<level>.<column> for the rows of the per-level compaction
+    # stats table, eg. 'compaction.l0.files' or 'compaction.sum.w_amp', and
+    # stalls.<cause> for the write stall counts, eg. 'stalls.total_stops'
+    # (the DB-wide stall counts have the entity NO_ENTITY).
+    DB_STATS = "** DB Stats **"
+    CF_STATS_REGEX = re.compile(r"\*\* Compaction Stats \[(.+)\] \*\*")
+    LEVEL_ROW_REGEX = re.compile(r"^(L\d+|Sum|Int)\s")
+    STALLS_PREFIXES = ("Stalls(count):", "Write Stall (count):")
+    PENDING_COMPACTION_BYTES = "Estimated pending compaction bytes:"
+    COMPACTION_STATS_COLUMNS = {
+        "Files": "files",
+        "Size": "size_bytes",
+        "Size(MB)": "size_bytes",
+        "Score": "score",
+        "Read(GB)": "read_gb",
+        "Rn(GB)": "rn_gb",
+        "Rnp1(GB)": "rnp1_gb",
+        "Write(GB)": "write_gb",
+        "WPreComp(GB)": "wprecomp_gb",
+        "Wnew(GB)": "wnew_gb",
+        "Moved(GB)": "moved_gb",
+        "W-Amp": "w_amp",
+        "Rd(MB/s)": "read_mb_per_sec",
+        "Wr(MB/s)": "write_mb_per_sec",
+        "Comp(sec)": "comp_sec",
+        "CompMergeCPU(sec)": "comp_merge_cpu_sec",
+        "Comp(cnt)": "comp_count",
+        "Avg(sec)": "avg_sec",
+        "KeyIn": "key_in",
+        "KeyDrop": "key_drop",
+        "Rblob(GB)": "rblob_gb",
+        "Wblob(GB)": "wblob_gb",
+    }
+    SIZE_UNITS = {"B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30, "TB": 1 << 40}
+    # the suffixes of the numbers printed by NumberToHumanString()
+    NUMBER_SUFFIXES = {"K": 1e3, "M": 1e6, "G": 1e9}
 
     @staticmethod
     def parse_log_line_for_stats(log_line):
@@ -40,11 +79,104 @@ class LogStatsParser(TimeSeriesData):
         # 'rocksdb.db.get.micros.p100': 92.0}
         return stat_dict
 
-    def __init__(self, logs_path_prefix, stats_freq_sec):
+    @staticmethod
+    def get_stat_name(name):
+        # eg. 'level0_slowdown_with_compaction', 'stop for
+        # pending_compaction_bytes' or 'l0-file-count-limit-delays'
+        return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+    @classmethod
+    def parse_human_number(cls, token):
+        # eg. '1234', '12K' or '3M'
+        if token[-1:].upper() in cls.NUMBER_SUFFIXES:
+            return float(token[:-1]) * cls.NUMBER_SUFFIXES[token[-1:].upper()]
+        return float(token)
+
+    @classmethod
+    def parse_compaction_stats_row(cls, header, row):
+        # Example header and row of a column family's compaction stats table:
+        # "Level Files Size Score Read(GB) Rn(GB) ... W-Amp ... KeyIn KeyDrop"
+        # "L0 2/0 50.28 MB 0.5 0.0 0.0 ... 1.0 ... 0 0"
+        # returns the level ('l0') and the Dict[stat_name, value]
+        tokens = row.split()
+        level = tokens[0].lower()
+        stat_dict = {}
+        ix = 1
+        for column in header[1:]:
+            if ix >= len(tokens):
+                break
+            token = tokens[ix]
+            ix += 1
+            if column == "Files":
+                # 'number of files/number of files being compacted'
+                num_files, _, num_compacting = token.partition("/")
+                stat_dict["files"] = float(num_files)
+                if num_compacting:
+                    stat_dict["files_compacting"] = float(num_compacting)
+                continue
+            if column == "Size":
+                value = float(token)
+                if ix < len(tokens) and tokens[ix].upper() in cls.SIZE_UNITS:
+                    value *= cls.SIZE_UNITS[tokens[ix].upper()]
+                    ix += 1
+            elif column == "Size(MB)":
+                value = float(token) * cls.SIZE_UNITS["MB"]
+            else:
+                value = cls.parse_human_number(token)
+            stat_name = cls.COMPACTION_STATS_COLUMNS.get(column)
+            if not stat_name:
+                stat_name = cls.get_stat_name(column)
+            stat_dict[stat_name] = value
+        return level, stat_dict
+
+    @classmethod
+    def parse_stalls_line(cls, line):
+        # Examples of the stall counts of a column family, in the older and
+        # in the newer format:
+        # "Stalls(count): 0 level0_slowdown, 0 level0_slowdown_with_compaction,
+        # ..., 2 stop for pending_compaction_bytes, ..., interval 2 total count"
+        # "Write Stall (count): cf-l0-file-count-limit-delays-with-ongoing-
+        # compaction: 0, ..., total-delays: 0, total-stops: 2"
+        # returns the Dict[cause, count]
+        counts = line.split(":", 1)[1]
+        stall_dict = {}
+        for part in counts.split(","):
+            part = part.strip()
+            old_format = re.match(r"^(\d+)\s+(.+)$", part)
+            new_format = re.match(r"^(.+):\s*(\d+)$", part)
+            interval = re.match(r"^interval:?\s+(\d+)\s+total count$", part)
+            if interval:
+                stall_dict["interval_total_count"] = float(interval.group(1))
+            elif old_format:
+                stall_dict[cls.get_stat_name(old_format.group(2))] = float(
+                    old_format.group(1)
+                )
+            elif new_format:
+                stall_dict[cls.get_stat_name(new_format.group(1))] = float(
+                    new_format.group(2)
+                )
+        return stall_dict
+
+    @classmethod
+    def is_stats_log(cls, message):
+        return (
+            cls.STATS in message
+            or cls.DB_STATS in message
+            or cls.CF_STATS_REGEX.search(message) is not None
+        )
+
+    def __init__(self, logs_path_prefix, stats_freq_sec, follow=False):
         super().__init__()
         self.logs_file_prefix = logs_path_prefix
         self.stats_freq_sec = stats_freq_sec
         self.duration_sec = 60
+        # In follow mode, only the stats dumps appended to the LOG files since
+        # the previous call to fetch_timeseries() are parsed and added to
+        # 'keys_ts', until they are moved to the store.
+        self.log_follower = None
+        if follow:
+            self.log_follower = LogFollower(logs_path_prefix, column_families=[])
+            self.is_incremental = True
 
     def get_keys_from_conditions(self, conditions):
         # Note: case insensitive stat names
@@ -89,9 +221,68 @@ class LogStatsParser(TimeSeriesData):
                         self.keys_ts[NO_ENTITY][stat] = {}
                     self.keys_ts[NO_ENTITY][stat][log_ts] = stats_on_line[stat]
 
+    def add_stat(self, entity, stat, timestamp, value, reqd_stats):
+        if stat not in reqd_stats:
+            return
+        if entity not in self.keys_ts:
+            self.keys_ts[entity] = {}
+        if stat not in self.keys_ts[entity]:
+            self.keys_ts[entity][stat] = {}
+        self.keys_ts[entity][stat][timestamp] = value
+
+    def add_cf_stats_to_timeseries(self, log, reqd_stats):
+        # this method parses the per column family sections of a periodic
+        # stats dump, i.e. the per-level compaction stats tables and the stall
+        # counts, and adds the required stats to keys_ts with the column
+        # family name as the entity
+        log_ts = log.get_timestamp()
+        entity = NO_ENTITY  # the DB-wide section comes first
+        header = None
+        for line in log.get_message().split("\n"):
+            line = line.strip()
+            cf_match = self.CF_STATS_REGEX.search(line)
+            if cf_match:
+                entity = cf_match.group(1)
+                header = None
+            elif line.startswith("Level "):
+                header = line.split()
+            elif line.startswith("Priority "):
+                # the same stats per compaction priority are not parsed
+                header = None
+            elif header and self.LEVEL_ROW_REGEX.match(line):
+                try:
+                    level, stat_dict = self.parse_compaction_stats_row(header, line)
+                except ValueError as e:
+                    print("WARNING(LogStatsParser) compaction stats: " + str(e))
+                    continue
+                for stat, value in stat_dict.items():
+                    stat = "compaction." + level + "." + stat
+                    self.add_stat(entity, stat, log_ts, value, reqd_stats)
+            elif line.startswith(self.STALLS_PREFIXES):
+                for cause, count in self.parse_stalls_line(line).items():
+                    stat = "stalls." + cause
+                    self.add_stat(entity, stat, log_ts, count, reqd_stats)
+            elif line.startswith(self.PENDING_COMPACTION_BYTES):
+                value = float(line[len(self.PENDING_COMPACTION_BYTES) :])
+                stat = "compaction.pending_bytes"
+                self.add_stat(entity, stat, log_ts, value, reqd_stats)
+
+    def add_log_to_timeseries(self, log, reqd_stats):
+        if self.STATS in log.get_message():
+            self.add_to_timeseries(log, reqd_stats)
+        else:
+            self.add_cf_stats_to_timeseries(log, reqd_stats)
+
     def fetch_timeseries(self, reqd_stats):
         # this method parses the Rocksdb LOG file and generates timeseries for
         # each of the statistic in the list reqd_stats
+        if self.log_follower:
+            if self.keys_ts is None:
+                self.keys_ts = {NO_ENTITY: {}}
+            for new_log in self.log_follower.read_new_logs():
+                if self.is_stats_log(new_log.get_message()):
+                    self.add_log_to_timeseries(new_log, reqd_stats)
+            return
         self.keys_ts = {NO_ENTITY: {}}
         for file_name in glob.glob(self.logs_file_prefix + "*"):
             # TODO(poojam23): find a way to distinguish between 'old' log files
@@ -103,15 +294,15 @@ class LogStatsParser(TimeSeriesData):
                 new_log = None
                 for line in db_logs:
                     if Log.is_new_log(line):
-                        if new_log and re.search(self.STATS, new_log.get_message()):
-                            self.add_to_timeseries(new_log, reqd_stats)
+                        if new_log and self.is_stats_log(new_log.get_message()):
+                            self.add_log_to_timeseries(new_log, reqd_stats)
                         new_log = Log(line, column_families=[])
                     else:
                         # To account for logs split into multiple lines
                         new_log.append_message(line)
             # Check for the last log in the file.
-            if new_log and re.search(self.STATS, new_log.get_message()):
-                self.add_to_timeseries(new_log, reqd_stats)
+            if new_log and self.is_stats_log(new_log.get_message()):
+                self.add_log_to_timeseries(new_log, reqd_stats)
 
 
 class DatabasePerfContext(TimeSeriesData):
@@ -344,3 +535,51 @@ class OdsStatsFetcher(TimeSeriesData):
         with open(self.OUTPUT_FILE) as fp:
             url = fp.readline()
         return url
+
+
+class BackendStatsFetcher(TimeSeriesData):
+    """
+    Fetches the time series of the required statistics, for all the entities,
+    from a TimeSeriesBackend (refer db_stats_backends.py) in one batch.
+    """
+
+    def __init__(
+        self,
+        backend,
+        entities,
+        start_time,
+        end_time,
+        stats_freq_sec=60,
+        key_prefix=None,
+    ):
+        super().__init__()
+        self.backend = backend
+        # a list of entity names, None fetches the stats of all the entities
+        self.entities = entities
+        self.start_time = start_time
+        self.end_time = end_time
+        self.key_prefix = key_prefix
+        self.stats_freq_sec = stats_freq_sec
+        self.duration_sec = 60
+
+    def get_keys_from_conditions(self, conditions):
+        # Note: case insensitive stat names
+        reqd_stats = []
+        for cond in conditions:
+            for key in cond.keys:
+                key = key.lower()
+                # keys prepended with '[]' are prefixed by 'key_prefix'
+                if key.startswith("[]"):
+                    key = key[2:]
+                    if self.key_prefix:
+                        key = self.key_prefix + "." + key
+                reqd_stats.append(key)
+        return reqd_stats
+
+    def fetch_timeseries(self, statistics):
+        # this method fetches the timeseries of all the required stats from
+        # the backend and populates the 'keys_ts' object
+        print("BackendStatsFetcher: fetching " + str(statistics))
+        self.keys_ts = self.backend.fetch(
+            self.entities, list(set(statistics)), self.start_time, self.end_time
+        )
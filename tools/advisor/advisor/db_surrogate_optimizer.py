@@ -0,0 +1,425 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import copy
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+from advisor.db_log_parser import NO_COL_FAMILY
+from advisor.db_objectives import LATENCY_METRICS, ParetoFront
+from advisor.db_options_model import get_option_spec, OptionSpec
+from advisor.db_options_parser import DatabaseOptions
+from advisor.rule_parser import Suggestion
+
+
+class GaussianProcess:
+    """
+    A Gaussian process regressor with a squared exponential kernel, used as
+    the surrogate model of the benchmark metric. The features are expected to
+    be scaled to [0, 1]; the length scale of the kernel is picked from
+    'length_scales' by maximizing the marginal likelihood of the observations.
+    """
+
+    def __init__(self, length_scales=(0.1, 0.2, 0.5, 1.0), noise=1e-2):
+        self.length_scales = length_scales
+        self.noise = noise
+
+    @staticmethod
+    def kernel(X1, X2, length_scale):
+        sq_dist = (
+            np.sum(X1**2, axis=1)[:, None]
+            + np.sum(X2**2, axis=1)[None, :]
+            - 2 * X1 @ X2.T
+        )
+        return np.exp(-0.5 * np.maximum(sq_dist, 0) / length_scale**2)
+
+    def fit(self, X, y):
+        self.X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.y_mean = y.mean()
+        self.y_std = y.std() or 1.0
+        y = (y - self.y_mean) / self.y_std
+        best_log_likelihood = None
+        for length_scale in self.length_scales:
+            K = self.kernel(self.X, self.X, length_scale)
+            K[np.diag_indices_from(K)] += self.noise
+            L = np.linalg.cholesky(K)
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+            log_likelihood = -0.5 * y @ alpha - np.sum(np.log(np.diag(L)))
+            if best_log_likelihood is None or log_likelihood > best_log_likelihood:
+                best_log_likelihood = log_likelihood
+                self.length_scale = length_scale
+                self.L = L
+                self.alpha = alpha
+        return self
+
+    def predict(self, X):
+        # returns the mean and the standard deviation of the posterior at X
+        X = np.asarray(X, dtype=np.float64)
+        K_s = self.kernel(X, self.X, self.length_scale)
+        mean = K_s @ self.alpha
+        v = np.linalg.solve(self.L, K_s.T)
+        var = np.maximum(1.0 - np.sum(v**2, axis=0), 1e-12)
+        return mean * self.y_std + self.y_mean, np.sqrt(var) * self.y_std
+
+
+def expected_improvement(mean, std, best, xi=0.01):
+    # the expected improvement over 'best' of maximizing the metric
+    improvement = mean - best - xi * abs(best)
+    z = improvement / std
+    cdf = 0.5 * (1.0 + np.vectorize(math.erf)(z / math.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z**2) / math.sqrt(2.0 * math.pi)
+    return improvement * cdf + std * pdf
+
+
+class ExperimentCache:
+    """
+    The results of all the experiments run by the optimizer: the full
+    configuration and the metric of every experiment, keyed by the canonical
+    hash of the configuration (refer DatabaseOptions.get_canonical_hash()). If
+    a file path is given, the results are persisted in it as JSON, so that
+    the surrogate model is also fitted on the experiments of previous runs.
+    """
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self.experiments = {}
+        if file_path and os.path.isfile(file_path):
+            with open(file_path) as fp:
+                self.experiments = json.load(fp)
+
+    def get_metric(self, config_hash):
+        if config_hash not in self.experiments:
+            return None
+        return self.experiments[config_hash]["metric"]
+
+    def add(self, db_options, metric):
+        self.experiments[db_options.get_canonical_hash()] = {
+            "options": db_options.get_all_options(),
+            "metric": metric,
+        }
+        if self.file_path:
+            with open(self.file_path, "w") as fp:
+                json.dump(self.experiments, fp)
+
+    def get_experiments(self):
+        # returns a list of (options, metric) for all the successful runs
+        return [
+            (experiment["options"], experiment["metric"])
+            for experiment in self.experiments.values()
+            if experiment["metric"] is not None
+        ]
+
+
+class SurrogateConfigOptimizer:
+    """
+    A model-guided alternative to ConfigOptimizer. Instead of applying one
+    rule's fixed +/-30% steps per benchmark run, it fits a Gaussian process
+    on the results of all the experiments run so far and picks the next
+    configuration by expected improvement. The triggered rules are only used
+    as a prior on the search: the options their suggestions act upon (in the
+    column families they were triggered for) are the dimensions that are
+    varied, in the direction of the suggested action, by up to
+    'max_step_factor' times in one step.
+
+    If 'objectives' are given, the bench runner returns metric vectors and
+    the optimizer keeps their Pareto front, as ConfigOptimizer does; the
+    model is then fitted on the first objective penalized by the violation of
+    the 'constraints' (refer ParetoFront.get_penalized_value()).
+    """
+
+    def __init__(
+        self,
+        bench_runner,
+        db_options,
+        rule_parser,
+        base_db,
+        num_iterations=10,
+        num_candidates=256,
+        max_step_factor=8.0,
+        cache_path=None,
+        seed=None,
+        trajectory_log=None,
+        objectives=None,
+        constraints=None,
+    ):
+        self.bench_runner = bench_runner
+        self.db_options = db_options
+        self.rule_parser = rule_parser
+        self.base_db_path = base_db
+        self.num_iterations = num_iterations
+        self.num_candidates = num_candidates
+        self.max_step_factor = max_step_factor
+        self.cache = ExperimentCache(cache_path)
+        self.random = random.Random(seed)
+        # if given, every benchmarked configuration is logged to this
+        # TrajectoryLog (refer db_trajectory.py)
+        self.trajectory_log = trajectory_log
+        # the (option, column family) pairs varied so far, with the prior of
+        # each: (action, suggested values)
+        self.search_dims = {}
+        # BenchmarkRunner.is_metric_better() tells the direction to optimize
+        self.maximize = bench_runner.is_metric_better(1, 0)
+        self.pareto_front = None
+        if objectives:
+            self.pareto_front = ParetoFront(objectives, constraints)
+            if self.pareto_front.get_metrics() & LATENCY_METRICS:
+                # the experiments stopped early would miss the latencies and
+                # be scored as infeasible
+                self.bench_runner.disable_early_stopping()
+
+    def get_score(self, metric):
+        # the value that the model is fitted on, larger is better; None for
+        # the results of the other mode (scalar or vector) found in the cache
+        if self.pareto_front:
+            if not isinstance(metric, dict):
+                return None
+            return self.pareto_front.get_penalized_value(metric)
+        if isinstance(metric, dict):
+            return None
+        return metric if self.maximize else -metric
+
+    def is_metric_better(self, new_metric, old_metric):
+        if not self.pareto_front:
+            return self.bench_runner.is_metric_better(new_metric, old_metric)
+        return self.pareto_front.is_better(new_metric, old_metric)
+
+    def get_priors(self, triggered_rules):
+        suggestions_dict = self.rule_parser.get_suggestions_dict()
+        priors = {}
+        for rule in triggered_rules:
+            for sugg_name in rule.get_suggestions():
+                sugg = suggestions_dict[sugg_name]
+                if not (sugg.option and sugg.action):
+                    continue
+                if DatabaseOptions.is_misc_option(sugg.option):
+                    col_fams = [NO_COL_FAMILY]
+                elif sugg.option.startswith("DBOptions."):
+                    col_fams = [NO_COL_FAMILY]
+                else:
+                    col_fams = rule.get_trigger_column_families() or []
+                for col_fam in col_fams:
+                    priors[(sugg.option, col_fam)] = (
+                        sugg.action,
+                        sugg.suggested_values,
+                    )
+        return priors
+
+    def get_step_value(self, option, old_value, action, suggested_values):
+        # returns a random new value for the option, as per its prior, or
+        # None if no value can be derived
+        spec = get_option_spec(option)
+        numeric = spec.type in (
+            OptionSpec.Type.int,
+            OptionSpec.Type.size,
+            OptionSpec.Type.double,
+        )
+        if action is Suggestion.Action.set or not numeric:
+            if not suggested_values:
+                return None
+            return self.random.choice(list(suggested_values))
+        try:
+            old_value = spec.parse(old_value) if old_value is not None else None
+        except ValueError:
+            old_value = None
+        if not old_value or old_value < 0:
+            if suggested_values:
+                return self.random.choice(list(suggested_values))
+            old_value = 1
+        exponent = self.random.uniform(0, math.log2(self.max_step_factor))
+        if action is Suggestion.Action.decrease:
+            exponent = -exponent
+        new_value = old_value * 2**exponent
+        if spec.type is not OptionSpec.Type.double:
+            new_value = int(round(new_value))
+        return new_value
+
+    def generate_candidates(self, base_options, priors):
+        # returns a list of configuration updates, each of which changes a
+        # random non-empty subset of the prior's dimensions
+        base_values = base_options.get_options([option for option, _ in priors])
+        dims = list(priors.keys())
+        candidates = []
+        for _ in range(self.num_candidates):
+            chosen = [dim for dim in dims if self.random.random() < 0.5]
+            if not chosen:
+                chosen = [self.random.choice(dims)]
+            updates = {}
+            for option, col_fam in chosen:
+                old_value = base_values.get(option, {}).get(col_fam)
+                if old_value is None and NO_COL_FAMILY in base_values.get(option, {}):
+                    old_value = base_values[option][NO_COL_FAMILY]
+                action, suggested_values = priors[(option, col_fam)]
+                new_value = self.get_step_value(
+                    option, old_value, action, suggested_values
+                )
+                if new_value is None:
+                    continue
+                if option not in updates:
+                    updates[option] = {}
+                updates[option][col_fam] = new_value
+            if updates:
+                candidates.append(DatabaseOptions.sanitize_options(updates))
+        return candidates
+
+    def encode(self, configs):
+        # returns the feature matrix of the configurations (each a
+        # Dict[option, Dict[col_fam, value]]): numeric options are scaled
+        # logarithmically and the others are one-hot encoded; every column is
+        # then scaled to [0, 1]
+        columns = []
+        for option, col_fam in sorted(self.search_dims):
+            spec = get_option_spec(option)
+            values = []
+            for config in configs:
+                values.append(config.get(option, {}).get(col_fam))
+            numeric_values = []
+            try:
+                for value in values:
+                    value = spec.parse(value) if value is not None else 0
+                    if isinstance(value, str):
+                        raise ValueError(value)
+                    numeric_values.append(
+                        math.copysign(math.log2(1 + abs(value)), value)
+                    )
+                columns.append(numeric_values)
+            except (TypeError, ValueError):
+                for category in sorted(set(str(value) for value in values)):
+                    columns.append([float(str(v) == category) for v in values])
+        if not columns:
+            return np.zeros((len(configs), 1))
+        X = np.array(columns, dtype=np.float64).T
+        span = X.max(axis=0) - X.min(axis=0)
+        span[span == 0] = 1.0
+        return (X - X.min(axis=0)) / span
+
+    def pick_candidate(self, candidates, base_options):
+        # returns the candidate configuration with the highest expected
+        # improvement, skipping the ones that were already benchmarked
+        new_candidates = []
+        for updates in candidates:
+            options = copy.deepcopy(base_options)
+            options.update_options(updates)
+            if self.cache.get_metric(options.get_canonical_hash()) is None:
+                new_candidates.append((updates, options))
+        if not new_candidates:
+            return None, None
+        experiments = []
+        for options, metric in self.cache.get_experiments():
+            score = self.get_score(metric)
+            if score is not None and math.isfinite(score):
+                experiments.append((options, score))
+        if not experiments:
+            # nothing to fit the model on yet
+            return self.random.choice(new_candidates)
+        configs = [options for options, _ in experiments]
+        configs.extend(options.get_all_options() for _, options in new_candidates)
+        X = self.encode(configs)
+        y = np.array([score for _, score in experiments])
+        model = GaussianProcess().fit(X[: len(experiments)], y)
+        mean, std = model.predict(X[len(experiments) :])
+        ei = expected_improvement(mean, std, y.max())
+        best_ix = int(np.argmax(ei))
+        predicted = mean[best_ix]
+        if not (self.pareto_front or self.maximize):
+            predicted = -predicted
+        print(
+            "SurrogateConfigOptimizer: predicted "
+            + ("score " if self.pareto_front else "metric ")
+            + str(predicted)
+            + " +/- "
+            + str(std[best_ix])
+            + ", expected improvement "
+            + str(ei[best_ix])
+        )
+        return new_candidates[best_ix]
+
+    def run_experiment(self, options):
+        if not self.pareto_front:
+            data_sources, metric = self.bench_runner.run_experiment(
+                options, self.base_db_path
+            )
+        else:
+            data_sources, metric = self.bench_runner.run_experiment(
+                options, self.base_db_path, metric_vector=True
+            )
+            if self.pareto_front.add(metric, copy.deepcopy(options)):
+                print("\nadded to the Pareto front: " + str(metric))
+        self.cache.add(options, metric)
+        return data_sources, metric
+
+    def log_step(self, options, metric, rule, accepted, duration_sec):
+        if self.trajectory_log:
+            self.trajectory_log.add_step(options, metric, rule, accepted, duration_sec)
+
+    def get_final_options(self, options):
+        # in the multi-objective mode, the recommended configuration of the
+        # Pareto front is returned instead of the best accepted one
+        if not self.pareto_front:
+            return options
+        recommended = self.pareto_front.get_recommended()
+        if not recommended:
+            print(
+                "WARNING(SurrogateConfigOptimizer): no configuration satisfies "
+                + "the constraints: "
+                + str(self.pareto_front.constraints)
+            )
+            return options
+        print("Recommended: " + str(recommended[0]))
+        return recommended[1]
+
+    def get_triggered_rules(self, data_sources, options):
+        self.rule_parser.load()
+        triggered_rules = self.rule_parser.get_triggered_rules(
+            data_sources, options.get_column_families()
+        )
+        print("\nTriggered:")
+        self.rule_parser.print_rules(triggered_rules)
+        return triggered_rules
+
+    def run(self):
+        print("Bootstrapping optimizer:")
+        best_options = copy.deepcopy(self.db_options)
+        start_time = time.time()
+        data_sources, best_metric = self.run_experiment(best_options)
+        print("Initial metric: " + str(best_metric))
+        self.log_step(best_options, best_metric, None, True, time.time() - start_time)
+        triggered_rules = self.get_triggered_rules(data_sources, best_options)
+        for iteration in range(self.num_iterations):
+            # the dimensions suggested by the rules triggered for the best
+            # configuration are explored first, then all the others seen
+            priors = self.get_priors(triggered_rules)
+            self.search_dims.update(priors)
+            if not self.search_dims:
+                print("\nNo more rules triggered!")
+                break
+            candidates = self.generate_candidates(
+                best_options, priors or self.search_dims
+            )
+            updates, options = self.pick_candidate(candidates, best_options)
+            if updates is None:
+                print("\nAll candidate configurations have been tried")
+                break
+            print("\nIteration " + str(iteration + 1) + ", updated config:")
+            print(updates)
+            start_time = time.time()
+            data_sources, metric = self.run_experiment(options)
+            duration_sec = time.time() - start_time
+            print("\nnew metric: " + str(metric))
+            accepted = metric is not None and (
+                best_metric is None or self.is_metric_better(metric, best_metric)
+            )
+            self.log_step(options, metric, None, accepted, duration_sec)
+            if accepted:
+                best_options = options
+                best_metric = metric
+                triggered_rules = self.get_triggered_rules(data_sources, options)
+        print("\nBest metric: " + str(best_metric))
+        return self.get_final_options(best_options)
@@ -8,7 +8,11 @@ from abc import abstractmethod
 from enum import Enum
 from typing import Dict
 
+import numpy as np
+
+from advisor.db_burst_detector import BurstDetector
 from advisor.db_log_parser import DataSource
+from advisor.db_timeseries_store import TimeSeriesStore
 
 
 NO_ENTITY = "ENTITY_PLACEHOLDER"
@@ -28,8 +32,22 @@ class TimeSeriesData(DataSource):
 
     def __init__(self):
         super().__init__(DataSource.Type.TIME_SERIES)
-        self.keys_ts = None  # Dict[entity, Dict[key, Dict[timestamp, value]]]
+        # the samples fetched by fetch_timeseries() that have not been added
+        # to 'ts_store' yet: Dict[entity, Dict[key, Dict[timestamp, value]]]
+        self.keys_ts = None
         self.stats_freq_sec = None
+        # the columnar TimeSeriesStore that the conditions are evaluated on;
+        # 'keys_ts' is moved into it once per check_and_trigger_conditions()
+        self.ts_store = None
+        # whether fetch_timeseries() fetches only the samples added since the
+        # previous call (eg. in follow mode), that are then appended to the
+        # store, instead of replacing all the time series
+        self.is_incremental = False
+        # the BurstDetector of every (condition, entity); the detectors are
+        # fed only the samples added since the last check, so that a growing
+        # time series (eg. in follow mode) is processed incrementally, and
+        # they are dropped whenever the store is replaced
+        self.burst_detectors = {}
 
     @abstractmethod
     def get_keys_from_conditions(self, conditions):
@@ -44,127 +62,156 @@ class TimeSeriesData(DataSource):
         # for each of them and populates the 'keys_ts' dictionary
         pass
 
-    def fetch_burst_epochs(
+    def get_store(self):
+        # returns the columnar TimeSeriesStore after moving the samples of
+        # 'keys_ts' into it; 'keys_ts' is then dropped, so that the samples
+        # are not kept in both forms
+        if self.keys_ts is not None:
+            new_store = TimeSeriesStore.from_keys_ts(self.keys_ts)
+            if self.is_incremental and self.ts_store is not None:
+                self.ts_store.extend(new_store)
+            else:
+                self.ts_store = new_store
+                # the detectors have seen the samples of the replaced store,
+                # which may be fetched again
+                self.burst_detectors = {}
+            self.keys_ts = None
+        elif self.ts_store is None:
+            self.ts_store = TimeSeriesStore()
+        return self.ts_store
+
+    def fetch_burst_intervals(
         self,
-        entities: str,
-        statistic: int,
-        window_sec: float,
-        threshold: bool,
-        percent: bool,
-    ) -> dict[str, dict[int, float]]:
-        # this method calculates the (percent) rate change in the 'statistic'
-        # for each entity (over 'window_sec' seconds) and returns the epochs
-        # where this rate change is greater than or equal to the 'threshold'
-        # value
+        store,
+        entities,
+        statistic,
+        window_sec,
+        threshold,
+        method=BurstDetector.Method.percent,
+        ewma_alpha=0.1,
+    ):
+        # this method feeds the (percent) rate change in the 'statistic' of
+        # each entity in 'store' to a streaming BurstDetector (refer
+        # BurstDetector for the methods) and returns the intervals of the
+        # bursts: Dict[entity, List[BurstInterval]]
         if self.stats_freq_sec == 0:
             # not time series data, cannot check for bursty behavior
             return
-        if window_sec < self.stats_freq_sec:
-            window_sec = self.stats_freq_sec
-        # 'window_samples' is the number of windows to go back to
-        # compare the current window with, while calculating rate change.
-        window_samples = math.ceil(window_sec / self.stats_freq_sec)
-        burst_epochs = {}
-        # if percent = False:
-        # curr_val = value at window for which rate change is being calculated
-        # prev_val = value at window that is window_samples behind curr_window
-        # Then rate_without_percent =
-        # ((curr_val-prev_val)*duration_sec)/(curr_timestamp-prev_timestamp)
-        # if percent = True:
-        # rate_with_percent = (rate_without_percent * 100) / prev_val
-        # These calculations are in line with the rate() transform supported
-        # by ODS
+        window_samples = math.ceil(
+            max(window_sec, self.stats_freq_sec) / (self.stats_freq_sec)
+        )
+        burst_intervals = {}
         for entity in entities:
-            if statistic not in self.keys_ts[entity]:
+            if not store.has_series(entity, statistic):
                 continue
-            timestamps = sorted(list(self.keys_ts[entity][statistic].keys()))
-            for ix in range(window_samples, len(timestamps), 1):
-                first_ts = timestamps[ix - window_samples]
-                last_ts = timestamps[ix]
-                first_val = self.keys_ts[entity][statistic][first_ts]
-                last_val = self.keys_ts[entity][statistic][last_ts]
-                diff = last_val - first_val
-                if percent:
-                    diff = diff * 100 / first_val
-                rate = (diff * self.duration_sec) / (last_ts - first_ts)
-                # if the rate change is greater than the provided threshold,
-                # then the condition is triggered for entity at time 'last_ts'
-                if rate >= threshold:
-                    if entity not in burst_epochs:
-                        burst_epochs[entity] = {}
-                    burst_epochs[entity][last_ts] = rate
-        return burst_epochs
-
-    def fetch_aggregated_values(self, entity, statistics, aggregation_op):
+            detector_key = (entity, statistic, window_samples, threshold, method)
+            detector_key += (ewma_alpha,)
+            if detector_key not in self.burst_detectors:
+                self.burst_detectors[detector_key] = BurstDetector(
+                    method, threshold, window_samples, self.duration_sec, ewma_alpha
+                )
+            detector = self.burst_detectors[detector_key]
+            timestamps, values = store.get_series(entity, statistic)
+            if detector.last_timestamp is not None:
+                # skip the samples the detector has already seen
+                start = np.searchsorted(timestamps, detector.last_timestamp, "right")
+                timestamps, values = timestamps[start:], values[start:]
+            detector.add_series(timestamps.tolist(), values.tolist())
+            intervals = detector.get_intervals()
+            if intervals:
+                burst_intervals[entity] = intervals
+        return burst_intervals
+
+    def fetch_aggregated_values(self, store, entity, statistics, aggregation_op):
         # this method performs the aggregation specified by 'aggregation_op'
-        # on the timeseries of 'statistics' for 'entity' and returns:
-        # Dict[statistic, aggregated_value]
+        # on the timeseries of 'statistics' for 'entity' in 'store' and
+        # returns: Dict[statistic, aggregated_value]
         result = {}
         for stat in statistics:
-            if stat not in self.keys_ts[entity]:
+            if not store.has_series(entity, stat):
                 continue
-            agg_val = None
-            if aggregation_op is self.AggregationOperator.latest:
-                latest_timestamp = max(list(self.keys_ts[entity][stat].keys()))
-                agg_val = self.keys_ts[entity][stat][latest_timestamp]
-            elif aggregation_op is self.AggregationOperator.oldest:
-                oldest_timestamp = min(list(self.keys_ts[entity][stat].keys()))
-                agg_val = self.keys_ts[entity][stat][oldest_timestamp]
-            elif aggregation_op is self.AggregationOperator.max:
-                agg_val = max(list(self.keys_ts[entity][stat].values()))
-            elif aggregation_op is self.AggregationOperator.min:
-                agg_val = min(list(self.keys_ts[entity][stat].values()))
-            elif aggregation_op is self.AggregationOperator.avg:
-                values = list(self.keys_ts[entity][stat].values())
-                agg_val = sum(values) / len(values)
-            result[stat] = agg_val
+            result[stat] = store.aggregate(entity, stat, aggregation_op.name)
         return result
 
     def check_and_trigger_conditions(self, conditions):
         # get the list of statistics that need to be fetched
         reqd_keys = self.get_keys_from_conditions(conditions)
         # fetch the required statistics and populate the map 'keys_ts'
-        self.fetch_timeseries(reqd_keys)
+        if self.profile:
+            start = self.profile.now()
+            self.fetch_timeseries(reqd_keys)
+            self.profile.record(
+                type(self).__name__ + ".fetch_timeseries", self.profile.now() - start
+            )
+        else:
+            self.fetch_timeseries(reqd_keys)
+        # the store is built once and shared by all the conditions
+        store = self.get_store()
         # Trigger the appropriate conditions
         for cond in conditions:
-            complete_keys = self.get_keys_from_conditions([cond])
-            # Get the entities that have all statistics required by 'cond':
-            # an entity is checked for a given condition only if we possess all
-            # of the condition's 'keys' for that entity
-            entities_with_stats = []
-            for entity in self.keys_ts:
-                stat_missing = False
-                for stat in complete_keys:
-                    if stat not in self.keys_ts[entity]:
-                        stat_missing = True
-                        break
-                if not stat_missing:
-                    entities_with_stats.append(entity)
-            if not entities_with_stats:
+            if not self.profile:
+                self.trigger_condition(store, cond)
                 continue
-            if cond.behavior is self.Behavior.bursty:
-                # for a condition that checks for bursty behavior, only one key
-                # should be present in the condition's 'keys' field
-                result = self.fetch_burst_epochs(
-                    entities_with_stats,
-                    complete_keys[0],  # there should be only one key
-                    cond.window_sec,
-                    cond.rate_threshold,
-                    True,
-                )
-                # Trigger in this case is:
-                # Dict[entity_name, Dict[timestamp, rate_change]]
-                # where the inner dictionary contains rate_change values when
-                # the rate_change >= threshold provided, with the
-                # corresponding timestamps
-                if result:
-                    cond.set_trigger(result)
-            elif cond.behavior is self.Behavior.evaluate_expression:
-                self.handle_evaluate_expression(
-                    cond, complete_keys, entities_with_stats
+            start = self.profile.now()
+            num_samples = self.trigger_condition(store, cond)
+            # every sample is a (timestamp, value) pair of 8 bytes each
+            self.profile.record(
+                cond.name,
+                self.profile.now() - start,
+                records=num_samples,
+                num_bytes=16 * num_samples,
+            )
+
+    def trigger_condition(self, store, cond):
+        # checks 'cond' on the time series of 'store' and returns the number
+        # of samples it was checked on
+        complete_keys = self.get_keys_from_conditions([cond])
+        # Get the entities that have all statistics required by 'cond':
+        # an entity is checked for a given condition only if we possess all
+        # of the condition's 'keys' for that entity
+        entities_with_stats = store.get_entities_with_keys(complete_keys)
+        if not entities_with_stats:
+            return 0
+        if cond.behavior is self.Behavior.bursty:
+            # for a condition that checks for bursty behavior, only one key
+            # should be present in the condition's 'keys' field
+            burst_intervals = self.fetch_burst_intervals(
+                store,
+                entities_with_stats,
+                complete_keys[0],  # there should be only one key
+                cond.window_sec,
+                cond.rate_threshold,
+                cond.burst_method,
+                cond.ewma_alpha,
+            )
+            # Trigger in this case is:
+            # Dict[entity_name, Dict[timestamp, score]]
+            # where the inner dictionary has one entry per burst: the peak
+            # score (eg. the percent rate change) of the burst and the
+            # timestamp at which it peaked; the whole intervals of the bursts
+            # are kept in the condition's 'burst_intervals'
+            if burst_intervals:
+                cond.burst_intervals = burst_intervals
+                cond.set_trigger(
+                    {
+                        entity: {
+                            interval.peak_timestamp: interval.peak_score
+                            for interval in intervals
+                        }
+                        for entity, intervals in burst_intervals.items()
+                    }
                 )
+        elif cond.behavior is self.Behavior.evaluate_expression:
+            self.handle_evaluate_expression(
+                store, cond, complete_keys, entities_with_stats
+            )
+        return sum(
+            len(store.get_series(entity, key)[0])
+            for entity in entities_with_stats
+            for key in complete_keys
+        )
 
-    def handle_evaluate_expression(self, condition, statistics, entities):
+    def handle_evaluate_expression(self, store, condition, statistics, entities):
         trigger = {}
         # check 'condition' for each of these entities
         for entity in entities:
@@ -175,29 +222,34 @@ class TimeSeriesData(DataSource):
                 # True, then list of the keys values is added to the
                 # condition's trigger: Dict[entity_name, List[stats]]
                 result = self.fetch_aggregated_values(
-                    entity, statistics, condition.aggregation_op
+                    store, entity, statistics, condition.aggregation_op
                 )
                 keys = [result[key] for key in statistics]
                 try:
-                    if eval(condition.expression):
+                    if condition.compiled_expression.evaluate(keys):
                         trigger[entity] = keys
                 except Exception as e:
                     print("WARNING(TimeSeriesData) check_and_trigger: " + str(e))
             else:
-                # assumption: all stats have same series of timestamps
                 # this is similar to the above but 'expression' is evaluated at
-                # each timestamp, since there is no aggregation, and all the
-                # epochs are added to the trigger when the condition's
-                # 'expression' evaluated to true; so trigger is:
+                # each timestamp common to all the stats, since there is no
+                # aggregation, and all the epochs are added to the trigger when
+                # the condition's 'expression' evaluated to true; so trigger is:
                 # Dict[entity, Dict[timestamp, List[stats]]]
-                for epoch in self.keys_ts[entity][statistics[0]].keys():
-                    keys = [self.keys_ts[entity][key][epoch] for key in statistics]
-                    try:
-                        if eval(condition.expression):
-                            if entity not in trigger:
-                                trigger[entity] = {}
-                            trigger[entity][epoch] = keys
-                    except Exception as e:
-                        print("WARNING(TimeSeriesData) check_and_trigger: " + str(e))
+                # The compiled expression is evaluated over all the epochs in
+                # one call.
+                timestamps, values = store.align(entity, statistics)
+                try:
+                    is_triggered = condition.compiled_expression.evaluate(values)
+                except Exception as e:
+                    print("WARNING(TimeSeriesData) check_and_trigger: " + str(e))
+                    continue
+                if is_triggered.any():
+                    trigger[entity] = dict(
+                        zip(
+                            timestamps[is_triggered].tolist(),
+                            values.T[is_triggered].tolist(),
+                        )
+                    )
         if trigger:
             condition.set_trigger(trigger)
@@ -0,0 +1,149 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import numpy as np
+
+
+class TimeSeriesStore:
+    """
+    A columnar store for the time series of a TimeSeriesData object. For every
+    (entity, statistic) pair it holds one sorted int64 array of timestamps and
+    one float64 array of the corresponding values, so that rate-of-change,
+    aggregations and joins across statistics are computed with vectorised
+    NumPy operations instead of Python loops over dictionaries.
+    """
+
+    @classmethod
+    def from_keys_ts(cls, keys_ts):
+        # keys_ts: Dict[entity, Dict[key, Dict[timestamp, value]]]
+        # Note: some fetchers (eg. OdsStatsFetcher.parse_ods_output) store the
+        # timestamps and values as strings, they are converted here.
+        store = cls()
+        for entity in keys_ts:
+            for key, series in keys_ts[entity].items():
+                timestamps = np.fromiter(
+                    (int(ts) for ts in series.keys()), np.int64, len(series)
+                )
+                values = np.fromiter(
+                    (float(val) for val in series.values()), np.float64, len(series)
+                )
+                store.add_series(entity, key, timestamps, values)
+        return store
+
+    def __init__(self):
+        # Dict[entity, Dict[key, Tuple[np.ndarray(int64), np.ndarray(float64)]]]
+        self.series = {}
+
+    def add_series(self, entity, key, timestamps, values):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if timestamps.shape != values.shape:
+            raise ValueError(
+                "TimeSeriesStore: " + str(key) + " has mismatched timestamps and values"
+            )
+        order = np.argsort(timestamps, kind="stable")
+        if entity not in self.series:
+            self.series[entity] = {}
+        self.series[entity][key] = (timestamps[order], values[order])
+
+    def extend(self, other):
+        # adds the time series of the store 'other' to this store; the samples
+        # of 'other' replace the samples of this store at the same timestamps
+        for entity, entity_series in other.series.items():
+            for key, (timestamps, values) in entity_series.items():
+                if not self.has_series(entity, key):
+                    if entity not in self.series:
+                        self.series[entity] = {}
+                    self.series[entity][key] = (timestamps, values)
+                    continue
+                old_timestamps, old_values = self.series[entity][key]
+                if not len(timestamps):
+                    continue
+                if not len(old_timestamps) or old_timestamps[-1] < timestamps[0]:
+                    # the common case of samples appended in time order
+                    self.series[entity][key] = (
+                        np.concatenate((old_timestamps, timestamps)),
+                        np.concatenate((old_values, values)),
+                    )
+                    continue
+                keep = ~np.isin(old_timestamps, timestamps)
+                self.add_series(
+                    entity,
+                    key,
+                    np.concatenate((old_timestamps[keep], timestamps)),
+                    np.concatenate((old_values[keep], values)),
+                )
+
+    def get_entities(self):
+        return list(self.series.keys())
+
+    def has_series(self, entity, key):
+        return entity in self.series and key in self.series[entity]
+
+    def get_series(self, entity, key):
+        # returns the (timestamps, values) arrays of 'key' for 'entity'
+        return self.series[entity][key]
+
+    def get_entities_with_keys(self, keys):
+        # returns the entities for which the time series of all the 'keys'
+        # are present
+        return [
+            entity
+            for entity in self.series
+            if all(key in self.series[entity] for key in keys)
+        ]
+
+    def rate_change(self, entity, key, window_samples, duration_sec, percent):
+        # Computes the rate of change of 'key' for 'entity' between every
+        # sample and the sample that is 'window_samples' behind it:
+        # rate = ((curr_val - prev_val) * duration_sec) / (curr_ts - prev_ts)
+        # and if 'percent' is True, the difference in values is expressed as
+        # a percentage of prev_val. Returns the (timestamps, rates) arrays,
+        # where each timestamp is that of the later sample of the window.
+        timestamps, values = self.series[entity][key]
+        if window_samples < 1 or len(timestamps) <= window_samples:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        first_ts = timestamps[:-window_samples]
+        last_ts = timestamps[window_samples:]
+        first_val = values[:-window_samples]
+        diff = values[window_samples:] - first_val
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if percent:
+                diff = diff * 100 / first_val
+            rates = (diff * duration_sec) / (last_ts - first_ts)
+        return last_ts, rates
+
+    def aggregate(self, entity, key, aggregation_op):
+        # 'aggregation_op' is the name of a TimeSeriesData.AggregationOperator
+        timestamps, values = self.series[entity][key]
+        if not len(values):
+            return None
+        if aggregation_op == "latest":
+            return float(values[-1])
+        elif aggregation_op == "oldest":
+            return float(values[0])
+        elif aggregation_op == "max":
+            return float(values.max())
+        elif aggregation_op == "min":
+            return float(values.min())
+        elif aggregation_op == "avg":
+            return float(values.mean())
+        raise ValueError("TimeSeriesStore: unknown aggregation " + str(aggregation_op))
+
+    def align(self, entity, keys):
+        # Joins the time series of 'keys' for 'entity' on their common
+        # timestamps. Returns the sorted common timestamps and a 2-D float64
+        # array with one row per key, i.e. values[i][j] is the value of
+        # keys[i] at timestamps[j].
+        timestamps = self.series[entity][keys[0]][0]
+        for key in keys[1:]:
+            timestamps = np.intersect1d(
+                timestamps, self.series[entity][key][0], assume_unique=True
+            )
+        values = np.empty((len(keys), len(timestamps)), dtype=np.float64)
+        for ix, key in enumerate(keys):
+            key_ts, key_values = self.series[entity][key]
+            values[ix] = key_values[np.searchsorted(key_ts, timestamps)]
+        return timestamps, values
@@ -0,0 +1,212 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import csv
+import json
+import os
+import time
+
+from advisor.db_objectives import MAXIMIZED_METRICS, THROUGHPUT
+from advisor.db_options_parser import DatabaseOptions
+
+
+class TrajectoryLog:
+    """
+    The trajectory of an optimizer session, persisted as JSON lines so that
+    it survives an interrupted session: a first 'session' record describing
+    the session (eg. its name, search mode and seed), then one 'step' record
+    per benchmarked configuration with the rule applied, the diff of the
+    options from the configuration the step started from, the metric (or
+    metric vector), whether the configuration was accepted or backtracked
+    from, the duration of the benchmark and the full configuration.
+    """
+
+    SESSION = "session"
+    STEP = "step"
+
+    def __init__(self, file_path, session_info=None):
+        self.file_path = file_path
+        self.num_steps = 0
+        # the options of the last accepted configuration
+        self.incumbent_options = None
+        session = {"type": self.SESSION, "start_time": time.time()}
+        session.update(session_info or {})
+        if "name" not in session:
+            session["name"] = os.path.splitext(os.path.basename(file_path))[0]
+        with open(self.file_path, "w") as fp:
+            fp.write(json.dumps(session, default=str) + "\n")
+
+    def add_step(self, db_options, metric, rule=None, accepted=True, duration_sec=None):
+        options = db_options.get_all_options()
+        diff = {}
+        if self.incumbent_options is not None:
+            diff = DatabaseOptions.get_options_diff(self.incumbent_options, options)
+        step = {
+            "type": self.STEP,
+            "step": self.num_steps,
+            "rule": rule,
+            "diff": diff,
+            "metric": metric,
+            "accepted": accepted,
+            "duration_sec": duration_sec,
+            "options": options,
+        }
+        if accepted:
+            self.incumbent_options = options
+        self.num_steps += 1
+        with open(self.file_path, "a") as fp:
+            fp.write(json.dumps(step, default=str) + "\n")
+
+
+def load_trajectory(file_path):
+    # returns the (session, List[step]) records of a trajectory log; a
+    # partially written last record (of an interrupted session) is skipped
+    session = None
+    steps = []
+    with open(file_path) as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type") == TrajectoryLog.SESSION:
+                session = record
+            elif record.get("type") == TrajectoryLog.STEP:
+                steps.append(record)
+    if session is None:
+        raise ValueError("TrajectoryLog: no session record in: " + file_path)
+    return session, steps
+
+
+class TrajectoryComparison:
+    """
+    Compares the trajectories of several optimizer sessions (eg. different
+    search strategies, or the same one with different seeds) on one metric:
+    the best metric found after every step, the number of benchmark runs
+    each session needed to reach a target metric, and the best configuration
+    found across all the sessions, to be used as the warm start of a new
+    session. 'metric' picks a metric out of the metric vectors of the
+    multi-objective sessions, the single-objective sessions have one metric
+    only; unless 'maximize' is given, larger values are better only for the
+    MAXIMIZED_METRICS, eg. THROUGHPUT.
+    """
+
+    def __init__(self, trajectories, metric=THROUGHPUT, maximize=None):
+        # List[Tuple(session, List[step])]
+        self.trajectories = trajectories
+        self.metric = metric
+        if maximize is None:
+            maximize = metric in MAXIMIZED_METRICS
+        self.maximize = maximize
+
+    @classmethod
+    def from_files(cls, file_paths, metric=THROUGHPUT, maximize=None):
+        return cls(
+            [load_trajectory(file_path) for file_path in file_paths], metric, maximize
+        )
+
+    def get_value(self, step):
+        metric = step["metric"]
+        if isinstance(metric, dict):
+            metric = metric.get(self.metric)
+        return metric
+
+    def is_better(self, value, best_value):
+        if value is None:
+            return False
+        if best_value is None:
+            return True
+        return value > best_value if self.maximize else value < best_value
+
+    def get_best_so_far(self, steps):
+        # the best metric among the configurations benchmarked up to (and
+        # including) every step
+        best_so_far = []
+        best_value = None
+        for step in steps:
+            value = self.get_value(step)
+            if self.is_better(value, best_value):
+                best_value = value
+            best_so_far.append(best_value)
+        return best_so_far
+
+    def get_runs_to_target(self, steps, target):
+        # the number of benchmark runs until the target metric was reached,
+        # None if it was never reached
+        for ix, value in enumerate(self.get_best_so_far(steps)):
+            if value is not None and (value == target or self.is_better(value, target)):
+                return ix + 1
+        return None
+
+    def get_best_step(self):
+        # returns the (session, step) of the best configuration of all the
+        # sessions, or None if no step has a metric
+        best = None
+        for session, steps in self.trajectories:
+            for step in steps:
+                if best is None or self.is_better(
+                    self.get_value(step), self.get_value(best[1])
+                ):
+                    best = (session, step)
+        if best is None or self.get_value(best[1]) is None:
+            return None
+        return best
+
+    def get_warm_start_options(self):
+        # the best configuration across all the sessions, in the format of
+        # DatabaseOptions.update_options(), or None
+        best = self.get_best_step()
+        if not best:
+            return None
+        return best[1]["options"]
+
+    def write_overlay_csv(self, file_path):
+        # one row per step and one column per session with the best metric
+        # so far, to overlay the trajectories in a spreadsheet or a plot
+        names = [session["name"] for session, _ in self.trajectories]
+        columns = [self.get_best_so_far(steps) for _, steps in self.trajectories]
+        num_steps = max((len(column) for column in columns), default=0)
+        with open(file_path, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["step"] + names)
+            for ix in range(num_steps):
+                writer.writerow(
+                    [ix]
+                    + [column[ix] if ix < len(column) else "" for column in columns]
+                )
+
+    def print_report(self, target=None):
+        print("Sessions compared on: " + self.metric)
+        for session, steps in self.trajectories:
+            best_so_far = self.get_best_so_far(steps)
+            durations = [step["duration_sec"] or 0 for step in steps]
+            line = (
+                session["name"]
+                + ": runs: "
+                + str(len(steps))
+                + ", accepted: "
+                + str(sum(1 for step in steps if step["accepted"]))
+                + ", best: "
+                + str(best_so_far[-1] if best_so_far else None)
+                + ", benchmark time (sec): "
+                + str(round(sum(durations), 1))
+            )
+            if target is not None:
+                line += ", runs to target: " + str(
+                    self.get_runs_to_target(steps, target)
+                )
+            print(line)
+        best = self.get_best_step()
+        if best:
+            print(
+                "Best configuration: session "
+                + best[0]["name"]
+                + ", step "
+                + str(best[1]["step"])
+                + ", "
+                + self.metric
+                + ": "
+                + str(self.get_value(best[1]))
+            )
@@ -0,0 +1,179 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import ast
+import operator
+
+import numpy as np
+
+
+class CompiledExpression:
+    """
+    A condition's 'evaluate' expression, eg. '(keys[1]/keys[0])>5', parsed
+    once and compiled into a tree of NumPy operations. Unlike eval(), only
+    numbers, indexing of the expression's variable with an integer
+    (eg. keys[1]), arithmetic, comparisons and boolean operators are allowed,
+    so a rules file cannot execute arbitrary code.
+
+    The compiled expression is evaluated over whole time series at once: each
+    'keys[i]' is a row of a 2-D array that has one column per epoch, and the
+    result has one boolean per epoch.
+    """
+
+    BIN_OPS = {
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Pow: np.power,
+    }
+    COMPARE_OPS = {
+        ast.Eq: np.equal,
+        ast.NotEq: np.not_equal,
+        ast.Lt: np.less,
+        ast.LtE: np.less_equal,
+        ast.Gt: np.greater,
+        ast.GtE: np.greater_equal,
+    }
+    UNARY_OPS = {
+        ast.UAdd: operator.pos,
+        ast.USub: np.negative,
+        ast.Not: np.logical_not,
+    }
+
+    @staticmethod
+    def _divide(numerator, denominator, divide_op):
+        # eval() raised ZeroDivisionError for such epochs and they were
+        # skipped; here they evaluate to NaN, which fails every comparison
+        numerator, denominator = np.broadcast_arrays(
+            np.asarray(numerator, dtype=np.float64),
+            np.asarray(denominator, dtype=np.float64),
+        )
+        result = np.full(numerator.shape, np.nan)
+        divide_op(numerator, denominator, out=result, where=(denominator != 0))
+        return result
+
+    def __init__(self, expression, variable="keys"):
+        self.expression = expression
+        self.variable = variable
+        # the largest index of 'variable' used in the expression
+        self.max_index = -1
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError("invalid expression: " + expression + ": " + str(e))
+        self.evaluator = self._compile(tree.body)
+
+    def __getstate__(self):
+        # the evaluator is a tree of closures, which cannot be pickled; it is
+        # compiled again from the expression when unpickled
+        return (self.expression, self.variable)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _compile(self, node):
+        # returns a function that takes the 2-D array of values and returns
+        # the value of the sub-expression rooted at 'node'
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = node.value
+            return lambda values: value
+        if isinstance(node, ast.Subscript):
+            if not (
+                isinstance(node.value, ast.Name) and node.value.id == self.variable
+            ):
+                raise ValueError(
+                    "only "
+                    + self.variable
+                    + "[<int>] can be indexed: "
+                    + self.expression
+                )
+            index = node.slice
+            if not (isinstance(index, ast.Constant) and type(index.value) is int):
+                raise ValueError(
+                    self.variable + " must be indexed by an int: " + self.expression
+                )
+            index = index.value
+            self.max_index = max(self.max_index, index)
+            return lambda values: values[index]
+        if isinstance(node, ast.BinOp):
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            if isinstance(node.op, ast.Div):
+                return lambda values: self._divide(
+                    left(values), right(values), np.divide
+                )
+            if isinstance(node.op, ast.Mod):
+                return lambda values: self._divide(left(values), right(values), np.fmod)
+            if type(node.op) in self.BIN_OPS:
+                op = self.BIN_OPS[type(node.op)]
+                return lambda values: op(left(values), right(values))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY_OPS:
+            op = self.UNARY_OPS[type(node.op)]
+            operand = self._compile(node.operand)
+            return lambda values: op(operand(values))
+        if isinstance(node, ast.Compare):
+            if all(type(op) in self.COMPARE_OPS for op in node.ops):
+                return self._compile_compare(node)
+        if isinstance(node, ast.BoolOp):
+            operands = [self._compile(value) for value in node.values]
+            op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+
+            def bool_op(values):
+                result = operands[0](values)
+                for operand in operands[1:]:
+                    result = op(result, operand(values))
+                return result
+
+            return bool_op
+        raise ValueError(
+            "unsupported construct '"
+            + type(node).__name__
+            + "' in expression: "
+            + self.expression
+        )
+
+    def _compile_compare(self, node):
+        # a chained comparison 'a < b < c' is 'a < b and b < c'
+        operands = [self._compile(node.left)]
+        operands.extend(self._compile(comparator) for comparator in node.comparators)
+        ops = [self.COMPARE_OPS[type(op)] for op in node.ops]
+
+        def compare(values):
+            operand_values = [operand(values) for operand in operands]
+            result = ops[0](operand_values[0], operand_values[1])
+            for ix in range(1, len(ops)):
+                result = np.logical_and(
+                    result, ops[ix](operand_values[ix], operand_values[ix + 1])
+                )
+            return result
+
+        return compare
+
+    def evaluate(self, values):
+        # 'values' is a sequence whose i-th element is the value (or the 1-D
+        # array of values over the epochs) of 'keys[i]'. Returns a boolean (or
+        # a boolean array with one element per epoch) that is True where the
+        # expression is truthy; NaN values are never truthy.
+        values = np.asarray(values, dtype=np.float64)
+        if self.max_index >= len(values):
+            raise IndexError(
+                "expression "
+                + self.expression
+                + " uses "
+                + self.variable
+                + "["
+                + str(self.max_index)
+                + "] but only "
+                + str(len(values))
+                + " values were provided"
+            )
+        with np.errstate(all="ignore"):
+            result = np.asarray(self.evaluator(values))
+        if result.dtype != np.bool_:
+            result = (result != 0) & ~np.isnan(result)
+        if len(values.shape) > 1:
+            # broadcast constant expressions over all the epochs
+            result = np.broadcast_to(result, values.shape[1:])
+        return result
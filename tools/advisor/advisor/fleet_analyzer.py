@@ -0,0 +1,247 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import glob
+import multiprocessing
+import os
+import re
+
+from advisor.db_log_parser import DatabaseLogs, DataSource
+from advisor.db_options_parser import DatabaseOptions
+from advisor.db_stats_fetcher import LogStatsParser
+from advisor.rule_parser import RulesSpec
+
+
+class FleetInstance:
+    """
+    The inputs of the Advisor for one database instance of a fleet: its
+    OPTIONS file and the path prefix of its LOG files.
+    """
+
+    OPTIONS_FILE_REGEX = re.compile(r"^OPTIONS-(\d+)$")
+
+    @classmethod
+    def from_db_dir(cls, db_dir, log_file_name="LOG"):
+        # picks the latest OPTIONS file of the database, returns None if the
+        # directory does not contain any
+        latest_options = None
+        latest_number = -1
+        for file_name in os.listdir(db_dir):
+            match = cls.OPTIONS_FILE_REGEX.match(file_name)
+            if match and int(match.group(1)) > latest_number:
+                latest_number = int(match.group(1))
+                latest_options = file_name
+        if latest_options is None:
+            return None
+        return cls(
+            os.path.basename(os.path.normpath(db_dir)),
+            os.path.join(db_dir, latest_options),
+            os.path.join(db_dir, log_file_name),
+        )
+
+    @classmethod
+    def from_fleet_dir(cls, fleet_dir, log_file_name="LOG"):
+        # every sub-directory of 'fleet_dir' that contains an OPTIONS file is
+        # the data directory (or a copy of it) of one database instance
+        instances = []
+        for db_dir in sorted(glob.glob(os.path.join(fleet_dir, "*"))):
+            if not os.path.isdir(db_dir):
+                continue
+            instance = cls.from_db_dir(db_dir, log_file_name)
+            if instance:
+                instances.append(instance)
+        return instances
+
+    def __init__(self, name, options_path, log_files_path_prefix):
+        self.name = name
+        self.options_path = options_path
+        self.log_files_path_prefix = log_files_path_prefix
+
+    def __repr__(self):
+        return (
+            "FleetInstance: "
+            + self.name
+            + " options: "
+            + self.options_path
+            + " logs: "
+            + self.log_files_path_prefix
+        )
+
+
+# The rules spec of a worker process; the rules spec loaded by the parent
+# process is sent once to every worker by init_worker() and re-used for all
+# the instances the worker analyzes.
+_worker_rules_spec = None
+
+
+def init_worker(rules_spec):
+    global _worker_rules_spec
+    _worker_rules_spec = rules_spec
+
+
+def analyze_instance(instance, stats_dump_period_sec):
+    # Runs the Advisor on one instance in a worker process and returns a
+    # picklable summary: (instance name, {rule name: scope}, error); the
+    # scope of a rule is the column families it was triggered for.
+    try:
+        rules_spec = _worker_rules_spec
+        rules_spec.reset_triggers()
+        db_options = DatabaseOptions(instance.options_path)
+        column_families = db_options.get_column_families()
+        data_sources = {
+            DataSource.Type.DB_OPTIONS: [db_options],
+            DataSource.Type.LOG: [
+                DatabaseLogs(instance.log_files_path_prefix, column_families)
+            ],
+            DataSource.Type.TIME_SERIES: [
+                LogStatsParser(instance.log_files_path_prefix, stats_dump_period_sec)
+            ],
+        }
+        triggered_rules = rules_spec.get_triggered_rules(data_sources, column_families)
+        result = {}
+        for rule in triggered_rules:
+            result[rule.name] = sorted(rule.get_trigger_column_families() or [])
+        return instance.name, result, None
+    except Exception as e:
+        return instance.name, {}, type(e).__name__ + ": " + str(e)
+
+
+class FleetReport:
+    """
+    The Advisor's results aggregated over a fleet: which rules were triggered
+    on which instances and the suggested option changes ranked by impact,
+    i.e. by the number of instances on which at least one rule suggesting the
+    change was triggered.
+    """
+
+    def __init__(self, rules_spec, instance_results):
+        # 'instance_results' is a list of the return values of
+        # analyze_instance()
+        self.rules_spec = rules_spec
+        self.num_instances = len(instance_results)
+        self.errors = {}
+        # rule name -> {instance name: column families}
+        self.rule_instances = {}
+        for name, triggered_rules, error in instance_results:
+            if error:
+                self.errors[name] = error
+                continue
+            for rule_name, column_families in triggered_rules.items():
+                if rule_name not in self.rule_instances:
+                    self.rule_instances[rule_name] = {}
+                self.rule_instances[rule_name][name] = column_families
+
+    def get_num_analyzed(self):
+        return self.num_instances - len(self.errors)
+
+    def get_rule_fractions(self):
+        # returns [(rule name, number of instances, fraction of the fleet)]
+        # sorted by decreasing number of instances
+        num_analyzed = self.get_num_analyzed()
+        fractions = []
+        for rule_name, instances in self.rule_instances.items():
+            fractions.append((rule_name, len(instances), len(instances) / num_analyzed))
+        fractions.sort(key=lambda x: (-x[1], x[0]))
+        return fractions
+
+    @staticmethod
+    def get_change_name(suggestion):
+        if suggestion.description:
+            return suggestion.description
+        change = suggestion.option + " " + suggestion.action.name
+        if suggestion.suggested_values:
+            change += " " + str(suggestion.suggested_values)
+        return change
+
+    def get_ranked_changes(self):
+        # Suggestions of different rules that change an option in the same
+        # way are the same change. Returns [(change, instances, rules)]
+        # ranked by the number of instances that the change applies to, ties
+        # broken by the number of rules suggesting it.
+        suggestions_dict = self.rules_spec.get_suggestions_dict()
+        rules_dict = self.rules_spec.get_rules_dict()
+        changes = {}
+        for rule_name, instances in self.rule_instances.items():
+            for sugg_name in rules_dict[rule_name].get_suggestions():
+                change = self.get_change_name(suggestions_dict[sugg_name])
+                if change not in changes:
+                    changes[change] = (set(), set())
+                changes[change][0].update(instances.keys())
+                changes[change][1].add(rule_name)
+        ranked_changes = [
+            (change, sorted(instances), sorted(rules))
+            for change, (instances, rules) in changes.items()
+        ]
+        ranked_changes.sort(key=lambda x: (-len(x[1]), -len(x[2]), x[0]))
+        return ranked_changes
+
+    def print_report(self, max_instances_listed=10):
+        num_analyzed = self.get_num_analyzed()
+        print(
+            "\nFleet: "
+            + str(num_analyzed)
+            + " of "
+            + str(self.num_instances)
+            + " instances analyzed"
+        )
+        for name, error in sorted(self.errors.items()):
+            print("WARNING(FleetReport) " + name + ": " + error)
+        if not num_analyzed:
+            return
+        print("\nTriggered rules:")
+        for rule_name, count, fraction in self.get_rule_fractions():
+            print("{:6.1%} ({}/{}) {}".format(fraction, count, num_analyzed, rule_name))
+        print("\nSuggested changes, ranked by impact:")
+        for rank, (change, instances, rules) in enumerate(self.get_ranked_changes()):
+            print(
+                "{}. {} instances: {} ({:.1%}) rules: {}".format(
+                    rank + 1,
+                    change,
+                    len(instances),
+                    len(instances) / num_analyzed,
+                    ", ".join(rules),
+                )
+            )
+            listed = instances[:max_instances_listed]
+            if len(instances) > max_instances_listed:
+                listed.append("...")
+            print("   " + ", ".join(listed))
+
+
+class FleetAnalyzer:
+    """
+    Runs the Advisor on all the instances of a fleet in parallel, in a pool of
+    'num_workers' processes (one per CPU by default), and aggregates the
+    results into a FleetReport.
+    """
+
+    def __init__(
+        self,
+        rules_spec_path,
+        stats_dump_period_sec,
+        num_workers=None,
+        rules_cache_dir=None,
+    ):
+        self.rules_spec_path = rules_spec_path
+        self.stats_dump_period_sec = stats_dump_period_sec
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        # the rules spec is loaded (and checked) only in the parent process,
+        # which also uses it to look up the suggestions of triggered rules
+        self.rules_spec = RulesSpec(rules_spec_path, rules_cache_dir)
+        self.rules_spec.load()
+
+    def analyze(self, instances):
+        tasks = [(instance, self.stats_dump_period_sec) for instance in instances]
+        if self.num_workers == 1:
+            init_worker(self.rules_spec)
+            results = [analyze_instance(*task) for task in tasks]
+        else:
+            with multiprocessing.Pool(
+                self.num_workers, init_worker, (self.rules_spec,)
+            ) as pool:
+                # many small chunks keep the workers evenly loaded when the
+                # size of the LOG files varies across the fleet
+                results = pool.starmap(analyze_instance, tasks, chunksize=1)
+        return FleetReport(self.rules_spec, results)
@@ -0,0 +1,76 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import argparse
+
+from advisor.fleet_analyzer import FleetAnalyzer, FleetInstance
+
+
+def main(args):
+    instances = FleetInstance.from_fleet_dir(args.fleet_path, args.log_file_name)
+    if not instances:
+        print("WARNING(FleetAnalyzer) no instances found in: " + args.fleet_path)
+        return
+    fleet_analyzer = FleetAnalyzer(
+        args.rules_spec,
+        args.stats_dump_period_sec,
+        args.num_workers,
+        args.rules_cache_dir,
+    )
+    report = fleet_analyzer.analyze(instances)
+    report.print_report(args.max_instances_listed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Use this script to run the Advisor on a fleet of Rocksdb\
+        instances and get the suggestions ranked by the fraction of the fleet\
+        they apply to."
+    )
+    parser.add_argument(
+        "--rules_spec",
+        required=True,
+        type=str,
+        help="path of the file containing the expert-specified Rules",
+    )
+    parser.add_argument(
+        "--rules_cache_dir",
+        type=str,
+        help="the directory in which the parsed rules spec is cached, so "
+        + "that an unchanged rules spec is not parsed again",
+    )
+    parser.add_argument(
+        "--fleet_path",
+        required=True,
+        type=str,
+        help="path of the directory that has one sub-directory per Rocksdb "
+        + "instance, containing its OPTIONS-* and LOG files",
+    )
+    parser.add_argument(
+        "--log_file_name",
+        type=str,
+        default="LOG",
+        help="the name of the Rocksdb LOG file in the instance directories",
+    )
+    parser.add_argument(
+        "--stats_dump_period_sec",
+        required=True,
+        type=int,
+        help="the frequency (in seconds) at which STATISTICS are printed to "
+        + "the Rocksdb LOG files",
+    )
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        help="the number of worker processes, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--max_instances_listed",
+        type=int,
+        default=10,
+        help="the maximum number of instances listed for each suggestion",
+    )
+    args = parser.parse_args()
+    main(args)
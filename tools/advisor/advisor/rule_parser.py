@@ -3,13 +3,22 @@
 #  COPYING file in the root directory) and Apache 2.0 License
 #  (found in the LICENSE.Apache file in the root directory).
 
+import bisect
+import hashlib
+import itertools
+import json
+import os
 import re
+import tempfile
 from abc import ABC, abstractmethod
 from enum import Enum
 
+from advisor.db_burst_detector import BurstDetector
 from advisor.db_log_parser import DataSource, NO_COL_FAMILY
 from advisor.db_timeseries_parser import TimeSeriesData
+from advisor.expression_compiler import CompiledExpression
 from advisor.ini_parser import IniParser
+from advisor.rule_report import EvaluationProfile
 
 
 class Section(ABC):
@@ -82,41 +91,76 @@ class Rule(Section):
                     in_seconds *= 24 * 60 * 60
                 self.overlap_time_seconds = in_seconds
 
-    def get_overlap_timestamps(self, key1_trigger_epochs, key2_trigger_epochs):
-        # this method takes in 2 timeseries i.e. timestamps at which the
-        # rule's 2 TIME_SERIES conditions were triggered and it finds
-        # (if present) the first pair of timestamps at which the 2 conditions
-        # were triggered within 'overlap_time_seconds' of each other
-        key1_lower_bounds = [
-            epoch - self.overlap_time_seconds for epoch in key1_trigger_epochs
-        ]
-        key1_lower_bounds.sort()
-        key2_trigger_epochs.sort()
-        trigger_ix = 0
-        overlap_pair = None
-        for key1_lb in key1_lower_bounds:
-            while key2_trigger_epochs[trigger_ix] < key1_lb and trigger_ix < len(
-                key2_trigger_epochs
-            ):
-                trigger_ix += 1
-            if trigger_ix >= len(key2_trigger_epochs):
-                break
-            if key2_trigger_epochs[trigger_ix] <= key1_lb + (
-                2 * self.overlap_time_seconds
-            ):
-                overlap_pair = (
-                    key2_trigger_epochs[trigger_ix],
-                    key1_lb + self.overlap_time_seconds,
-                )
-                break
-        return overlap_pair
+    def get_overlap_timestamps(self, key1_trigger_intervals, key2_trigger_intervals):
+        # this method takes in the (start, end) intervals over which the rule's
+        # 2 TIME_SERIES conditions were triggered, i.e. the bursts of a
+        # bursty condition or (epoch, epoch) for every epoch at which an
+        # expression evaluated to true, and it finds (if present) the first
+        # pair of intervals that are within 'overlap_time_seconds' of each
+        # other; it returns the pair of their closest timestamps, the one of
+        # the second condition first
+        key2_trigger_intervals = sorted(key2_trigger_intervals)
+        if not key2_trigger_intervals:
+            return None
+        key2_starts = [start for start, _ in key2_trigger_intervals]
+        # the largest end of the intervals up to each index, non-decreasing
+        key2_max_ends = list(
+            itertools.accumulate((end for _, end in key2_trigger_intervals), func=max)
+        )
+        for key1_start, key1_end in sorted(key1_trigger_intervals):
+            # the key2 intervals that start early enough to overlap
+            num_candidates = bisect.bisect_right(
+                key2_starts, key1_end + self.overlap_time_seconds
+            )
+            if not num_candidates:
+                continue
+            # the first of them that also ends late enough to overlap
+            trigger_ix = bisect.bisect_left(
+                key2_max_ends,
+                key1_start - self.overlap_time_seconds,
+                hi=num_candidates,
+            )
+            if trigger_ix == num_candidates:
+                continue
+            key2_start, key2_end = key2_trigger_intervals[trigger_ix]
+            key1_timestamp = min(max(key2_start, key1_start), key1_end)
+            key2_timestamp = min(max(key1_timestamp, key2_start), key2_end)
+            return (key2_timestamp, key1_timestamp)
+        return None
+
+    @staticmethod
+    def get_trigger_intervals(cond, entity):
+        # a bursty condition is triggered over the whole intervals of its
+        # bursts, while its trigger only has the peak of every burst; other
+        # conditions are triggered at the epochs of their trigger
+        burst_intervals = getattr(cond, "burst_intervals", None)
+        if burst_intervals and entity in burst_intervals:
+            return [
+                (interval.start, interval.end) for interval in burst_intervals[entity]
+            ]
+        return [(epoch, epoch) for epoch in cond.get_trigger()[entity]]
 
     def get_trigger_entities(self):
         return self.trigger_entities
 
+    def reset_trigger(self):
+        self.trigger_entities = None
+        self.trigger_column_families = None
+
     def get_trigger_column_families(self):
         return self.trigger_column_families
 
+    @staticmethod
+    def get_entity_column_families(entities, column_families):
+        # the statistics parsed per column family from the LOG (eg.
+        # 'compaction.l0.score') have the column family name as the entity, so
+        # the conditions on them are triggered for those column families only;
+        # other entities (eg. hosts or NO_ENTITY) apply to all column families
+        entity_col_fams = set(entities).intersection(column_families)
+        if entity_col_fams:
+            return entity_col_fams
+        return set(column_families)
+
     def is_triggered(self, conditions_dict, column_families):
         if self.overlap_time_seconds:
             condition1 = conditions_dict[self.conditions[0]]
@@ -137,13 +181,16 @@ class Rule(Section):
             entity_intersection = set(map1.keys()).intersection(set(map2.keys()))
             for entity in entity_intersection:
                 overlap_timestamps_pair = self.get_overlap_timestamps(
-                    list(map1[entity].keys()), list(map2[entity].keys())
+                    self.get_trigger_intervals(condition1, entity),
+                    self.get_trigger_intervals(condition2, entity),
                 )
                 if overlap_timestamps_pair:
                     self.trigger_entities[entity] = overlap_timestamps_pair
                     is_triggered = True
             if is_triggered:
-                self.trigger_column_families = set(column_families)
+                self.trigger_column_families = self.get_entity_column_families(
+                    self.trigger_entities.keys(), column_families
+                )
             return is_triggered
         else:
             all_conditions_triggered = True
@@ -165,6 +212,13 @@ class Rule(Section):
                     )
                 elif cond.get_data_source() is DataSource.Type.TIME_SERIES:
                     cond_entities = set(cond.get_trigger().keys())
+                    self.trigger_column_families = (
+                        self.trigger_column_families.intersection(
+                            self.get_entity_column_families(
+                                cond_entities, column_families
+                            )
+                        )
+                    )
                     if self.trigger_entities is None:
                         self.trigger_entities = cond_entities
                     else:
@@ -356,8 +410,18 @@ class TimeSeriesCondition(Condition):
     def create(cls, base_condition):
         base_condition.set_data_source(DataSource.Type["TIME_SERIES"])
         base_condition.__class__ = cls
+        # how the rate changes are scored for the bursty behavior (refer
+        # BurstDetector), and the intervals of the bursts that triggered the
+        # condition: Dict[entity, List[BurstInterval]]
+        base_condition.burst_method = BurstDetector.Method.percent
+        base_condition.ewma_alpha = 0.1
+        base_condition.burst_intervals = None
         return base_condition
 
+    def reset_trigger(self):
+        super().reset_trigger()
+        self.burst_intervals = None
+
     def set_parameter(self, key, value):
         if key == "keys":
             if isinstance(value, str):
@@ -370,8 +434,21 @@ class TimeSeriesCondition(Condition):
             self.rate_threshold = float(value)
         elif key == "window_sec":
             self.window_sec = int(value)
+        elif key == "burst_method":
+            try:
+                self.burst_method = BurstDetector.Method[value]
+            except KeyError:
+                raise ValueError(self.name + ": unknown burst_method: " + value)
+        elif key == "ewma_alpha":
+            self.ewma_alpha = float(value)
         elif key == "evaluate":
             self.expression = value
+            # the expression is parsed only once, into an evaluator that only
+            # supports arithmetic, comparisons and keys[i]
+            try:
+                self.compiled_expression = CompiledExpression(value)
+            except ValueError as e:
+                raise ValueError(self.name + ": " + str(e))
         elif key == "aggregation_op":
             self.aggregation_op = TimeSeriesData.AggregationOperator[value]
 
@@ -387,6 +464,8 @@ class TimeSeriesCondition(Condition):
                 self.window_sec = 300  # default window length is 5 minutes
             if len(self.keys) > 1:
                 raise ValueError(self.name + ": specify only one key")
+            if not 0 < self.ewma_alpha <= 1:
+                raise ValueError(self.name + ": ewma_alpha must be in (0, 1]")
         elif self.behavior is TimeSeriesData.Behavior.evaluate_expression:
             if not (self.expression):
                 raise ValueError(self.name + ": specify evaluation expression")
@@ -400,6 +479,7 @@ class TimeSeriesCondition(Condition):
         if self.behavior is TimeSeriesData.Behavior.bursty:
             ts_cond_str += " rate_threshold: " + str(self.rate_threshold)
             ts_cond_str += " window_sec: " + str(self.window_sec)
+            ts_cond_str += " burst_method: " + self.burst_method.name
         if self.behavior is TimeSeriesData.Behavior.evaluate_expression:
             ts_cond_str += " expression: " + self.expression
             if hasattr(self, "aggregation_op"):
@@ -410,8 +490,118 @@ class TimeSeriesCondition(Condition):
 
 
 class RulesSpec:
-    def __init__(self, rules_path):
+    """
+    Parses the rules spec file into its Rule, Condition and Suggestion
+    objects. The file is first compiled into an immutable, data-only form:
+    a tuple of its sections as (section type, section name, parameters)
+    tuples, from which the objects are built and checked. load() compiles
+    and checks the file only if it has changed since it was last loaded;
+    otherwise it just resets the triggers of the rules and conditions, so
+    that they can be evaluated again. If 'cache_dir' is given, the compiled
+    rules spec is also cached there as JSON, in a file named after the hash
+    of the rules spec file, so that loading an unchanged rules spec again
+    (in another process, or another run) skips the parsing. Only data is
+    read from the cache: the objects are built from it, and their
+    expressions compiled, like from the file. A loaded RulesSpec can be
+    pickled, eg. to send it to worker processes.
+    The 'rules_packs' are more rules spec files (eg. generated by
+    db_rules_pack.py) that are loaded after the rules spec file, in order; a
+    section of a rules pack replaces the section of the same type and name
+    loaded before it.
+    """
+
+    # changed whenever the compiled form changes, so that the rules specs
+    # cached by older versions are not used
+    COMPILED_FORMAT_VERSION = "2"
+
+    def __init__(self, rules_path, cache_dir=None, rules_packs=None):
         self.file_path = rules_path
+        self.rules_packs = list(rules_packs or [])
+        self.cache_dir = cache_dir
+        # the compiled form of the rules spec files, refer compile_file()
+        self.compiled_spec = None
+        # the hash of the rules spec files that were last loaded by load()
+        self.loaded_hash = None
+        # the EvaluationProfile the data sources record into, if enabled
+        self.profile = None
+
+    def get_file_hash(self):
+        file_hash = hashlib.sha1(self.COMPILED_FORMAT_VERSION.encode())
+        for file_path in [self.file_path] + self.rules_packs:
+            with open(file_path, "rb") as db_rules:
+                file_hash.update(db_rules.read())
+        return file_hash.hexdigest()
+
+    def get_cache_path(self, file_hash):
+        return os.path.join(self.cache_dir, "rules-" + file_hash + ".json")
+
+    @staticmethod
+    def freeze_sections(sections):
+        # converts the sections, eg. read from JSON, to the compiled form;
+        # raises ValueError if they are not in that form
+        compiled_spec = []
+        for section_type, section_name, parameters in sections:
+            if section_type not in ("rule", "cond", "sugg"):
+                raise ValueError("unknown section type: " + str(section_type))
+            frozen_parameters = []
+            for key, value in parameters:
+                if isinstance(value, list):
+                    value = tuple(value)
+                values = value if isinstance(value, tuple) else (value,)
+                if not isinstance(key, str) or not all(
+                    val is None or isinstance(val, str) for val in values
+                ):
+                    raise ValueError("invalid parameter of " + str(section_name))
+                frozen_parameters.append((key, value))
+            compiled_spec.append(
+                (section_type, str(section_name), tuple(frozen_parameters))
+            )
+        return tuple(compiled_spec)
+
+    def load_from_cache(self, file_hash):
+        # returns True if the compiled rules spec was loaded from the cache
+        try:
+            with open(self.get_cache_path(file_hash)) as cache_file:
+                compiled_spec = self.freeze_sections(json.load(cache_file))
+            self.build_sections(compiled_spec)
+            self.perform_section_checks()
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print("WARNING(RulesSpec) ignoring the cached rules spec: " + str(e))
+            return False
+
+    def write_to_cache(self, file_hash):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # written to a temporary file that is renamed, so that concurrent
+        # readers never see a partially written cache file
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump(self.compiled_spec, cache_file)
+        os.replace(temp_path, self.get_cache_path(file_hash))
+
+    def load(self):
+        file_hash = self.get_file_hash()
+        if file_hash == self.loaded_hash:
+            self.reset_triggers()
+            return
+        if not (self.cache_dir and self.load_from_cache(file_hash)):
+            self.load_rules_from_spec()
+            self.perform_section_checks()
+            if self.cache_dir:
+                self.write_to_cache(file_hash)
+        self.loaded_hash = file_hash
+
+    def reset_triggers(self):
+        for cond in self.conditions_dict.values():
+            cond.reset_trigger()
+        for rule in self.rules_dict.values():
+            rule.reset_trigger()
+
+    def enable_profiling(self):
+        self.profile = EvaluationProfile()
+        return self.profile
 
     def initialise_fields(self):
         self.rules_dict = {}
@@ -427,9 +617,20 @@ class RulesSpec:
             sugg.perform_checks()
 
     def load_rules_from_spec(self):
-        self.initialise_fields()
-        with open(self.file_path) as db_rules:
-            curr_section = None
+        self.loaded_hash = None
+        compiled_spec = ()
+        for file_path in [self.file_path] + self.rules_packs:
+            compiled_spec += self.compile_file(file_path)
+        self.build_sections(compiled_spec)
+
+    @staticmethod
+    def compile_file(file_path):
+        # returns the sections of the rules spec file, in order, as
+        # (section type, section name, ((key, value), ...)) tuples, where the
+        # section type is the name of its IniParser.Element and the list
+        # values are tuples
+        sections = []
+        with open(file_path) as db_rules:
             for line in db_rules:
                 line = IniParser.remove_trailing_comment(line)
                 if not line:
@@ -438,33 +639,39 @@ class RulesSpec:
                 if element is IniParser.Element.comment:
                     continue
                 elif element is not IniParser.Element.key_val:
-                    curr_section = element  # it's a new IniParser header
                     section_name = IniParser.get_section_name(line)
-                    if element is IniParser.Element.rule:
-                        new_rule = Rule(section_name)
-                        self.rules_dict[section_name] = new_rule
-                    elif element is IniParser.Element.cond:
-                        new_cond = Condition(section_name)
-                        self.conditions_dict[section_name] = new_cond
-                    elif element is IniParser.Element.sugg:
-                        new_suggestion = Suggestion(section_name)
-                        self.suggestions_dict[section_name] = new_suggestion
-                elif element is IniParser.Element.key_val:
-                    key, value = IniParser.get_key_value_pair(line)
-                    if curr_section is IniParser.Element.rule:
-                        new_rule.set_parameter(key, value)
-                    elif curr_section is IniParser.Element.cond:
-                        if key == "source":
-                            if value == "LOG":
-                                new_cond = LogCondition.create(new_cond)
-                            elif value == "OPTIONS":
-                                new_cond = OptionCondition.create(new_cond)
-                            elif value == "TIME_SERIES":
-                                new_cond = TimeSeriesCondition.create(new_cond)
-                        else:
-                            new_cond.set_parameter(key, value)
-                    elif curr_section is IniParser.Element.sugg:
-                        new_suggestion.set_parameter(key, value)
+                    sections.append((element.name, section_name, []))
+                elif sections:
+                    sections[-1][2].append(IniParser.get_key_value_pair(line))
+        return RulesSpec.freeze_sections(sections)
+
+    def build_sections(self, compiled_spec):
+        # builds the Rule, Condition and Suggestion objects of the compiled
+        # rules spec; they are new objects, so that the triggers set on them
+        # are never shared
+        self.initialise_fields()
+        for section_type, section_name, parameters in compiled_spec:
+            if section_type == "rule":
+                section = Rule(section_name)
+                self.rules_dict[section_name] = section
+            elif section_type == "cond":
+                section = Condition(section_name)
+                self.conditions_dict[section_name] = section
+            else:
+                section = Suggestion(section_name)
+                self.suggestions_dict[section_name] = section
+            for key, value in parameters:
+                if isinstance(value, tuple):
+                    value = list(value)
+                if section_type != "cond" or key != "source":
+                    section.set_parameter(key, value)
+                elif value == "LOG":
+                    section = LogCondition.create(section)
+                elif value == "OPTIONS":
+                    section = OptionCondition.create(section)
+                elif value == "TIME_SERIES":
+                    section = TimeSeriesCondition.create(section)
+        self.compiled_spec = compiled_spec
 
     def get_rules_dict(self):
         return self.rules_dict
@@ -493,6 +700,8 @@ class RulesSpec:
             if not cond_subset:
                 continue
             for source in data_sources[source_type]:
+                if self.profile:
+                    source.set_profile(self.profile)
                 source.check_and_trigger_conditions(cond_subset)
 
     def print_rules(self, rules):
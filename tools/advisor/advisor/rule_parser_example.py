@@ -4,25 +4,38 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import argparse
+import time
 
 from advisor.db_log_parser import DatabaseLogs, DataSource
 from advisor.db_options_parser import DatabaseOptions
-from advisor.db_stats_fetcher import LogStatsParser, OdsStatsFetcher
+from advisor.db_stats_backends import create_backend
+from advisor.db_stats_fetcher import (
+    BackendStatsFetcher,
+    LogStatsParser,
+    OdsStatsFetcher,
+)
 from advisor.rule_parser import RulesSpec
+from advisor.rule_report import RuleReport
 
 
 def main(args):
     # initialise the RulesSpec parser
-    rule_spec_parser = RulesSpec(args.rules_spec)
-    rule_spec_parser.load_rules_from_spec()
-    rule_spec_parser.perform_section_checks()
+    rule_spec_parser = RulesSpec(
+        args.rules_spec, args.rules_cache_dir, args.rules_packs
+    )
+    rule_spec_parser.load()
+    profile = None
+    if args.report_json or args.report_html:
+        profile = rule_spec_parser.enable_profiling()
     # initialize the DatabaseOptions object
     db_options = DatabaseOptions(args.rocksdb_options)
     # Create DatabaseLogs object
-    db_logs = DatabaseLogs(args.log_files_path_prefix, db_options.get_column_families())
+    db_logs = DatabaseLogs(
+        args.log_files_path_prefix, db_options.get_column_families(), args.follow
+    )
     # Create the Log STATS object
     db_log_stats = LogStatsParser(
-        args.log_files_path_prefix, args.stats_dump_period_sec
+        args.log_files_path_prefix, args.stats_dump_period_sec, args.follow
     )
     data_sources = {
         DataSource.Type.DB_OPTIONS: [db_options],
@@ -39,10 +52,61 @@ def main(args):
                 args.ods_key_prefix,
             )
         )
+    if args.prometheus_source:
+        entities = None
+        if args.prometheus_entities:
+            entities = args.prometheus_entities.split(",")
+        data_sources[DataSource.Type.TIME_SERIES].append(
+            BackendStatsFetcher(
+                create_backend(
+                    args.prometheus_source,
+                    args.prometheus_step_sec,
+                    args.prometheus_entity_label,
+                ),
+                entities,
+                args.prometheus_tstart,
+                args.prometheus_tend,
+                args.prometheus_step_sec,
+                args.prometheus_key_prefix,
+            )
+        )
+    if args.follow:
+        follow_logs(rule_spec_parser, data_sources, db_options, args)
+        return
     triggered_rules = rule_spec_parser.get_triggered_rules(
         data_sources, db_options.get_column_families()
     )
     rule_spec_parser.print_rules(triggered_rules)
+    report = RuleReport(rule_spec_parser, triggered_rules, profile)
+    if args.report_json:
+        report.write_json(args.report_json)
+    if args.report_html:
+        report.write_html(args.report_html)
+
+
+def follow_logs(rule_spec_parser, data_sources, db_options, args):
+    # The LOG data sources were created in follow mode, so every iteration
+    # only parses what was appended to the LOG files since the last one. The
+    # triggers of LOG conditions accumulate, whereas the TIME_SERIES
+    # conditions are re-evaluated over the whole (growing) time series, so
+    # their stale triggers are reset first. Only the rules that were not
+    # triggered in the previous iteration are printed.
+    reported_rules = set()
+    while True:
+        for cond in rule_spec_parser.get_conditions_dict().values():
+            if cond.get_data_source() is DataSource.Type.TIME_SERIES:
+                cond.reset_trigger()
+        triggered_rules = rule_spec_parser.get_triggered_rules(
+            data_sources, db_options.get_column_families()
+        )
+        new_rules = [
+            rule for rule in triggered_rules if rule.name not in reported_rules
+        ]
+        if new_rules:
+            print("\n" + time.strftime("%Y/%m/%d-%H:%M:%S") + " Triggered:")
+            rule_spec_parser.print_rules(new_rules)
+        reported_rules = {rule.name for rule in triggered_rules}
+        time.sleep(args.poll_interval_sec)
 
 
 if __name__ == "__main__":
@@ -56,6 +120,19 @@ if __name__ == "__main__":
         type=str,
         help="path of the file containing the expert-specified Rules",
     )
+    parser.add_argument(
+        "--rules_cache_dir",
+        type=str,
+        help="the directory in which the parsed rules spec is cached, so "
+        + "that an unchanged rules spec is not parsed again",
+    )
+    parser.add_argument(
+        "--rules_packs",
+        nargs="*",
+        help="whitespace-separated paths of rules packs (eg. generated by "
+        + "advisor.rules_pack_example) that are loaded after the rules spec "
+        + "and replace its sections of the same name",
+    )
     parser.add_argument(
         "--rocksdb_options",
         required=True,
@@ -94,5 +171,74 @@ if __name__ == "__main__":
     parser.add_argument(
         "--ods_tend", type=int, help="end time of timeseries to be fetched from ODS"
     )
+    # Prometheus arguments
+    parser.add_argument(
+        "--prometheus_source",
+        type=str,
+        help="the URL of a Prometheus server or the path (file, directory or "
+        + "glob) of Prometheus query_range JSON / OpenMetrics text files",
+    )
+    parser.add_argument(
+        "--prometheus_entities",
+        type=str,
+        help="comma-separated values of the entity label for which the stats "
+        + "need to be fetched, all entities are fetched if not given",
+    )
+    parser.add_argument(
+        "--prometheus_entity_label",
+        type=str,
+        default="instance",
+        help="the label that identifies the entity (i.e. the database) of a series",
+    )
+    parser.add_argument(
+        "--prometheus_key_prefix",
+        type=str,
+        help="the prefix that needs to be attached to the keys of time "
+        + "series to be fetched from Prometheus",
+    )
+    parser.add_argument(
+        "--prometheus_step_sec",
+        type=int,
+        default=60,
+        help="the resolution (in seconds) of the time series fetched from Prometheus",
+    )
+    parser.add_argument(
+        "--prometheus_tstart",
+        type=int,
+        help="start time of timeseries to be fetched from Prometheus; for a "
+        + "Prometheus server, defaults to an hour before the end time",
+    )
+    parser.add_argument(
+        "--prometheus_tend",
+        type=int,
+        help="end time of timeseries to be fetched from Prometheus; for a "
+        + "Prometheus server, defaults to the current time",
+    )
+    # report arguments
+    parser.add_argument(
+        "--report_json",
+        type=str,
+        help="path of the JSON report that explains why every rule was "
+        + "triggered and how long every condition took to evaluate",
+    )
+    parser.add_argument(
+        "--report_html",
+        type=str,
+        help="path of the HTML version of the report",
+    )
+    # follow mode arguments
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="keep tailing the Rocksdb LOG files (including the rotated "
+        + "LOG.old.* files) and print the rules as they get triggered",
+    )
+    parser.add_argument(
+        "--poll_interval_sec",
+        type=int,
+        default=60,
+        help="the interval (in seconds) at which the LOG files are checked "
+        + "for new logs in follow mode",
+    )
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,244 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import html
+import json
+import time
+
+from advisor.db_log_parser import DataSource
+
+
+class EvaluationProfile:
+    """
+    The cost of evaluating each condition of a rules spec: the time spent,
+    the number of records (LOG entries, time series samples or options) and
+    bytes scanned, and the number of times it was evaluated. The data sources
+    record into it when it is set with DataSource.set_profile(); the time
+    spent by a data source in fetching or parsing data shared by all its
+    conditions is recorded against the data source instead.
+    """
+
+    def __init__(self):
+        # Dict[condition or data source name, Dict[stat, value]]
+        self.stats = {}
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    def record(self, name, seconds, records=0, num_bytes=0, evaluations=1):
+        if name not in self.stats:
+            self.stats[name] = {
+                "time_sec": 0.0,
+                "records_scanned": 0,
+                "bytes_scanned": 0,
+                "evaluations": 0,
+            }
+        stats = self.stats[name]
+        stats["time_sec"] += seconds
+        stats["records_scanned"] += records
+        stats["bytes_scanned"] += num_bytes
+        stats["evaluations"] += evaluations
+
+    def get_stats(self, name):
+        return self.stats.get(name)
+
+
+class RuleReport:
+    """
+    Explains the result of a run of the rules engine: for every condition its
+    evaluation cost (refer EvaluationProfile) and trigger count, and for every
+    triggered rule the evidence that fired each of its conditions, i.e. the
+    LOG lines (file, line number and message), the time series windows or the
+    option values. The report can be written as JSON or HTML.
+    """
+
+    def __init__(self, rules_spec, triggered_rules, profile=None):
+        self.rules_spec = rules_spec
+        self.triggered_rules = triggered_rules
+        self.profile = profile
+
+    @staticmethod
+    def get_log_evidence(log):
+        return {
+            "file": log.file_name,
+            "line": log.line_number,
+            "time": log.get_human_readable_time(),
+            "column_family": log.get_column_family(),
+            "message": log.get_message(),
+        }
+
+    @staticmethod
+    def get_time_series_evidence(cond, entity, entity_trigger):
+        # the trigger of an entity is one of:
+        # Dict[timestamp, score] for the bursty behavior, whose intervals
+        # are in the condition's 'burst_intervals',
+        # Dict[timestamp, List[values]] for expressions evaluated per epoch,
+        # List[values] for expressions evaluated on aggregated values
+        burst_intervals = getattr(cond, "burst_intervals", None)
+        if burst_intervals and entity in burst_intervals:
+            # the window of the first bursty rate to the end of the burst
+            return [
+                {
+                    "entity": entity,
+                    "start": interval.start - cond.window_sec,
+                    "end": interval.end,
+                    "peak_timestamp": interval.peak_timestamp,
+                    "value": interval.peak_score,
+                }
+                for interval in burst_intervals[entity]
+            ]
+        if isinstance(entity_trigger, dict):
+            evidence = []
+            window_sec = getattr(cond, "window_sec", None)
+            for timestamp, value in sorted(entity_trigger.items()):
+                window = {"entity": entity, "end": timestamp, "value": value}
+                window["start"] = timestamp - window_sec if window_sec else timestamp
+                evidence.append(window)
+            return evidence
+        return [
+            {
+                "entity": entity,
+                "aggregation_op": cond.aggregation_op.name,
+                "value": entity_trigger,
+            }
+        ]
+
+    def get_condition_evidence(self, cond):
+        trigger = cond.get_trigger()
+        if not trigger:
+            return []
+        evidence = []
+        if cond.get_data_source() is DataSource.Type.LOG:
+            for logs in trigger.values():
+                evidence.extend(self.get_log_evidence(log) for log in logs)
+        elif cond.get_data_source() is DataSource.Type.TIME_SERIES:
+            for entity, entity_trigger in trigger.items():
+                evidence.extend(
+                    self.get_time_series_evidence(cond, entity, entity_trigger)
+                )
+        else:
+            for col_fam, values in trigger.items():
+                evidence.append(
+                    {
+                        "column_family": col_fam,
+                        "options": dict(zip(cond.options, values)),
+                    }
+                )
+        return evidence
+
+    def get_report(self):
+        conditions_dict = self.rules_spec.get_conditions_dict()
+        suggestions_dict = self.rules_spec.get_suggestions_dict()
+        conditions = {}
+        for name, cond in conditions_dict.items():
+            conditions[name] = {
+                "source": cond.get_data_source().name,
+                "triggered": cond.is_triggered(),
+                "trigger_count": len(self.get_condition_evidence(cond)),
+            }
+            if self.profile and self.profile.get_stats(name):
+                conditions[name].update(self.profile.get_stats(name))
+        rules = []
+        for rule in self.triggered_rules:
+            rules.append(
+                {
+                    "name": rule.name,
+                    "suggestions": [
+                        repr(suggestions_dict[sugg]) for sugg in rule.get_suggestions()
+                    ],
+                    "entities": sorted(rule.get_trigger_entities() or []),
+                    "column_families": sorted(rule.get_trigger_column_families() or []),
+                    "evidence": {
+                        cond_name: self.get_condition_evidence(
+                            conditions_dict[cond_name]
+                        )
+                        for cond_name in rule.conditions
+                    },
+                }
+            )
+        report = {"conditions": conditions, "triggered_rules": rules}
+        if self.profile:
+            # the costs recorded against the data sources
+            report["data_sources"] = {
+                name: stats
+                for name, stats in self.profile.stats.items()
+                if name not in conditions_dict
+            }
+        return report
+
+    def write_json(self, file_path):
+        with open(file_path, "w") as fp:
+            json.dump(self.get_report(), fp, indent=2, default=str)
+
+    @staticmethod
+    def get_html_table(header, rows, row_ids=None):
+        table = "<table>\n<tr>"
+        table += "".join("<th>" + html.escape(str(cell)) + "</th>" for cell in header)
+        table += "</tr>\n"
+        for ix, row in enumerate(rows):
+            if row_ids:
+                table += '<tr id="' + html.escape(row_ids[ix]) + '">'
+            else:
+                table += "<tr>"
+            table += "".join("<td>" + html.escape(str(cell)) + "</td>" for cell in row)
+            table += "</tr>\n"
+        return table + "</table>\n"
+
+    def write_html(self, file_path):
+        report = self.get_report()
+        cost_header = ["time_sec", "records_scanned", "bytes_scanned", "evaluations"]
+        page = (
+            "<!DOCTYPE html>\n<html>\n<head><meta charset='utf-8'>"
+            + "<title>Rocksdb Advisor report</title>\n<style>"
+            + "table{border-collapse:collapse}td,th{border:1px solid #999;"
+            + "padding:2px 6px;text-align:left;vertical-align:top}</style>"
+            + "</head>\n<body>\n<h1>Triggered rules</h1>\n"
+        )
+        for rule in report["triggered_rules"]:
+            page += '<h2 id="rule-' + html.escape(rule["name"]) + '">'
+            page += html.escape(rule["name"]) + "</h2>\n<ul>\n"
+            for sugg in rule["suggestions"]:
+                page += "<li>" + html.escape(sugg) + "</li>\n"
+            page += "</ul>\n"
+            if rule["column_families"]:
+                page += "<p>column families: "
+                page += html.escape(", ".join(rule["column_families"])) + "</p>\n"
+            if rule["entities"]:
+                page += "<p>entities: "
+                page += html.escape(", ".join(rule["entities"])) + "</p>\n"
+            for cond_name, evidence in rule["evidence"].items():
+                page += '<h3><a href="#cond-' + html.escape(cond_name) + '">'
+                page += html.escape(cond_name) + "</a></h3>\n"
+                if not evidence:
+                    continue
+                header = list(evidence[0].keys())
+                rows = [[item.get(key) for key in header] for item in evidence]
+                page += self.get_html_table(header, rows)
+        page += "<h1>Conditions</h1>\n"
+        header = ["condition", "source", "triggered", "trigger_count"]
+        if self.profile:
+            header += cost_header
+        # the most expensive conditions first
+        conditions = sorted(
+            report["conditions"].items(), key=lambda x: -x[1].get("time_sec", 0)
+        )
+        rows = [
+            [name] + [cond.get(key, "") for key in header[1:]]
+            for name, cond in conditions
+        ]
+        # every row is the target of the links from the triggered rules
+        row_ids = ["cond-" + name for name, _ in conditions]
+        page += self.get_html_table(header, rows, row_ids)
+        if report.get("data_sources"):
+            page += "<h1>Data sources</h1>\n"
+            rows = [
+                [name] + [stats[key] for key in cost_header]
+                for name, stats in report["data_sources"].items()
+            ]
+            page += self.get_html_table(["data source"] + cost_header, rows)
+        page += "</body>\n</html>\n"
+        with open(file_path, "w") as fp:
+            fp.write(page)
@@ -0,0 +1,84 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import argparse
+
+from advisor.db_rules_pack import ExperimentResults, RulesPack, WORKLOAD_FEATURES
+from advisor.rule_parser import RulesSpec
+
+
+def main(args):
+    experiments = ExperimentResults.load(args.experiments_dir)
+    workload = {}
+    for feature in args.workload or []:
+        name, value = feature.split("=")
+        if name not in WORKLOAD_FEATURES:
+            raise ValueError(
+                "RulesPack: unknown workload feature: "
+                + name
+                + ", expected one of: "
+                + ", ".join(WORKLOAD_FEATURES)
+            )
+        workload[name] = int(value)
+    base_rules = None
+    if args.rules_spec:
+        base_rules = RulesSpec(args.rules_spec)
+        base_rules.load()
+    rules_pack = RulesPack(experiments, args.pack_name, args.tolerance)
+    print("Rules pack in: " + rules_pack.write(args.output_file, workload, base_rules))
+
+
+if __name__ == "__main__":
+    """
+    An example run of this tool from the command-line would look like:
+    python3 -m advisor.rules_pack_example
+    --experiments_dir=../../write_buffer_experiment/results
+    --workload value_size=1024 num_cores=4 --rules_spec=advisor/rules.ini
+    --output_file=temp/write_buffer_pack.ini
+    """
+    parser = argparse.ArgumentParser(
+        description="Use this script to derive a rules pack from the results\
+        of the write buffer experiments, to be loaded with the --rules_packs\
+        argument of the advisor."
+    )
+    parser.add_argument(
+        "--experiments_dir",
+        required=True,
+        type=str,
+        help="the results directory of write_buffer_experiment/run_experiments.sh",
+    )
+    parser.add_argument(
+        "--workload",
+        nargs="*",
+        help="whitespace-separated features of the workload being tuned, "
+        + "given in the <feature>=<value> format, out of: value_size "
+        + "(bytes), num_cores and write_rate (bytes/sec, 0 if unthrottled); "
+        + "the rules are derived from the experiments of the nearest workload",
+    )
+    parser.add_argument(
+        "--rules_spec",
+        type=str,
+        help="path of the rules spec that the pack is loaded on top of; its "
+        + "suggestions that increase or decrease the experimented options "
+        + "are overridden to set the empirically best values",
+    )
+    parser.add_argument(
+        "--output_file", required=True, type=str, help="path of the rules pack"
+    )
+    parser.add_argument(
+        "--pack_name",
+        type=str,
+        default="write-buffer-pack",
+        help="the prefix of the names of the sections of the rules pack",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="an option's value is considered fast if its throughput is "
+        + "within this fraction of the best throughput",
+    )
+    args = parser.parse_args()
+    main(args)
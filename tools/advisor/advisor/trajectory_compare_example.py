@@ -0,0 +1,80 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import argparse
+import json
+
+from advisor.db_objectives import THROUGHPUT
+from advisor.db_trajectory import TrajectoryComparison
+
+
+def main(args):
+    maximize = None
+    if args.minimize:
+        maximize = False
+    comparison = TrajectoryComparison.from_files(
+        args.trajectories, args.metric, maximize
+    )
+    comparison.print_report(args.target)
+    if args.overlay_csv:
+        comparison.write_overlay_csv(args.overlay_csv)
+        print("Best metric per step of every session in: " + args.overlay_csv)
+    if args.best_options:
+        with open(args.best_options, "w") as fp:
+            json.dump(comparison.get_warm_start_options(), fp, indent=2)
+        print("Best configuration in: " + args.best_options)
+
+
+if __name__ == "__main__":
+    """
+    An example run of this tool from the command-line would look like:
+    python3 -m advisor.trajectory_compare_example
+    --trajectories temp/rules-seed1.jsonl temp/surrogate-seed1.jsonl
+    --metric=throughput --target=250000 --overlay_csv=temp/overlay.csv
+    """
+    parser = argparse.ArgumentParser(
+        description="Use this script to compare the trajectories of the\
+        sessions of the config optimizer, logged with its --trajectory_log\
+        argument."
+    )
+    parser.add_argument(
+        "--trajectories",
+        required=True,
+        nargs="+",
+        help="whitespace-separated paths of the trajectory logs to compare",
+    )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        default=THROUGHPUT,
+        help="the metric to compare the sessions on, picked out of the "
+        + "metric vectors of the multi-objective sessions",
+    )
+    parser.add_argument(
+        "--minimize",
+        action="store_true",
+        help="smaller values of the metric are better; by default only "
+        + "throughput is maximized",
+    )
+    parser.add_argument(
+        "--target",
+        type=float,
+        help="if given, the number of benchmark runs every session needed "
+        + "to reach this metric is reported",
+    )
+    parser.add_argument(
+        "--overlay_csv",
+        type=str,
+        help="path of a CSV file with the best metric so far of every "
+        + "session per step, to overlay the trajectories",
+    )
+    parser.add_argument(
+        "--best_options",
+        type=str,
+        help="path of a JSON file to which the best configuration across "
+        + "the sessions is written",
+    )
+    args = parser.parse_args()
+    main(args)
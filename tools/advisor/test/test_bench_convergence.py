@@ -0,0 +1,54 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import random
+import unittest
+
+from advisor.bench_convergence import ThroughputConvergence
+
+
+Status = ThroughputConvergence.Status
+
+
+class TestThroughputConvergence(unittest.TestCase):
+    def add_all(self, convergence, samples, baseline=None):
+        # returns the status after each sample until the first stop
+        statuses = []
+        for sample in samples:
+            statuses.append(convergence.add(sample, baseline))
+            if statuses[-1] is not Status.running:
+                break
+        return statuses
+
+    def test_converged(self):
+        rand = random.Random(0)
+        samples = [1000 + rand.uniform(-20, 20) for _ in range(50)]
+        convergence = ThroughputConvergence()
+        statuses = self.add_all(convergence, [100, 5000] + samples)
+        self.assertIs(Status.converged, statuses[-1])
+        # the warm-up samples are ignored
+        self.assertEqual(7, len(statuses))
+        self.assertAlmostEqual(1000, convergence.get_mean(), delta=20)
+
+    def test_level_shift(self):
+        rand = random.Random(0)
+        # write stalls set in after 4 intervals
+        samples = [1000 + rand.uniform(-10, 10) for _ in range(6)]
+        samples += [500 + rand.uniform(-10, 10) for _ in range(50)]
+        convergence = ThroughputConvergence(rel_ci_width=0.01)
+        statuses = self.add_all(convergence, samples)
+        self.assertIs(Status.converged, statuses[-1])
+        self.assertAlmostEqual(500, convergence.get_mean(), delta=10)
+
+    def test_losing(self):
+        samples = [600, 610, 590, 605, 595, 600, 600, 600]
+        convergence = ThroughputConvergence()
+        statuses = self.add_all(convergence, samples, baseline=1000)
+        self.assertIs(Status.losing, statuses[-1])
+        self.assertEqual(5, len(statuses))
+        # not clearly worse than the baseline
+        convergence = ThroughputConvergence(rel_ci_width=0.001)
+        statuses = self.add_all(convergence, samples, baseline=640)
+        self.assertNotIn(Status.losing, statuses)
@@ -4,11 +4,26 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import os
+import shutil
+import sys
+import tempfile
+import time
 import unittest
 
 from advisor.db_bench_runner import DBBenchRunner
+from advisor.db_config_optimizer import ConfigOptimizer
 from advisor.db_log_parser import DataSource, NO_COL_FAMILY
+from advisor.db_objectives import (
+    Constraint,
+    MEMTABLE_MEMORY,
+    P99,
+    P999,
+    PEAK_RSS,
+    THROUGHPUT,
+    WRITE_AMP,
+)
 from advisor.db_options_parser import DatabaseOptions
+from advisor.db_surrogate_optimizer import SurrogateConfigOptimizer
 
 
 class TestDBBenchRunnerMethods(unittest.TestCase):
@@ -99,6 +114,142 @@ class TestDBBenchRunnerMethods(unittest.TestCase):
         )
         self.assertEqual(experiment_command, expected_command)
 
+    def test_get_metric_vector(self):
+        output = [
+            "DB path: [/dev/shm/dbbench]",
+            "overwrite : 16.582 micros/op 60305 ops/sec; 4.2 MB/s",
+            "Microseconds per write:",
+            "Count: 603050 Average: 16.5820  StdDev: 40.12",
+            "Min: 1  Median: 10.1  Max: 9000",
+            "Percentiles: P50: 10.10 P75: 14.20 P99: 120.50 P99.9: 800.00 "
+            + "P99.99: 2100.00",
+            "Microseconds per read:",
+            "Percentiles: P50: 3.10 P75: 4.20 P99: 150.50 P99.9: 300.00 "
+            + "P99.99: 900.00",
+            "STATISTICS:",
+            "rocksdb.bytes.written COUNT : 1000",
+            "rocksdb.compact.write.bytes COUNT : 2500",
+            "rocksdb.flush.write.bytes COUNT : 1000",
+            "rocksdb.db.get.micros P50 : 3.1 P95 : 8.0 P99 : 150.5 P100 : 900.0 "
+            + "COUNT : 100 SUM : 400",
+        ]
+        with tempfile.NamedTemporaryFile("w", delete=False) as fp:
+            fp.write("\n".join(output) + "\n")
+        self.bench_runner.OUTPUT_FILE = fp.name
+        try:
+            parsed_output = self.bench_runner._parse_output()
+        finally:
+            os.remove(fp.name)
+        metrics = self.bench_runner.get_metric_vector(
+            parsed_output, 1 << 30, self.db_options
+        )
+        expected_metrics = {
+            THROUGHPUT: 60305.0,
+            P99: 150.5,
+            P999: 800.0,
+            PEAK_RSS: 1 << 30,
+            WRITE_AMP: 3.5,
+            # the default max_write_buffer_number is 2
+            MEMTABLE_MEMORY: 2 * (4194000 + 1024000),
+        }
+        self.assertDictEqual(expected_metrics, metrics)
+
+    def test_get_metric_vector_missing_percentiles(self):
+        parsed_output = {
+            DBBenchRunner.THROUGHPUT: 60305.0,
+            DBBenchRunner.PERCENTILES: [{"P50": 10.1, "P99": 120.5}],
+            DBBenchRunner.STATS_COUNT: {},
+        }
+        metrics = self.bench_runner.get_metric_vector(
+            parsed_output, None, self.db_options
+        )
+        self.assertEqual(120.5, metrics[P99])
+        self.assertNotIn(P999, metrics)
+        # without --histogram, db_bench prints no percentiles
+        parsed_output[DBBenchRunner.PERCENTILES] = []
+        metrics = self.bench_runner.get_metric_vector(
+            parsed_output, None, self.db_options
+        )
+        self.assertNotIn(P99, metrics)
+        self.assertNotIn(P999, metrics)
+        self.assertEqual(60305.0, metrics[THROUGHPUT])
+
+    def test_build_experiment_command_histogram(self):
+        command = self.bench_runner._build_experiment_command(
+            self.db_options, "/dev/shm", histogram=True
+        )
+        self.assertIn(" --histogram", command)
+
+
+# a stand-in for db_bench that reports a constant throughput to the file given
+# by --report_file until it is killed
+FAKE_DB_BENCH = """
+import sys, time
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+interval = float(args["report_interval_seconds"])
+with open(args["report_file"], "w") as fp:
+    fp.write("secs_elapsed,interval_qps\\n")
+    for ix in range(1, 2000):
+        time.sleep(interval)
+        fp.write(str(ix) + "," + str(int(1000 * interval)) + "\\n")
+        fp.flush()
+print("never gets here")
+"""
+
+
+class TestDBBenchRunnerEarlyStopping(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        script_path = os.path.join(self.dir_path, "fake_db_bench.py")
+        with open(script_path, "w") as fp:
+            fp.write(FAKE_DB_BENCH)
+        self.command = sys.executable + " " + script_path
+        self.bench_runner = DBBenchRunner([self.command, "overwrite"])
+        self.bench_runner.OUTPUT_FILE = os.path.join(self.dir_path, "out")
+        self.bench_runner.ERROR_FILE = os.path.join(self.dir_path, "err")
+        self.bench_runner.REPORT_FILE = os.path.join(self.dir_path, "report")
+        self.bench_runner.set_early_stopping(0.02, warmup_intervals=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_converged(self):
+        start_time = time.time()
+        peak_rss, throughput = self.bench_runner._run_command_with_early_stopping(
+            self.command
+        )
+        # the fake db_bench would have run for 40 seconds
+        self.assertLess(time.time() - start_time, 10)
+        self.assertAlmostEqual(1000, throughput, delta=1)
+        self.assertGreater(peak_rss, 0)
+        with open(self.bench_runner.OUTPUT_FILE) as fp:
+            self.assertNotIn("never gets here", fp.read())
+
+    def test_losing(self):
+        self.bench_runner.best_throughput = 5000
+        _, throughput = self.bench_runner._run_command_with_early_stopping(self.command)
+        self.assertAlmostEqual(1000, throughput, delta=1)
+
+    def test_latency_objectives(self):
+        # the runs stopped early do not measure the latencies, so the
+        # optimizers that need them disable early stopping
+        ConfigOptimizer(self.bench_runner, None, None, None, [THROUGHPUT, PEAK_RSS])
+        self.assertEqual(self.bench_runner.report_interval_sec, 0.02)
+        ConfigOptimizer(
+            self.bench_runner,
+            None,
+            None,
+            None,
+            [THROUGHPUT],
+            Constraint.parse_all(P99 + "<100"),
+        )
+        self.assertIsNone(self.bench_runner.report_interval_sec)
+        self.bench_runner.set_early_stopping(0.02, warmup_intervals=1)
+        SurrogateConfigOptimizer(
+            self.bench_runner, None, None, None, objectives=[THROUGHPUT, P999]
+        )
+        self.assertIsNone(self.bench_runner.report_interval_sec)
+
 
 class TestDBBenchRunner(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,155 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import unittest
+
+from advisor.db_burst_detector import BurstDetector, BurstInterval
+from advisor.db_stats_fetcher import LogStatsParser
+from advisor.db_timeseries_parser import NO_ENTITY
+from advisor.rule_parser import Condition, TimeSeriesCondition
+
+
+def get_counter_series(num_samples, burst_samples, freq_sec=10):
+    # a cumulative counter that grows by about 10 per sample, and by 100
+    # per sample during the burst
+    timestamps = []
+    values = []
+    value = 0
+    for ix in range(num_samples):
+        value += 100 if ix in burst_samples else 10 + (ix % 2)
+        timestamps.append(1000 + ix * freq_sec)
+        values.append(value)
+    return timestamps, values
+
+
+class TestBurstDetector(unittest.TestCase):
+    def setUp(self):
+        self.timestamps, self.values = get_counter_series(100, range(50, 55))
+
+    def test_percent(self):
+        detector = BurstDetector(BurstDetector.Method.percent, 50, 1, 60)
+        timestamps = [0, 10, 20, 30, 40]
+        values = [100, 100, 200, 200, 100]
+        for timestamp, value in zip(timestamps, values):
+            detector.add(timestamp, value)
+        # same formula as TimeSeriesStore.rate_change(): 100% in 10 seconds
+        # is 600% per 60 seconds
+        self.assertListEqual(detector.get_intervals(), [BurstInterval(20, 20, 600.0)])
+
+    def test_ewma(self):
+        detector = BurstDetector(BurstDetector.Method.ewma, 3, 1, 60)
+        detector.add_series(self.timestamps, self.values)
+        intervals = detector.get_intervals()
+        self.assertEqual(len(intervals), 1)
+        self.assertEqual(intervals[0].start, self.timestamps[50])
+        self.assertEqual(intervals[0].end, self.timestamps[54])
+        self.assertGreater(intervals[0].peak_score, 9)
+
+    def test_zscore(self):
+        detector = BurstDetector(BurstDetector.Method.zscore, 6, 1, 60)
+        detector.add_series(self.timestamps, self.values)
+        intervals = detector.get_intervals()
+        self.assertEqual(len(intervals), 1)
+        self.assertEqual(intervals[0].start, self.timestamps[50])
+        self.assertEqual(intervals[0].end, self.timestamps[54])
+
+    def test_warmup(self):
+        # a burst before 'warmup_samples' rates have been seen is not scored
+        timestamps, values = get_counter_series(40, range(3, 6))
+        detector = BurstDetector(BurstDetector.Method.ewma, 3, 1, 60)
+        detector.add_series(timestamps, values)
+        self.assertListEqual(detector.get_intervals(), [])
+
+    def test_incremental(self):
+        detector = BurstDetector(BurstDetector.Method.ewma, 3, 2, 60)
+        detector.add_series(self.timestamps, self.values)
+        incremental_detector = BurstDetector(BurstDetector.Method.ewma, 3, 2, 60)
+        # the burst is still open after the first half
+        incremental_detector.add_series(self.timestamps[:53], self.values[:53])
+        self.assertEqual(len(incremental_detector.get_intervals()), 1)
+        self.assertEqual(
+            incremental_detector.get_intervals()[0].end, self.timestamps[52]
+        )
+        # samples that were already added are ignored
+        incremental_detector.add_series(self.timestamps[40:], self.values[40:])
+        self.assertListEqual(
+            incremental_detector.get_intervals(), detector.get_intervals()
+        )
+
+    def test_add_returns_closed_interval(self):
+        detector = BurstDetector(BurstDetector.Method.ewma, 3, 1, 60)
+        closed_intervals = []
+        for timestamp, value in zip(self.timestamps, self.values):
+            interval = detector.add(timestamp, value)
+            if interval:
+                closed_intervals.append((timestamp, interval))
+        self.assertEqual(len(closed_intervals), 1)
+        self.assertEqual(closed_intervals[0][0], self.timestamps[55])
+
+
+class TestBurstyCondition(unittest.TestCase):
+    def setUp(self):
+        timestamps, values = get_counter_series(100, range(50, 55))
+        self.keys_ts = {
+            NO_ENTITY: {
+                "rocksdb.bytes.written": dict(zip(timestamps[:80], values[:80]))
+            }
+        }
+        self.remaining_samples = list(zip(timestamps[80:], values[80:]))
+        self.log_stats_parser = LogStatsParser("dummy_log_file", 10)
+        self.log_stats_parser.keys_ts = self.keys_ts
+        self.log_stats_parser.fetch_timeseries = lambda statistics: None
+        self.cond = TimeSeriesCondition.create(Condition("write-burst"))
+        self.cond.set_parameter("keys", "rocksdb.bytes.written")
+        self.cond.set_parameter("behavior", "bursty")
+        self.cond.set_parameter("window_sec", 10)
+        self.cond.set_parameter("rate_threshold", 3)
+        self.cond.set_parameter("burst_method", "ewma")
+        self.cond.perform_checks()
+
+    def test_trigger(self):
+        self.log_stats_parser.check_and_trigger_conditions([self.cond])
+        intervals = self.cond.burst_intervals[NO_ENTITY]
+        self.assertEqual(len(intervals), 1)
+        self.assertDictEqual(
+            self.cond.get_trigger(),
+            {NO_ENTITY: {intervals[0].peak_timestamp: intervals[0].peak_score}},
+        )
+        # the detector carries over to the samples added later, which are
+        # fetched on their own in follow mode and appended to the store
+        self.cond.reset_trigger()
+        self.assertIsNone(self.cond.burst_intervals)
+        self.log_stats_parser.is_incremental = True
+        self.log_stats_parser.keys_ts = {
+            NO_ENTITY: {"rocksdb.bytes.written": dict(self.remaining_samples)}
+        }
+        self.log_stats_parser.check_and_trigger_conditions([self.cond])
+        self.assertListEqual(self.cond.burst_intervals[NO_ENTITY], intervals)
+        store = self.log_stats_parser.ts_store
+        timestamps, _ = store.get_series(NO_ENTITY, "rocksdb.bytes.written")
+        self.assertEqual(len(timestamps), 100)
+        self.assertEqual(len(self.log_stats_parser.burst_detectors), 1)
+
+    def test_fetch_again(self):
+        self.log_stats_parser.check_and_trigger_conditions([self.cond])
+        self.assertEqual(len(self.cond.burst_intervals[NO_ENTITY]), 1)
+        # the same time window is fetched again, without the burst this time,
+        # and replaces the time series
+        self.cond.reset_trigger()
+        timestamps, values = get_counter_series(80, [])
+        self.log_stats_parser.keys_ts = {
+            NO_ENTITY: {"rocksdb.bytes.written": dict(zip(timestamps, values))}
+        }
+        self.log_stats_parser.check_and_trigger_conditions([self.cond])
+        self.assertFalse(self.cond.burst_intervals)
+        self.assertFalse(self.cond.is_triggered())
+
+    def test_invalid_method(self):
+        with self.assertRaisesRegex(ValueError, ".*unknown burst_method.*"):
+            self.cond.set_parameter("burst_method", "median")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,9 +4,11 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import os
+import shutil
+import tempfile
 import unittest
 
-from advisor.db_log_parser import DatabaseLogs, Log, NO_COL_FAMILY
+from advisor.db_log_parser import DatabaseLogs, Log, LogFollower, NO_COL_FAMILY
 from advisor.rule_parser import Condition, LogCondition
 
 
@@ -94,3 +96,84 @@ class TestDatabaseLogs(unittest.TestCase):
             + "remaining part of the log",
         )
         self.assertIsNone(condition3.get_trigger())
+
+
+class TestLogFollower(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, "LOG")
+        self.column_families = ["default", "col-fam-A"]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def append_to_log(self, text, file_path=None):
+        with open(file_path or self.log_path, "a") as fp:
+            fp.write(text)
+
+    def test_read_new_logs(self):
+        follower = LogFollower(self.log_path, self.column_families)
+        self.append_to_log(
+            "2018/05/25-14:30:05.601692 7f82bd676200 [default] first log\n"
+            + "2018/05/25-14:30:06.601692 7f82bd676200 [col-fam-A] second log\n"
+            + "continued on the next line\n"
+            + "2018/05/25-14:30:07.6016"
+        )
+        # the last log is held back until it is known to be complete
+        logs = follower.read_new_logs()
+        self.assertEqual(1, len(logs))
+        self.assertEqual("[default] first log", logs[0].get_message())
+        self.assertEqual([], follower.read_new_logs())
+        self.append_to_log("92 7f82bd676200 third log\n")
+        logs = follower.read_new_logs()
+        self.assertEqual(1, len(logs))
+        self.assertEqual("col-fam-A", logs[0].get_column_family())
+        self.assertEqual(
+            "[col-fam-A] second log\ncontinued on the next line",
+            logs[0].get_message(),
+        )
+        logs = follower.read_new_logs(flush=True)
+        self.assertEqual(1, len(logs))
+        self.assertEqual("third log", logs[0].get_message())
+
+    def test_log_rotation(self):
+        follower = LogFollower(self.log_path, self.column_families)
+        self.append_to_log(
+            "2018/05/25-14:30:05.601692 7f82bd676200 first log\n"
+            + "2018/05/25-14:30:06.601692 7f82bd676200 second log\n"
+        )
+        self.assertEqual(1, len(follower.read_new_logs()))
+        # Rocksdb renames the LOG file and starts a new one
+        os.rename(self.log_path, self.log_path + ".old.1527258605601692")
+        self.append_to_log("2018/05/25-14:30:07.601692 7f82bd676200 third log\n")
+        logs = follower.read_new_logs(flush=True)
+        self.assertEqual(
+            ["second log", "third log"], [log.get_message() for log in logs]
+        )
+
+
+class TestDatabaseLogsFollow(unittest.TestCase):
+    def test_check_and_trigger_conditions(self):
+        temp_dir = tempfile.mkdtemp()
+        log_path = os.path.join(temp_dir, "LOG")
+        db_logs = DatabaseLogs(log_path, ["default"], follow=True)
+        condition = LogCondition.create(Condition("cond-A"))
+        condition.set_parameter("regex", "Stopping writes")
+        with open(log_path, "a") as fp:
+            fp.write(
+                "2018/05/25-14:30:05.601692 7f82bd676200 [default] "
+                + "Stopping writes because we have 2 immutable memtables\n"
+                + "2018/05/25-14:30:06.601692 7f82bd676200 other log\n"
+            )
+        db_logs.check_and_trigger_conditions([condition])
+        self.assertEqual(1, len(condition.get_trigger()["default"]))
+        # only the logs appended since the last check are parsed
+        with open(log_path, "a") as fp:
+            fp.write(
+                "2018/05/25-14:30:07.601692 7f82bd676200 [default] "
+                + "Stopping writes because we have 2 immutable memtables\n"
+                + "2018/05/25-14:30:08.601692 7f82bd676200 other log\n"
+            )
+        db_logs.check_and_trigger_conditions([condition])
+        self.assertEqual(2, len(condition.get_trigger()["default"]))
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,65 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import unittest
+
+from advisor.db_objectives import Constraint, P99, ParetoFront, PEAK_RSS, THROUGHPUT
+
+
+class TestConstraint(unittest.TestCase):
+    def test_parse_all(self):
+        constraints = Constraint.parse_all("p99 < 0.3ms and memtable_memory<=1GB")
+        self.assertEqual(2, len(constraints))
+        self.assertEqual("p99", constraints[0].metric)
+        self.assertEqual("<", constraints[0].operator)
+        self.assertEqual(300.0, constraints[0].threshold)
+        self.assertEqual(1 << 30, constraints[1].threshold)
+        self.assertListEqual([], Constraint.parse_all(None))
+        with self.assertRaises(ValueError):
+            Constraint.parse("p99 < 300 parsecs")
+
+    def test_get_violation(self):
+        constraint = Constraint.parse("p99 < 300us")
+        self.assertEqual(0, constraint.get_violation({P99: 200.0}))
+        self.assertEqual(1.0, constraint.get_violation({P99: 600.0}))
+        self.assertEqual(float("inf"), constraint.get_violation({}))
+
+
+class TestParetoFront(unittest.TestCase):
+    def setUp(self):
+        self.front = ParetoFront(
+            [THROUGHPUT, P99, PEAK_RSS], Constraint.parse_all("p99 < 300us")
+        )
+
+    def test_add(self):
+        self.assertTrue(self.front.add({THROUGHPUT: 100, P99: 200, PEAK_RSS: 10}, "a"))
+        # trades latency for throughput
+        self.assertTrue(self.front.add({THROUGHPUT: 120, P99: 250, PEAK_RSS: 10}, "b"))
+        # infeasible
+        self.assertFalse(self.front.add({THROUGHPUT: 300, P99: 900, PEAK_RSS: 1}, "c"))
+        # dominated by 'b'
+        self.assertFalse(self.front.add({THROUGHPUT: 110, P99: 260, PEAK_RSS: 10}, "d"))
+        # dominates 'a'
+        self.assertTrue(self.front.add({THROUGHPUT: 100, P99: 150, PEAK_RSS: 10}, "e"))
+        configs = sorted(config for _, config in self.front.get_front())
+        self.assertListEqual(["b", "e"], configs)
+        self.assertEqual("b", self.front.get_recommended()[1])
+
+    def test_is_better(self):
+        old_metrics = {THROUGHPUT: 100, P99: 200, PEAK_RSS: 10}
+        # 2% more throughput, but the tail latency violates the constraint
+        self.assertFalse(
+            self.front.is_better({THROUGHPUT: 102, P99: 600, PEAK_RSS: 10}, old_metrics)
+        )
+        self.assertTrue(
+            self.front.is_better({THROUGHPUT: 102, P99: 250, PEAK_RSS: 10}, old_metrics)
+        )
+        self.assertFalse(
+            self.front.is_better({THROUGHPUT: 90, P99: 250, PEAK_RSS: 10}, old_metrics)
+        )
+        # closer to satisfying the constraint
+        self.assertTrue(
+            self.front.is_better({THROUGHPUT: 90, P99: 400}, {THROUGHPUT: 90, P99: 500})
+        )
@@ -0,0 +1,46 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import unittest
+
+from advisor.db_options_model import get_option_spec, OptionSpec
+
+
+class TestOptionSpec(unittest.TestCase):
+    def test_parse(self):
+        spec = get_option_spec("CFOptions.write_buffer_size")
+        self.assertIs(OptionSpec.Type.size, spec.type)
+        self.assertEqual(67108864, spec.parse("64M"))
+        self.assertEqual(67108864, spec.parse("67108864"))
+        self.assertEqual(4096, spec.parse(4096.7))
+        self.assertEqual(1000000, spec.parse("1e6"))
+        # 64-bit values are parsed exactly, eg. the default ttl
+        spec = get_option_spec("CFOptions.ttl")
+        self.assertEqual(18446744073709551614, spec.parse("18446744073709551614"))
+        self.assertIsNone(spec.check(spec.parse("18446744073709551614")))
+        spec = get_option_spec("DBOptions.use_fsync")
+        self.assertTrue(spec.parse("true"))
+        self.assertFalse(spec.parse("false"))
+        with self.assertRaises(ValueError):
+            spec.parse("maybe")
+        # options without a spec are strings
+        spec = get_option_spec("CFOptions.compaction_filter_factory")
+        self.assertIs(OptionSpec.Type.string, spec.type)
+        self.assertEqual("nullptr", spec.parse("nullptr"))
+
+    def test_check_and_clamp(self):
+        spec = get_option_spec("CFOptions.max_write_buffer_number")
+        self.assertIsNone(spec.check(4))
+        self.assertIsNotNone(spec.check(1))
+        self.assertEqual(2, spec.clamp(1))
+        spec = get_option_spec("CFOptions.compression")
+        self.assertIsNone(spec.check("kLZ4Compression"))
+        self.assertIsNotNone(spec.check("kLZ5Compression"))
+
+    def test_to_string(self):
+        spec = get_option_spec("CFOptions.max_bytes_for_level_multiplier")
+        self.assertEqual("10.000000", spec.to_string(spec.parse("10")))
+        spec = get_option_spec("TableOptions.BlockBasedTable.block_align")
+        self.assertEqual("true", spec.to_string(spec.parse("1")))
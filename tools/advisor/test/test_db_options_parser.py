@@ -145,6 +145,69 @@ class TestDatabaseOptions(unittest.TestCase):
         }
         self.assertDictEqual(expected_misc_options, self.db_options.get_misc_options())
 
+    def test_get_typed_options(self):
+        options = self.db_options.get_typed_options(
+            [
+                "DBOptions.manual_wal_flush",
+                "CFOptions.num_levels",
+                "CFOptions.max_bytes_for_level_multiplier",
+                "CFOptions.compaction_filter_factory",
+                "rate_limiter_bytes_per_sec",
+            ]
+        )
+        expected_options = {
+            "DBOptions.manual_wal_flush": {NO_COL_FAMILY: False},
+            "CFOptions.num_levels": {"default": 7, "col_fam_A": 5},
+            "CFOptions.max_bytes_for_level_multiplier": {
+                "default": 10.0,
+                "col_fam_A": 10.0,
+            },
+            "CFOptions.compaction_filter_factory": {
+                "default": "nullptr",
+                "col_fam_A": "nullptr",
+            },
+            "rate_limiter_bytes_per_sec": {NO_COL_FAMILY: 1024000},
+        }
+        self.assertDictEqual(expected_options, options)
+        self.db_options.update_options({"CFOptions.num_levels": {"default": "0"}})
+        with self.assertRaises(ValueError):
+            self.db_options.get_typed_options(["CFOptions.num_levels"])
+
+    def test_get_canonical_hash(self):
+        og_hash = self.db_options.get_canonical_hash()
+        other_options = DatabaseOptions(
+            self.og_options, ["rate_limiter_bytes_per_sec=1024000", "bloom_bits=4"]
+        )
+        self.assertEqual(og_hash, other_options.get_canonical_hash())
+        # the same value written differently
+        other_options.update_options(
+            {
+                "CFOptions.max_bytes_for_level_base": {"default": "256M"},
+                "CFOptions.max_bytes_for_level_multiplier": {"col_fam_A": 10},
+            }
+        )
+        self.assertEqual(og_hash, other_options.get_canonical_hash())
+        other_options.update_options({"CFOptions.num_levels": {"default": 6}})
+        self.assertNotEqual(og_hash, other_options.get_canonical_hash())
+
+    def test_sanitize_options(self):
+        options = {
+            "CFOptions.write_buffer_size": {"default": 1000, "col_fam_A": "4194000"},
+            "CFOptions.max_write_buffer_number": {"default": -1, "col_fam_A": 4.0},
+            "CFOptions.compression": {"default": "kSuperFastCompression"},
+            "CFOptions.ttl": {"default": "18446744073709551614"},
+            "random_misc_option": {NO_COL_FAMILY: "something"},
+        }
+        expected_options = {
+            "CFOptions.write_buffer_size": {"default": 65536, "col_fam_A": "4194000"},
+            "CFOptions.max_write_buffer_number": {"default": 2, "col_fam_A": 4},
+            "CFOptions.ttl": {"default": "18446744073709551614"},
+            "random_misc_option": {NO_COL_FAMILY: "something"},
+        }
+        self.assertDictEqual(
+            expected_options, DatabaseOptions.sanitize_options(options)
+        )
+
     def test_generate_options_config(self):
         # make sure file does not exist from before
         self.assertFalse(os.path.isfile(self.generated_options))
@@ -0,0 +1,193 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from advisor.db_log_parser import DataSource
+from advisor.db_options_parser import DatabaseOptions
+from advisor.db_rules_pack import (
+    Experiment,
+    ExperimentResults,
+    NUM_CORES,
+    RulesPack,
+    VALUE_SIZE,
+    WRITE_RATE,
+)
+from advisor.rule_parser import RulesSpec, Suggestion
+
+
+RULES_SPEC = """
+[Rule "stall-too-many-memtables"]
+suggestions=inc-write-buffer-size
+conditions=stall-too-many-memtables
+
+[Condition "stall-too-many-memtables"]
+source=LOG
+regex=Stopping writes because we have \\d+ immutable memtables
+
+[Suggestion "inc-write-buffer-size"]
+option=CFOptions.write_buffer_size
+action=increase
+"""
+
+
+class TestExperimentResults(unittest.TestCase):
+    def test_load(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        experiments = ExperimentResults.load(
+            os.path.join(this_path, "input_files/write_buffer_results")
+        )
+        # the 64MB experiment did not complete
+        self.assertListEqual(
+            [(exp.name, exp.throughput) for exp in experiments],
+            [
+                ("scenario1_32mb_small", 49841.0),
+                ("scenario1_512mb_extreme_large", 36910.0),
+                ("scenario1_8mb_extreme_small", 36705.0),
+            ],
+        )
+        self.assertDictEqual(
+            experiments[0].options,
+            {
+                "CFOptions.write_buffer_size": 32 << 20,
+                "CFOptions.max_write_buffer_number": 3,
+                "CFOptions.min_write_buffer_number_to_merge": 1,
+            },
+        )
+        # the workload of the write benchmark, not of the read benchmark
+        self.assertDictEqual(
+            experiments[0].workload, {VALUE_SIZE: 1024, NUM_CORES: 4, WRITE_RATE: 0}
+        )
+
+
+def get_experiment(name, write_buffer_size, throughput, value_size=1024):
+    return Experiment(
+        name,
+        {
+            "CFOptions.write_buffer_size": write_buffer_size,
+            "CFOptions.max_write_buffer_number": 3,
+        },
+        {VALUE_SIZE: value_size, NUM_CORES: 4, WRITE_RATE: 0},
+        throughput,
+    )
+
+
+class TestRulesPack(unittest.TestCase):
+    def setUp(self):
+        self.experiments = [
+            get_experiment("8mb", 8 << 20, 36000),
+            get_experiment("32mb", 32 << 20, 50000),
+            get_experiment("64mb", 64 << 20, 46000),
+            get_experiment("64mb-again", 64 << 20, 48000),
+            get_experiment("512mb", 512 << 20, 37000),
+            # small values are faster with large write buffers
+            get_experiment("small-8mb", 8 << 20, 60000, value_size=64),
+            get_experiment("small-512mb", 512 << 20, 90000, value_size=64),
+        ]
+        self.rules_pack = RulesPack(self.experiments)
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_nearest_workload(self):
+        self.assertEqual(
+            self.rules_pack.get_nearest_workload({VALUE_SIZE: 1000}), (1024, 4, 0)
+        )
+        self.assertEqual(
+            self.rules_pack.get_nearest_workload({VALUE_SIZE: 100, NUM_CORES: 8}),
+            (64, 4, 0),
+        )
+        # without workload features, the workload with the most experiments
+        self.assertEqual(self.rules_pack.get_nearest_workload(), (1024, 4, 0))
+        self.assertIsNone(RulesPack([]).get_nearest_workload())
+
+    def test_sweeps(self):
+        sweeps = RulesPack.get_sweeps(self.experiments[:5])
+        # the max_write_buffer_number is not swept
+        self.assertListEqual(list(sweeps.keys()), ["CFOptions.write_buffer_size"])
+        sweep = sweeps["CFOptions.write_buffer_size"]
+        self.assertListEqual(
+            sweep,
+            [
+                (8 << 20, 36000),
+                (32 << 20, 50000),
+                (64 << 20, 47000),
+                (512 << 20, 37000),
+            ],
+        )
+        self.assertTupleEqual(
+            self.rules_pack.get_fast_range(sweep), (32 << 20, 32 << 20, 64 << 20)
+        )
+
+    def test_load_pack(self):
+        rules_path = os.path.join(self.dir_path, "rules.ini")
+        with open(rules_path, "w") as rules_file:
+            rules_file.write(RULES_SPEC)
+        base_rules = RulesSpec(rules_path)
+        base_rules.load()
+        pack_path = self.rules_pack.write(
+            os.path.join(self.dir_path, "pack.ini"), {VALUE_SIZE: 1024}, base_rules
+        )
+        rules_spec = RulesSpec(rules_path, rules_packs=[pack_path])
+        rules_spec.load()
+        # the generic suggestion jumps to the empirically best value
+        suggestion = rules_spec.get_suggestions_dict()["inc-write-buffer-size"]
+        self.assertIs(suggestion.action, Suggestion.Action.set)
+        self.assertListEqual(suggestion.suggested_values, [str(32 << 20)])
+        self.assertIn("stall-too-many-memtables", rules_spec.get_rules_dict())
+        # the pack's rule is triggered by a write buffer outside the fast range
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        db_options = DatabaseOptions(
+            os.path.join(this_path, "input_files/OPTIONS-000005")
+        )
+        triggered_rules = rules_spec.get_triggered_rules(
+            {DataSource.Type.DB_OPTIONS: [db_options]},
+            db_options.get_column_families(),
+        )
+        self.assertListEqual(
+            [rule.name for rule in triggered_rules],
+            ["write-buffer-pack-write-buffer-size"],
+        )
+        # a changed rules pack is loaded again
+        loaded_hash = rules_spec.loaded_hash
+        self.rules_pack.write(pack_path, {VALUE_SIZE: 64}, base_rules)
+        rules_spec.load()
+        self.assertNotEqual(rules_spec.loaded_hash, loaded_hash)
+        suggestion = rules_spec.get_suggestions_dict()["inc-write-buffer-size"]
+        self.assertListEqual(suggestion.suggested_values, [str(512 << 20)])
+
+    def test_all_values_fast(self):
+        rules_path = os.path.join(self.dir_path, "rules.ini")
+        with open(rules_path, "w") as rules_file:
+            rules_file.write(RULES_SPEC)
+        base_rules = RulesSpec(rules_path)
+        base_rules.load()
+        # every swept write buffer size is within the tolerance of the best
+        rules_pack = RulesPack(
+            [
+                get_experiment("8mb", 8 << 20, 47000),
+                get_experiment("32mb", 32 << 20, 50000),
+                get_experiment("512mb", 512 << 20, 46000),
+            ]
+        )
+        pack_path = rules_pack.write(
+            os.path.join(self.dir_path, "pack.ini"), None, base_rules
+        )
+        rules_spec = RulesSpec(rules_path, rules_packs=[pack_path])
+        rules_spec.load()
+        # the generic suggestion is kept and the pack adds no rules
+        suggestion = rules_spec.get_suggestions_dict()["inc-write-buffer-size"]
+        self.assertIs(suggestion.action, Suggestion.Action.increase)
+        self.assertListEqual(
+            list(rules_spec.get_rules_dict().keys()), ["stall-too-many-memtables"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
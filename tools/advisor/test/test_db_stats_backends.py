@@ -0,0 +1,207 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from advisor.db_stats_backends import (
+    create_backend,
+    PrometheusFileBackend,
+    PrometheusHttpBackend,
+)
+from advisor.db_stats_fetcher import BackendStatsFetcher
+from advisor.db_timeseries_parser import NO_ENTITY
+from advisor.rule_parser import Condition, TimeSeriesCondition
+
+
+def get_query_response(metric_name, entity, values):
+    return {
+        "status": "success",
+        "data": {
+            "resultType": "matrix",
+            "result": [
+                {
+                    "metric": {"__name__": metric_name, "instance": entity},
+                    "values": [[ts, str(value)] for ts, value in values],
+                }
+            ],
+        },
+    }
+
+
+class TestPrometheusFileBackend(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        response = get_query_response(
+            "rocksdb_db_get_micros_p50", "host1", [(100, 10.5), (160, 12.0)]
+        )
+        with open(os.path.join(self.dir_path, "query.json"), "w") as fp:
+            json.dump(response, fp)
+        with open(os.path.join(self.dir_path, "metrics.prom"), "w") as fp:
+            fp.write("# TYPE rocksdb_block_cache_miss counter\n")
+            fp.write('rocksdb_block_cache_miss{instance="host1"} 37 100\n')
+            fp.write('rocksdb_block_cache_miss{instance="host2"} 41 100\n')
+            fp.write('rocksdb_block_cache_miss{instance="host1"} 52 160\n')
+            fp.write("rocksdb_not_requested 1 100\n")
+            fp.write("rocksdb_stall_micros 7\n")
+        os.utime(os.path.join(self.dir_path, "metrics.prom"), (220, 220))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_fetch(self):
+        backend = PrometheusFileBackend(self.dir_path)
+        keys = [
+            "rocksdb.db.get.micros.p50",
+            "rocksdb.block.cache.miss",
+            "rocksdb.stall.micros",
+        ]
+        keys_ts = backend.fetch(None, keys, None, None)
+        expected = {
+            "host1": {
+                "rocksdb.db.get.micros.p50": {100: 10.5, 160: 12.0},
+                "rocksdb.block.cache.miss": {100: 37.0, 160: 52.0},
+            },
+            "host2": {"rocksdb.block.cache.miss": {100: 41.0}},
+            # the sample without labels or a timestamp
+            NO_ENTITY: {"rocksdb.stall.micros": {220: 7.0}},
+        }
+        self.assertDictEqual(expected, keys_ts)
+
+    def test_fetch_filters(self):
+        backend = create_backend(os.path.join(self.dir_path, "*.prom"))
+        self.assertIsInstance(backend, PrometheusFileBackend)
+        keys_ts = backend.fetch(["host1"], ["rocksdb.block.cache.miss"], 150, 200)
+        expected = {"host1": {"rocksdb.block.cache.miss": {160: 52.0}}}
+        self.assertDictEqual(expected, keys_ts)
+
+
+class TestBackendStatsFetcher(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        values = [(100, 1.0), (160, 2.0), (220, 40.0)]
+        for ix, key in enumerate(["rocksdb_db_get_micros_p50", "app_cache_miss"]):
+            response = get_query_response(key, "host1", values)
+            with open(os.path.join(self.dir_path, str(ix) + ".json"), "w") as fp:
+                json.dump(response, fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_check_and_trigger_conditions(self):
+        fetcher = BackendStatsFetcher(
+            PrometheusFileBackend(self.dir_path), None, None, None, key_prefix="app"
+        )
+        cond1 = TimeSeriesCondition.create(Condition("cond-1"))
+        cond1.set_parameter("keys", ["rocksdb.db.get.micros.p50", "[]cache.miss"])
+        cond1.set_parameter("behavior", "evaluate_expression")
+        cond1.set_parameter("aggregation_op", "latest")
+        cond1.set_parameter("evaluate", "keys[0] + keys[1] > 50")
+        fetcher.check_and_trigger_conditions([cond1])
+        self.assertDictEqual({"host1": [40.0, 40.0]}, cond1.get_trigger())
+
+
+class PrometheusRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.queries.append(self.path)
+        server.connections.add(self.client_address)
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        metric_names = params["query"][0].split('"')[1].split("|")
+        response = {"status": "success", "data": {"resultType": "matrix"}}
+        response["data"]["result"] = [
+            {
+                "metric": {"__name__": name, "instance": "host1"},
+                "values": [[int(params["start"][0]), str(ix)]],
+            }
+            for ix, name in enumerate(metric_names)
+        ]
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPrometheusHttpBackend(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), PrometheusRequestHandler)
+        self.server.queries = []
+        self.server.connections = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch(self):
+        url = "http://127.0.0.1:" + str(self.server.server_address[1])
+        backend = create_backend(url)
+        self.assertIsInstance(backend, PrometheusHttpBackend)
+        backend.keys_per_request = 2
+        keys = ["rocksdb.key" + str(ix) for ix in range(5)]
+        keys_ts = backend.fetch(["host1"], keys, 100, 200)
+        backend.close()
+        # 5 keys are fetched in 3 requests over a single connection
+        self.assertEqual(3, len(self.server.queries))
+        self.assertEqual(1, len(self.server.connections))
+        self.assertSetEqual(set(keys), set(keys_ts["host1"].keys()))
+        self.assertDictEqual({100: 1.0}, keys_ts["host1"]["rocksdb.key1"])
+
+    def test_build_query(self):
+        backend = PrometheusHttpBackend("http://127.0.0.1:9090", timeout_sec=5)
+        query = backend.build_query(
+            ["rocksdb_key0", "rocksdb_key1"], ["host-1.example.com:9090", "host2"]
+        )
+        # the backslashes of the regex escapes are escaped in the PromQL
+        # string literal
+        self.assertEqual(
+            query,
+            r'{__name__=~"rocksdb_key0|rocksdb_key1",'
+            + r'instance=~"host\\-1\\.example\\.com:9090|host2"}',
+        )
+        self.assertEqual(5, backend.get_connection().timeout)
+
+    def test_fetch_default_time_range(self):
+        url = "http://127.0.0.1:" + str(self.server.server_address[1])
+        backend = create_backend(url)
+        before = int(time.time())
+        keys_ts = backend.fetch(["host1"], ["rocksdb.key0"], None, None)
+        backend.close()
+        self.assertEqual(1, len(self.server.queries))
+        params = urllib.parse.parse_qs(
+            urllib.parse.urlparse(self.server.queries[0]).query
+        )
+        end_time = int(params["end"][0])
+        self.assertGreaterEqual(end_time, before)
+        self.assertLessEqual(end_time, time.time())
+        start_time = int(params["start"][0])
+        self.assertEqual(
+            end_time - PrometheusHttpBackend.DEFAULT_WINDOW_SEC, start_time
+        )
+        self.assertDictEqual({start_time: 0.0}, keys_ts["host1"]["rocksdb.key0"])
+        # only the missing end of the time range is defaulted
+        backend.fetch(["host1"], ["rocksdb.key0"], None, 2000)
+        params = urllib.parse.parse_qs(
+            urllib.parse.urlparse(self.server.queries[1]).query
+        )
+        self.assertEqual(["2000"], params["end"])
+        self.assertEqual([str(2000 - 3600)], params["start"])
+        backend.close()
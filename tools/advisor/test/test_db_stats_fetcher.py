@@ -4,12 +4,15 @@
 #  (found in the LICENSE.Apache file in the root directory).
 
 import os
+import shutil
+import tempfile
 import time
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from advisor.db_stats_fetcher import DatabasePerfContext, LogStatsParser
 from advisor.db_timeseries_parser import NO_ENTITY
+from advisor.db_timeseries_store import TimeSeriesStore
 from advisor.rule_parser import Condition, TimeSeriesCondition
 
 
@@ -95,6 +98,171 @@ class TestLogStatsParser(unittest.TestCase):
         self.log_stats_parser.fetch_timeseries.assert_called_once()
 
 
+class TestTimeSeriesDataStore(unittest.TestCase):
+    def setUp(self):
+        self.log_stats_parser = LogStatsParser("dummy_log_file", 20)
+        self.log_stats_parser.fetch_timeseries = MagicMock()
+        self.num_entities = 50
+        self.log_stats_parser.keys_ts = {
+            "host-" + str(ix): {"rocksdb.key1": {10: ix, 20: 2 * ix}}
+            for ix in range(self.num_entities)
+        }
+
+    def test_store_built_once(self):
+        conditions = []
+        for aggregation_op in ["max", "min", "avg"]:
+            cond = TimeSeriesCondition.create(Condition("cond-" + aggregation_op))
+            cond.set_parameter("keys", "rocksdb.key1")
+            cond.set_parameter("behavior", "evaluate_expression")
+            cond.set_parameter("evaluate", "keys[0]>=40")
+            cond.set_parameter("aggregation_op", aggregation_op)
+            cond.perform_checks()
+            conditions.append(cond)
+        with patch.object(
+            TimeSeriesStore, "from_keys_ts", wraps=TimeSeriesStore.from_keys_ts
+        ) as from_keys_ts:
+            self.log_stats_parser.check_and_trigger_conditions(conditions)
+            from_keys_ts.assert_called_once()
+        # the samples are only kept in the store
+        self.assertIsNone(self.log_stats_parser.keys_ts)
+        # the max, min and avg of host-ix are 2 * ix, ix and 1.5 * ix
+        self.assertEqual(len(conditions[0].get_trigger()), self.num_entities - 20)
+        self.assertEqual(len(conditions[1].get_trigger()), self.num_entities - 40)
+        self.assertEqual(len(conditions[2].get_trigger()), self.num_entities - 27)
+        # without newly fetched samples, the store is reused
+        store = self.log_stats_parser.ts_store
+        self.log_stats_parser.check_and_trigger_conditions(conditions)
+        self.assertIs(store, self.log_stats_parser.ts_store)
+        # a non-incremental fetch replaces the time series
+        self.log_stats_parser.keys_ts = {"host-0": {"rocksdb.key1": {30: 100}}}
+        self.log_stats_parser.check_and_trigger_conditions(conditions)
+        self.assertListEqual(["host-0"], self.log_stats_parser.ts_store.get_entities())
+
+
+class TestLogStatsParserFollow(unittest.TestCase):
+    def test_fetch_timeseries(self):
+        temp_dir = tempfile.mkdtemp()
+        log_path = os.path.join(temp_dir, "LOG")
+        log_stats_parser = LogStatsParser(log_path, 20, follow=True)
+        stat = "rocksdb.block.cache.hit.count"
+        stats_dump = (
+            "%s 7f82bd676200 [db/db_impl.cc:485] STATISTICS:\n"
+            + "rocksdb.block.cache.hit COUNT : %d\n"
+        )
+        with open(log_path, "a") as fp:
+            fp.write(stats_dump % ("2018/07/06-16:20:14.000000", 37))
+            fp.write(stats_dump % ("2018/07/06-16:20:34.000000", 52))
+        log_stats_parser.fetch_timeseries([stat])
+        # the last dump is not parsed until it is known to be complete
+        self.assertDictEqual(
+            {1530894014: 37.0}, log_stats_parser.keys_ts[NO_ENTITY][stat]
+        )
+        with open(log_path, "a") as fp:
+            fp.write(stats_dump % ("2018/07/06-16:20:54.000000", 60))
+        log_stats_parser.fetch_timeseries([stat])
+        self.assertDictEqual(
+            {1530894014: 37.0, 1530894034: 52.0},
+            log_stats_parser.keys_ts[NO_ENTITY][stat],
+        )
+        shutil.rmtree(temp_dir)
+
+
+class TestLogStatsParserColumnFamilyStats(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        log_path = os.path.join(this_path, "input_files/LOG-2")
+        self.log_stats_parser = LogStatsParser(log_path, 600)
+        self.timestamps = [1527258605, 1527259205]
+
+    def get_series(self, entity, stat):
+        return [
+            self.log_stats_parser.keys_ts[entity][stat][ts] for ts in self.timestamps
+        ]
+
+    def test_compaction_stats(self):
+        stats = [
+            "compaction.l0.files",
+            "compaction.l0.files_compacting",
+            "compaction.l0.score",
+            "compaction.l1.size_bytes",
+            "compaction.l1.read_gb",
+            "compaction.l1.write_gb",
+            "compaction.l1.w_amp",
+            "compaction.l1.key_in",
+            "compaction.sum.w_amp",
+            "compaction.pending_bytes",
+            "rocksdb.block.cache.miss.count",
+        ]
+        self.log_stats_parser.fetch_timeseries(stats)
+        keys_ts = self.log_stats_parser.keys_ts
+        self.assertSetEqual(set(keys_ts.keys()), {NO_ENTITY, "default", "col_fam_A"})
+        self.assertListEqual(self.get_series("default", stats[0]), [4.0, 24.0])
+        self.assertListEqual(self.get_series("col_fam_A", stats[0]), [2.0, 2.0])
+        self.assertListEqual(self.get_series("default", stats[1]), [1.0, 1.0])
+        self.assertListEqual(self.get_series("default", stats[2]), [1.0, 6.0])
+        self.assertAlmostEqual(
+            self.get_series("default", stats[3])[0], 191.21 * (1 << 20)
+        )
+        self.assertListEqual(self.get_series("default", stats[4]), [0.5, 0.5])
+        self.assertListEqual(self.get_series("default", stats[5]), [0.5, 0.5])
+        self.assertListEqual(self.get_series("default", stats[6]), [2.5, 2.5])
+        self.assertListEqual(self.get_series("default", stats[7]), [12e3, 12e3])
+        self.assertListEqual(self.get_series("col_fam_A", stats[8]), [3.5, 3.5])
+        self.assertListEqual(self.get_series("default", stats[9]), [1000.0, 2000.0])
+        # the STATISTICS dumps are still parsed
+        self.assertListEqual(self.get_series(NO_ENTITY, stats[10]), [100.0, 200.0])
+        # the stats not required are not added
+        self.assertNotIn("compaction.l0.w_amp", keys_ts["default"])
+
+    def test_stall_counts(self):
+        stats = [
+            "stalls.level0_numfiles",
+            "stalls.stop_for_pending_compaction_bytes",
+            "stalls.l0_file_count_limit_stops",
+            "stalls.total_stops",
+            "stalls.write_buffer_manager_limit_stops",
+        ]
+        self.log_stats_parser.fetch_timeseries(stats)
+        # the older format
+        self.assertListEqual(self.get_series("default", stats[0]), [0.0, 3.0])
+        self.assertListEqual(self.get_series("default", stats[1]), [0.0, 0.0])
+        # the newer format
+        self.assertListEqual(self.get_series("col_fam_A", stats[2]), [0.0, 3.0])
+        self.assertListEqual(self.get_series("col_fam_A", stats[3]), [0.0, 3.0])
+        # the DB-wide stall counts
+        self.assertListEqual(self.get_series(NO_ENTITY, stats[4]), [0.0, 3.0])
+
+    def test_check_and_trigger_conditions(self):
+        # the condition is checked for every column family, and triggered
+        # only for the one with too many L0 files
+        cond1 = TimeSeriesCondition.create(Condition("cond-1"))
+        cond1.set_parameter("keys", ["compaction.l0.files", "compaction.l0.score"])
+        cond1.set_parameter("behavior", "evaluate_expression")
+        cond1.set_parameter("aggregation_op", "latest")
+        cond1.set_parameter("evaluate", "keys[0]>=20 and keys[1]>1")
+        self.log_stats_parser.check_and_trigger_conditions([cond1])
+        self.assertDictEqual(cond1.get_trigger(), {"default": [24.0, 6.0]})
+
+    def test_parse_compaction_stats_row(self):
+        header = "Level Files Size(MB) Score Read(GB) W-Amp Comp(cnt)".split()
+        level, stat_dict = LogStatsParser.parse_compaction_stats_row(
+            header, "L2 10/2 512.5 0.9 1.5 3.0 7"
+        )
+        self.assertEqual(level, "l2")
+        self.assertDictEqual(
+            stat_dict,
+            {
+                "files": 10.0,
+                "files_compacting": 2.0,
+                "size_bytes": 512.5 * (1 << 20),
+                "score": 0.9,
+                "read_gb": 1.5,
+                "w_amp": 3.0,
+                "comp_count": 7.0,
+            },
+        )
+
+
 class TestDatabasePerfContext(unittest.TestCase):
     def test_unaccumulate_metrics(self):
         perf_dict = {
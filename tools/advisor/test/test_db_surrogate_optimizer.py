@@ -0,0 +1,160 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from advisor.bench_runner import BenchmarkRunner
+from advisor.db_log_parser import DataSource
+from advisor.db_objectives import Constraint, P99, THROUGHPUT
+from advisor.db_options_parser import DatabaseOptions
+from advisor.db_surrogate_optimizer import (
+    expected_improvement,
+    GaussianProcess,
+    SurrogateConfigOptimizer,
+)
+from advisor.rule_parser import RulesSpec
+
+
+RULES_SPEC = """
+[Rule "small-write-buffer"]
+suggestions=inc-write-buffer-size
+conditions=small-write-buffer
+
+[Condition "small-write-buffer"]
+source=OPTIONS
+options=CFOptions.write_buffer_size
+evaluate=int(options[0]) < 64000000
+
+[Suggestion "inc-write-buffer-size"]
+option=CFOptions.write_buffer_size
+action=increase
+"""
+
+
+class FakeBenchRunner(BenchmarkRunner):
+    # the throughput peaks when the write_buffer_size of the 'default'
+    # column family is 64MB
+    @staticmethod
+    def is_metric_better(new_metric, old_metric):
+        return new_metric >= old_metric
+
+    def __init__(self):
+        self.num_runs = 0
+
+    def run_experiment(self, db_options, db_path):
+        self.num_runs += 1
+        options = db_options.get_options(["CFOptions.write_buffer_size"])
+        write_buffer_size = int(options["CFOptions.write_buffer_size"]["default"])
+        metric = 1000 - 100 * (math.log2(write_buffer_size) - 26) ** 2
+        return {DataSource.Type.DB_OPTIONS: [db_options]}, metric
+
+
+class FakeMetricVectorBenchRunner(FakeBenchRunner):
+    # the p99 latency doubles with the write_buffer_size of the 'default'
+    # column family: 100us at 16MB, 400us at 64MB
+    def run_experiment(self, db_options, db_path, metric_vector=False):
+        data_sources, throughput = super().run_experiment(db_options, db_path)
+        options = db_options.get_options(["CFOptions.write_buffer_size"])
+        write_buffer_size = int(options["CFOptions.write_buffer_size"]["default"])
+        p99 = 100 * 2 ** (math.log2(write_buffer_size) - 24)
+        return data_sources, {THROUGHPUT: throughput, P99: p99}
+
+
+class TestGaussianProcess(unittest.TestCase):
+    def test_fit_predict(self):
+        X = np.array([[0.0], [0.5], [1.0]])
+        y = np.array([1.0, 3.0, 2.0])
+        mean, std = GaussianProcess().fit(X, y).predict(X)
+        self.assertTrue(np.allclose(y, mean, atol=0.1))
+        self.assertTrue(np.all(std < 0.2))
+        # far from the observations, the uncertainty is large
+        mean, std = GaussianProcess(length_scales=(0.1,)).fit(X, y).predict([[3.0]])
+        self.assertGreater(std[0], 0.5)
+
+    def test_expected_improvement(self):
+        ei = expected_improvement(
+            np.array([1.0, 1.0, 2.0]), np.array([0.1, 1.0, 0.1]), 1.5
+        )
+        self.assertLess(ei[0], ei[1])
+        self.assertLess(ei[1], ei[2])
+
+
+class TestSurrogateConfigOptimizer(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        self.options_path = os.path.join(this_path, "input_files/OPTIONS-000005")
+        self.dir_path = tempfile.mkdtemp()
+        rules_path = os.path.join(self.dir_path, "rules.ini")
+        with open(rules_path, "w") as fp:
+            fp.write(RULES_SPEC)
+        self.rules_spec = RulesSpec(rules_path)
+        self.cache_path = os.path.join(self.dir_path, "experiments.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_run(self):
+        bench_runner = FakeBenchRunner()
+        optimizer = SurrogateConfigOptimizer(
+            bench_runner,
+            DatabaseOptions(self.options_path),
+            self.rules_spec,
+            None,
+            num_iterations=6,
+            cache_path=self.cache_path,
+            seed=0,
+        )
+        best_options = optimizer.run()
+        self.assertEqual(7, bench_runner.num_runs)
+        _, initial_metric = bench_runner.run_experiment(
+            DatabaseOptions(self.options_path), None
+        )
+        _, best_metric = bench_runner.run_experiment(best_options, None)
+        self.assertGreater(best_metric, initial_metric + 400)
+        # the experiments are re-used by the next run
+        optimizer = SurrogateConfigOptimizer(
+            FakeBenchRunner(),
+            DatabaseOptions(self.options_path),
+            self.rules_spec,
+            None,
+            cache_path=self.cache_path,
+        )
+        self.assertEqual(7, len(optimizer.cache.get_experiments()))
+
+    def test_run_with_constraints(self):
+        bench_runner = FakeMetricVectorBenchRunner()
+        optimizer = SurrogateConfigOptimizer(
+            bench_runner,
+            DatabaseOptions(self.options_path),
+            self.rules_spec,
+            None,
+            num_iterations=8,
+            cache_path=self.cache_path,
+            seed=0,
+            objectives=[THROUGHPUT, P99],
+            constraints=Constraint.parse_all("p99 < 250us"),
+        )
+        best_options = optimizer.run()
+        _, initial_metrics = bench_runner.run_experiment(
+            DatabaseOptions(self.options_path), None
+        )
+        _, best_metrics = bench_runner.run_experiment(best_options, None)
+        # the throughput peaks at 64MB, but the constraint holds below 40MB
+        self.assertLess(best_metrics[P99], 250)
+        self.assertGreater(best_metrics[THROUGHPUT], initial_metrics[THROUGHPUT] + 400)
+        for metrics, _ in optimizer.pareto_front.get_front():
+            self.assertLess(metrics[P99], 250)
+        # the model is fitted on the penalized throughput
+        infeasible_metrics = {THROUGHPUT: 1000.0, P99: 375.0}
+        self.assertEqual(500.0, optimizer.get_score(infeasible_metrics))
+        self.assertEqual(0.0, optimizer.get_score({THROUGHPUT: 1000.0}))
+        # the scalar results of the single-objective mode are not fitted on
+        self.assertIsNone(optimizer.get_score(1000.0))
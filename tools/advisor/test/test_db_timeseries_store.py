@@ -0,0 +1,86 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import unittest
+
+from advisor.db_timeseries_store import TimeSeriesStore
+
+
+class TestTimeSeriesStore(unittest.TestCase):
+    def setUp(self):
+        keys_ts = {
+            "entity-A": {
+                # inserted out of order, the store sorts by timestamp
+                "key1": {30: 40.0, 10: 10.0, 20: 20.0, 40: 40.0},
+                "key2": {10: 1.0, 20: 2.0, 40: 4.0},
+            },
+            # timestamps and values given as strings, like in ODS output
+            "entity-B": {"key1": {"10": "5", "20": "15"}},
+        }
+        self.store = TimeSeriesStore.from_keys_ts(keys_ts)
+
+    def test_get_series(self):
+        timestamps, values = self.store.get_series("entity-A", "key1")
+        self.assertListEqual([10, 20, 30, 40], timestamps.tolist())
+        self.assertListEqual([10.0, 20.0, 40.0, 40.0], values.tolist())
+        timestamps, values = self.store.get_series("entity-B", "key1")
+        self.assertListEqual([10, 20], timestamps.tolist())
+        self.assertListEqual([5.0, 15.0], values.tolist())
+
+    def test_get_entities_with_keys(self):
+        self.assertListEqual(
+            ["entity-A", "entity-B"], self.store.get_entities_with_keys(["key1"])
+        )
+        self.assertListEqual(
+            ["entity-A"], self.store.get_entities_with_keys(["key1", "key2"])
+        )
+
+    def test_rate_change(self):
+        timestamps, rates = self.store.rate_change("entity-A", "key1", 1, 10, False)
+        self.assertListEqual([20, 30, 40], timestamps.tolist())
+        self.assertListEqual([10.0, 20.0, 0.0], rates.tolist())
+        timestamps, rates = self.store.rate_change("entity-A", "key1", 2, 20, True)
+        self.assertListEqual([30, 40], timestamps.tolist())
+        self.assertListEqual([300.0, 100.0], rates.tolist())
+        # not enough samples for the window
+        timestamps, rates = self.store.rate_change("entity-B", "key1", 2, 20, True)
+        self.assertEqual(0, len(rates))
+
+    def test_aggregate(self):
+        expected = {"avg": 27.5, "max": 40.0, "min": 10.0, "latest": 40.0}
+        expected["oldest"] = 10.0
+        for aggregation_op, value in expected.items():
+            self.assertEqual(
+                value, self.store.aggregate("entity-A", "key1", aggregation_op)
+            )
+        with self.assertRaises(ValueError):
+            self.store.aggregate("entity-A", "key1", "median")
+
+    def test_align(self):
+        timestamps, values = self.store.align("entity-A", ["key1", "key2"])
+        self.assertListEqual([10, 20, 40], timestamps.tolist())
+        self.assertListEqual([[10.0, 20.0, 40.0], [1.0, 2.0, 4.0]], values.tolist())
+
+    def test_extend(self):
+        new_store = TimeSeriesStore.from_keys_ts(
+            {
+                # appended after the last sample
+                "entity-A": {"key1": {50: 50.0, 60: 60.0}},
+                # overlaps with the samples of the store
+                "entity-B": {"key1": {20: 25.0, 5: 0.0}, "key2": {10: 1.0}},
+                "entity-C": {"key1": {10: 1.0}},
+            }
+        )
+        self.store.extend(new_store)
+        timestamps, values = self.store.get_series("entity-A", "key1")
+        self.assertListEqual([10, 20, 30, 40, 50, 60], timestamps.tolist())
+        self.assertListEqual([10.0, 20.0, 40.0, 40.0, 50.0, 60.0], values.tolist())
+        timestamps, values = self.store.get_series("entity-B", "key1")
+        self.assertListEqual([5, 10, 20], timestamps.tolist())
+        self.assertListEqual([0.0, 5.0, 25.0], values.tolist())
+        self.assertTrue(self.store.has_series("entity-B", "key2"))
+        self.assertListEqual(
+            ["entity-A", "entity-B", "entity-C"], self.store.get_entities()
+        )
@@ -0,0 +1,186 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from advisor.db_config_optimizer import ConfigOptimizer
+from advisor.db_options_parser import DatabaseOptions
+from advisor.db_surrogate_optimizer import SurrogateConfigOptimizer
+from advisor.db_trajectory import load_trajectory, TrajectoryComparison, TrajectoryLog
+from advisor.rule_parser import RulesSpec
+from test.test_db_surrogate_optimizer import FakeBenchRunner, RULES_SPEC
+
+
+def get_trajectory(name, metrics, maximize=True):
+    session = {"type": TrajectoryLog.SESSION, "name": name, "maximize": maximize}
+    steps = [
+        {
+            "type": TrajectoryLog.STEP,
+            "step": ix,
+            "rule": None,
+            "diff": {},
+            "metric": metric,
+            "accepted": True,
+            "duration_sec": 10,
+            "options": {"bloom_bits": {"NO_COL_FAMILY": str(ix)}},
+        }
+        for ix, metric in enumerate(metrics)
+    ]
+    return session, steps
+
+
+class TestTrajectoryLog(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        self.options_path = os.path.join(this_path, "input_files/OPTIONS-000005")
+        self.dir_path = tempfile.mkdtemp()
+        rules_path = os.path.join(self.dir_path, "rules.ini")
+        with open(rules_path, "w") as fp:
+            fp.write(RULES_SPEC)
+        self.rules_spec = RulesSpec(rules_path)
+        self.log_path = os.path.join(self.dir_path, "session.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_config_optimizer(self):
+        bench_runner = FakeBenchRunner()
+        trajectory_log = TrajectoryLog(self.log_path, {"seed": 1})
+        ConfigOptimizer(
+            bench_runner,
+            DatabaseOptions(self.options_path),
+            self.rules_spec,
+            None,
+            trajectory_log=trajectory_log,
+        ).run()
+        session, steps = load_trajectory(self.log_path)
+        self.assertEqual(session["name"], "session")
+        self.assertEqual(session["seed"], 1)
+        self.assertEqual(len(steps), bench_runner.num_runs)
+        self.assertIsNone(steps[0]["rule"])
+        self.assertDictEqual(steps[0]["diff"], {})
+        for step in steps[1:]:
+            self.assertEqual(step["rule"], "small-write-buffer")
+            self.assertListEqual(
+                list(step["diff"].keys()), ["CFOptions.write_buffer_size"]
+            )
+            self.assertGreaterEqual(step["duration_sec"], 0)
+        # a step is accepted if it is not worse than the last accepted one,
+        # the options diff of which it is relative to
+        incumbent = steps[0]
+        for step in steps[1:]:
+            self.assertEqual(
+                step["accepted"], step["metric"] >= incumbent["metric"], step
+            )
+            for col_fam, (old_value, new_value) in step["diff"][
+                "CFOptions.write_buffer_size"
+            ].items():
+                options = incumbent["options"]["CFOptions.write_buffer_size"]
+                self.assertEqual(old_value, options[col_fam])
+                options = step["options"]["CFOptions.write_buffer_size"]
+                self.assertEqual(new_value, options[col_fam])
+            if step["accepted"]:
+                incumbent = step
+
+    def test_surrogate_optimizer(self):
+        bench_runner = FakeBenchRunner()
+        SurrogateConfigOptimizer(
+            bench_runner,
+            DatabaseOptions(self.options_path),
+            self.rules_spec,
+            None,
+            num_iterations=3,
+            seed=0,
+            trajectory_log=TrajectoryLog(self.log_path),
+        ).run()
+        _, steps = load_trajectory(self.log_path)
+        self.assertEqual(len(steps), bench_runner.num_runs)
+        self.assertListEqual([step["step"] for step in steps], list(range(len(steps))))
+
+    def test_interrupted_session(self):
+        trajectory_log = TrajectoryLog(self.log_path)
+        trajectory_log.add_step(DatabaseOptions(self.options_path), 100.0)
+        with open(self.log_path, "a") as fp:
+            fp.write('{"type": "step", "step": 1, "met')
+        _, steps = load_trajectory(self.log_path)
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0]["metric"], 100.0)
+
+
+class TestTrajectoryComparison(unittest.TestCase):
+    def setUp(self):
+        self.comparison = TrajectoryComparison(
+            [
+                get_trajectory("seed1", [100, 90, 150, 160]),
+                get_trajectory("seed2", [100, 200, None]),
+            ]
+        )
+
+    def test_best_so_far(self):
+        _, steps = self.comparison.trajectories[0]
+        self.assertListEqual(
+            self.comparison.get_best_so_far(steps), [100, 100, 150, 160]
+        )
+        _, steps = self.comparison.trajectories[1]
+        self.assertListEqual(self.comparison.get_best_so_far(steps), [100, 200, 200])
+
+    def test_runs_to_target(self):
+        runs = [
+            self.comparison.get_runs_to_target(steps, 150)
+            for _, steps in self.comparison.trajectories
+        ]
+        self.assertListEqual(runs, [3, 2])
+        _, steps = self.comparison.trajectories[0]
+        self.assertIsNone(self.comparison.get_runs_to_target(steps, 500))
+
+    def test_minimize(self):
+        comparison = TrajectoryComparison(
+            [get_trajectory("p99", [{"p99": 300}, {"p99": 200}, {"p99": 250}])],
+            metric="p99",
+        )
+        self.assertFalse(comparison.maximize)
+        _, steps = comparison.trajectories[0]
+        self.assertListEqual(comparison.get_best_so_far(steps), [300, 200, 200])
+        self.assertEqual(comparison.get_runs_to_target(steps, 200), 2)
+
+    def test_warm_start(self):
+        session, step = self.comparison.get_best_step()
+        self.assertEqual(session["name"], "seed2")
+        self.assertEqual(step["step"], 1)
+        self.assertDictEqual(
+            self.comparison.get_warm_start_options(),
+            {"bloom_bits": {"NO_COL_FAMILY": "1"}},
+        )
+        self.assertIsNone(
+            TrajectoryComparison([get_trajectory("empty", [])]).get_best_step()
+        )
+
+    def test_overlay_csv(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(dir_path, "overlay.csv")
+            self.comparison.write_overlay_csv(csv_path)
+            with open(csv_path) as fp:
+                rows = list(csv.reader(fp))
+        finally:
+            shutil.rmtree(dir_path)
+        self.assertListEqual(
+            rows,
+            [
+                ["step", "seed1", "seed2"],
+                ["0", "100", "100"],
+                ["1", "100", "200"],
+                ["2", "150", "200"],
+                ["3", "160", ""],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import unittest
+
+from advisor.expression_compiler import CompiledExpression
+from advisor.rule_parser import Condition, TimeSeriesCondition
+
+
+class TestCompiledExpression(unittest.TestCase):
+    def test_evaluate_scalars(self):
+        expression = CompiledExpression("keys[0]-(keys[1]*100)<200")
+        self.assertTrue(expression.evaluate([1792.0, 15.9638]))
+        self.assertFalse(expression.evaluate([1792.0, 1.0]))
+        expression = CompiledExpression("keys[0]+keys[1]+keys[2]==0")
+        self.assertTrue(expression.evaluate([0, 0, 0]))
+
+    def test_evaluate_series(self):
+        values = [[1.0, 2.0, 0.0, 4.0], [10.0, 5.0, 3.0, 40.0]]
+        expression = CompiledExpression("(keys[1]/keys[0])>5")
+        # division by zero never triggers the condition
+        self.assertListEqual(
+            [True, False, False, True], expression.evaluate(values).tolist()
+        )
+        expression = CompiledExpression("1 < keys[0] <= 4 and not keys[1] == 40")
+        self.assertListEqual(
+            [False, True, False, False], expression.evaluate(values).tolist()
+        )
+        expression = CompiledExpression("-keys[0] + 2**3 % 5")
+        self.assertListEqual(
+            [True, True, True, True], expression.evaluate(values).tolist()
+        )
+
+    def test_unsafe_expressions(self):
+        for expression in [
+            "__import__('os').system('ls')",
+            "keys.__class__",
+            "open('/etc/passwd')",
+            "options[0] > 1",
+            "keys[keys[0]] > 1",
+            "[k for k in keys]",
+            "keys[0] >",
+        ]:
+            with self.assertRaises(ValueError):
+                CompiledExpression(expression)
+
+    def test_index_out_of_range(self):
+        expression = CompiledExpression("keys[2] > 1")
+        with self.assertRaises(IndexError):
+            expression.evaluate([1.0, 2.0])
+
+    def test_time_series_condition(self):
+        cond = TimeSeriesCondition.create(Condition("cond-1"))
+        with self.assertRaises(ValueError):
+            cond.set_parameter("evaluate", "eval('keys[0]') > 1")
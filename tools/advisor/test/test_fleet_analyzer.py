@@ -0,0 +1,74 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from advisor.fleet_analyzer import FleetAnalyzer, FleetInstance, FleetReport
+
+
+class TestFleetAnalyzer(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        input_path = os.path.join(this_path, "input_files")
+        self.rules_path = os.path.join(input_path, "triggered_rules.ini")
+        self.fleet_path = tempfile.mkdtemp()
+        for db_name, log_name in [("db1", "LOG-0"), ("db2", "LOG-1"), ("db3", None)]:
+            db_path = os.path.join(self.fleet_path, db_name)
+            os.mkdir(db_path)
+            options_path = os.path.join(input_path, "OPTIONS-000005")
+            shutil.copy(options_path, os.path.join(db_path, "OPTIONS-000005"))
+            shutil.copy(options_path, os.path.join(db_path, "OPTIONS-000003"))
+            if log_name:
+                log_path = os.path.join(input_path, log_name)
+                shutil.copy(log_path, os.path.join(db_path, "LOG"))
+        # not the directory of a database
+        os.mkdir(os.path.join(self.fleet_path, "misc"))
+
+    def tearDown(self):
+        shutil.rmtree(self.fleet_path)
+
+    def test_from_fleet_dir(self):
+        instances = FleetInstance.from_fleet_dir(self.fleet_path)
+        self.assertListEqual(["db1", "db2", "db3"], [i.name for i in instances])
+        self.assertEqual(
+            os.path.join(self.fleet_path, "db1", "OPTIONS-000005"),
+            instances[0].options_path,
+        )
+
+    def test_analyze(self):
+        instances = FleetInstance.from_fleet_dir(self.fleet_path)
+        for num_workers in [1, 2]:
+            fleet_analyzer = FleetAnalyzer(self.rules_path, 20, num_workers)
+            report = fleet_analyzer.analyze(instances)
+            self.assertEqual(3, report.get_num_analyzed())
+            rule_fractions = report.get_rule_fractions()
+            self.assertEqual(("level0-level1-ratio", 3, 1.0), rule_fractions[0])
+            self.assertEqual(
+                ("stall-too-many-compaction-bytes", 1, 1 / 3), rule_fractions[-1]
+            )
+            ranked_changes = report.get_ranked_changes()
+            self.assertListEqual(["db1", "db2", "db3"], ranked_changes[0][1])
+            # suggested by 3 rules, on 2 instances
+            change, instances_changed, rules = ranked_changes[1]
+            self.assertEqual("CFOptions.write_buffer_size increase", change)
+            self.assertListEqual(["db1", "db2"], instances_changed)
+            self.assertEqual(3, len(rules))
+            self.assertListEqual(["db1"], ranked_changes[-1][1])
+
+    def test_report_errors(self):
+        fleet_analyzer = FleetAnalyzer(self.rules_path, 20, 1)
+        results = [
+            ("db1", {"stall-too-many-memtables": ["default"]}, None),
+            ("db2", {}, "ValueError: bad OPTIONS file"),
+        ]
+        report = FleetReport(fleet_analyzer.rules_spec, results)
+        self.assertEqual(1, report.get_num_analyzed())
+        self.assertDictEqual({"db2": "ValueError: bad OPTIONS file"}, report.errors)
+        self.assertListEqual(
+            [("stall-too-many-memtables", 1, 1.0)], report.get_rule_fractions()
+        )
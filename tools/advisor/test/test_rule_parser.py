@@ -3,12 +3,20 @@
 #  COPYING file in the root directory) and Apache 2.0 License
 #  (found in the LICENSE.Apache file in the root directory).
 
+import json
 import os
+import pickle
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
+from advisor.db_burst_detector import BurstInterval
 from advisor.db_log_parser import DatabaseLogs, DataSource
 from advisor.db_options_parser import DatabaseOptions
-from advisor.rule_parser import RulesSpec
+from advisor.db_stats_fetcher import LogStatsParser
+from advisor.db_timeseries_parser import NO_ENTITY
+from advisor.rule_parser import Condition, Rule, RulesSpec, TimeSeriesCondition
 
 RuleToSuggestions = {
     "stall-too-many-memtables": ["inc-bg-flush", "inc-write-buffer"],
@@ -149,6 +157,214 @@ class TestConditionsConjunctions(unittest.TestCase):
             )
 
 
+class TestColumnFamilyTimeSeriesRules(unittest.TestCase):
+    def setUp(self):
+        # load the Rules of the advisor, which include 'l0-files-pile-up'
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        ini_path = os.path.join(this_path, "../advisor/rules.ini")
+        self.db_rules = RulesSpec(ini_path)
+        self.db_rules.load()
+        # in LOG-2, the L0 score of 'default' reaches 6.0 while that of
+        # 'col_fam_A' stays at 0.5
+        log_path = os.path.join(this_path, "input_files/LOG-2")
+        options_path = os.path.join(this_path, "input_files/OPTIONS-000005")
+        self.column_families = DatabaseOptions(options_path).get_column_families()
+        self.data_sources = {
+            DataSource.Type.TIME_SERIES: [LogStatsParser(log_path, 600)]
+        }
+
+    def test_column_family_entities(self):
+        self.assertSetEqual(set(self.column_families), {"default", "col_fam_A"})
+        triggered_rules = self.db_rules.get_triggered_rules(
+            self.data_sources, self.column_families
+        )
+        rules = {rule.name: rule for rule in triggered_rules}
+        self.assertIn("l0-files-pile-up", rules)
+        rule = rules["l0-files-pile-up"]
+        self.assertSetEqual(rule.get_trigger_entities(), {"default"})
+        self.assertSetEqual(rule.get_trigger_column_families(), {"default"})
+
+    def test_other_entities(self):
+        # the entities that are not column families apply to all of them
+        self.assertSetEqual(
+            Rule.get_entity_column_families(
+                {NO_ENTITY, "host-1"}, self.column_families
+            ),
+            {"default", "col_fam_A"},
+        )
+
+
+class TestOverlappingConditions(unittest.TestCase):
+    def setUp(self):
+        self.rule = Rule("write-and-read-bursts")
+        self.rule.set_parameter("conditions", ["write-burst", "read-burst"])
+        self.rule.set_parameter("suggestions", "inc-write-buffer")
+        self.rule.set_parameter("overlap_time_period", "1m")
+        self.rule.perform_checks()
+        self.conditions_dict = {}
+        for cond_name in self.rule.conditions:
+            cond = TimeSeriesCondition.create(Condition(cond_name))
+            cond.set_parameter("keys", "rocksdb.bytes." + cond_name)
+            cond.set_parameter("behavior", "bursty")
+            cond.set_parameter("window_sec", 60)
+            cond.set_parameter("rate_threshold", 100)
+            self.conditions_dict[cond_name] = cond
+
+    def set_bursts(self, cond_name, bursts):
+        # 'bursts' is a list of (start, end, peak_timestamp) tuples
+        intervals = []
+        for start, end, peak_timestamp in bursts:
+            interval = BurstInterval(start, peak_timestamp, 200.0)
+            interval.end = end
+            intervals.append(interval)
+        cond = self.conditions_dict[cond_name]
+        cond.burst_intervals = {NO_ENTITY: intervals}
+        cond.set_trigger(
+            {NO_ENTITY: {interval.peak_timestamp: 200.0 for interval in intervals}}
+        )
+
+    def test_overlapping_bursts(self):
+        # the bursts overlap for 200 seconds, but peak 900 seconds apart
+        self.set_bursts("write-burst", [(1000, 1600, 1050)])
+        self.set_bursts("read-burst", [(100, 200, 150), (1400, 2000, 1950)])
+        self.assertTrue(self.rule.is_triggered(self.conditions_dict, ["default"]))
+        self.assertDictEqual(
+            self.rule.get_trigger_entities(), {NO_ENTITY: (1400, 1400)}
+        )
+
+    def test_bursts_within_overlap_time(self):
+        self.set_bursts("write-burst", [(1000, 1600, 1050)])
+        self.set_bursts("read-burst", [(1650, 2000, 1950)])
+        self.assertTrue(self.rule.is_triggered(self.conditions_dict, ["default"]))
+        self.assertDictEqual(
+            self.rule.get_trigger_entities(), {NO_ENTITY: (1650, 1600)}
+        )
+        self.set_bursts("read-burst", [(100, 900, 150), (1700, 2000, 1950)])
+        self.assertFalse(self.rule.is_triggered(self.conditions_dict, ["default"]))
+
+    def test_overlapping_epochs(self):
+        # the conditions triggered at epochs, eg. with evaluate_expression
+        self.assertTupleEqual(
+            self.rule.get_overlap_timestamps(
+                [(100, 100), (500, 500)], [(20, 20), (130, 130)]
+            ),
+            (130, 100),
+        )
+        self.assertIsNone(
+            self.rule.get_overlap_timestamps([(100, 100)], [(20, 20), (170, 170)])
+        )
+        self.assertIsNone(self.rule.get_overlap_timestamps([(100, 100)], []))
+
+
+class TestRulesSpecCache(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        self.input_path = os.path.join(this_path, "input_files")
+        self.cache_dir = tempfile.mkdtemp()
+        self.rules_path = os.path.join(self.cache_dir, "rules.ini")
+        shutil.copy(os.path.join(this_path, "../advisor/rules.ini"), self.rules_path)
+        options_path = os.path.join(self.input_path, "OPTIONS-000005")
+        db_options_parser = DatabaseOptions(options_path)
+        self.column_families = db_options_parser.get_column_families()
+        self.data_sources = {
+            DataSource.Type.DB_OPTIONS: [db_options_parser],
+            DataSource.Type.LOG: [
+                DatabaseLogs(
+                    os.path.join(self.input_path, "LOG-0"), self.column_families
+                )
+            ],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def get_triggered_rule_names(self, db_rules):
+        triggered_rules = db_rules.get_triggered_rules(
+            self.data_sources, self.column_families
+        )
+        return sorted(rule.name for rule in triggered_rules)
+
+    def test_load_from_cache(self):
+        db_rules = RulesSpec(self.rules_path, self.cache_dir)
+        db_rules.load()
+        expected_rules = self.get_triggered_rule_names(db_rules)
+        self.assertTrue(expected_rules)
+        cached_rules = RulesSpec(self.rules_path, self.cache_dir)
+        with mock.patch.object(RulesSpec, "load_rules_from_spec") as parse:
+            cached_rules.load()
+            parse.assert_not_called()
+        self.assertListEqual(
+            sorted(cached_rules.get_rules_dict().keys()),
+            sorted(db_rules.get_rules_dict().keys()),
+        )
+        self.assertListEqual(
+            self.get_triggered_rule_names(cached_rules), expected_rules
+        )
+        # the sections are built anew from the cached data
+        self.assertEqual(cached_rules.compiled_spec, db_rules.compiled_spec)
+        for name, rule in cached_rules.get_rules_dict().items():
+            self.assertIsNot(rule, db_rules.get_rules_dict()[name])
+
+    def test_compiled_spec(self):
+        db_rules = RulesSpec(self.rules_path, self.cache_dir)
+        db_rules.load()
+        # the compiled form is immutable (hashable) and cached as JSON
+        hash(db_rules.compiled_spec)
+        cache_path = db_rules.get_cache_path(db_rules.loaded_hash)
+        with open(cache_path) as cache_file:
+            self.assertEqual(
+                RulesSpec.freeze_sections(json.load(cache_file)),
+                db_rules.compiled_spec,
+            )
+        # a cache file that is not a compiled rules spec is ignored
+        with open(cache_path, "w") as cache_file:
+            json.dump([["exec", "name", []]], cache_file)
+        cached_rules = RulesSpec(self.rules_path, self.cache_dir)
+        cached_rules.load()
+        self.assertListEqual(
+            sorted(cached_rules.get_rules_dict().keys()),
+            sorted(db_rules.get_rules_dict().keys()),
+        )
+
+    def test_reload(self):
+        db_rules = RulesSpec(self.rules_path)
+        db_rules.load()
+        expected_rules = self.get_triggered_rule_names(db_rules)
+        # an unchanged rules spec is not parsed again, only its triggers are
+        # reset
+        with mock.patch.object(RulesSpec, "load_rules_from_spec") as parse:
+            db_rules.load()
+            parse.assert_not_called()
+        for cond in db_rules.get_conditions_dict().values():
+            self.assertFalse(cond.is_triggered(), repr(cond))
+        for rule in db_rules.get_rules_dict().values():
+            self.assertIsNone(rule.get_trigger_column_families())
+            self.assertIsNone(rule.get_trigger_entities())
+        self.assertListEqual(self.get_triggered_rule_names(db_rules), expected_rules)
+        # a changed rules spec is parsed again
+        with open(self.rules_path, "a") as rules_file:
+            rules_file.write('\n[Suggestion "new-suggestion"]\n')
+            rules_file.write("option=DBOptions.max_background_jobs\n")
+            rules_file.write("action=increase\n")
+        db_rules.load()
+        self.assertIn("new-suggestion", db_rules.get_suggestions_dict())
+
+    def test_pickle(self):
+        db_rules = RulesSpec(self.rules_path)
+        db_rules.load()
+        unpickled_rules = pickle.loads(pickle.dumps(db_rules))
+        for name, cond in db_rules.get_conditions_dict().items():
+            unpickled_cond = unpickled_rules.get_conditions_dict()[name]
+            self.assertEqual(repr(unpickled_cond), repr(cond))
+            if hasattr(cond, "compiled_expression"):
+                expression = cond.compiled_expression
+                values = [[i + 1.0] for i in range(expression.max_index + 1)]
+                self.assertEqual(
+                    unpickled_cond.compiled_expression.evaluate(values).tolist(),
+                    expression.evaluate(values).tolist(),
+                )
+
+
 class TestSanityChecker(unittest.TestCase):
     def setUp(self):
         this_path = os.path.abspath(os.path.dirname(__file__))
@@ -0,0 +1,144 @@
+# Copyright (c) 2011-present, Facebook, Inc.  All rights reserved.
+#  This source code is licensed under both the GPLv2 (found in the
+#  COPYING file in the root directory) and Apache 2.0 License
+#  (found in the LICENSE.Apache file in the root directory).
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from advisor.db_log_parser import DatabaseLogs, DataSource
+from advisor.db_options_parser import DatabaseOptions
+from advisor.db_timeseries_parser import TimeSeriesData
+from advisor.rule_parser import RulesSpec
+from advisor.rule_report import EvaluationProfile, RuleReport
+
+
+class TestEvaluationProfile(unittest.TestCase):
+    def test_record(self):
+        profile = EvaluationProfile()
+        self.assertIsNone(profile.get_stats("cond"))
+        profile.record("cond", 0.5, records=1, num_bytes=10)
+        profile.record("cond", 0.25, records=2, num_bytes=20)
+        self.assertDictEqual(
+            profile.get_stats("cond"),
+            {
+                "time_sec": 0.75,
+                "records_scanned": 3,
+                "bytes_scanned": 30,
+                "evaluations": 2,
+            },
+        )
+
+
+class TestRuleReport(unittest.TestCase):
+    def setUp(self):
+        this_path = os.path.abspath(os.path.dirname(__file__))
+        input_path = os.path.join(this_path, "input_files")
+        self.log_path = os.path.join(input_path, "LOG-0")
+        self.db_rules = RulesSpec(os.path.join(input_path, "triggered_rules.ini"))
+        self.db_rules.load_rules_from_spec()
+        self.db_rules.perform_section_checks()
+        self.profile = self.db_rules.enable_profiling()
+        db_options = DatabaseOptions(os.path.join(input_path, "OPTIONS-000005"))
+        self.column_families = db_options.get_column_families()
+        self.data_sources = {
+            DataSource.Type.DB_OPTIONS: [db_options],
+            DataSource.Type.LOG: [DatabaseLogs(self.log_path, self.column_families)],
+        }
+        self.triggered_rules = self.db_rules.get_triggered_rules(
+            self.data_sources, self.column_families
+        )
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_profile(self):
+        with open(self.log_path) as log_file:
+            num_logs = sum(1 for line in log_file if line[:2] == "20")
+        for name, cond in self.db_rules.get_conditions_dict().items():
+            stats = self.profile.get_stats(name)
+            self.assertIsNotNone(stats, name)
+            self.assertGreaterEqual(stats["time_sec"], 0)
+            if cond.get_data_source() is DataSource.Type.LOG:
+                # every log is scanned once by the regex of every condition
+                self.assertEqual(stats["records_scanned"], num_logs)
+                self.assertGreater(stats["bytes_scanned"], 0)
+            else:
+                self.assertEqual(stats["records_scanned"], len(cond.options))
+
+    def test_log_evidence(self):
+        report = RuleReport(
+            self.db_rules, self.triggered_rules, self.profile
+        ).get_report()
+        rule = next(
+            rule
+            for rule in report["triggered_rules"]
+            if rule["name"] == "stall-too-many-L0"
+        )
+        evidence = rule["evidence"]["stall-too-many-L0"]
+        self.assertTrue(evidence)
+        with open(self.log_path) as log_file:
+            lines = log_file.readlines()
+        for item in evidence:
+            self.assertEqual(item["file"], self.log_path)
+            # the evidence points at the exact line of the LOG
+            line = lines[item["line"] - 1]
+            self.assertIn(item["time"], line)
+            self.assertIn("Stalling writes because we have", line)
+        self.assertEqual(
+            report["conditions"]["stall-too-many-L0"]["trigger_count"], len(evidence)
+        )
+
+    def test_time_series_evidence(self):
+        class Cond:
+            window_sec = 60
+
+        evidence = RuleReport.get_time_series_evidence(
+            Cond(), "db1", {1000: 120.0, 940: 80.0}
+        )
+        self.assertEqual(
+            evidence,
+            [
+                {"entity": "db1", "end": 940, "value": 80.0, "start": 880},
+                {"entity": "db1", "end": 1000, "value": 120.0, "start": 940},
+            ],
+        )
+
+        class AggregatedCond:
+            aggregation_op = TimeSeriesData.AggregationOperator.latest
+
+        evidence = RuleReport.get_time_series_evidence(
+            AggregatedCond(), "db1", [1.0, 2.0]
+        )
+        self.assertEqual(
+            evidence,
+            [{"entity": "db1", "aggregation_op": "latest", "value": [1.0, 2.0]}],
+        )
+
+    def test_write_reports(self):
+        report = RuleReport(self.db_rules, self.triggered_rules, self.profile)
+        json_path = os.path.join(self.output_dir, "report.json")
+        html_path = os.path.join(self.output_dir, "report.html")
+        report.write_json(json_path)
+        report.write_html(html_path)
+        with open(json_path) as json_file:
+            report_dict = json.load(json_file)
+        self.assertSetEqual(
+            {rule["name"] for rule in report_dict["triggered_rules"]},
+            {rule.name for rule in self.triggered_rules},
+        )
+        with open(html_path) as html_file:
+            page = html_file.read()
+        for rule in self.triggered_rules:
+            self.assertIn('id="rule-' + rule.name + '"', page)
+            for cond_name in rule.conditions:
+                self.assertIn('href="#cond-' + cond_name + '"', page)
+                self.assertIn('id="cond-' + cond_name + '"', page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
+import array
 import gc
 import heapq
+import json
+import multiprocessing
+import os
 import random
 import sys
 import time
 from collections import OrderedDict
+from functools import cmp_to_key
 from os import path
 
 import numpy as np
@@ -16,6 +21,57 @@ kSampleSize = 64  # The sample size used when performing eviction.
 kMicrosInSecond = 1000000
 kSecondsInMinute = 60
 kSecondsInHour = 3600
+kStatsBatchSize = 1 << 12  # The number of accesses counted per stats update.
+
+# The stack distance of an access to a key that is not cached by an LRU cache
+# of any size.
+kInfiniteStackDistance = float("inf")
+kUint64Mask = (1 << 64) - 1
+kSamplingHashModulus = 1 << 64
+kSamplingChunkSize = 1 << 20  # The number of records hashed at a time.
+
+# The binary trace format: kBinaryTraceMagic, the length of the JSON header as
+# a little-endian uint64, the JSON header (the format version, the number of
+# records and the column family names) and, at the next multiple of
+# kBinaryTraceAlignment, the records as a NumPy structured array of
+# kBinaryTraceDtype. The columns are those of the human readable trace, except
+# that cf_name is the index of the column family name in the header.
+kBinaryTraceMagic = b"PYSIMTRC"
+kBinaryTraceVersion = 1
+kBinaryTraceAlignment = 64
+kBinaryTraceChunkSize = 1 << 16  # The number of records read at a time.
+kBinaryTraceDtype = np.dtype(
+    [
+        ("access_time", "<u8"),
+        ("block_id", "<u8"),
+        ("block_type", "u1"),
+        ("block_size", "<u8"),
+        ("cf_id", "<u8"),
+        ("cf_name", "<u4"),
+        ("level", "<u4"),
+        ("fd", "<u8"),
+        ("caller", "u1"),
+        ("no_insert", "u1"),
+        ("get_id", "<u8"),
+        ("key_id", "<u8"),
+        ("kv_size", "<u8"),
+        ("is_hit", "u1"),
+        ("referenced_key_exist_in_block", "u1"),
+        ("num_keys_in_block", "<u8"),
+        ("table_id", "<u8"),
+        ("seq_number", "<u8"),
+        ("block_key_size", "<u8"),
+        ("key_size", "<u8"),
+        ("block_offset_in_file", "<u8"),
+    ]
+)
+# The next access sidecar of a trace and a target column family: a
+# little-endian int64 per access to the column family, the position among
+# these accesses of the next access to the same block, or kNoNextAccess if the
+# block is not accessed again.
+kNextAccessFileSuffix = ".next_access"
+kNextAccessChunkSize = 1 << 20  # The number of records processed at a time.
+kNoNextAccess = np.iinfo(np.int64).max
 
 
 class TraceRecord:
@@ -25,6 +81,31 @@ class TraceRecord:
     trace_replay/block_cache_tracer.h
     """
 
+    __slots__ = (
+        "access_time",
+        "block_id",
+        "block_type",
+        "block_size",
+        "cf_id",
+        "cf_name",
+        "level",
+        "fd",
+        "caller",
+        "no_insert",
+        "get_id",
+        "key_id",
+        "kv_size",
+        "is_hit",
+        "referenced_key_exist_in_block",
+        "num_keys_in_block",
+        "table_id",
+        "seq_number",
+        "block_key_size",
+        "key_size",
+        "block_offset_in_file",
+        "next_access_seq_no",
+    )
+
     def __init__(
         self,
         access_time,
@@ -86,6 +167,18 @@ class TraceRecord:
 class CacheEntry:
     """A cache entry stored in the cache."""
 
+    __slots__ = (
+        "value_size",
+        "last_access_number",
+        "num_hits",
+        "cf_id",
+        "level",
+        "block_type",
+        "last_access_time",
+        "insertion_time",
+        "table_id",
+    )
+
     def __init__(
         self,
         value_size,
@@ -138,6 +231,8 @@ class CacheEntry:
 class HashEntry:
     """A hash entry stored in a hash table."""
 
+    __slots__ = ("key", "hash", "value")
+
     def __init__(self, key, hash, value):
         self.key = key
         self.hash = hash
@@ -149,347 +244,357 @@ class HashEntry:
 
 class HashTable:
     """
-    A custom implementation of hash table to support fast random sampling.
-    It is closed hashing and uses chaining to resolve hash conflicts.
-    It grows/shrinks the hash table upon insertion/deletion to support
-    fast lookups and random samplings.
+    A hash table that supports fast random sampling. The entries are stored in
+    a dense list and a dict maps each key to its position in the list, so that
+    an insert, a delete (which moves the last entry into the freed position),
+    a lookup and a uniform random sample of k entries are O(1) per entry and
+    never rehash all entries at once.
     """
 
     def __init__(self):
-        self.initial_size = 32
-        self.table = [None] * self.initial_size
-        self.elements = 0
+        self.entries = []
+        self.positions = {}
+
+    @property
+    def elements(self):
+        return len(self.entries)
 
     def random_sample(self, sample_size):
         """Randomly sample 'sample_size' hash entries from the table."""
-        samples = []
-        index = random.randint(0, len(self.table) - 1)
-        pos = index
-        # Starting from index, adding hash entries to the sample list until
-        # sample_size is met or we ran out of entries.
-        while True:
-            if self.table[pos] is not None:
-                for i in range(len(self.table[pos])):
-                    if self.table[pos][i] is None:
-                        continue
-                    samples.append(self.table[pos][i])
-                    if len(samples) == sample_size:
-                        break
-            pos += 1
-            pos = pos % len(self.table)
-            if pos == index or len(samples) == sample_size:
-                break
-        assert len(samples) <= sample_size
-        return samples
+        positions = random.sample(
+            range(len(self.entries)), min(sample_size, len(self.entries))
+        )
+        return [self.entries[pos] for pos in positions]
 
     def __repr__(self):
-        all_entries = []
-        for i in range(len(self.table)):
-            if self.table[i] is None:
-                continue
-            for j in range(len(self.table[i])):
-                if self.table[i][j] is not None:
-                    all_entries.append(self.table[i][j])
-        return f"{all_entries}"
+        return f"{self.entries}"
 
     def values(self):
-        all_values = []
-        for i in range(len(self.table)):
-            if self.table[i] is None:
-                continue
-            for j in range(len(self.table[i])):
-                if self.table[i][j] is not None:
-                    all_values.append(self.table[i][j].value)
-        return all_values
+        return [entry.value for entry in self.entries]
 
     def __len__(self):
-        return self.elements
+        return len(self.entries)
 
     def insert(self, key, hash, value):
         """
         Insert a hash entry in the table. Replace the old entry if it already
         exists.
         """
-        self.grow()
-        inserted = False
-        index = hash % len(self.table)
-        if self.table[index] is None:
-            self.table[index] = []
-        # Search for the entry first.
-        for i in range(len(self.table[index])):
-            if self.table[index][i] is None:
-                continue
-            if self.table[index][i].hash == hash and self.table[index][i].key == key:
-                # The entry already exists in the table.
-                self.table[index][i] = HashEntry(key, hash, value)
-                return
-
-        # Find an empty slot.
-        for i in range(len(self.table[index])):
-            if self.table[index][i] is None:
-                self.table[index][i] = HashEntry(key, hash, value)
-                inserted = True
-                break
-        if not inserted:
-            self.table[index].append(HashEntry(key, hash, value))
-        self.elements += 1
-
-    def resize(self, new_size):
-        if new_size == len(self.table):
-            return
-        if new_size < self.initial_size:
-            return
-        if self.elements < 100:
+        pos = self.positions.get(key)
+        if pos is not None:
+            self.entries[pos] = HashEntry(key, hash, value)
             return
-        new_table = [None] * new_size
-        # Copy 'self.table' to new_table.
-        for i in range(len(self.table)):
-            entries = self.table[i]
-            if entries is None:
-                continue
-            for j in range(len(entries)):
-                if entries[j] is None:
-                    continue
-                index = entries[j].hash % new_size
-                if new_table[index] is None:
-                    new_table[index] = []
-                new_table[index].append(entries[j])
-        self.table = new_table
-        del new_table
-        # Manually call python gc here to free the memory as 'self.table'
-        # might be very large.
-        gc.collect()
-
-    def grow(self):
-        if self.elements < 4 * len(self.table):
-            return
-        new_size = int(len(self.table) * 1.5)
-        self.resize(new_size)
+        self.positions[key] = len(self.entries)
+        self.entries.append(HashEntry(key, hash, value))
 
     def delete(self, key, hash):
-        index = hash % len(self.table)
-        deleted = False
-        deleted_entry = None
-        if self.table[index] is None:
-            return
-        for i in range(len(self.table[index])):
-            if (
-                self.table[index][i] is not None
-                and self.table[index][i].hash == hash
-                and self.table[index][i].key == key
-            ):
-                deleted_entry = self.table[index][i]
-                self.table[index][i] = None
-                self.elements -= 1
-                deleted = True
-                break
-        if deleted:
-            self.shrink()
+        pos = self.positions.pop(key, None)
+        if pos is None:
+            return None
+        deleted_entry = self.entries[pos]
+        last_entry = self.entries.pop()
+        if pos < len(self.entries):
+            self.entries[pos] = last_entry
+            self.positions[last_entry.key] = pos
         return deleted_entry
 
-    def shrink(self):
-        if self.elements * 2 >= len(self.table):
-            return
-        new_size = int(len(self.table) * 0.7)
-        self.resize(new_size)
-
     def lookup(self, key, hash):
-        index = hash % len(self.table)
-        if self.table[index] is None:
+        pos = self.positions.get(key)
+        if pos is None:
             return None
-        for i in range(len(self.table[index])):
-            if (
-                self.table[index][i] is not None
-                and self.table[index][i].hash == hash
-                and self.table[index][i].key == key
-            ):
-                return self.table[index][i].value
-        return None
+        return self.entries[pos].value
+
+
+class IntervalCounters:
+    """
+    Counters of the accesses per interval of time_unit seconds, in the rows of
+    a NumPy array indexed by the interval number. The array grows by doubling
+    to cover the intervals of the accesses added to it.
+    """
+
+    def __init__(self, time_unit, num_counters):
+        self.interval = kMicrosInSecond * time_unit
+        self.first_interval = None
+        self.counts = np.zeros((num_counters, 0), dtype=np.int64)
+
+    def add(self, access_times, counters, values=1):
+        """
+        Add the values to the counters of the intervals of the access times.
+        The counters and the values are either one per access or scalars.
+        """
+        if len(access_times) == 0:
+            return
+        intervals = np.asarray(access_times, dtype=np.int64) // self.interval
+        low = int(intervals.min())
+        high = int(intervals.max())
+        if self.first_interval is None:
+            self.first_interval = low
+        num_intervals = self.counts.shape[1]
+        if low < self.first_interval or high >= self.first_interval + num_intervals:
+            first_interval = min(low, self.first_interval)
+            counts = np.zeros(
+                (
+                    self.counts.shape[0],
+                    max(high - first_interval + 1, 2 * num_intervals),
+                ),
+                dtype=np.int64,
+            )
+            offset = self.first_interval - first_interval
+            counts[:, offset : offset + num_intervals] = self.counts
+            self.counts = counts
+            self.first_interval = first_interval
+        np.add.at(self.counts, (counters, intervals - self.first_interval), values)
+
+    def get(self, counter, start, end):
+        """
+        The counts of a counter in the intervals [start, end).
+        """
+        counts = np.zeros(max(0, end - start), dtype=np.int64)
+        if self.first_interval is None:
+            return counts
+        low = max(start, self.first_interval)
+        high = min(end, self.first_interval + self.counts.shape[1])
+        if low < high:
+            counts[low - start : high - start] = self.counts[
+                counter, low - self.first_interval : high - self.first_interval
+            ]
+        return counts
+
+    def clear(self):
+        self.first_interval = None
+        self.counts = np.zeros((self.counts.shape[0], 0), dtype=np.int64)
+
+
+def format_timeline_row(label, values, value_format):
+    return ",".join([label] + np.char.mod(value_format, values).tolist())
+
+
+def write_timeline_header(header_file_path, start, end):
+    if not path.exists(header_file_path):
+        with open(header_file_path, "w+") as header_file:
+            header_file.write(
+                format_timeline_row("time", np.arange(start, end), "%d") + "\n"
+            )
+
+
+def get_ratios(counts, totals):
+    """
+    The percentages of the counts in the totals, 0 where the total is 0.
+    """
+    ratios = np.zeros(len(counts))
+    np.divide(counts * 100.0, totals, out=ratios, where=totals > 0)
+    return ratios
 
 
 class MissRatioStats:
+    """
+    The miss ratio of a cache, with its misses and miss bytes per interval of
+    time_unit seconds. The access times are buffered and counted
+    kStatsBatchSize at a time.
+    """
+
+    # The interval counters.
+    kAccesses = 0
+    kMisses = 1
+    kMissBytes = 2
+
     def __init__(self, time_unit):
         self.num_misses = 0
         self.num_accesses = 0
         self.time_unit = time_unit
-        self.time_misses = {}
-        self.time_miss_bytes = {}
-        self.time_accesses = {}
+        self.time_counters = IntervalCounters(time_unit, 3)
+        self.access_times = []
+        self.miss_times = []
+        self.miss_bytes = []
 
     def update_metrics(self, access_time, is_hit, miss_bytes):
-        access_time /= kMicrosInSecond * self.time_unit
         self.num_accesses += 1
-        if access_time not in self.time_accesses:
-            self.time_accesses[access_time] = 0
-        self.time_accesses[access_time] += 1
+        self.access_times.append(access_time)
         if not is_hit:
             self.num_misses += 1
-            if access_time not in self.time_misses:
-                self.time_misses[access_time] = 0
-                self.time_miss_bytes[access_time] = 0
-            self.time_misses[access_time] += 1
-            self.time_miss_bytes[access_time] += miss_bytes
+            self.miss_times.append(access_time)
+            self.miss_bytes.append(miss_bytes)
+        # The buffers are emptied by reset_counter too.
+        if self.num_accesses % kStatsBatchSize == 0:
+            self.flush()
+
+    def flush(self):
+        """
+        Count the buffered accesses into the interval counters.
+        """
+        self.time_counters.add(self.access_times, self.kAccesses)
+        self.time_counters.add(self.miss_times, self.kMisses)
+        self.time_counters.add(
+            self.miss_times, self.kMissBytes, np.array(self.miss_bytes, np.int64)
+        )
+        self.access_times.clear()
+        self.miss_times.clear()
+        self.miss_bytes.clear()
 
     def reset_counter(self):
         self.num_misses = 0
         self.num_accesses = 0
-        self.time_miss_bytes.clear()
-        self.time_misses.clear()
-        self.time_accesses.clear()
+        self.time_counters.clear()
+        self.access_times.clear()
+        self.miss_times.clear()
+        self.miss_bytes.clear()
 
     def compute_miss_bytes(self):
-        miss_bytes = []
-        for at in self.time_miss_bytes:
-            miss_bytes.append(self.time_miss_bytes[at])
-        miss_bytes = sorted(miss_bytes)
-        avg_miss_bytes = 0
-        p95_miss_bytes = 0
-        for i in range(len(miss_bytes)):
-            avg_miss_bytes += float(miss_bytes[i]) / float(len(miss_bytes))
-
+        """
+        The average and the 95th percentile of the miss bytes of the intervals
+        with misses.
+        """
+        self.flush()
+        counts = self.time_counters.counts
+        miss_bytes = np.sort(counts[self.kMissBytes][counts[self.kMisses] > 0])
+        if len(miss_bytes) == 0:
+            return 0, 0
         p95_index = min(int(0.95 * float(len(miss_bytes))), len(miss_bytes) - 1)
-        p95_miss_bytes = miss_bytes[p95_index]
-        return avg_miss_bytes, p95_miss_bytes
+        return float(np.mean(miss_bytes)), int(miss_bytes[p95_index])
 
     def miss_ratio(self):
         return float(self.num_misses) * 100.0 / float(self.num_accesses)
 
+    def adjust_num_accesses(self, scale):
+        """
+        SHARDS-adj: scale the number of accesses to the number expected from
+        the sampled fraction of the blocks, counting the difference as hits,
+        which corrects the miss ratio of a sample with more or fewer accesses
+        than expected, eg. with or without a hot block.
+        The interval counters are left as they are.
+        """
+        self.num_accesses = max(self.num_misses, round(self.num_accesses * scale))
+
     def write_miss_timeline(
         self, cache_type, cache_size, target_cf_name, result_dir, start, end
     ):
-        start /= kMicrosInSecond * self.time_unit
-        end /= kMicrosInSecond * self.time_unit
-        header_file_path = "{}/header-ml-miss-timeline-{}-{}-{}-{}".format(
-            result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+        self.flush()
+        start //= kMicrosInSecond * self.time_unit
+        end //= kMicrosInSecond * self.time_unit
+        write_timeline_header(
+            "{}/header-ml-miss-timeline-{}-{}-{}-{}".format(
+                result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+            ),
+            start,
+            end,
         )
-        if not path.exists(header_file_path):
-            with open(header_file_path, "w+") as header_file:
-                header = "time"
-                for trace_time in range(start, end):
-                    header += f",{trace_time}"
-                header_file.write(header + "\n")
         file_path = "{}/data-ml-miss-timeline-{}-{}-{}-{}".format(
             result_dir, self.time_unit, cache_type, cache_size, target_cf_name
         )
+        misses = self.time_counters.get(self.kMisses, start, end)
         with open(file_path, "w+") as file:
-            row = f"{cache_type}"
-            for trace_time in range(start, end):
-                row += f",{self.time_misses.get(trace_time, 0)}"
-            file.write(row + "\n")
+            file.write(format_timeline_row(f"{cache_type}", misses, "%d") + "\n")
 
     def write_miss_ratio_timeline(
         self, cache_type, cache_size, target_cf_name, result_dir, start, end
     ):
-        start /= kMicrosInSecond * self.time_unit
-        end /= kMicrosInSecond * self.time_unit
-        header_file_path = "{}/header-ml-miss-ratio-timeline-{}-{}-{}-{}".format(
-            result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+        self.flush()
+        start //= kMicrosInSecond * self.time_unit
+        end //= kMicrosInSecond * self.time_unit
+        write_timeline_header(
+            "{}/header-ml-miss-ratio-timeline-{}-{}-{}-{}".format(
+                result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+            ),
+            start,
+            end,
         )
-        if not path.exists(header_file_path):
-            with open(header_file_path, "w+") as header_file:
-                header = "time"
-                for trace_time in range(start, end):
-                    header += f",{trace_time}"
-                header_file.write(header + "\n")
         file_path = "{}/data-ml-miss-ratio-timeline-{}-{}-{}-{}".format(
             result_dir, self.time_unit, cache_type, cache_size, target_cf_name
         )
+        miss_ratios = get_ratios(
+            self.time_counters.get(self.kMisses, start, end),
+            self.time_counters.get(self.kAccesses, start, end),
+        )
         with open(file_path, "w+") as file:
-            row = f"{cache_type}"
-            for trace_time in range(start, end):
-                naccesses = self.time_accesses.get(trace_time, 0)
-                miss_ratio = 0
-                if naccesses > 0:
-                    miss_ratio = float(
-                        self.time_misses.get(trace_time, 0) * 100.0
-                    ) / float(naccesses)
-                row += f",{miss_ratio:.2f}"
-            file.write(row + "\n")
+            file.write(format_timeline_row(f"{cache_type}", miss_ratios, "%.2f") + "\n")
 
 
 class PolicyStats:
+    """
+    The number of evictions per interval of time_unit seconds in which each
+    policy was selected. The evictions are buffered and counted
+    kStatsBatchSize at a time.
+    """
+
     def __init__(self, time_unit, policies):
-        self.time_selected_polices = {}
-        self.time_accesses = {}
         self.policy_names = {}
         self.time_unit = time_unit
         for i in range(len(policies)):
             self.policy_names[i] = policies[i].policy_name()
+        # The counter of the evictions, followed by those of every policy.
+        self.time_counters = IntervalCounters(time_unit, 1 + len(policies))
+        self.access_times = []
+        self.selected_policies = []
 
     def update_metrics(self, access_time, selected_policy):
-        access_time /= kMicrosInSecond * self.time_unit
-        if access_time not in self.time_accesses:
-            self.time_accesses[access_time] = 0
-        self.time_accesses[access_time] += 1
-        if access_time not in self.time_selected_polices:
-            self.time_selected_polices[access_time] = {}
-        policy_name = self.policy_names[selected_policy]
-        if policy_name not in self.time_selected_polices[access_time]:
-            self.time_selected_polices[access_time][policy_name] = 0
-        self.time_selected_polices[access_time][policy_name] += 1
+        self.access_times.append(access_time)
+        self.selected_policies.append(selected_policy)
+        if len(self.access_times) == kStatsBatchSize:
+            self.flush()
+
+    def flush(self):
+        """
+        Count the buffered evictions into the interval counters.
+        """
+        self.time_counters.add(self.access_times, 0)
+        self.time_counters.add(
+            self.access_times, 1 + np.array(self.selected_policies, np.int64)
+        )
+        self.access_times.clear()
+        self.selected_policies.clear()
 
     def write_policy_timeline(
         self, cache_type, cache_size, target_cf_name, result_dir, start, end
     ):
-        start /= kMicrosInSecond * self.time_unit
-        end /= kMicrosInSecond * self.time_unit
-        header_file_path = "{}/header-ml-policy-timeline-{}-{}-{}-{}".format(
-            result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+        self.flush()
+        start //= kMicrosInSecond * self.time_unit
+        end //= kMicrosInSecond * self.time_unit
+        write_timeline_header(
+            "{}/header-ml-policy-timeline-{}-{}-{}-{}".format(
+                result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+            ),
+            start,
+            end,
         )
-        if not path.exists(header_file_path):
-            with open(header_file_path, "w+") as header_file:
-                header = "time"
-                for trace_time in range(start, end):
-                    header += f",{trace_time}"
-                header_file.write(header + "\n")
         file_path = "{}/data-ml-policy-timeline-{}-{}-{}-{}".format(
             result_dir, self.time_unit, cache_type, cache_size, target_cf_name
         )
         with open(file_path, "w+") as file:
             for policy in self.policy_names:
                 policy_name = self.policy_names[policy]
-                row = f"{cache_type}-{policy_name}"
-                for trace_time in range(start, end):
-                    row += ",{}".format(
-                        self.time_selected_polices.get(trace_time, {}).get(
-                            policy_name, 0
-                        )
-                    )
-                file.write(row + "\n")
+                selected = self.time_counters.get(1 + policy, start, end)
+                file.write(
+                    format_timeline_row(f"{cache_type}-{policy_name}", selected, "%d")
+                    + "\n"
+                )
 
     def write_policy_ratio_timeline(
-        self, cache_type, cache_size, target_cf_name, file_path, start, end
+        self, cache_type, cache_size, target_cf_name, result_dir, start, end
     ):
-        start /= kMicrosInSecond * self.time_unit
-        end /= kMicrosInSecond * self.time_unit
-        header_file_path = "{}/header-ml-policy-ratio-timeline-{}-{}-{}-{}".format(
-            result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+        self.flush()
+        start //= kMicrosInSecond * self.time_unit
+        end //= kMicrosInSecond * self.time_unit
+        write_timeline_header(
+            "{}/header-ml-policy-ratio-timeline-{}-{}-{}-{}".format(
+                result_dir, self.time_unit, cache_type, cache_size, target_cf_name
+            ),
+            start,
+            end,
         )
-        if not path.exists(header_file_path):
-            with open(header_file_path, "w+") as header_file:
-                header = "time"
-                for trace_time in range(start, end):
-                    header += f",{trace_time}"
-                header_file.write(header + "\n")
         file_path = "{}/data-ml-policy-ratio-timeline-{}-{}-{}-{}".format(
             result_dir, self.time_unit, cache_type, cache_size, target_cf_name
         )
+        naccesses = self.time_counters.get(0, start, end)
         with open(file_path, "w+") as file:
             for policy in self.policy_names:
                 policy_name = self.policy_names[policy]
-                row = f"{cache_type}-{policy_name}"
-                for trace_time in range(start, end):
-                    naccesses = self.time_accesses.get(trace_time, 0)
-                    ratio = 0
-                    if naccesses > 0:
-                        ratio = float(
-                            self.time_selected_polices.get(trace_time, {}).get(
-                                policy_name, 0
-                            )
-                            * 100.0
-                        ) / float(naccesses)
-                    row += f",{ratio:.2f}"
-                file.write(row + "\n")
+                ratios = get_ratios(
+                    self.time_counters.get(1 + policy, start, end), naccesses
+                )
+                file.write(
+                    format_timeline_row(f"{cache_type}-{policy_name}", ratios, "%.2f")
+                    + "\n"
+                )
 
 
 class Policy:
@@ -522,11 +627,7 @@ class Policy:
 
 class LRUPolicy(Policy):
     def prioritize_samples(self, samples, auxilliary_info):
-        return sorted(
-            samples,
-            cmp=lambda e1, e2: e1.value.last_access_number
-            - e2.value.last_access_number,
-        )
+        return sorted(samples, key=lambda e: e.value.last_access_number)
 
     def policy_name(self):
         return "lru"
@@ -534,11 +635,7 @@ class LRUPolicy(Policy):
 
 class MRUPolicy(Policy):
     def prioritize_samples(self, samples, auxilliary_info):
-        return sorted(
-            samples,
-            cmp=lambda e1, e2: e2.value.last_access_number
-            - e1.value.last_access_number,
-        )
+        return sorted(samples, key=lambda e: -e.value.last_access_number)
 
     def policy_name(self):
         return "mru"
@@ -546,7 +643,7 @@ class MRUPolicy(Policy):
 
 class LFUPolicy(Policy):
     def prioritize_samples(self, samples, auxilliary_info):
-        return sorted(samples, cmp=lambda e1, e2: e1.value.num_hits - e2.value.num_hits)
+        return sorted(samples, key=lambda e: e.value.num_hits)
 
     def policy_name(self):
         return "lfu"
@@ -588,7 +685,9 @@ class HyperbolicPolicy(Policy):
     def prioritize_samples(self, samples, auxilliary_info):
         assert len(auxilliary_info) == 3
         now = auxilliary_info[0]
-        return sorted(samples, cmp=lambda e1, e2: self.compare(e1, e2, now))
+        return sorted(
+            samples, key=cmp_to_key(lambda e1, e2: self.compare(e1, e2, now))
+        )
 
     def policy_name(self):
         return "hb"
@@ -645,8 +744,10 @@ class CostClassPolicy(Policy):
         cost_class_label = auxilliary_info[2]
         return sorted(
             samples,
-            cmp=lambda e1, e2: self.compare(
-                e1, e2, now, cost_classes, cost_class_label
+            key=cmp_to_key(
+                lambda e1, e2: self.compare(
+                    e1, e2, now, cost_classes, cost_class_label
+                )
             ),
         )
 
@@ -674,10 +775,11 @@ class Cache:
         self.retain_get_id_range = 100000
 
     def block_key(self, trace_record):
-        return f"b{trace_record.block_id}"
+        return trace_record.block_id
 
     def row_key(self, trace_record):
-        return f"g{trace_record.fd}-{trace_record.key_id}"
+        # Row keys are negative so that they never collide with block ids.
+        return ~((trace_record.fd << 64) | trace_record.key_id)
 
     def _lookup(self, trace_record, key, hash):
         """
@@ -841,6 +943,14 @@ class CostClassEntry:
     same type will share one cost class entry.
     """
 
+    __slots__ = (
+        "hits",
+        "num_entries_in_cache",
+        "size_in_cache",
+        "sum_insertion_times",
+        "sum_last_access_time",
+    )
+
     def __init__(self):
         self.hits = 0
         self.num_entries_in_cache = 0
@@ -1056,6 +1166,9 @@ class LinUCBCache(MLCache):
     DOI=http://dx.doi.org/10.1145/1772690.1772758
     """
 
+    # The number of accesses whose random tie-breaking noise is drawn at once.
+    kNoiseBatchSize = 1024
+
     def __init__(self, cache_size, enable_cache_row_key, policies, cost_class_label):
         super().__init__(
             cache_size, enable_cache_row_key, policies, cost_class_label
@@ -1064,36 +1177,62 @@ class LinUCBCache(MLCache):
         self.th = np.zeros((len(self.policies), self.nfeatures))
         self.eps = 0.2
         self.b = np.zeros_like(self.th)
-        self.A = np.zeros((len(self.policies), self.nfeatures, self.nfeatures))
-        self.A_inv = np.zeros((len(self.policies), self.nfeatures, self.nfeatures))
-        for i in range(len(self.policies)):
-            self.A[i] = np.identity(self.nfeatures)
+        # The inverses of the A matrices, which start as identity matrices and
+        # are updated incrementally with the Sherman-Morrison formula.
+        self.A_inv = np.tile(
+            np.identity(self.nfeatures), (len(self.policies), 1, 1)
+        )
         self.th_hat = np.zeros_like(self.th)
         self.p = np.zeros(len(self.policies))
         self.alph = 0.2
+        # Buffers preallocated for _select_policy.
+        self.x_i = np.zeros(self.nfeatures)
+        self.A_inv_x = np.zeros_like(self.th)
+        self.x_A_inv_x = np.zeros(len(self.policies))
+        self.means = np.zeros(len(self.policies))
+        self.outer = np.zeros((self.nfeatures, self.nfeatures))
+        self.noise = np.zeros((0, len(self.policies)))
+        self.noise_index = 0
+
+    def _next_noise(self):
+        if self.noise_index == len(self.noise):
+            self.noise = np.random.random((self.kNoiseBatchSize, len(self.policies)))
+            self.noise *= 0.000001
+            self.noise_index = 0
+        self.noise_index += 1
+        return self.noise[self.noise_index - 1]
 
     def _select_policy(self, trace_record, key):
         if len(self.policies) == 1:
             return 0
-        x_i = np.zeros(self.nfeatures)  # The current context vector
+        x_i = self.x_i  # The current context vector
         x_i[0] = trace_record.block_type
         x_i[1] = trace_record.level
         x_i[2] = trace_record.cf_id
-        p = np.zeros(len(self.policies))
-        for a in range(len(self.policies)):
-            self.th_hat[a] = self.A_inv[a].dot(self.b[a])
-            ta = x_i.dot(self.A_inv[a]).dot(x_i)
-            a_upper_ci = self.alph * np.sqrt(ta)
-            a_mean = self.th_hat[a].dot(x_i)
-            p[a] = a_mean + a_upper_ci
-        p = p + (np.random.random(len(p)) * 0.000001)
-        selected_policy = p.argmax()
+        # The upper confidence bounds of all policies at once.
+        A_inv_x = np.matmul(self.A_inv, x_i, out=self.A_inv_x)
+        x_A_inv_x = np.dot(A_inv_x, x_i, out=self.x_A_inv_x)
+        p = np.sqrt(np.abs(x_A_inv_x, out=self.p), out=self.p)
+        p *= self.alph
+        p += np.dot(self.th_hat, x_i, out=self.means)
+        p += self._next_noise()
+        selected_policy = int(p.argmax())
         reward = self.policies[selected_policy].generate_reward(key)
         assert reward <= 1 and reward >= 0
-        self.A[selected_policy] += np.outer(x_i, x_i)
-        self.b[selected_policy] += reward * x_i
-        self.A_inv[selected_policy] = np.linalg.inv(self.A[selected_policy])
-        del x_i
+        # A += x_i x_i^T, so A_inv -= (A_inv x_i)(A_inv x_i)^T / (1 + x_i^T A_inv x_i)
+        # since A_inv is symmetric.
+        u = A_inv_x[selected_policy]
+        outer = np.multiply(u[:, None], u, out=self.outer)
+        outer /= 1.0 + x_A_inv_x[selected_policy]
+        self.A_inv[selected_policy] -= outer
+        if reward:
+            self.b[selected_policy] += reward * x_i
+        # Only the estimate of the selected policy changes.
+        np.dot(
+            self.A_inv[selected_policy],
+            self.b[selected_policy],
+            out=self.th_hat[selected_policy],
+        )
         return selected_policy
 
     def cache_name(self):
@@ -1111,16 +1250,18 @@ class OPTCacheEntry:
     access is the furthest in the future is ordered before other entries.
     """
 
+    __slots__ = ("key", "next_access_seq_no", "value_size", "is_removed")
+
     def __init__(self, key, next_access_seq_no, value_size):
         self.key = key
         self.next_access_seq_no = next_access_seq_no
         self.value_size = value_size
         self.is_removed = False
 
-    def __cmp__(self, other):
+    def __lt__(self, other):
         if other.next_access_seq_no != self.next_access_seq_no:
-            return other.next_access_seq_no - self.next_access_seq_no
-        return self.value_size - other.value_size
+            return other.next_access_seq_no < self.next_access_seq_no
+        return self.value_size < other.value_size
 
     def __repr__(self):
         return "({} {} {} {})".format(
@@ -1241,20 +1382,22 @@ class GDSizeEntry:
     A cache entry for the greedy dual size replacement policy.
     """
 
+    __slots__ = ("key", "value_size", "priority", "is_removed")
+
     def __init__(self, key, value_size, priority):
         self.key = key
         self.value_size = value_size
         self.priority = priority
         self.is_removed = False
 
-    def __cmp__(self, other):
+    def __lt__(self, other):
         if other.priority != self.priority:
-            return self.priority - other.priority
-        return self.value_size - other.value_size
+            return self.priority < other.priority
+        return self.value_size < other.value_size
 
     def __repr__(self):
         return "({} {} {} {})".format(
-            self.key, self.next_access_seq_no, self.value_size, self.is_removed
+            self.key, self.priority, self.value_size, self.is_removed
         )
 
 
@@ -1460,8 +1603,9 @@ class LRUCache(Cache):
 
     def __init__(self, cache_size, enable_cache_row_key):
         super().__init__(cache_size, enable_cache_row_key)
-        self.table = {}
-        self.lru = Deque()
+        # The table is also the LRU queue, from the least to the most recently
+        # used entry, which saves a second container entry per cached key.
+        self.table = OrderedDict()
 
     def cache_name(self):
         if self.enable_cache_row_key:
@@ -1472,15 +1616,13 @@ class LRUCache(Cache):
         if key not in self.table:
             return False
         # A cache hit. Update LRU queue.
-        self.lru.remove(key)
-        self.lru.appendleft(key)
+        self.table.move_to_end(key)
         return True
 
     def _evict(self, trace_record, key, hash, value_size):
         while self.used_size + value_size > self.cache_size:
-            evict_key = self.lru.pop()
-            self.used_size -= self.table[evict_key].value_size
-            del self.table[evict_key]
+            _, evict_entry = self.table.popitem(last=False)
+            self.used_size -= evict_entry.value_size
 
     def _insert(self, trace_record, key, hash, value_size):
         self.table[key] = CacheEntry(
@@ -1492,346 +1634,1207 @@ class LRUCache(Cache):
             0,
             trace_record.access_time,
         )
-        self.lru.appendleft(key)
 
     def _should_admit(self, trace_record, key, hash, value_size):
         return True
 
 
-class TraceCache(Cache):
+class TwoQCache(Cache):
     """
-    A trace cache. Lookup returns true if the trace observes a cache hit.
-    It is used to maintain cache hits observed in the trace.
+    An implementation of the full version of 2Q. A missed key is inserted
+    into the FIFO queue A1in, where it stays however often it is accessed so
+    that correlated accesses do not promote it, unless the ghost queue A1out
+    remembers it being evicted from A1in: then it is inserted into the LRU
+    queue Am. The queues are sized in bytes: A1in takes kInRatio of the cache
+    and A1out remembers the keys of kOutRatio of the cache.
+
+    Theodore Johnson and Dennis Shasha. 1994. 2Q: A Low Overhead High
+    Performance Buffer Management Replacement Algorithm. In Proceedings of the
+    20th International Conference on Very Large Data Bases (VLDB '94). Morgan
+    Kaufmann Publishers Inc., San Francisco, CA, USA, 439-450.
     """
 
-    def __init__(self, cache_size):
-        super().__init__(cache_size, enable_cache_row_key=0)
+    kInRatio = 0.25
+    kOutRatio = 0.5
+
+    def __init__(self, cache_size, enable_cache_row_key):
+        super().__init__(cache_size, enable_cache_row_key)
+        self.table = {}
+        # The queues map their keys to the cache entries, from the oldest or
+        # least recently used key to the newest or most recently used one.
+        self.a1in = OrderedDict()
+        self.a1in_size = 0
+        self.am = OrderedDict()
+        # The ghost queue maps the keys evicted from A1in to their sizes.
+        self.a1out = OrderedDict()
+        self.a1out_size = 0
+        # Whether A1out remembers the missed key being inserted.
+        self.is_remembered = False
+
+    def cache_name(self):
+        if self.enable_cache_row_key:
+            return "Hybrid 2Q (2q_hybrid)"
+        return "2Q (2q)"
 
     def _lookup(self, trace_record, key, hash):
-        return trace_record.is_hit
+        if key in self.am:
+            self.am.move_to_end(key)
+            return True
+        return key in self.a1in
 
     def _evict(self, trace_record, key, hash, value_size):
-        pass
+        ghost_size = self.a1out.pop(key, None)
+        self.is_remembered = ghost_size is not None
+        if self.is_remembered:
+            self.a1out_size -= ghost_size
+        while self.used_size + value_size > self.cache_size:
+            if self.a1in and (
+                self.a1in_size > self.kInRatio * self.cache_size or not self.am
+            ):
+                evict_key, evict_entry = self.a1in.popitem(last=False)
+                self.a1in_size -= evict_entry.value_size
+                self.a1out[evict_key] = evict_entry.value_size
+                self.a1out_size += evict_entry.value_size
+                while self.a1out_size > self.kOutRatio * self.cache_size:
+                    _, ghost_size = self.a1out.popitem(last=False)
+                    self.a1out_size -= ghost_size
+            else:
+                evict_key, evict_entry = self.am.popitem(last=False)
+            del self.table[evict_key]
+            self.used_size -= evict_entry.value_size
 
     def _insert(self, trace_record, key, hash, value_size):
-        pass
+        entry = CacheEntry(
+            value_size,
+            trace_record.cf_id,
+            trace_record.level,
+            trace_record.block_type,
+            trace_record.table_id,
+            0,
+            trace_record.access_time,
+        )
+        self.table[key] = entry
+        if self.is_remembered:
+            self.am[key] = entry
+        else:
+            self.a1in[key] = entry
+            self.a1in_size += value_size
 
     def _should_admit(self, trace_record, key, hash, value_size):
-        return False
-
-    def cache_name(self):
-        return "Trace"
+        return True
 
 
-def parse_cache_size(cs):
-    cs = cs.replace("\n", "")
-    if cs[-1] == "M":
-        return int(cs[: len(cs) - 1]) * 1024 * 1024
-    if cs[-1] == "G":
-        return int(cs[: len(cs) - 1]) * 1024 * 1024 * 1024
-    if cs[-1] == "T":
-        return int(cs[: len(cs) - 1]) * 1024 * 1024 * 1024 * 1024
-    return int(cs)
+class SieveEntry:
+    """
+    A cache entry of SIEVE, linked into the FIFO queue of the cache.
+    """
 
+    __slots__ = ("key", "value_size", "visited", "newer", "older")
 
-def create_cache(cache_type, cache_size, downsample_size):
-    cache_size = cache_size / downsample_size
-    enable_cache_row_key = 0
-    if "hybridn" in cache_type:
-        enable_cache_row_key = 2
-        cache_type = cache_type[:-8]
-    if "hybrid" in cache_type:
-        enable_cache_row_key = 1
-        cache_type = cache_type[:-7]
-    if cache_type == "ts":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [LRUPolicy(), LFUPolicy(), HyperbolicPolicy()],
-            cost_class_label=None,
-        )
-    elif cache_type == "linucb":
-        return LinUCBCache(
-            cache_size,
-            enable_cache_row_key,
-            [LRUPolicy(), LFUPolicy(), HyperbolicPolicy()],
-            cost_class_label=None,
-        )
-    elif cache_type == "pylru":
-        return ThompsonSamplingCache(
-            cache_size, enable_cache_row_key, [LRUPolicy()], cost_class_label=None
-        )
-    elif cache_type == "pymru":
-        return ThompsonSamplingCache(
-            cache_size, enable_cache_row_key, [MRUPolicy()], cost_class_label=None
-        )
-    elif cache_type == "pylfu":
-        return ThompsonSamplingCache(
-            cache_size, enable_cache_row_key, [LFUPolicy()], cost_class_label=None
-        )
-    elif cache_type == "pyhb":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [HyperbolicPolicy()],
-            cost_class_label=None,
-        )
-    elif cache_type == "pycctbbt":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [CostClassPolicy()],
-            cost_class_label="table_bt",
-        )
-    elif cache_type == "pycccf":
-        return ThompsonSamplingCache(
-            cache_size, enable_cache_row_key, [CostClassPolicy()], cost_class_label="cf"
-        )
-    elif cache_type == "pycctblevelbt":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [CostClassPolicy()],
-            cost_class_label="table_level_bt",
-        )
-    elif cache_type == "pycccfbt":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [CostClassPolicy()],
-            cost_class_label="cf_bt",
-        )
-    elif cache_type == "pycctb":
-        return ThompsonSamplingCache(
-            cache_size,
-            enable_cache_row_key,
-            [CostClassPolicy()],
-            cost_class_label="table",
-        )
-    elif cache_type == "pyccbt":
-        return ThompsonSamplingCache(
-            cache_size, enable_cache_row_key, [CostClassPolicy()], cost_class_label="bt"
-        )
-    elif cache_type == "opt":
-        if enable_cache_row_key:
-            print("opt does not support hybrid mode.")
-            assert False
-        return OPTCache(cache_size)
-    elif cache_type == "trace":
-        if enable_cache_row_key:
-            print("trace does not support hybrid mode.")
-            assert False
-        return TraceCache(cache_size)
-    elif cache_type == "lru":
-        return LRUCache(cache_size, enable_cache_row_key)
-    elif cache_type == "arc":
-        return ARCCache(cache_size, enable_cache_row_key)
-    elif cache_type == "gdsize":
-        return GDSizeCache(cache_size, enable_cache_row_key)
-    else:
-        print(f"Unknown cache type {cache_type}")
-        assert False
-    return None
+    def __init__(self, key, value_size):
+        self.key = key
+        self.value_size = value_size
+        self.visited = False
+        self.newer = None
+        self.older = None
 
 
-class BlockAccessTimeline:
+class SieveCache(Cache):
     """
-    BlockAccessTimeline stores all accesses of a block.
+    An implementation of SIEVE. The keys are kept in a FIFO queue and a hit
+    only marks the key as visited. To make room, the hand moves from the
+    oldest towards the newest key, unmarking the visited keys it passes, and
+    evicts the first key that is not visited. Unlike CLOCK, the keys that
+    survive stay where they are, so that the new keys that are not accessed
+    again are evicted quickly.
+
+    Yazhuo Zhang, Juncheng Yang, Yao Yue, Ymir Vigfusson, and K. V. Rashmi.
+    2024. SIEVE is Simpler than LRU: an Efficient Turn-Key Eviction Algorithm
+    for Web Caches. In 21st USENIX Symposium on Networked Systems Design and
+    Implementation (NSDI '24). USENIX Association, Santa Clara, CA, USA,
+    1229-1246.
     """
 
-    def __init__(self):
-        self.accesses = []
-        self.current_access_index = 1
-
-    def get_next_access(self):
-        if self.current_access_index == len(self.accesses):
-            return sys.maxsize
-        next_access_seq_no = self.accesses[self.current_access_index]
-        self.current_access_index += 1
-        return next_access_seq_no
-
+    def __init__(self, cache_size, enable_cache_row_key):
+        super().__init__(cache_size, enable_cache_row_key)
+        self.table = {}
+        self.newest = None
+        self.oldest = None
+        # The next entry to consider for eviction, the oldest if None.
+        self.hand = None
+
+    def cache_name(self):
+        if self.enable_cache_row_key:
+            return "Hybrid SIEVE (sieve_hybrid)"
+        return "SIEVE (sieve)"
+
+    def _lookup(self, trace_record, key, hash):
+        entry = self.table.get(key)
+        if entry is None:
+            return False
+        entry.visited = True
+        return True
+
+    def _evict(self, trace_record, key, hash, value_size):
+        while self.used_size + value_size > self.cache_size:
+            entry = self.hand or self.oldest
+            while entry.visited:
+                entry.visited = False
+                entry = entry.newer or self.oldest
+            self.hand = entry.newer
+            if entry.newer is None:
+                self.newest = entry.older
+            else:
+                entry.newer.older = entry.older
+            if entry.older is None:
+                self.oldest = entry.newer
+            else:
+                entry.older.newer = entry.newer
+            del self.table[entry.key]
+            self.used_size -= entry.value_size
+
+    def _insert(self, trace_record, key, hash, value_size):
+        entry = SieveEntry(key, value_size)
+        entry.older = self.newest
+        if self.newest is None:
+            self.oldest = entry
+        else:
+            self.newest.newer = entry
+        self.newest = entry
+        self.table[key] = entry
+
+    def _should_admit(self, trace_record, key, hash, value_size):
+        return True
+
+
+class S3FIFOEntry:
+    """
+    A cache entry of S3-FIFO, with the number of times it was accessed since
+    its insertion into its queue, up to S3FIFOCache.kMaxFreq.
+    """
+
+    __slots__ = ("value_size", "freq")
+
+    def __init__(self, value_size):
+        self.value_size = value_size
+        self.freq = 0
+
+
+class S3FIFOCache(Cache):
+    """
+    An implementation of S3-FIFO. New keys are inserted into the small FIFO
+    queue S, which takes kSmallRatio of the cache. Most of them are not
+    accessed again and are quickly evicted from S into the ghost queue G,
+    which remembers as many bytes of keys as the main FIFO queue M caches.
+    The keys evicted from S after being accessed there, and the missed keys
+    that G remembers, are inserted into M. M reinserts the keys that it would
+    evict if they were accessed since their insertion, at most kMaxFreq times.
+
+    Juncheng Yang, Yazhuo Zhang, Ziyue Qiu, Yao Yue, and Rashmi Vinayak. 2023.
+    FIFO queues are all you need for cache eviction. In Proceedings of the
+    29th Symposium on Operating Systems Principles (SOSP '23). ACM, New York,
+    NY, USA, 130-149.
+    DOI=https://doi.org/10.1145/3600006.3613147
+    """
+
+    kSmallRatio = 0.1
+    kMaxFreq = 3
+
+    def __init__(self, cache_size, enable_cache_row_key):
+        super().__init__(cache_size, enable_cache_row_key)
+        self.table = {}
+        # The queues map their keys to the cache entries, from the oldest key
+        # to the newest one.
+        self.small = OrderedDict()
+        self.small_size = 0
+        self.main = OrderedDict()
+        # The ghost queue maps the keys evicted from S to their sizes.
+        self.ghost = OrderedDict()
+        self.ghost_size = 0
+        # Whether G remembers the missed key being inserted.
+        self.is_remembered = False
+
+    def cache_name(self):
+        if self.enable_cache_row_key:
+            return "Hybrid S3-FIFO (s3fifo_hybrid)"
+        return "S3-FIFO (s3fifo)"
+
+    def _lookup(self, trace_record, key, hash):
+        entry = self.table.get(key)
+        if entry is None:
+            return False
+        if entry.freq < self.kMaxFreq:
+            entry.freq += 1
+        return True
+
+    def _evict_small(self):
+        # Evict the oldest key of S that was not accessed, moving the keys
+        # before it into M.
+        while self.small:
+            key, entry = self.small.popitem(last=False)
+            self.small_size -= entry.value_size
+            if entry.freq > 0:
+                entry.freq = 0
+                self.main[key] = entry
+                continue
+            del self.table[key]
+            self.used_size -= entry.value_size
+            self.ghost[key] = entry.value_size
+            self.ghost_size += entry.value_size
+            while self.ghost_size > (1 - self.kSmallRatio) * self.cache_size:
+                _, ghost_size = self.ghost.popitem(last=False)
+                self.ghost_size -= ghost_size
+            return
+
+    def _evict_main(self):
+        # Evict the oldest key of M that was not accessed since its insertion,
+        # reinserting the keys before it.
+        while True:
+            key, entry = self.main.popitem(last=False)
+            if entry.freq > 0:
+                entry.freq -= 1
+                self.main[key] = entry
+                continue
+            del self.table[key]
+            self.used_size -= entry.value_size
+            return
+
+    def _evict(self, trace_record, key, hash, value_size):
+        ghost_size = self.ghost.pop(key, None)
+        self.is_remembered = ghost_size is not None
+        if self.is_remembered:
+            self.ghost_size -= ghost_size
+        while self.used_size + value_size > self.cache_size:
+            if self.small and (
+                self.small_size >= self.kSmallRatio * self.cache_size or not self.main
+            ):
+                self._evict_small()
+            else:
+                self._evict_main()
+
+    def _insert(self, trace_record, key, hash, value_size):
+        entry = S3FIFOEntry(value_size)
+        self.table[key] = entry
+        if self.is_remembered:
+            self.main[key] = entry
+        else:
+            self.small[key] = entry
+            self.small_size += value_size
+
+    def _should_admit(self, trace_record, key, hash, value_size):
+        return True
+
+
+class FrequencySketch:
+    """
+    The frequency sketch of TinyLFU: a count-min sketch of kDepth rows of
+    counters that saturate at kMaxCount, behind a doorkeeper Bloom filter that
+    absorbs the first access to every key so that the keys accessed once take
+    no counters. After every sample_size accesses, the counters are halved and
+    the doorkeeper is cleared, so that the old accesses weigh less.
+    """
+
+    kDepth = 4
+    kMaxCount = 15
+    kHalve = bytes(count >> 1 for count in range(256))
+
+    def __init__(self, num_keys):
+        # The number of counters of a row, a power of two.
+        self.width = 1 << max(4, (int(num_keys) - 1).bit_length())
+        self.sample_size = 10 * self.width
+        self.counters = bytearray(self.kDepth * self.width)
+        # 64 bits per counter of a row, about 6 per sampled access.
+        self.doorkeeper = bytearray(8 * self.width)
+        self.num_accesses = 0
+
+    def _hash(self, key):
+        # The two halves of a multiplicative hash of the key, the second one
+        # odd, from which the indexes are derived by double hashing.
+        h = ((key & kUint64Mask) * 0x9E3779B97F4A7C15) & kUint64Mask
+        h ^= h >> 29
+        return h & 0xFFFFFFFF, (h >> 32) | 1
+
+    def _doorkeeper_bits(self, h1, h2):
+        mask = (len(self.doorkeeper) << 3) - 1
+        return (h1 + self.kDepth * h2) & mask, (h1 + (self.kDepth + 1) * h2) & mask
+
+    def _in_doorkeeper(self, bit1, bit2):
+        doorkeeper = self.doorkeeper
+        return bool(
+            doorkeeper[bit1 >> 3] >> (bit1 & 7) & 1
+            and doorkeeper[bit2 >> 3] >> (bit2 & 7) & 1
+        )
+
+    def frequency(self, key):
+        """
+        The estimated number of accesses to the key.
+        """
+        h1, h2 = self._hash(key)
+        mask = self.width - 1
+        count = self.kMaxCount
+        for i in range(self.kDepth):
+            count = min(count, self.counters[i * self.width + ((h1 + i * h2) & mask)])
+        return count + self._in_doorkeeper(*self._doorkeeper_bits(h1, h2))
+
+    def increment(self, key):
+        h1, h2 = self._hash(key)
+        bit1, bit2 = self._doorkeeper_bits(h1, h2)
+        if self._in_doorkeeper(bit1, bit2):
+            mask = self.width - 1
+            for i in range(self.kDepth):
+                index = i * self.width + ((h1 + i * h2) & mask)
+                if self.counters[index] < self.kMaxCount:
+                    self.counters[index] += 1
+        else:
+            self.doorkeeper[bit1 >> 3] |= 1 << (bit1 & 7)
+            self.doorkeeper[bit2 >> 3] |= 1 << (bit2 & 7)
+        self.num_accesses += 1
+        if self.num_accesses == self.sample_size:
+            self.reset()
+
+    def reset(self):
+        self.counters = bytearray(self.counters.translate(self.kHalve))
+        self.doorkeeper = bytearray(len(self.doorkeeper))
+        self.num_accesses //= 2
+
+
+class WTinyLFUCache(Cache):
+    """
+    An implementation of W-TinyLFU. New keys are inserted into the LRU window,
+    which takes kWindowRatio of the cache, and move from the window to the
+    probation segment of the main segmented LRU. A key hit in probation moves
+    to the protected segment, which takes kProtectedRatio of the main cache
+    and demotes its least recently used keys back to probation. To make room,
+    the key most recently moved to probation competes with the least recently
+    used key of probation, and the one whose frequency estimated by the
+    TinyLFU sketch of the recent accesses is lower is evicted.
+
+    Gil Einziger, Roy Friedman, and Ben Manes. 2017. TinyLFU: A Highly
+    Efficient Cache Admission Policy. ACM Trans. Storage 13, 4, Article 35
+    (November 2017), 31 pages. DOI=https://doi.org/10.1145/3149371
+    """
+
+    kWindowRatio = 0.01
+    kProtectedRatio = 0.8
+    # The average size of the cached entries the sketch is sized with.
+    kAverageValueSize = 16 * 1024
+
+    def __init__(self, cache_size, enable_cache_row_key):
+        super().__init__(cache_size, enable_cache_row_key)
+        self.table = {}
+        # The segments map their keys to the cache entries, from the least to
+        # the most recently used key.
+        self.window = OrderedDict()
+        self.window_size = 0
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.protected_size = 0
+        self.sketch = FrequencySketch(cache_size / self.kAverageValueSize)
+
+    def cache_name(self):
+        if self.enable_cache_row_key:
+            return "Hybrid W-TinyLFU (wtinylfu_hybrid)"
+        return "W-TinyLFU (wtinylfu)"
+
+    def _lookup(self, trace_record, key, hash):
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+            return True
+        if key in self.protected:
+            self.protected.move_to_end(key)
+            return True
+        entry = self.probation.pop(key, None)
+        if entry is None:
+            return False
+        self.protected[key] = entry
+        self.protected_size += entry.value_size
+        max_protected_size = (
+            self.kProtectedRatio * (1 - self.kWindowRatio) * self.cache_size
+        )
+        while self.protected_size > max_protected_size and len(self.protected) > 1:
+            demoted_key, demoted_entry = self.protected.popitem(last=False)
+            self.protected_size -= demoted_entry.value_size
+            self.probation[demoted_key] = demoted_entry
+        return True
+
+    def _evict(self, trace_record, key, hash, value_size):
+        while self.used_size + value_size > self.cache_size:
+            if self.probation:
+                victim_key = next(iter(self.probation))
+                candidate_key = next(reversed(self.probation))
+                evict_key = candidate_key
+                if self.sketch.frequency(candidate_key) > self.sketch.frequency(
+                    victim_key
+                ):
+                    evict_key = victim_key
+                evict_entry = self.probation.pop(evict_key)
+            elif self.protected:
+                evict_key, evict_entry = self.protected.popitem(last=False)
+                self.protected_size -= evict_entry.value_size
+            else:
+                evict_key, evict_entry = self.window.popitem(last=False)
+                self.window_size -= evict_entry.value_size
+            del self.table[evict_key]
+            self.used_size -= evict_entry.value_size
+
+    def _insert(self, trace_record, key, hash, value_size):
+        entry = CacheEntry(
+            value_size,
+            trace_record.cf_id,
+            trace_record.level,
+            trace_record.block_type,
+            trace_record.table_id,
+            0,
+            trace_record.access_time,
+        )
+        self.table[key] = entry
+        self.window[key] = entry
+        self.window_size += value_size
+        while (
+            self.window_size > self.kWindowRatio * self.cache_size
+            and len(self.window) > 1
+        ):
+            moved_key, moved_entry = self.window.popitem(last=False)
+            self.window_size -= moved_entry.value_size
+            self.probation[moved_key] = moved_entry
+
+    def _should_admit(self, trace_record, key, hash, value_size):
+        return True
+
+
+class LIRSEntry:
+    """
+    A resident cache entry of LIRS, either a LIR or a HIR key.
+    """
+
+    __slots__ = ("value_size", "is_lir")
+
+    def __init__(self, value_size):
+        self.value_size = value_size
+        self.is_lir = False
+
+
+class LIRSCache(Cache):
+    """
+    An implementation of LIRS. The keys with a low inter-reference recency
+    (LIR), i.e. whose last two accesses were separated by accesses to few
+    other keys, take up to 1 - kHIRRatio of the cache, and the other cached
+    keys (HIR) are in the FIFO queue Q. The stack S orders the LIR keys and
+    the recently accessed HIR keys by recency, including the non-resident HIR
+    keys that were evicted, and its bottom key is always a LIR key. A HIR key
+    accessed while in S was accessed again sooner than the bottom LIR key, so
+    it becomes LIR and the bottom LIR key becomes HIR. The non-resident keys
+    of S take at most as many bytes as the cache.
+
+    Song Jiang and Xiaodong Zhang. 2002. LIRS: an efficient low
+    inter-reference recency set replacement policy to improve buffer cache
+    performance. In Proceedings of the 2002 ACM SIGMETRICS International
+    Conference on Measurement and Modeling of Computer Systems (SIGMETRICS
+    '02). ACM, New York, NY, USA, 31-42.
+    DOI=https://doi.org/10.1145/511334.511340
+    """
+
+    kHIRRatio = 0.01
+
+    def __init__(self, cache_size, enable_cache_row_key):
+        super().__init__(cache_size, enable_cache_row_key)
+        self.table = {}
+        # The keys of S, from the bottom to the top of the stack.
+        self.stack = OrderedDict()
+        # Q maps the resident HIR keys to their entries, from the oldest.
+        self.queue = OrderedDict()
+        self.lir_size = 0
+        # The sizes of the non-resident keys of S, from the first evicted.
+        self.non_resident = OrderedDict()
+        self.non_resident_size = 0
+
+    def cache_name(self):
+        if self.enable_cache_row_key:
+            return "Hybrid LIRS (lirs_hybrid)"
+        return "LIRS (lirs)"
+
+    def _prune(self):
+        # Remove the HIR keys from the bottom of S.
+        while self.stack:
+            key = next(iter(self.stack))
+            entry = self.table.get(key)
+            if entry is not None and entry.is_lir:
+                return
+            del self.stack[key]
+            if entry is None:
+                self.non_resident_size -= self.non_resident.pop(key)
+
+    def _push_hir(self, key):
+        # Push a resident HIR key onto S, unless S has no LIR key for it to be
+        # above, e.g. when a key as large as the cache was demoted.
+        if self.lir_size > 0:
+            self.stack[key] = None
+
+    def _make_lir(self, entry):
+        entry.is_lir = True
+        self.lir_size += entry.value_size
+        # Demote the bottom LIR keys of S until the LIR keys fit.
+        while self.lir_size > (1 - self.kHIRRatio) * self.cache_size:
+            key, _ = self.stack.popitem(last=False)
+            demoted_entry = self.table[key]
+            demoted_entry.is_lir = False
+            self.lir_size -= demoted_entry.value_size
+            self.queue[key] = demoted_entry
+            self._prune()
+
+    def _lookup(self, trace_record, key, hash):
+        entry = self.table.get(key)
+        if entry is None:
+            return False
+        if entry.is_lir:
+            is_bottom = next(iter(self.stack)) == key
+            self.stack.move_to_end(key)
+            if is_bottom:
+                self._prune()
+        elif key in self.stack:
+            self.stack.move_to_end(key)
+            del self.queue[key]
+            self._make_lir(entry)
+        else:
+            self._push_hir(key)
+            self.queue.move_to_end(key)
+        return True
+
+    def _evict(self, trace_record, key, hash, value_size):
+        while self.used_size + value_size > self.cache_size:
+            if self.queue:
+                evict_key, evict_entry = self.queue.popitem(last=False)
+                if evict_key in self.stack:
+                    self.non_resident[evict_key] = evict_entry.value_size
+                    self.non_resident_size += evict_entry.value_size
+                del self.table[evict_key]
+            else:
+                # All cached keys are LIR keys: evict the bottom one of S.
+                evict_key, _ = self.stack.popitem(last=False)
+                evict_entry = self.table.pop(evict_key)
+                self.lir_size -= evict_entry.value_size
+                self._prune()
+            self.used_size -= evict_entry.value_size
+        while self.non_resident_size > self.cache_size:
+            non_resident_key, non_resident_size = self.non_resident.popitem(
+                last=False
+            )
+            del self.stack[non_resident_key]
+            self.non_resident_size -= non_resident_size
+
+    def _insert(self, trace_record, key, hash, value_size):
+        entry = LIRSEntry(value_size)
+        self.table[key] = entry
+        non_resident_size = self.non_resident.pop(key, None)
+        if non_resident_size is not None:
+            # The key was accessed again while in S.
+            self.non_resident_size -= non_resident_size
+            self.stack.move_to_end(key)
+            self._make_lir(entry)
+        elif self.lir_size + value_size <= (1 - self.kHIRRatio) * self.cache_size:
+            # The LIR keys do not fill their share of the cache yet.
+            self.stack[key] = None
+            entry.is_lir = True
+            self.lir_size += value_size
+        else:
+            self._push_hir(key)
+            self.queue[key] = entry
+
+    def _should_admit(self, trace_record, key, hash, value_size):
+        return True
+
+
+class TraceCache(Cache):
+    """
+    A trace cache. Lookup returns true if the trace observes a cache hit.
+    It is used to maintain cache hits observed in the trace.
+    """
+
+    def __init__(self, cache_size):
+        super().__init__(cache_size, enable_cache_row_key=0)
+
+    def _lookup(self, trace_record, key, hash):
+        return trace_record.is_hit
+
+    def _evict(self, trace_record, key, hash, value_size):
+        pass
+
+    def _insert(self, trace_record, key, hash, value_size):
+        pass
+
+    def _should_admit(self, trace_record, key, hash, value_size):
+        return False
+
+    def cache_name(self):
+        return "Trace"
+
+
+def parse_cache_size(cs):
+    cs = cs.replace("\n", "")
+    if cs[-1] == "M":
+        return int(cs[: len(cs) - 1]) * 1024 * 1024
+    if cs[-1] == "G":
+        return int(cs[: len(cs) - 1]) * 1024 * 1024 * 1024
+    if cs[-1] == "T":
+        return int(cs[: len(cs) - 1]) * 1024 * 1024 * 1024 * 1024
+    return int(cs)
+
+
+def create_cache(cache_type, cache_size, downsample_size):
+    cache_size = cache_size / downsample_size
+    enable_cache_row_key = 0
+    if "hybridn" in cache_type:
+        enable_cache_row_key = 2
+        cache_type = cache_type[:-8]
+    if "hybrid" in cache_type:
+        enable_cache_row_key = 1
+        cache_type = cache_type[:-7]
+    if cache_type == "ts":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [LRUPolicy(), LFUPolicy(), HyperbolicPolicy()],
+            cost_class_label=None,
+        )
+    elif cache_type == "linucb":
+        return LinUCBCache(
+            cache_size,
+            enable_cache_row_key,
+            [LRUPolicy(), LFUPolicy(), HyperbolicPolicy()],
+            cost_class_label=None,
+        )
+    elif cache_type == "pylru":
+        return ThompsonSamplingCache(
+            cache_size, enable_cache_row_key, [LRUPolicy()], cost_class_label=None
+        )
+    elif cache_type == "pymru":
+        return ThompsonSamplingCache(
+            cache_size, enable_cache_row_key, [MRUPolicy()], cost_class_label=None
+        )
+    elif cache_type == "pylfu":
+        return ThompsonSamplingCache(
+            cache_size, enable_cache_row_key, [LFUPolicy()], cost_class_label=None
+        )
+    elif cache_type == "pyhb":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [HyperbolicPolicy()],
+            cost_class_label=None,
+        )
+    elif cache_type == "pycctbbt":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [CostClassPolicy()],
+            cost_class_label="table_bt",
+        )
+    elif cache_type == "pycccf":
+        return ThompsonSamplingCache(
+            cache_size, enable_cache_row_key, [CostClassPolicy()], cost_class_label="cf"
+        )
+    elif cache_type == "pycctblevelbt":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [CostClassPolicy()],
+            cost_class_label="table_level_bt",
+        )
+    elif cache_type == "pycccfbt":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [CostClassPolicy()],
+            cost_class_label="cf_bt",
+        )
+    elif cache_type == "pycctb":
+        return ThompsonSamplingCache(
+            cache_size,
+            enable_cache_row_key,
+            [CostClassPolicy()],
+            cost_class_label="table",
+        )
+    elif cache_type == "pyccbt":
+        return ThompsonSamplingCache(
+            cache_size, enable_cache_row_key, [CostClassPolicy()], cost_class_label="bt"
+        )
+    elif cache_type == "opt":
+        if enable_cache_row_key:
+            print("opt does not support hybrid mode.")
+            assert False
+        return OPTCache(cache_size)
+    elif cache_type == "trace":
+        if enable_cache_row_key:
+            print("trace does not support hybrid mode.")
+            assert False
+        return TraceCache(cache_size)
+    elif cache_type == "lru":
+        return LRUCache(cache_size, enable_cache_row_key)
+    elif cache_type == "2q":
+        return TwoQCache(cache_size, enable_cache_row_key)
+    elif cache_type == "sieve":
+        return SieveCache(cache_size, enable_cache_row_key)
+    elif cache_type == "s3fifo":
+        return S3FIFOCache(cache_size, enable_cache_row_key)
+    elif cache_type == "wtinylfu":
+        return WTinyLFUCache(cache_size, enable_cache_row_key)
+    elif cache_type == "lirs":
+        return LIRSCache(cache_size, enable_cache_row_key)
+    elif cache_type == "arc":
+        return ARCCache(cache_size, enable_cache_row_key)
+    elif cache_type == "gdsize":
+        return GDSizeCache(cache_size, enable_cache_row_key)
+    else:
+        print(f"Unknown cache type {cache_type}")
+        assert False
+    return None
+
+
+def percent(e1, e2):
+    if e2 == 0:
+        return -1
+    return float(e1) * 100.0 / float(e2)
+
+
+def is_target_cf(access_cf, target_cf_name):
+    if target_cf_name == "all":
+        return True
+    return access_cf == target_cf_name
+
+
+def parse_trace_line(line):
+    """
+    Parse a line of the human readable trace into a tuple of its columns.
+    """
+    ts = line.split(",")
+    return (
+        int(ts[0]),
+        int(ts[1]),
+        int(ts[2]),
+        int(ts[3]),
+        int(ts[4]),
+        ts[5],
+        int(ts[6]),
+        int(ts[7]),
+        int(ts[8]),
+        int(ts[9]),
+        int(ts[10]),
+        int(ts[11]),
+        int(ts[12]),
+        int(ts[13]),
+        int(ts[14]),
+        int(ts[15]),
+        int(ts[16]),
+        int(ts[17]),
+        int(ts[18]),
+        int(ts[19]),
+        int(ts[20]),
+    )
+
+
+def is_binary_trace(trace_file_path):
+    with open(trace_file_path, "rb") as trace_file:
+        return trace_file.read(len(kBinaryTraceMagic)) == kBinaryTraceMagic
+
+
+def convert_trace_to_binary(trace_file_path, binary_trace_file_path):
+    """
+    Convert a human readable trace into the binary trace format, so that the
+    simulations read it with np.memmap instead of parsing it. Returns the
+    number of records.
+    """
+    cf_name_ids = {}
+    num_records = 0
+    data_file_path = binary_trace_file_path + ".data"
+    # The records are written to a data file first since the header is only
+    # known once the whole trace is read.
+    with open(trace_file_path) as trace_file, open(data_file_path, "wb") as data_file:
+        chunk = np.zeros(kBinaryTraceChunkSize, dtype=kBinaryTraceDtype)
+        chunk_size = 0
+        for line in trace_file:
+            if not line.strip():
+                continue
+            record = parse_trace_line(line)
+            cf_name_id = cf_name_ids.setdefault(record[5], len(cf_name_ids))
+            chunk[chunk_size] = record[:5] + (cf_name_id,) + record[6:]
+            chunk_size += 1
+            if chunk_size == kBinaryTraceChunkSize:
+                chunk.tofile(data_file)
+                num_records += chunk_size
+                chunk_size = 0
+        chunk[:chunk_size].tofile(data_file)
+        num_records += chunk_size
+    header = json.dumps(
+        {
+            "version": kBinaryTraceVersion,
+            "num_records": num_records,
+            "cf_names": sorted(cf_name_ids, key=cf_name_ids.get),
+        }
+    ).encode()
+    prefix_size = len(kBinaryTraceMagic) + 8 + len(header)
+    padding = -prefix_size % kBinaryTraceAlignment
+    with open(binary_trace_file_path, "wb") as binary_trace_file:
+        binary_trace_file.write(kBinaryTraceMagic)
+        binary_trace_file.write(np.uint64(len(header)).tobytes())
+        binary_trace_file.write(header)
+        binary_trace_file.write(b"\0" * padding)
+        with open(data_file_path, "rb") as data_file:
+            while True:
+                data = data_file.read(1 << 24)
+                if not data:
+                    break
+                binary_trace_file.write(data)
+    os.remove(data_file_path)
+    return num_records
+
+
+def load_binary_trace(binary_trace_file_path):
+    """
+    Map the records of a binary trace into memory. Returns the records and the
+    column family names that their cf_name column indexes.
+    """
+    with open(binary_trace_file_path, "rb") as trace_file:
+        assert trace_file.read(len(kBinaryTraceMagic)) == kBinaryTraceMagic
+        header_size = int(np.frombuffer(trace_file.read(8), dtype="<u8")[0])
+        header = json.loads(trace_file.read(header_size))
+    assert header["version"] == kBinaryTraceVersion, header
+    prefix_size = len(kBinaryTraceMagic) + 8 + header_size
+    offset = prefix_size + (-prefix_size % kBinaryTraceAlignment)
+    if header["num_records"] == 0:
+        return np.zeros(0, dtype=kBinaryTraceDtype), header["cf_names"]
+    records = np.memmap(
+        binary_trace_file_path,
+        dtype=kBinaryTraceDtype,
+        mode="r",
+        offset=offset,
+        shape=(header["num_records"],),
+    )
+    return records, header["cf_names"]
+
+
+def read_trace(trace_file_path):
+    """
+    Iterate over the records of a human readable or binary trace, as tuples of
+    the columns of the human readable trace.
+    """
+    if not is_binary_trace(trace_file_path):
+        with open(trace_file_path) as trace_file:
+            for line in trace_file:
+                yield parse_trace_line(line)
+        return
+    records, cf_names = load_binary_trace(trace_file_path)
+    for start in range(0, len(records), kBinaryTraceChunkSize):
+        # tolist() converts a whole chunk to Python ints at once.
+        for record in records[start : start + kBinaryTraceChunkSize].tolist():
+            yield record[:5] + (cf_names[record[5]],) + record[6:]
+
+
+def sampling_hash(keys):
+    """
+    The splitmix64 finalizer of a NumPy array of uint64 keys. It is the same
+    hash as SpatialSampler.hash, vectorized.
+    """
+    z = keys.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class SpatialSampler:
+    """
+    SHARDS spatial sampling: a key is in the sample if its hash is below
+    sampling_rate * 2^64, so either all or none of the accesses to a key are
+    simulated. Simulating the sampled accesses with caches scaled down by the
+    sampled fraction of the blocks, about the sampling rate, estimates the
+    miss ratios of the full sized caches, once the hits are corrected for the
+    number of sampled accesses (refer MissRatioStats.adjust_num_accesses).
+    The accesses are sampled by their block id, including those of the hybrid
+    caches to row keys, since a row key is in the same block across accesses
+    until it is compacted.
+    """
+
+    def __init__(self, sampling_rate):
+        assert 0 < sampling_rate <= 1, sampling_rate
+        self.sampling_rate = sampling_rate
+        self.threshold = int(sampling_rate * kSamplingHashModulus)
+
+    @staticmethod
+    def hash(key):
+        z = (key + 0x9E3779B97F4A7C15) & kUint64Mask
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & kUint64Mask
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & kUint64Mask
+        return z ^ (z >> 31)
+
+    def is_sampled(self, block_id):
+        return self.hash(block_id) < self.threshold
+
+    @staticmethod
+    def get_sampling_rate(trace_file_path, max_sampled_keys, target_cf_name):
+        """
+        The largest sampling rate with which at most max_sampled_keys blocks
+        are sampled, so that the size of the sample, and the time and memory
+        to simulate it, is bounded however large the trace is. The caches can
+        not drop keys, so the rate is chosen before the simulation from the
+        block ids of the trace instead of being lowered while sampling.
+        """
+        # The smallest max_sampled_keys + 1 distinct hashes seen so far.
+        hashes = np.zeros(0, dtype=np.uint64)
+        for block_ids in read_block_ids(trace_file_path, target_cf_name):
+            hashes = np.unique(np.concatenate([hashes, sampling_hash(block_ids)]))[
+                : max_sampled_keys + 1
+            ]
+        if len(hashes) <= max_sampled_keys:
+            return 1.0
+        threshold = int(hashes[max_sampled_keys])
+        sampling_rate = threshold / kSamplingHashModulus
+        # The division may round up, which would sample one more block.
+        while int(sampling_rate * kSamplingHashModulus) > threshold:
+            sampling_rate = float(np.nextafter(sampling_rate, 0))
+        return sampling_rate
+
+    def get_sampled_fractions(
+        self, trace_file_path, target_cf_name, max_accesses_to_process=-1
+    ):
+        """
+        The fractions of the blocks and of the accesses that are sampled.
+        Both deviate from the sampling rate by chance, most with small
+        samples, and the fraction of the accesses most with skewed traces,
+        where whether a few hot blocks are sampled moves it far. The caches
+        are scaled by the fraction of the blocks, since their capacity is in
+        blocks, and SHARDS-adj corrects the miss ratios for the fraction of
+        the accesses.
+        """
+        num_accesses = 0
+        num_sampled_accesses = 0
+        block_ids_seen = np.zeros(0, dtype=np.uint64)
+        threshold = np.uint64(self.threshold)
+        for block_ids in read_block_ids(trace_file_path, target_cf_name):
+            if max_accesses_to_process != -1:
+                block_ids = block_ids[: max_accesses_to_process + 1 - num_accesses]
+            num_accesses += len(block_ids)
+            num_sampled_accesses += int(
+                np.count_nonzero(sampling_hash(block_ids) < threshold)
+            )
+            block_ids_seen = np.unique(
+                np.concatenate([block_ids_seen, block_ids.astype(np.uint64)])
+            )
+            if (
+                max_accesses_to_process != -1
+                and num_accesses > max_accesses_to_process
+            ):
+                break
+        num_sampled_blocks = int(
+            np.count_nonzero(sampling_hash(block_ids_seen) < threshold)
+        )
+        if num_sampled_accesses == 0:
+            return self.sampling_rate, self.sampling_rate
+        return (
+            num_sampled_blocks / len(block_ids_seen),
+            num_sampled_accesses / num_accesses,
+        )
 
-def percent(e1, e2):
-    if e2 == 0:
-        return -1
-    return float(e1) * 100.0 / float(e2)
+
+def read_block_ids(trace_file_path, target_cf_name):
+    """
+    Iterate over the block ids of the accesses to the target column family,
+    as NumPy arrays of up to kSamplingChunkSize block ids.
+    """
+    if is_binary_trace(trace_file_path):
+        records, cf_names = load_binary_trace(trace_file_path)
+        if target_cf_name != "all" and target_cf_name not in cf_names:
+            return
+        for start in range(0, len(records), kSamplingChunkSize):
+            chunk = records[start : start + kSamplingChunkSize]
+            if target_cf_name != "all":
+                chunk = chunk[chunk["cf_name"] == cf_names.index(target_cf_name)]
+            yield np.asarray(chunk["block_id"])
+        return
+    block_ids = []
+    for ts in read_trace(trace_file_path):
+        if not is_target_cf(ts[5], target_cf_name):
+            continue
+        block_ids.append(ts[1])
+        if len(block_ids) == kSamplingChunkSize:
+            yield np.array(block_ids, dtype=np.uint64)
+            block_ids = []
+    if block_ids:
+        yield np.array(block_ids, dtype=np.uint64)
 
 
-def is_target_cf(access_cf, target_cf_name):
-    if target_cf_name == "all":
-        return True
-    return access_cf == target_cf_name
+def get_next_access_file_path(trace_file_path, target_cf_name):
+    return f"{trace_file_path}.{target_cf_name}{kNextAccessFileSuffix}"
 
 
-def run(
+def compute_next_accesses(trace_file_path, target_cf_name, next_access_file_path):
+    """
+    Compute the next access sidecar of a trace. The block ids of the accesses
+    to the target column family are written into the sidecar first and then
+    replaced by the positions of the next accesses in a backward pass, one
+    chunk at a time. Besides the
+    chunk, only the sorted ids of the blocks seen so far and the positions of
+    their earliest accesses are kept in memory. Returns the number of records.
+    """
+    tmp_file_path = f"{next_access_file_path}.tmp.{os.getpid()}"
+    num_records = 0
+    with open(tmp_file_path, "wb") as tmp_file:
+        for block_ids in read_block_ids(trace_file_path, target_cf_name):
+            block_ids.astype("<u8").tofile(tmp_file)
+            num_records += len(block_ids)
+    if num_records > 0:
+        next_accesses = np.memmap(tmp_file_path, dtype="<i8", mode="r+")
+        block_ids = next_accesses.view("<u8")
+        seen_ids = np.zeros(0, dtype=np.uint64)
+        seen_positions = np.zeros(0, dtype=np.int64)
+        for end in range(num_records, 0, -kNextAccessChunkSize):
+            start = max(0, end - kNextAccessChunkSize)
+            chunk = np.array(block_ids[start:end], dtype=np.uint64)
+            order = np.argsort(chunk, kind="stable")
+            sorted_ids = chunk[order]
+            positions = order.astype(np.int64) + start
+            is_same = sorted_ids[:-1] == sorted_ids[1:]
+            # The next access of all but the last access to a block in the
+            # chunk is its next access in the chunk.
+            chunk_next_accesses = np.full(len(chunk), kNoNextAccess, dtype=np.int64)
+            chunk_next_accesses[:-1][is_same] = positions[1:][is_same]
+            is_last = np.append(~is_same, True)
+            is_first = np.insert(~is_same, 0, True)
+            unique_ids = sorted_ids[is_last]
+            seen_index = np.searchsorted(seen_ids, unique_ids)
+            is_seen = seen_index < len(seen_ids)
+            is_seen[is_seen] = seen_ids[seen_index[is_seen]] == unique_ids[is_seen]
+            last_next_accesses = np.full(len(unique_ids), kNoNextAccess, np.int64)
+            last_next_accesses[is_seen] = seen_positions[seen_index[is_seen]]
+            chunk_next_accesses[is_last] = last_next_accesses
+            next_accesses[start + order] = chunk_next_accesses
+            # The earliest accesses of the chunk replace those seen so far.
+            is_kept = np.ones(len(seen_ids), dtype=bool)
+            is_kept[seen_index[is_seen]] = False
+            seen_ids = seen_ids[is_kept]
+            seen_positions = seen_positions[is_kept]
+            insert_index = np.searchsorted(seen_ids, unique_ids)
+            seen_ids = np.insert(seen_ids, insert_index, unique_ids)
+            seen_positions = np.insert(
+                seen_positions, insert_index, positions[is_first]
+            )
+        next_accesses.flush()
+        del next_accesses, block_ids
+    # Concurrent simulations of the same trace may compute the sidecar at the
+    # same time, so it is renamed into place once complete.
+    os.replace(tmp_file_path, next_access_file_path)
+    return num_records
+
+
+def load_next_accesses(trace_file_path, target_cf_name):
+    """
+    Map the next access sidecar of a trace into memory, computing it first if
+    it does not exist or is older than the trace.
+    """
+    next_access_file_path = get_next_access_file_path(trace_file_path, target_cf_name)
+    if not os.path.exists(next_access_file_path) or os.path.getmtime(
+        next_access_file_path
+    ) < os.path.getmtime(trace_file_path):
+        print(f"Computing the next accesses of {trace_file_path}.")
+        compute_next_accesses(trace_file_path, target_cf_name, next_access_file_path)
+    if os.path.getsize(next_access_file_path) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.memmap(next_access_file_path, dtype="<i8", mode="r")
+
+
+def read_next_accesses(trace_file_path, target_cf_name):
+    """
+    Iterate over the next accesses of the accesses to the target column family,
+    as ints.
+    """
+    next_accesses = load_next_accesses(trace_file_path, target_cf_name)
+    for start in range(0, len(next_accesses), kNextAccessChunkSize):
+        yield from next_accesses[start : start + kNextAccessChunkSize].tolist()
+
+
+def run_caches(
     trace_file_path,
-    cache_type,
-    cache,
+    caches,
     warmup_seconds,
     max_accesses_to_process,
     target_cf_name,
+    sampler=None,
 ):
+    """
+    Simulate a list of (cache_type, cache) on the trace in lockstep: every
+    trace record is decoded once and accessed in all caches. With a
+    SpatialSampler, the caches only access the sampled keys. Returns the start
+    time and the duration of the trace.
+    """
     warmup_complete = False
     trace_miss_ratio_stats = MissRatioStats(kSecondsInMinute)
-    access_seq_no = 0
-    time_interval = 1
-    start_time = time.time()
-    trace_start_time = 0
-    trace_duration = 0
-    is_opt_cache = False
-    if cache.cache_name() == "Belady MIN (opt)":
-        is_opt_cache = True
-
-    block_access_timelines = {}
-    num_no_inserts = 0
-    num_blocks_with_no_size = 0
-    num_inserts_block_with_no_size = 0
-
-    if is_opt_cache:
-        # Read all blocks in memory and stores their access times so that OPT
-        # can use this information to evict the cached key which next access is
-        # the furthest in the future.
-        print("Preprocessing block traces.")
-        with open(trace_file_path) as trace_file:
-            for line in trace_file:
-                if (
-                    max_accesses_to_process != -1
-                    and access_seq_no > max_accesses_to_process
-                ):
-                    break
-                ts = line.split(",")
-                timestamp = int(ts[0])
-                cf_name = ts[5]
-                if not is_target_cf(cf_name, target_cf_name):
-                    continue
-                if trace_start_time == 0:
-                    trace_start_time = timestamp
-                trace_duration = timestamp - trace_start_time
-                block_id = int(ts[1])
-                block_size = int(ts[3])
-                no_insert = int(ts[9])
-                if block_id not in block_access_timelines:
-                    block_access_timelines[block_id] = BlockAccessTimeline()
-                    if block_size == 0:
-                        num_blocks_with_no_size += 1
-                block_access_timelines[block_id].accesses.append(access_seq_no)
-                access_seq_no += 1
-                if no_insert == 1:
-                    num_no_inserts += 1
-                if no_insert == 0 and block_size == 0:
-                    num_inserts_block_with_no_size += 1
-                if access_seq_no % 100 != 0:
-                    continue
-                now = time.time()
-                if now - start_time > time_interval * 10:
-                    print(
-                        "Take {} seconds to process {} trace records with trace "
-                        "duration of {} seconds. Throughput: {} records/second.".format(
-                            now - start_time,
-                            access_seq_no,
-                            trace_duration / 1000000,
-                            access_seq_no / (now - start_time),
-                        )
-                    )
-                    time_interval += 1
-            print(
-                "Trace contains {} blocks, {}({:.2f}%) blocks with no size."
-                "{} accesses, {}({:.2f}%) accesses with no_insert,"
-                "{}({:.2f}%) accesses that want to insert but block size is 0.".format(
-                    len(block_access_timelines),
-                    num_blocks_with_no_size,
-                    percent(num_blocks_with_no_size, len(block_access_timelines)),
-                    access_seq_no,
-                    num_no_inserts,
-                    percent(num_no_inserts, access_seq_no),
-                    num_inserts_block_with_no_size,
-                    percent(num_inserts_block_with_no_size, access_seq_no),
-                )
-            )
+    next_accesses = None
+    if any(cache.cache_name() == "Belady MIN (opt)" for _, cache in caches):
+        # OPT streams the next accesses of the records alongside the trace.
+        next_accesses = read_next_accesses(trace_file_path, target_cf_name)
 
     access_seq_no = 0
     time_interval = 1
     start_time = time.time()
     trace_start_time = 0
     trace_duration = 0
-    print(f"Running simulated {cache.cache_name()} cache on block traces.")
-    with open(trace_file_path) as trace_file:
-        for line in trace_file:
-            if (
-                max_accesses_to_process != -1
-                and access_seq_no > max_accesses_to_process
-            ):
-                break
-            if access_seq_no % 1000000 == 0:
-                # Force a python gc periodically to reduce memory usage.
-                gc.collect()
-            ts = line.split(",")
-            timestamp = int(ts[0])
-            cf_name = ts[5]
-            if not is_target_cf(cf_name, target_cf_name):
-                continue
-            if trace_start_time == 0:
-                trace_start_time = timestamp
-            trace_duration = timestamp - trace_start_time
-            if (
-                not warmup_complete
-                and warmup_seconds > 0
-                and trace_duration > warmup_seconds * 1000000
-            ):
+    for _, cache in caches:
+        print(f"Running simulated {cache.cache_name()} cache on block traces.")
+    for ts in read_trace(trace_file_path):
+        if max_accesses_to_process != -1 and access_seq_no > max_accesses_to_process:
+            break
+        if access_seq_no % 1000000 == 0:
+            # Force a python gc periodically to reduce memory usage.
+            gc.collect()
+        timestamp = ts[0]
+        cf_name = ts[5]
+        if not is_target_cf(cf_name, target_cf_name):
+            continue
+        if trace_start_time == 0:
+            trace_start_time = timestamp
+        trace_duration = timestamp - trace_start_time
+        if (
+            not warmup_complete
+            and warmup_seconds > 0
+            and trace_duration > warmup_seconds * 1000000
+        ):
+            for _, cache in caches:
                 cache.miss_ratio_stats.reset_counter()
-                warmup_complete = True
-            next_access_seq_no = 0
-            block_id = int(ts[1])
-            if is_opt_cache:
-                next_access_seq_no = block_access_timelines[block_id].get_next_access()
-            record = TraceRecord(
-                access_time=int(ts[0]),
-                block_id=int(ts[1]),
-                block_type=int(ts[2]),
-                block_size=int(ts[3]),
-                cf_id=int(ts[4]),
-                cf_name=ts[5],
-                level=int(ts[6]),
-                fd=int(ts[7]),
-                caller=int(ts[8]),
-                no_insert=int(ts[9]),
-                get_id=int(ts[10]),
-                key_id=int(ts[11]),
-                kv_size=int(ts[12]),
-                is_hit=int(ts[13]),
-                referenced_key_exist_in_block=int(ts[14]),
-                num_keys_in_block=int(ts[15]),
-                table_id=int(ts[16]),
-                seq_number=int(ts[17]),
-                block_key_size=int(ts[18]),
-                key_size=int(ts[19]),
-                block_offset_in_file=int(ts[20]),
-                next_access_seq_no=next_access_seq_no,
-            )
-            trace_miss_ratio_stats.update_metrics(
-                record.access_time, is_hit=record.is_hit, miss_bytes=record.block_size
-            )
-            cache.access(record)
+            warmup_complete = True
+        next_access_seq_no = 0
+        if next_accesses is not None:
+            next_access_seq_no = next(next_accesses)
+        block_id = ts[1]
+        if sampler is not None and not sampler.is_sampled(block_id):
             access_seq_no += 1
-            del record
-            del ts
-            if access_seq_no % 100 != 0:
-                continue
-            # Report progress every 10 seconds.
-            now = time.time()
-            if now - start_time > time_interval * 10:
-                print(
-                    "Take {} seconds to process {} trace records with trace "
-                    "duration of {} seconds. Throughput: {} records/second. "
-                    "Trace miss ratio {}".format(
-                        now - start_time,
-                        access_seq_no,
-                        trace_duration / 1000000,
-                        access_seq_no / (now - start_time),
-                        trace_miss_ratio_stats.miss_ratio(),
-                    )
+            continue
+        # The caches do not modify the record, so they all share it.
+        record = TraceRecord(*ts, next_access_seq_no=next_access_seq_no)
+        trace_miss_ratio_stats.update_metrics(
+            record.access_time, is_hit=record.is_hit, miss_bytes=record.block_size
+        )
+        for _, cache in caches:
+            cache.access(record)
+        access_seq_no += 1
+        del record
+        del ts
+        if access_seq_no % 100 != 0:
+            continue
+        # Report progress every 10 seconds.
+        now = time.time()
+        if now - start_time > time_interval * 10:
+            print(
+                "Take {} seconds to process {} trace records with trace "
+                "duration of {} seconds. Throughput: {} records/second. "
+                "Trace miss ratio {}".format(
+                    now - start_time,
+                    access_seq_no,
+                    trace_duration / 1000000,
+                    access_seq_no / (now - start_time),
+                    trace_miss_ratio_stats.miss_ratio(),
                 )
-                time_interval += 1
+            )
+            time_interval += 1
+            for cache_type, cache in caches:
                 print(
                     "{},0,0,{},{},{}".format(
                         cache_type,
@@ -1851,15 +2854,495 @@ def run(
             trace_miss_ratio_stats.miss_ratio(),
         )
     )
-    print(
-        "{},0,0,{},{},{}".format(
+    for cache_type, cache in caches:
+        print(
+            "{},0,0,{},{},{}".format(
+                cache_type,
+                cache.cache_size,
+                cache.miss_ratio_stats.miss_ratio(),
+                cache.miss_ratio_stats.num_accesses,
+            )
+        )
+    return trace_start_time, trace_duration
+
+
+def run(
+    trace_file_path,
+    cache_type,
+    cache,
+    warmup_seconds,
+    max_accesses_to_process,
+    target_cf_name,
+):
+    return run_caches(
+        trace_file_path,
+        [(cache_type, cache)],
+        warmup_seconds,
+        max_accesses_to_process,
+        target_cf_name,
+    )
+
+
+def get_configs(cache_types, cache_sizes):
+    """
+    The (cache_type, cache_size) pairs of the grid of the cache types and the
+    cache sizes. The trace cache replays the hits observed in the trace, so it
+    is only simulated with the largest cache size.
+    """
+    configs = []
+    for cache_size in cache_sizes:
+        for cache_type in cache_types:
+            if cache_type == "trace" and cache_size != max(cache_sizes):
+                continue
+            configs.append((cache_type, cache_size))
+    return configs
+
+
+def run_configs_shard(
+    trace_file_path,
+    configs,
+    downsample_size,
+    warmup_seconds,
+    max_accesses_to_process,
+    target_cf_name,
+    result_dir,
+    sampling_rate=1.0,
+    sampled_fractions=(1.0, 1.0),
+):
+    """
+    Simulate the caches of the configs in lockstep and report their stats into
+    the result directory. With a sampling_rate below 1, the caches are scaled
+    down by the sampled fraction of the blocks and the number of accesses of
+    their miss ratios is adjusted by the sampled fraction of the accesses
+    (refer SpatialSampler.get_sampled_fractions). Returns (cache_type,
+    cache_size, miss ratio, number of accesses) of every config.
+    """
+    sampled_block_fraction, sampled_access_fraction = sampled_fractions
+    sampler = None
+    if sampling_rate < 1:
+        sampler = SpatialSampler(sampling_rate)
+    caches = [
+        (
             cache_type,
-            cache.cache_size,
-            cache.miss_ratio_stats.miss_ratio(),
-            cache.miss_ratio_stats.num_accesses,
+            create_cache(
+                cache_type, cache_size * sampled_block_fraction, downsample_size
+            ),
         )
+        for cache_type, cache_size in configs
+    ]
+    trace_start_time, trace_duration = run_caches(
+        trace_file_path,
+        caches,
+        warmup_seconds,
+        max_accesses_to_process,
+        target_cf_name,
+        sampler,
     )
-    return trace_start_time, trace_duration
+    results = []
+    for (cache_type, cache_size), (_, cache) in zip(configs, caches):
+        if sampler is not None:
+            cache.miss_ratio_stats.adjust_num_accesses(
+                sampled_block_fraction / sampled_access_fraction
+            )
+        if result_dir is not None:
+            report_stats(
+                cache,
+                cache_type,
+                cache_size,
+                target_cf_name,
+                result_dir,
+                trace_start_time,
+                trace_start_time + trace_duration,
+            )
+        results.append(
+            (
+                cache_type,
+                cache_size,
+                cache.miss_ratio_stats.miss_ratio(),
+                cache.miss_ratio_stats.num_accesses,
+            )
+        )
+    return results
+
+
+def run_configs(
+    trace_file_path,
+    configs,
+    downsample_size,
+    warmup_seconds,
+    max_accesses_to_process,
+    target_cf_name,
+    result_dir,
+    num_workers=1,
+    sampling_rate=1.0,
+):
+    """
+    Simulate a list of (cache_type, cache_size) configs on the trace. Instead
+    of one run over the trace per config, the configs are split into
+    num_workers shards, each of which is simulated in lockstep by a worker
+    process (or by this process if num_workers is 1) that decodes the trace
+    once. With a sampling_rate below 1, the caches, scaled down by the
+    sampled fraction of the blocks, only simulate the keys sampled by a
+    SpatialSampler, and their miss ratios are corrected by SHARDS-adj.
+    Returns (cache_type, cache_size, miss ratio, number of accesses) of every
+    config, in the order of the configs.
+    """
+    sampled_fractions = (1.0, 1.0)
+    if sampling_rate < 1:
+        sampled_fractions = SpatialSampler(sampling_rate).get_sampled_fractions(
+            trace_file_path, target_cf_name, max_accesses_to_process
+        )
+        print(
+            "Sampled fractions of the blocks and of the accesses: {}, {}".format(
+                *sampled_fractions
+            )
+        )
+    if any(cache_type == "opt" for cache_type, _ in configs):
+        # Compute the next access sidecar once, before the workers map it.
+        load_next_accesses(trace_file_path, target_cf_name)
+    num_workers = max(1, min(num_workers, len(configs)))
+    shards = [configs[i::num_workers] for i in range(num_workers)]
+    args = [
+        (
+            trace_file_path,
+            shard,
+            downsample_size,
+            warmup_seconds,
+            max_accesses_to_process,
+            target_cf_name,
+            result_dir,
+            sampling_rate,
+            sampled_fractions,
+        )
+        for shard in shards
+    ]
+    if num_workers == 1:
+        shard_results = [run_configs_shard(*args[0])]
+    else:
+        with multiprocessing.Pool(num_workers) as pool:
+            shard_results = pool.starmap(run_configs_shard, args)
+    results = {}
+    for shard_result in shard_results:
+        for result in shard_result:
+            results[result[:2]] = result
+    return [results[config] for config in configs]
+
+
+def get_sampling_errors(results, sampled_results):
+    """
+    Compare the miss ratios of a sampled run of run_configs with those of a
+    full run. Returns (cache_type, cache_size, miss ratio, sampled miss ratio,
+    absolute error) of every config.
+    """
+    errors = []
+    for result, sampled_result in zip(results, sampled_results):
+        assert result[:2] == sampled_result[:2], (result, sampled_result)
+        errors.append(
+            result[:3] + (sampled_result[2], abs(result[2] - sampled_result[2]))
+        )
+    return errors
+
+
+def report_sampling_errors(errors, sampling_rate, target_cf_name, result_dir):
+    with open(f"{result_dir}/data-ml-sampling-error-{target_cf_name}", "w+") as f:
+        f.write("cache_type,cache_size,miss_ratio,sampled_miss_ratio,error\n")
+        for error in errors:
+            f.write("{},{},{},{},{}\n".format(*error))
+    absolute_errors = [error[4] for error in errors]
+    print(
+        "Sampling rate {}: mean absolute error {:.4f}%, max absolute error "
+        "{:.4f}%.".format(
+            sampling_rate,
+            sum(absolute_errors) / len(absolute_errors),
+            max(absolute_errors),
+        )
+    )
+
+
+class FenwickTree:
+    """
+    A Fenwick (binary indexed) tree over positions 1..size that maintains
+    prefix sums of the values at the positions in O(log n).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def add(self, position, value):
+        self.total += value
+        while position <= self.size:
+            self.tree[position] += value
+            position += position & -position
+
+    def prefix_sum(self, position):
+        """
+        Returns the sum of the values at positions 1..position.
+        """
+        result = 0
+        while position > 0:
+            result += self.tree[position]
+            position -= position & -position
+        return result
+
+
+class LRUStack:
+    """
+    The LRU stack of the keys accessed so far, where each key weighs its value
+    size. A key's position is the sequence number of its last access, and a
+    Fenwick tree over the positions holds the value size of each key at its
+    position, so that the bytes of the keys accessed after a key are a suffix
+    sum. The positions are renumbered once they run out, so the tree is at
+    most four times the number of keys in the stack.
+    """
+
+    kMinSize = 1 << 16
+
+    def __init__(self):
+        self.keys = {}  # key -> (position, value_size)
+        self.tree = FenwickTree(self.kMinSize)
+        self.next_position = 1
+
+    def _compact(self):
+        size = max(self.kMinSize, 4 * len(self.keys))
+        self.tree = FenwickTree(size)
+        self.next_position = 1
+        for key, (_, value_size) in sorted(
+            self.keys.items(), key=lambda item: item[1][0]
+        ):
+            self.keys[key] = (self.next_position, value_size)
+            self.tree.add(self.next_position, value_size)
+            self.next_position += 1
+
+    def access(self, key, value_size, no_insert):
+        """
+        Move the key to the top of the stack. Returns the stack distance of
+        the key: the bytes of the distinct keys accessed since its last
+        access, including itself, i.e., the smallest LRU cache size that has
+        it cached. Returns kInfiniteStackDistance if the key is not in the
+        stack. A key that is not in the stack is only pushed if it is to be
+        inserted.
+        """
+        distance = kInfiniteStackDistance
+        entry = self.keys.get(key)
+        if entry is not None:
+            position, cached_size = entry
+            distance = self.tree.total - self.tree.prefix_sum(position - 1)
+            self.tree.add(position, -cached_size)
+            del self.keys[key]
+            value_size = cached_size
+        elif no_insert or value_size <= 0:
+            return distance
+        if self.next_position > self.tree.size:
+            self._compact()
+        self.keys[key] = (self.next_position, value_size)
+        self.tree.add(self.next_position, value_size)
+        self.next_position += 1
+        return distance
+
+
+class LRUStackDistances:
+    """
+    Computes the LRU stack distances of the accesses of a trace in one pass,
+    from which the miss ratio of a strict LRU cache (refer LRUCache) of every
+    size follows: an access is a hit in the caches at least as large as its
+    stack distance. The miss ratios are exact if all accesses insert their
+    block (no_insert is 0) and no block is larger than the cache, otherwise
+    the stack also moves the blocks of no_insert accesses that miss.
+
+    With enable_cache_row_key, as in Cache, the row key of a get request is
+    looked up first and its block is only accessed upon a row miss, so the
+    keys accessed depend on the cache size. The stack then applies every row
+    and block access, which makes the miss ratios of the hybrid caches an
+    approximation.
+    """
+
+    def __init__(self, cache_type, enable_cache_row_key):
+        self.cache_type = cache_type
+        self.enable_cache_row_key = enable_cache_row_key
+        self.stack = LRUStack()
+        self.distances = array.array("d")
+        self.get_id_row_key_map = {}
+        self.max_seen_get_id = 0
+        self.retain_get_id_range = 100000
+
+    def reset_counter(self):
+        self.distances = array.array("d")
+
+    def access(self, trace_record):
+        if (
+            self.enable_cache_row_key > 0
+            and trace_record.caller == 1
+            and trace_record.key_id != 0
+            and trace_record.get_id != 0
+        ):
+            self._access_row(trace_record)
+            return
+        self.distances.append(
+            self.stack.access(
+                trace_record.block_id,
+                trace_record.block_size,
+                trace_record.no_insert,
+            )
+        )
+
+    def _access_row(self, trace_record):
+        # A get request hits in the caches at least as large as the smallest
+        # stack distance of a row key it looked up, or of the access itself.
+        row_key = ~((trace_record.fd << 64) | trace_record.key_id)
+        self.max_seen_get_id = max(self.max_seen_get_id, trace_record.get_id)
+        self.get_id_row_key_map.pop(
+            self.max_seen_get_id - self.retain_get_id_range, None
+        )
+        if trace_record.get_id not in self.get_id_row_key_map:
+            self.get_id_row_key_map[trace_record.get_id] = {}
+            self.get_id_row_key_map[trace_record.get_id]["h"] = kInfiniteStackDistance
+        get_map = self.get_id_row_key_map[trace_record.get_id]
+        distance = get_map["h"]
+        if row_key not in get_map:
+            # First time seen this key.
+            row_distance = self.stack.access(
+                row_key, trace_record.kv_size, no_insert=False
+            )
+            get_map[row_key] = trace_record.kv_size > 0
+            get_map["h"] = min(get_map["h"], row_distance)
+            distance = min(distance, row_distance)
+        no_insert = trace_record.no_insert
+        if (
+            self.enable_cache_row_key == 2
+            and trace_record.kv_size > 0
+            and trace_record.block_type == 9
+        ):
+            no_insert = True
+        block_distance = self.stack.access(
+            trace_record.block_id, trace_record.block_size, no_insert
+        )
+        self.distances.append(min(distance, block_distance))
+        if trace_record.kv_size > 0 and not get_map[row_key]:
+            # Insert the row key-value pair.
+            self.stack.access(row_key, trace_record.kv_size, no_insert=False)
+            get_map[row_key] = True
+
+    def get_miss_ratios(self, cache_sizes):
+        """
+        Returns the miss ratio (in percent) of each cache size.
+        """
+        distances = np.sort(np.frombuffer(self.distances, dtype=np.float64))
+        num_hits = np.searchsorted(distances, cache_sizes, side="right")
+        return [
+            percent(len(distances) - hits, len(distances)) for hits in num_hits
+        ]
+
+    def get_miss_ratio_curve(self):
+        """
+        Returns the miss ratio curve as (cache size, miss ratio in percent) at
+        every cache size where the miss ratio changes.
+        """
+        distances = np.sort(np.frombuffer(self.distances, dtype=np.float64))
+        distances = distances[distances != kInfiniteStackDistance]
+        cache_sizes, counts = np.unique(distances, return_counts=True)
+        num_misses = len(self.distances) - np.cumsum(counts)
+        return [
+            (int(cache_size), percent(misses, len(self.distances)))
+            for cache_size, misses in zip(cache_sizes, num_misses)
+        ]
+
+
+def run_lru_stack_distances(
+    trace_file_path,
+    cache_types,
+    warmup_seconds,
+    max_accesses_to_process,
+    target_cf_name,
+):
+    """
+    Compute the LRU stack distances of the trace for each of the cache types
+    (lru, lru_hybrid, lru_hybridn) in one pass. Returns the
+    LRUStackDistances of each cache type.
+    """
+    analyzers = []
+    for cache_type in cache_types:
+        enable_cache_row_key = 0
+        if cache_type.endswith("_hybridn"):
+            enable_cache_row_key = 2
+        elif cache_type.endswith("_hybrid"):
+            enable_cache_row_key = 1
+        assert cache_type.split("_")[0] == "lru", cache_type
+        analyzers.append(LRUStackDistances(cache_type, enable_cache_row_key))
+    warmup_complete = False
+    access_seq_no = 0
+    time_interval = 1
+    start_time = time.time()
+    trace_start_time = 0
+    trace_duration = 0
+    print("Computing LRU stack distances on block traces.")
+    for ts in read_trace(trace_file_path):
+        if max_accesses_to_process != -1 and access_seq_no > max_accesses_to_process:
+            break
+        timestamp = ts[0]
+        cf_name = ts[5]
+        if not is_target_cf(cf_name, target_cf_name):
+            continue
+        if trace_start_time == 0:
+            trace_start_time = timestamp
+        trace_duration = timestamp - trace_start_time
+        if (
+            not warmup_complete
+            and warmup_seconds > 0
+            and trace_duration > warmup_seconds * 1000000
+        ):
+            for analyzer in analyzers:
+                analyzer.reset_counter()
+            warmup_complete = True
+        record = TraceRecord(*ts, next_access_seq_no=0)
+        for analyzer in analyzers:
+            analyzer.access(record)
+        access_seq_no += 1
+        if access_seq_no % 100 != 0:
+            continue
+        # Report progress every 10 seconds.
+        now = time.time()
+        if now - start_time > time_interval * 10:
+            print(
+                "Take {} seconds to process {} trace records with trace "
+                "duration of {} seconds. Throughput: {} records/second.".format(
+                    now - start_time,
+                    access_seq_no,
+                    trace_duration / 1000000,
+                    access_seq_no / (now - start_time),
+                )
+            )
+            time_interval += 1
+    return analyzers
+
+
+def report_lru_miss_ratio_curve(
+    analyzer, cache_sizes, downsample_size, target_cf_name, result_dir
+):
+    """
+    Write the miss ratio of each cache size into the same MRC files as
+    report_stats, and the whole miss ratio curve (scaled up by the
+    downsample size) into data-ml-lru-mrc-curve-<cache_type>-<target cf>.
+    """
+    miss_ratios = analyzer.get_miss_ratios(
+        [cache_size / downsample_size for cache_size in cache_sizes]
+    )
+    num_accesses = len(analyzer.distances)
+    for cache_size, miss_ratio in zip(cache_sizes, miss_ratios):
+        print(f"{analyzer.cache_type},0,0,{cache_size},{miss_ratio},{num_accesses}")
+        cache_label = f"{analyzer.cache_type}-{cache_size}-{target_cf_name}"
+        with open(f"{result_dir}/data-ml-mrc-{cache_label}", "w+") as mrc_file:
+            mrc_file.write(
+                f"{analyzer.cache_type},0,0,{cache_size},{miss_ratio},{num_accesses}\n"
+            )
+    curve_file_path = "{}/data-ml-lru-mrc-curve-{}-{}".format(
+        result_dir, analyzer.cache_type, target_cf_name
+    )
+    with open(curve_file_path, "w+") as curve_file:
+        curve_file.write("cache_size,miss_ratio\n")
+        for cache_size, miss_ratio in analyzer.get_miss_ratio_curve():
+            curve_file.write(f"{cache_size * downsample_size},{miss_ratio}\n")
 
 
 def report_stats(
@@ -1951,23 +3434,139 @@ def report_stats(
 
 
 if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        num_records = convert_trace_to_binary(sys.argv[2], sys.argv[3])
+        print(f"Converted {num_records} trace records into {sys.argv[3]}")
+        exit(0)
+    if len(sys.argv) == 4 and sys.argv[1] == "next_access":
+        next_access_file_path = get_next_access_file_path(sys.argv[2], sys.argv[3])
+        num_accesses = compute_next_accesses(
+            sys.argv[2], sys.argv[3], next_access_file_path
+        )
+        print(f"Computed {num_accesses} next accesses into {next_access_file_path}")
+        exit(0)
+    if len(sys.argv) == 10 and sys.argv[1] == "lru_mrc":
+        # Compute the miss ratios of LRU caches of all sizes in one pass over
+        # the trace.
+        cache_sizes = [parse_cache_size(cs) for cs in sys.argv[3].split(",")]
+        analyzers = run_lru_stack_distances(
+            trace_file_path=sys.argv[6],
+            cache_types=sys.argv[2].split(","),
+            warmup_seconds=int(sys.argv[5]),
+            max_accesses_to_process=int(sys.argv[8]),
+            target_cf_name=sys.argv[9],
+        )
+        for analyzer in analyzers:
+            report_lru_miss_ratio_curve(
+                analyzer,
+                cache_sizes,
+                downsample_size=int(sys.argv[4]),
+                target_cf_name=sys.argv[9],
+                result_dir=sys.argv[7],
+            )
+        exit(0)
+    if len(sys.argv) == 14 and sys.argv[1] == "sampled":
+        # Estimate the miss ratios of the grid of cache types x cache sizes
+        # by simulating a spatial sample of the trace, and optionally report
+        # the errors of the estimates against a full simulation.
+        trace_file_path = sys.argv[6]
+        result_dir = sys.argv[7]
+        target_cf_name = sys.argv[9]
+        num_workers = int(sys.argv[10])
+        sampling_rate = float(sys.argv[11])
+        max_sampled_keys = int(sys.argv[12])
+        if max_sampled_keys > 0:
+            sampling_rate = min(
+                sampling_rate,
+                SpatialSampler.get_sampling_rate(
+                    trace_file_path, max_sampled_keys, target_cf_name
+                ),
+            )
+        print(f"Sampling rate: {sampling_rate}")
+        configs = get_configs(
+            sys.argv[2].split(","),
+            [parse_cache_size(cs) for cs in sys.argv[3].split(",")],
+        )
+        args = {
+            "trace_file_path": trace_file_path,
+            "configs": configs,
+            "downsample_size": int(sys.argv[4]),
+            "warmup_seconds": int(sys.argv[5]),
+            "max_accesses_to_process": int(sys.argv[8]),
+            "target_cf_name": target_cf_name,
+            "num_workers": num_workers,
+        }
+        sampled_results = run_configs(
+            result_dir=result_dir, sampling_rate=sampling_rate, **args
+        )
+        if int(sys.argv[13]):
+            results = run_configs(result_dir=None, **args)
+            report_sampling_errors(
+                get_sampling_errors(results, sampled_results),
+                sampling_rate,
+                target_cf_name,
+                result_dir,
+            )
+        exit(0)
+    if len(sys.argv) == 11 and sys.argv[1] == "multi":
+        # Simulate the grid of cache types x cache sizes in one pass over the
+        # trace per worker process.
+        configs = get_configs(
+            sys.argv[2].split(","),
+            [parse_cache_size(cs) for cs in sys.argv[3].split(",")],
+        )
+        run_configs(
+            trace_file_path=sys.argv[6],
+            configs=configs,
+            downsample_size=int(sys.argv[4]),
+            warmup_seconds=int(sys.argv[5]),
+            max_accesses_to_process=int(sys.argv[8]),
+            target_cf_name=sys.argv[9],
+            result_dir=sys.argv[7],
+            num_workers=int(sys.argv[10]),
+        )
+        exit(0)
     if len(sys.argv) <= 8:
         print(
             "Must provide 8 arguments.\n"
-            "1) Cache type (ts, linucb, arc, lru, opt, pylru, pymru, pylfu, "
-            "pyhb, gdsize, trace). One may evaluate the hybrid row_block cache "
-            "by appending '_hybrid' to a cache_type, e.g., ts_hybrid. "
+            "1) Cache type (ts, linucb, arc, lru, 2q, sieve, s3fifo, wtinylfu, "
+            "lirs, opt, pylru, pymru, pylfu, pyhb, gdsize, trace). One may "
+            "evaluate the hybrid row_block cache by appending '_hybrid' to a "
+            "cache_type, e.g., ts_hybrid. "
             "Note that hybrid is not supported with opt and trace. \n"
             "2) Cache size (xM, xG, xT).\n"
             "3) The sampling frequency used to collect the trace. (The "
             "simulation scales down the cache size by the sampling frequency).\n"
             "4) Warmup seconds (The number of seconds used for warmup).\n"
-            "5) Trace file path.\n"
+            "5) Trace file path. (Either a human readable trace or a binary "
+            "trace converted from it with "
+            "'convert <trace_file_path> <binary_trace_file_path>'. The opt "
+            "cache reads the next accesses of the trace from the "
+            "<trace_file_path>.<target_cf>.next_access file, which is "
+            "computed if missing or with "
+            "'next_access <trace_file_path> <target_cf>'.)\n"
             "6) Result directory (A directory that saves generated results)\n"
             "7) Max number of accesses to process\n"
             "8) The target column family. (The simulation will only run "
             "accesses on the target column family. If it is set to all, "
-            "it will run against all accesses.)"
+            "it will run against all accesses.)\n"
+            "Alternatively, 'multi <cache_types> <cache_sizes> <arguments 3 to "
+            "8> <num_workers>' simulates all comma-separated cache types with "
+            "all comma-separated cache sizes, decoding the trace once per "
+            "worker process.\n"
+            "'lru_mrc <cache_types> <cache_sizes> <arguments 3 to 8>' computes "
+            "the miss ratios of LRU caches (lru, lru_hybrid, lru_hybridn) of "
+            "all sizes from the LRU stack distances, in one pass; those of "
+            "lru_hybrid and lru_hybridn are approximations.\n"
+            "'sampled <cache_types> <cache_sizes> <arguments 3 to 8> "
+            "<num_workers> <sampling_rate> <max_sampled_keys> <validate>' "
+            "simulates the keys sampled with the sampling rate (lowered so "
+            "that at most max_sampled_keys blocks are sampled unless it is 0) "
+            "on caches scaled down by the sampled fraction of the blocks, and "
+            "corrects the miss ratios by SHARDS-adj. With validate set to 1, "
+            "it also runs "
+            "a full simulation and reports the errors of the sampled miss "
+            "ratios."
         )
         exit(1)
     print(f"Arguments: {sys.argv}")
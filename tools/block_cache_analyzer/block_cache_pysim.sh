@@ -8,7 +8,7 @@
 # result_dir: The directory to store pysim results. The output files from a pysim is stores in result_dir/ml
 # downsample_size: The downsample size used to collect the trace.
 # warmup_seconds: The number of seconds used for warmup.
-# max_jobs: The max number of concurrent pysims to run.
+# max_jobs: The max number of worker processes running the pysims.
 
 # Install required packages to run simulations.
 # sudo dnf install -y numpy scipy python-matplotlib ipython python-pandas sympy python-nose atlas-devel
@@ -25,47 +25,36 @@ downsample_size="$3"
 warmup_seconds="$4"
 max_jobs="$5"
 max_num_accesses=100000000
-current_jobs=1
 
 ml_tmp_result_dir="$result_dir/ml"
 rm -rf "$ml_tmp_result_dir"
 mkdir -p "$result_dir"
 mkdir -p "$ml_tmp_result_dir"
 
-# Report miss ratio in the trace.
-current_jobs=$(ps aux | grep pysim | grep python | grep -cv grep)
-for cf_name in "all"
-do
-for cache_size in "1G" "2G" "4G" "8G" "16G" #"12G" "16G" "1T"
-do
-for cache_type in "opt" "lru" "pylru" "pycctbbt" "pyhb" "ts" "trace" "lru_hybrid"  #"pycctblevelbt" #"lru_hybridn" "opt" #"pylru" "pylru_hybrid" "pycctbbt" "pycccfbt" "trace"
-do
-    if [[ $cache_type == "trace" && $cache_size != "16G" ]]; then
-      # We only need to collect miss ratios observed in the trace once.
-      continue
-    fi
-    while [ "$current_jobs" -ge "$max_jobs" ]
-    do
-      sleep 10
-      echo "Waiting jobs to complete. Number of running jobs: $current_jobs"
-      current_jobs=$(ps aux | grep pysim | grep python | grep -cv grep)
-      echo "Waiting jobs to complete. Number of running jobs: $current_jobs"
-    done
-    output="log-ml-$cache_type-$cache_size-$cf_name"
-    echo "Running simulation for $cache_type, cache size $cache_size, and cf_name $cf_name. Number of running jobs: $current_jobs. "
-    nohup python block_cache_pysim.py "$cache_type" "$cache_size" "$downsample_size" "$warmup_seconds" "$trace_file" "$ml_tmp_result_dir" "$max_num_accesses" "$cf_name" >& "$ml_tmp_result_dir/$output" &
-    current_jobs=$((current_jobs+1))
-done
-done
-done
+# Convert the trace into the binary trace format once so that the pysims map
+# it into memory instead of each parsing the human readable trace.
+binary_trace_file="$result_dir/trace.bin"
+python block_cache_pysim.py convert "$trace_file" "$binary_trace_file"
 
-# Wait for all jobs to complete.
-while [ $current_jobs -gt 0 ]
+# Simulate all cache types and cache sizes. Every worker process decodes the
+# trace once and simulates its share of the caches in lockstep.
+for cf_name in "all"
 do
-  sleep 10
-  echo "Waiting jobs to complete. Number of running jobs: $current_jobs"
-  current_jobs=$(ps aux | grep pysim | grep python | grep -cv grep)
-  echo "Waiting jobs to complete. Number of running jobs: $current_jobs"
+# Other cache types: pycctblevelbt, lru_hybridn, pylru_hybrid, pycccfbt,
+# 2q, sieve, s3fifo, wtinylfu, lirs.
+cache_types="opt,pylru,pycctbbt,pyhb,ts,trace,lru_hybrid"
+cache_sizes="1G,2G,4G,8G,16G" # 12G, 1T
+# The LRU miss ratios of all cache sizes are computed in one pass from the
+# LRU stack distances instead of being simulated. They are exact only for
+# lru, so lru_hybrid is still simulated.
+lru_cache_types="lru"
+echo "Computing LRU miss ratio curves for $lru_cache_types and cf_name $cf_name."
+python block_cache_pysim.py lru_mrc "$lru_cache_types" "$cache_sizes" "$downsample_size" "$warmup_seconds" "$binary_trace_file" "$ml_tmp_result_dir" "$max_num_accesses" "$cf_name" >& "$ml_tmp_result_dir/log-ml-lru-mrc-$cf_name"
+# Compute the next access of every access once for the opt cache.
+python block_cache_pysim.py next_access "$binary_trace_file" "$cf_name"
+output="log-ml-$cf_name"
+echo "Running simulations for $cache_types, cache sizes $cache_sizes, and cf_name $cf_name with $max_jobs workers."
+python block_cache_pysim.py multi "$cache_types" "$cache_sizes" "$downsample_size" "$warmup_seconds" "$binary_trace_file" "$ml_tmp_result_dir" "$max_num_accesses" "$cf_name" "$max_jobs" >& "$ml_tmp_result_dir/$output"
 done
 
 echo "Combine individual pysim output files"
@@ -5,26 +5,49 @@ import os
 import random
 import sys
 
+import numpy as np
+
 from block_cache_pysim import (
     ARCCache,
     CacheEntry,
+    convert_trace_to_binary,
     create_cache,
+    FrequencySketch,
     GDSizeCache,
+    get_configs,
+    get_next_access_file_path,
+    get_sampling_errors,
     HashTable,
     HyperbolicPolicy,
+    is_binary_trace,
     kMicrosInSecond,
+    kNoNextAccess,
     kSampleSize,
     LFUPolicy,
+    LIRSCache,
     LinUCBCache,
+    load_binary_trace,
+    load_next_accesses,
     LRUCache,
     LRUPolicy,
+    LRUStack,
+    MissRatioStats,
     MRUPolicy,
     OPTCache,
     OPTCacheEntry,
+    read_trace,
     run,
+    run_configs,
+    run_lru_stack_distances,
+    S3FIFOCache,
+    sampling_hash,
+    SieveCache,
+    SpatialSampler,
     ThompsonSamplingCache,
     TraceCache,
     TraceRecord,
+    TwoQCache,
+    WTinyLFUCache,
 )
 
 
@@ -104,18 +127,19 @@ def assert_metrics(cache, expected_value, expected_value_size=1, custom_hashtabl
     )
     for expeceted_k in expected_value[3]:
         if custom_hashtable:
-            val = cache.table.lookup(f"b{expeceted_k}", expeceted_k)
+            val = cache.table.lookup(expeceted_k, expeceted_k)
         else:
-            val = cache.table[f"b{expeceted_k}"]
+            val = cache.table[expeceted_k]
         assert val is not None, "Expected {} Actual: Not Exist {}, Table: {}".format(
             expeceted_k, expected_value, cache.table
         )
         assert val.value_size == expected_value_size
     for expeceted_k in expected_value[4]:
+        # The row key of the key expeceted_k in file 0.
         if custom_hashtable:
-            val = cache.table.lookup(f"g0-{expeceted_k}", expeceted_k)
+            val = cache.table.lookup(~expeceted_k, expeceted_k)
         else:
-            val = cache.table[f"g0-{expeceted_k}"]
+            val = cache.table[~expeceted_k]
         assert val is not None
         assert val.value_size == expected_value_size
 
@@ -263,6 +287,111 @@ def test_lru_cache(cache, custom_hashtable):
     print("Test LRU cache: Success")
 
 
+def test_scan_resistant_caches():
+    print("Test scan resistant caches")
+    # Access k4, miss. evict k1, the only key of A1in.
+    test_cache(TwoQCache(3, enable_cache_row_key=0), [3, 7, 4, [2, 3, 4], []], False)
+    # Access k4, miss. evict k2, the oldest key that was not visited.
+    test_cache(SieveCache(3, enable_cache_row_key=0), [3, 7, 4, [1, 3, 4], []], False)
+    # Access k4, miss. evict k2, the oldest key of S that was not accessed.
+    test_cache(
+        S3FIFOCache(3, enable_cache_row_key=0), [3, 7, 4, [1, 3, 4], []], False
+    )
+    # Access k4, miss. evict k2, which was accessed less than k1 in probation.
+    test_cache(
+        WTinyLFUCache(3, enable_cache_row_key=0), [3, 7, 4, [1, 3, 4], []], False
+    )
+    # Access k4, miss. evict k1, the bottom LIR key.
+    test_cache(LIRSCache(3, enable_cache_row_key=0), [3, 7, 4, [2, 3, 4], []], False)
+
+    # Access a hot set of keys that fits in the cache, each access followed by
+    # an access to a key that is never accessed again. LRU keeps evicting the
+    # hot keys, the scan resistant caches keep most of them.
+    num_hot_keys = 60
+    scan_key = num_hot_keys
+    caches = [
+        LRUCache(100, enable_cache_row_key=0),
+        TwoQCache(100, enable_cache_row_key=0),
+        SieveCache(100, enable_cache_row_key=0),
+        S3FIFOCache(100, enable_cache_row_key=0),
+        WTinyLFUCache(100, enable_cache_row_key=0),
+        LIRSCache(100, enable_cache_row_key=0),
+    ]
+    rng = random.Random(0)
+    for i in range(20000):
+        if i % 2 == 0:
+            block_id = rng.randint(0, num_hot_keys - 1)
+        else:
+            block_id = scan_key
+            scan_key += 1
+        k = TraceRecord(
+            access_time=i,
+            block_id=block_id,
+            block_type=1,
+            block_size=1,
+            cf_id=0,
+            cf_name="",
+            level=0,
+            fd=0,
+            caller=1,
+            no_insert=0,
+            get_id=i,
+            key_id=block_id,
+            kv_size=0,
+            is_hit=1,
+            referenced_key_exist_in_block=1,
+            num_keys_in_block=0,
+            table_id=0,
+            seq_number=0,
+            block_key_size=0,
+            key_size=0,
+            block_offset_in_file=0,
+            next_access_seq_no=0,
+        )
+        for cache in caches:
+            cache.access(k)
+    lru_miss_ratio = caches[0].miss_ratio_stats.miss_ratio()
+    for cache in caches[1:]:
+        miss_ratio = cache.miss_ratio_stats.miss_ratio()
+        print(f"{cache.cache_name()}: {miss_ratio:.2f}%, LRU: {lru_miss_ratio:.2f}%")
+        assert miss_ratio < lru_miss_ratio
+        assert cache.used_size <= cache.cache_size
+        assert sum(entry.value_size for entry in cache.table.values()) == (
+            cache.used_size
+        )
+    print("Test scan resistant caches: Success")
+
+
+def test_frequency_sketch():
+    print("Test frequency sketch")
+    sketch = FrequencySketch(64)
+    assert sketch.width == 64
+    for key in range(64):
+        for _ in range(key % 8):
+            sketch.increment(key)
+    # Count-min sketches never underestimate, and rarely overestimate when the
+    # counters outnumber the keys.
+    num_exact = 0
+    for key in range(64):
+        frequency = sketch.frequency(key)
+        assert frequency >= key % 8
+        num_exact += frequency == key % 8
+    assert num_exact >= 56
+    # The row key of a hybrid cache is negative.
+    for _ in range(3):
+        sketch.increment(~1)
+    assert sketch.frequency(~1) >= 3
+    # The counters saturate.
+    for _ in range(2 * FrequencySketch.kMaxCount):
+        sketch.increment(1000)
+    assert sketch.frequency(1000) == FrequencySketch.kMaxCount + 1
+    # The frequencies are halved after sample_size accesses.
+    sketch.num_accesses = sketch.sample_size - 1
+    sketch.increment(1000)
+    assert sketch.frequency(1000) == FrequencySketch.kMaxCount // 2
+    print("Test frequency sketch: Success")
+
+
 def test_mru_cache():
     print("Test MRU cache")
     policies = []
@@ -346,21 +475,18 @@ def test_mix(cache):
     print(f"Test Mix {cache.cache_name()} cache: Success")
 
 
-def test_end_to_end():
-    print("Test All caches")
-    n = 100000
-    nblocks = 1000
-    block_size = 16 * 1024
+def write_trace(trace_file_path, n, nblocks, block_size, key_ids=None):
+    # The block ids are uniform in [0, nblocks] unless key_ids are given.
     ncfs = 7
     nlevels = 6
     nfds = 100000
-    trace_file_path = "test_trace"
-    # All blocks are of the same size so that OPT must achieve the lowest miss
-    # ratio.
     with open(trace_file_path, "w+") as trace_file:
         access_records = ""
         for i in range(n):
-            key_id = random.randint(0, nblocks)
+            if key_ids is None:
+                key_id = random.randint(0, nblocks)
+            else:
+                key_id = key_ids[i]
             cf_id = random.randint(0, ncfs)
             level = random.randint(0, nlevels)
             fd = random.randint(0, nfds)
@@ -391,6 +517,17 @@ def test_end_to_end():
             access_records += access_record + "\n"
         trace_file.write(access_records)
 
+
+def test_end_to_end():
+    print("Test All caches")
+    n = 100000
+    nblocks = 1000
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    # All blocks are of the same size so that OPT must achieve the lowest miss
+    # ratio.
+    write_trace(trace_file_path, n, nblocks, block_size)
+
     print("Test All caches: Start testing caches")
     cache_size = block_size * nblocks / 10
     downsample_size = 1
@@ -399,6 +536,11 @@ def test_end_to_end():
         "ts",
         "opt",
         "lru",
+        "2q",
+        "sieve",
+        "s3fifo",
+        "wtinylfu",
+        "lirs",
         "pylru",
         "linucb",
         "gdsize",
@@ -427,9 +569,240 @@ def test_end_to_end():
         print(f"Test All {cache.cache_name()}: Success")
 
     os.remove(trace_file_path)
+    os.remove(get_next_access_file_path(trace_file_path, "all"))
     print("Test All: Success")
 
 
+def test_binary_trace():
+    print("Test binary trace")
+    n = 10000
+    nblocks = 100
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    binary_trace_file_path = "test_trace.bin"
+    write_trace(trace_file_path, n, nblocks, block_size)
+    assert not is_binary_trace(trace_file_path)
+    assert convert_trace_to_binary(trace_file_path, binary_trace_file_path) == n
+    assert is_binary_trace(binary_trace_file_path)
+    records, cf_names = load_binary_trace(binary_trace_file_path)
+    assert len(records) == n
+    assert sorted(cf_names) == sorted({f"cf_{cf_id}" for cf_id in range(8)})
+    assert list(read_trace(binary_trace_file_path)) == list(
+        read_trace(trace_file_path)
+    )
+
+    cache_size = block_size * nblocks / 10
+    for cache_type in ["lru", "arc"]:
+        caches = []
+        for path in [trace_file_path, binary_trace_file_path]:
+            cache = create_cache(cache_type, cache_size, downsample_size=1)
+            run(path, cache_type, cache, 0, -1, "cf_3")
+            caches.append(cache)
+        assert caches[0].miss_ratio_stats.num_accesses > 0
+        assert (
+            caches[0].miss_ratio_stats.num_accesses
+            == caches[1].miss_ratio_stats.num_accesses
+        )
+        assert (
+            caches[0].miss_ratio_stats.miss_ratio()
+            == caches[1].miss_ratio_stats.miss_ratio()
+        )
+    os.remove(trace_file_path)
+    os.remove(binary_trace_file_path)
+    print("Test binary trace: Success")
+
+
+def test_run_configs():
+    print("Test run configs")
+    n = 10000
+    nblocks = 100
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    write_trace(trace_file_path, n, nblocks, block_size)
+    cache_sizes = [block_size * nblocks / 20, block_size * nblocks / 5]
+    configs = get_configs(["lru", "arc", "trace"], cache_sizes)
+    assert configs == [
+        ("lru", cache_sizes[0]),
+        ("arc", cache_sizes[0]),
+        ("lru", cache_sizes[1]),
+        ("arc", cache_sizes[1]),
+        ("trace", cache_sizes[1]),
+    ]
+    expected_results = []
+    for cache_type, cache_size in configs:
+        cache = create_cache(cache_type, cache_size, downsample_size=1)
+        run(trace_file_path, cache_type, cache, 0, -1, "all")
+        expected_results.append(
+            (
+                cache_type,
+                cache_size,
+                cache.miss_ratio_stats.miss_ratio(),
+                cache.miss_ratio_stats.num_accesses,
+            )
+        )
+    for num_workers in [1, 2]:
+        results = run_configs(
+            trace_file_path,
+            configs,
+            downsample_size=1,
+            warmup_seconds=0,
+            max_accesses_to_process=-1,
+            target_cf_name="all",
+            result_dir=None,
+            num_workers=num_workers,
+        )
+        assert results == expected_results, "Expected {} Actual {}".format(
+            expected_results, results
+        )
+    os.remove(trace_file_path)
+    print("Test run configs: Success")
+
+
+def test_lru_stack_distances():
+    print("Test LRU stack distances")
+    n = 10000
+    nblocks = 100
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    write_trace(trace_file_path, n, nblocks, block_size)
+    cache_sizes = [block_size * nblocks * ratio / 10 for ratio in range(1, 11)]
+    cache_types = ["lru", "lru_hybrid", "lru_hybridn"]
+    # Renumber the positions of the stack many times.
+    min_size = LRUStack.kMinSize
+    LRUStack.kMinSize = 64
+    try:
+        analyzers = run_lru_stack_distances(
+            trace_file_path, cache_types, 0, -1, "all"
+        )
+    finally:
+        LRUStack.kMinSize = min_size
+    for cache_type, analyzer in zip(cache_types, analyzers):
+        assert analyzer.cache_type == cache_type
+        assert len(analyzer.distances) == n
+        miss_ratios = analyzer.get_miss_ratios(cache_sizes)
+        for cache_size, miss_ratio in zip(cache_sizes, miss_ratios):
+            cache = create_cache(cache_type, cache_size, downsample_size=1)
+            run(trace_file_path, cache_type, cache, 0, -1, "all")
+            expected_miss_ratio = cache.miss_ratio_stats.miss_ratio()
+            if cache_type == "lru":
+                # The miss ratios of LRU are exact.
+                assert (
+                    miss_ratio == expected_miss_ratio
+                ), f"Expected {expected_miss_ratio} Actual {miss_ratio}"
+            else:
+                assert abs(miss_ratio - expected_miss_ratio) < 1.0
+        curve = analyzer.get_miss_ratio_curve()
+        for i in range(1, len(curve)):
+            assert curve[i - 1][0] < curve[i][0]
+            assert curve[i - 1][1] > curve[i][1]
+    # A cache as large as all blocks only misses their first accesses.
+    num_blocks = len({record[1] for record in read_trace(trace_file_path)})
+    assert analyzers[0].get_miss_ratio_curve()[-1][1] == num_blocks * 100.0 / n
+    os.remove(trace_file_path)
+    print("Test LRU stack distances: Success")
+
+
+def test_next_accesses():
+    print("Test next accesses")
+    n = 10000
+    nblocks = 100
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    binary_trace_file_path = "test_trace.bin"
+    write_trace(trace_file_path, n, nblocks, block_size)
+    convert_trace_to_binary(trace_file_path, binary_trace_file_path)
+    for target_cf_name in ["all", "cf_3"]:
+        block_ids = [
+            record[1]
+            for record in read_trace(trace_file_path)
+            if target_cf_name in ("all", record[5])
+        ]
+        expected_next_accesses = [kNoNextAccess] * len(block_ids)
+        last_accesses = {}
+        for i in reversed(range(len(block_ids))):
+            expected_next_accesses[i] = last_accesses.get(block_ids[i], kNoNextAccess)
+            last_accesses[block_ids[i]] = i
+        for path in [trace_file_path, binary_trace_file_path]:
+            next_accesses = load_next_accesses(path, target_cf_name)
+            assert next_accesses.tolist() == expected_next_accesses
+            os.remove(get_next_access_file_path(path, target_cf_name))
+
+    # OPT is simulated with the next accesses.
+    cache_size = block_size * nblocks / 10
+    miss_ratios = []
+    for path in [trace_file_path, binary_trace_file_path]:
+        cache = create_cache("opt", cache_size, downsample_size=1)
+        run(path, "opt", cache, 0, -1, "cf_3")
+        assert cache.miss_ratio_stats.num_accesses > 0
+        miss_ratios.append(cache.miss_ratio_stats.miss_ratio())
+        lru_cache = create_cache("lru", cache_size, downsample_size=1)
+        run(path, "lru", lru_cache, 0, -1, "cf_3")
+        assert miss_ratios[-1] <= lru_cache.miss_ratio_stats.miss_ratio()
+        os.remove(get_next_access_file_path(path, "cf_3"))
+    assert miss_ratios[0] == miss_ratios[1]
+    os.remove(trace_file_path)
+    os.remove(binary_trace_file_path)
+    print("Test next accesses: Success")
+
+
+def test_spatial_sampling():
+    print("Test spatial sampling")
+    n = 50000
+    nblocks = 2000
+    block_size = 16 * 1024
+    trace_file_path = "test_trace"
+    write_trace(trace_file_path, n, nblocks, block_size)
+    keys = np.arange(1000, dtype=np.uint64)
+    assert [int(h) for h in sampling_hash(keys)] == [
+        SpatialSampler.hash(key) for key in range(1000)
+    ]
+    # The sampling rate is lowered to hold at most 100 blocks.
+    sampling_rate = SpatialSampler.get_sampling_rate(trace_file_path, 100, "all")
+    sampler = SpatialSampler(sampling_rate)
+    block_ids = {record[1] for record in read_trace(trace_file_path)}
+    num_sampled_blocks = sum(sampler.is_sampled(block_id) for block_id in block_ids)
+    assert 90 <= num_sampled_blocks <= 100, num_sampled_blocks
+    assert SpatialSampler.get_sampling_rate(trace_file_path, n, "all") == 1.0
+
+    cache_sizes = [block_size * nblocks * ratio / 10 for ratio in [2, 5, 8]]
+    configs = get_configs(["lru", "arc", "lru_hybrid"], cache_sizes)
+    args = {
+        "trace_file_path": trace_file_path,
+        "configs": configs,
+        "downsample_size": 1,
+        "warmup_seconds": 0,
+        "max_accesses_to_process": -1,
+        "target_cf_name": "all",
+        "result_dir": None,
+    }
+    results = run_configs(**args)
+    sampled_results = run_configs(sampling_rate=0.3, **args)
+    for result, sampled_result in zip(results, sampled_results):
+        # About 30% of the accesses are sampled.
+        assert 0.25 * n < sampled_result[3] < 0.35 * n
+    errors = get_sampling_errors(results, sampled_results)
+    assert max(error[4] for error in errors) < 2.0, errors
+
+    # A skewed (Zipf) trace, where whether a few hot blocks are sampled moves
+    # the sampled fraction of the accesses far from the sampling rate.
+    n = 100000
+    nblocks = 20000
+    rng = np.random.default_rng(0)
+    probabilities = np.arange(1, nblocks + 1) ** -1.1
+    probabilities /= probabilities.sum()
+    key_ids = rng.permutation(nblocks)[rng.choice(nblocks, n, p=probabilities)]
+    write_trace(trace_file_path, n, nblocks, block_size, key_ids.tolist())
+    args["configs"] = get_configs(
+        ["lru"], [block_size * nblocks * ratio / 10 for ratio in [1, 3]]
+    )
+    results = run_configs(**args)
+    sampled_results = run_configs(sampling_rate=0.1, **args)
+    errors = get_sampling_errors(results, sampled_results)
+    assert max(error[4] for error in errors) < 2.0, errors
+    os.remove(trace_file_path)
+    print("Test spatial sampling: Success")
+
+
 def test_hybrid(cache):
     print(f"Test {cache.cache_name()} cache")
     k = TraceRecord(
@@ -641,6 +1014,91 @@ def test_opt_cache():
     print("Test OPT cache: Success")
 
 
+def test_miss_ratio_stats():
+    print("Test miss ratio stats")
+    stats = MissRatioStats(time_unit=60)
+    start = 100 * 60 * kMicrosInSecond
+    # The accesses are counted in batches, out of order across batches.
+    for minute in [3, 1, 3, 0]:
+        for i in range(3000):
+            stats.update_metrics(
+                start + minute * 60 * kMicrosInSecond + i,
+                is_hit=i % 3 == 0,
+                miss_bytes=10,
+            )
+    assert stats.num_accesses == 12000
+    assert stats.num_misses == 8000
+    assert stats.compute_miss_bytes() == (80000 / 3, 40000)
+    result_dir = "test_miss_ratio_stats"
+    os.makedirs(result_dir, exist_ok=True)
+    # The timeline covers one minute before and after the accesses.
+    end = start + 5 * 60 * kMicrosInSecond
+    start -= 60 * kMicrosInSecond
+    stats.write_miss_timeline("lru", 1, "all", result_dir, start, end)
+    stats.write_miss_ratio_timeline("lru", 1, "all", result_dir, start, end)
+    with open(f"{result_dir}/header-ml-miss-timeline-60-lru-1-all") as header_file:
+        assert header_file.read() == "time,99,100,101,102,103,104\n"
+    with open(f"{result_dir}/data-ml-miss-timeline-60-lru-1-all") as data_file:
+        assert data_file.read() == "lru,0,2000,2000,0,4000,0\n"
+    with open(f"{result_dir}/data-ml-miss-ratio-timeline-60-lru-1-all") as data_file:
+        assert data_file.read() == "lru,0.00,66.67,66.67,0.00,66.67,0.00\n"
+    stats.reset_counter()
+    assert stats.compute_miss_bytes() == (0, 0)
+    for file_name in os.listdir(result_dir):
+        os.remove(f"{result_dir}/{file_name}")
+    os.rmdir(result_dir)
+    print("Test miss ratio stats: Success")
+
+
+def test_linucb_cache():
+    print("Test LinUCB cache")
+    cache = LinUCBCache(
+        kSampleSize,
+        enable_cache_row_key=0,
+        policies=[LRUPolicy(), MRUPolicy(), LFUPolicy()],
+        cost_class_label=None,
+    )
+    A = np.tile(np.identity(cache.nfeatures), (len(cache.policies), 1, 1))
+    b = np.zeros((len(cache.policies), cache.nfeatures))
+    for i in range(2000):
+        k = TraceRecord(
+            access_time=i,
+            block_id=i,
+            block_type=random.randint(0, 9),
+            block_size=1,
+            cf_id=random.randint(0, 100),
+            cf_name="",
+            level=random.randint(0, 6),
+            fd=0,
+            caller=1,
+            no_insert=0,
+            get_id=i,
+            key_id=i,
+            kv_size=1,
+            is_hit=0,
+            referenced_key_exist_in_block=0,
+            num_keys_in_block=0,
+            table_id=0,
+            seq_number=0,
+            block_key_size=0,
+            key_size=0,
+            block_offset_in_file=0,
+            next_access_seq_no=0,
+        )
+        key = random.randint(0, 100)
+        rewards = [policy.generate_reward(key) for policy in cache.policies]
+        policy = cache._select_policy(k, key)
+        cache.policies[policy].evict(key=random.randint(0, 100), max_size=50)
+        x = np.array([k.block_type, k.level, k.cf_id, 0])
+        A[policy] += np.outer(x, x)
+        b[policy] += rewards[policy] * x
+    # The incremental inverses match the inverses of the A matrices.
+    assert np.allclose(cache.A_inv, np.linalg.inv(A))
+    assert np.allclose(cache.b, b)
+    assert np.allclose(cache.th_hat, np.einsum("pij,pj->pi", cache.A_inv, b))
+    print("Test LinUCB cache: Success")
+
+
 def test_trace_cache():
     print("Test trace cache")
     cache = TraceCache(0)
@@ -680,6 +1138,8 @@ def test_trace_cache():
 
 if __name__ == "__main__":
     test_hash_table()
+    test_miss_ratio_stats()
+    test_linucb_cache()
     test_trace_cache()
     test_opt_cache()
     test_lru_cache(
@@ -689,6 +1149,8 @@ if __name__ == "__main__":
         custom_hashtable=True,
     )
     test_lru_cache(LRUCache(3, enable_cache_row_key=0), custom_hashtable=False)
+    test_scan_resistant_caches()
+    test_frequency_sketch()
     test_mru_cache()
     test_lfu_cache()
     test_hybrid(
@@ -716,6 +1178,11 @@ if __name__ == "__main__":
         "trace",
         "pyhb",
         "lru",
+        "2q",
+        "sieve",
+        "s3fifo",
+        "wtinylfu",
+        "lirs",
         "pylru",
         "linucb",
         "gdsize",
@@ -732,3 +1199,8 @@ if __name__ == "__main__":
                     cache_type_str += "_hybridn"
             test_mix(create_cache(cache_type_str, cache_size=100, downsample_size=1))
     test_end_to_end()
+    test_binary_trace()
+    test_run_configs()
+    test_lru_stack_distances()
+    test_next_accesses()
+    test_spatial_sampling()